@@ -0,0 +1,294 @@
+"""
+Run concurrent virtual FilePond clients carrying out chunked uploads and
+report the latency, throughput and error rate for each endpoint.
+
+Each virtual client carries out the requests that the FilePond client
+library makes for a chunked upload:
+
+  POST   process/      start the upload, with the Upload-Length header
+  PATCH  patch/<id>    send each chunk, with the Upload-Offset,
+                       Upload-Length and Upload-Name headers
+  HEAD   patch/<id>    before a chunk, with probability --restart-rate,
+                       get the offset to resume the upload from
+  DELETE revert/       after the upload is complete, with probability
+                       --revert-rate, remove the temporary upload
+
+By default, a local server is started in this process, using the
+tests.settings configuration and a temporary SQLite test database, and
+Django's threaded live server handles the requests. To test a deployed
+worker, e.g. a gunicorn worker on the local host, pass the base URL of the
+filepond endpoints with --url. Uploads that aren't reverted are left on
+that server.
+
+For each endpoint, the number of requests, the error rate (requests that
+failed or didn't return a 2xx status), the 50th, 95th and 99th percentile
+latency and the request rate are reported, followed by the upload data
+throughput.
+
+Run from the root of the repository:
+
+    python -m benchmarks.load_test [--clients N] [--uploads N]
+        [--file-size BYTES] [--chunk-size BYTES] [--restart-rate P]
+        [--revert-rate P] [--url URL]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import requests
+
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+
+ENDPOINTS = ('process', 'patch', 'head', 'revert')
+
+PERCENTILES = (50, 95, 99)
+
+
+class EndpointStats(object):
+    """
+    The latencies, in seconds, and number of errors for the requests made to
+    an endpoint. Shared by the virtual clients.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+
+    def record(self, latency, error):
+        with self._lock:
+            self.latencies.append(latency)
+            if error:
+                self.errors += 1
+
+
+def percentile(values, pct):
+    """
+    Get the nearest-rank percentile of a sorted list of values.
+    """
+    if not values:
+        return None
+    rank = max(int(-(-pct * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+class UploadError(Exception):
+    pass
+
+
+class VirtualClient(object):
+    """
+    Carries out chunked uploads as the FilePond client library does,
+    recording the requests made in the shared stats.
+    """
+
+    def __init__(self, base_url, stats, args, seed):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.stats = stats
+        self.args = args
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.bytes_sent = 0
+        self.uploads_completed = 0
+        self.uploads_failed = 0
+
+    def _request(self, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + url,
+                                            timeout=self.args.timeout,
+                                            **kwargs)
+        except requests.RequestException as e:
+            self.stats[endpoint].record(time.perf_counter() - start, True)
+            raise UploadError('%s request failed: %s' % (endpoint, str(e)))
+        error = not (200 <= response.status_code < 300)
+        self.stats[endpoint].record(time.perf_counter() - start, error)
+        if error:
+            raise UploadError('%s request returned status %s: %s'
+                              % (endpoint, response.status_code,
+                                 response.text[:200]))
+        return response
+
+    def upload(self, data):
+        size = len(data)
+        response = self._request(
+            'process', 'POST', 'process/',
+            files={'filepond': (None, '{}')},
+            headers={'Upload-Length': str(size)})
+        upload_id = response.text.strip()
+        patch_url = 'patch/%s' % upload_id
+
+        offset = 0
+        while offset < size:
+            if self.random.random() < self.args.restart_rate:
+                response = self._request('head', 'HEAD', patch_url)
+                offset = int(response.headers['Upload-Offset'])
+            chunk = data[offset:offset + self.args.chunk_size]
+            self._request(
+                'patch', 'PATCH', patch_url, data=chunk,
+                headers={'Content-Type': CHUNK_CONTENT_TYPE,
+                         'Upload-Offset': str(offset),
+                         'Upload-Length': str(size),
+                         'Upload-Name': 'load_test.bin'})
+            offset += len(chunk)
+            self.bytes_sent += len(chunk)
+
+        if self.random.random() < self.args.revert_rate:
+            self._request('revert', 'DELETE', 'revert/', data=upload_id,
+                          headers={'Content-Type': 'text/plain'})
+
+    def run(self, data):
+        for _ in range(self.args.uploads):
+            try:
+                self.upload(data)
+                self.uploads_completed += 1
+            except UploadError:
+                self.uploads_failed += 1
+        self.session.close()
+
+
+def run(base_url, args):
+    """
+    Run the virtual clients, returning a tuple (stats, clients, elapsed)
+    where stats is a dict mapping endpoint names to EndpointStats.
+    """
+    stats = defaultdict(EndpointStats)
+    for endpoint in ENDPOINTS:
+        stats[endpoint]
+    data = os.urandom(args.file_size)
+    clients = [VirtualClient(base_url, stats, args, args.seed + i)
+               for i in range(args.clients)]
+    threads = [threading.Thread(target=client.run, args=(data,))
+               for client in clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (stats, clients, time.perf_counter() - start)
+
+
+@contextmanager
+def local_server():
+    """
+    Start a threaded live server for the tests.settings configuration using
+    a temporary SQLite test database. Yields the base URL of the filepond
+    endpoints.
+    """
+    import logging
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.db import connections
+    from django.test.runner import DiscoverRunner
+    from django.test.testcases import LiveServerThread, _StaticFilesHandler
+
+    # Debug logging to the console would dominate the timings
+    logging.getLogger('django_drf_filepond').setLevel(logging.WARNING)
+
+    # Use a file for the test database rather than an in-memory database
+    # so that each of the server's request threads has its own connection.
+    db_dir = tempfile.mkdtemp(prefix='drf_filepond_load_test_')
+    connections['default'].settings_dict['TEST']['NAME'] = os.path.join(
+        db_dir, 'load_test.db')
+    runner = DiscoverRunner(verbosity=0)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases(aliases={'default'})
+    server = LiveServerThread('127.0.0.1', _StaticFilesHandler)
+    server.daemon = True
+    server.start()
+    server.is_ready.wait()
+    try:
+        if server.error:
+            raise server.error
+        yield 'http://127.0.0.1:%s/%s' % (
+            server.port, settings.URL_BASE.lstrip('^'))
+    finally:
+        server.terminate()
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
+        shutil.rmtree(db_dir, True)
+
+
+def report(stats, clients, elapsed, args):
+    print('%d clients x %d uploads of %d bytes in %d byte chunks, '
+          '%.2fs:' % (args.clients, args.uploads, args.file_size,
+                      args.chunk_size, elapsed))
+    print('  %-8s %8s %8s %9s %9s %9s %10s'
+          % ('endpoint', 'requests', 'errors', 'p50 (ms)', 'p95 (ms)',
+             'p99 (ms)', 'requests/s'))
+    for endpoint in ENDPOINTS:
+        endpoint_stats = stats[endpoint]
+        latencies = sorted(endpoint_stats.latencies)
+        if not latencies:
+            continue
+        print('  %-8s %8d %7.1f%% %9.1f %9.1f %9.1f %10.1f'
+              % ((endpoint, len(latencies),
+                  100.0 * endpoint_stats.errors / len(latencies)) +
+                 tuple(percentile(latencies, pct) * 1000
+                       for pct in PERCENTILES) +
+                 (len(latencies) / elapsed,)))
+    completed = sum(client.uploads_completed for client in clients)
+    failed = sum(client.uploads_failed for client in clients)
+    bytes_sent = sum(client.bytes_sent for client in clients)
+    print('  uploads: %d completed, %d failed, %.1f uploads/s, %.2f MB/s'
+          % (completed, failed, completed / elapsed,
+             bytes_sent / (1024.0 * 1024.0) / elapsed))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=10,
+                        help='The number of concurrent virtual clients '
+                        '(default: 10)')
+    parser.add_argument('--uploads', type=int, default=5,
+                        help='The number of uploads made by each client '
+                        '(default: 5)')
+    parser.add_argument('--file-size', type=int, default=1024 * 1024,
+                        help='The size of each upload in bytes '
+                        '(default: 1048576)')
+    parser.add_argument('--chunk-size', type=int, default=256 * 1024,
+                        help='The size of each chunk in bytes '
+                        '(default: 262144)')
+    parser.add_argument('--restart-rate', type=float, default=0.05,
+                        help='The probability of a HEAD request to restart '
+                        'the upload before each chunk (default: 0.05)')
+    parser.add_argument('--revert-rate', type=float, default=1.0,
+                        help='The probability of reverting each completed '
+                        'upload (default: 1.0)')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='The timeout for each request in seconds '
+                        '(default: 60)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The seed for the clients\' random choices '
+                        '(default: 0)')
+    parser.add_argument('--url',
+                        help='The base URL of the filepond endpoints, e.g. '
+                        'http://127.0.0.1:8000/fp/. If not set, a local '
+                        'server is started.')
+    args = parser.parse_args()
+    if args.chunk_size <= 0 or args.file_size <= 0:
+        parser.error('The file and chunk sizes must be greater than 0')
+
+    if args.url:
+        (stats, clients, elapsed) = run(args.url, args)
+    else:
+        with local_server() as base_url:
+            (stats, clients, elapsed) = run(base_url, args)
+    return 1 if report(stats, clients, elapsed, args) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
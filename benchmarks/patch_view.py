@@ -0,0 +1,123 @@
+"""
+Compare the number of chunk upload PATCH requests per second handled by
+PatchView, which uses DRF's APIView, and LeanPatchView.
+
+The requests are made using Django's test client, so they pass through the
+middleware configured in tests.settings, against a temporary test database.
+Each run sends the specified number of chunks for a single chunked upload
+that is never completed so only the handling of individual chunks is
+measured.
+
+Run from the root of the repository:
+
+    python -m benchmarks.patch_view [--requests N] [--chunk-size BYTES]
+"""
+import argparse
+import os
+import shutil
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import Client, override_settings  # noqa: E402
+from django.test.runner import DiscoverRunner  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from django_drf_filepond.models import TemporaryUploadChunked, \
+    storage  # noqa: E402
+
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+
+# The number of requests sent before timing each run
+WARMUP_REQUESTS = 20
+
+
+def _send_chunks(client, url_name, num_requests, chunk_size):
+    # Start a chunked upload that is one byte larger than the data that is
+    # sent so that it isn't completed, then send the chunks. Returns the
+    # time taken to send the chunks.
+    total_size = (WARMUP_REQUESTS + num_requests) * chunk_size + 1
+    response = client.post(reverse('process'), {'filepond': '{}'},
+                           HTTP_UPLOAD_LENGTH=str(total_size))
+    upload_id = response.content.decode()
+    url = reverse(url_name, args=[upload_id])
+    chunk = b'x' * chunk_size
+
+    def send_chunk(i):
+        response = client.patch(
+            url, data=chunk, content_type=CHUNK_CONTENT_TYPE,
+            HTTP_UPLOAD_OFFSET=str(i * chunk_size),
+            HTTP_UPLOAD_LENGTH=str(total_size),
+            HTTP_UPLOAD_NAME='benchmark.bin')
+        if response.status_code != 200:
+            raise RuntimeError('Chunk request failed with status %s: %s'
+                               % (response.status_code, response.content))
+
+    try:
+        for i in range(WARMUP_REQUESTS):
+            send_chunk(i)
+        start = time.perf_counter()
+        for i in range(WARMUP_REQUESTS, WARMUP_REQUESTS + num_requests):
+            send_chunk(i)
+        return time.perf_counter() - start
+    finally:
+        tuc = TemporaryUploadChunked.objects.get(upload_id=upload_id)
+        shutil.rmtree(os.path.join(storage.base_location, tuc.upload_dir),
+                      True)
+        tuc.delete()
+
+
+def run(num_requests, chunk_size, repeat):
+    """
+    Time the patch endpoint handled by each view, returning a dict mapping
+    the view name to the best requests per second achieved.
+    """
+    client = Client()
+    results = {}
+    with override_settings(ROOT_URLCONF='benchmarks.urls'):
+        for _ in range(repeat):
+            for (name, url_name) in (('PatchView', 'patch'),
+                                     ('LeanPatchView', 'lean_patch')):
+                elapsed = _send_chunks(client, url_name, num_requests,
+                                       chunk_size)
+                results[name] = max(results.get(name, 0),
+                                    num_requests / elapsed)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=500,
+                        help='The number of chunk requests timed for each '
+                        'view in each run (default: 500)')
+    parser.add_argument('--chunk-size', type=int, default=1024,
+                        help='The size of each chunk in bytes '
+                        '(default: 1024)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='The number of runs, the best result for each '
+                        'view is reported (default: 3)')
+    args = parser.parse_args()
+
+    runner = DiscoverRunner(verbosity=0)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        results = run(args.requests, args.chunk_size, args.repeat)
+    finally:
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
+
+    print('%d requests with %d byte chunks, best of %d runs:'
+          % (args.requests, args.chunk_size, args.repeat))
+    for (name, rate) in sorted(results.items()):
+        print('  %-14s %8.1f requests/s' % (name, rate))
+    print('  LeanPatchView speedup: %.2fx'
+          % (results['LeanPatchView'] / results['PatchView']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,500 @@
+"""
+Measure the throughput of the main upload, storage and retrieval paths and
+compare the results with a stored baseline.
+
+The following benchmarks are run for each of the specified file sizes
+(and, for chunked uploads, chunk sizes):
+
+  standard_upload   POST of a complete file to the process endpoint (MB/s)
+  chunked_upload    a complete chunked upload, from the initial POST to the
+                    final PATCH request that triggers reassembly (MB/s)
+  chunks_read       reading a file through
+                    DrfFilepondChunkedUploadedFile.chunks() (MB/s)
+  reassemble        FilepondChunkedFileUploader._store_upload, reassembling
+                    the chunks into a TemporaryUpload (MB/s)
+  store_local       api.store_upload to the local file store (ms)
+  store_remote      api.store_upload to a storage backend, a
+                    FileSystemStorage in a temporary directory stands in for
+                    a remote storage backend (ms)
+  load              GET request to the load endpoint (MB/s)
+  restore           GET request to the restore endpoint (MB/s)
+
+Requests are made using Django's test client against a temporary test
+database, as in benchmarks.patch_view. The best result of the repeated runs
+is reported for each benchmark, along with the spread of the runs (how much
+slower the median run was than the best).
+
+Baselines are stored as JSON files in benchmarks/baselines. Save the
+results as a baseline with --save-baseline NAME and compare a run with a
+baseline with --compare NAME. When comparing, a benchmark is reported as a
+regression if it is slower than the baseline by more than its tolerance and
+the exit status is 1 if there are any regressions. The tolerance for each
+benchmark is the threshold plus the larger of the spreads of the run and the
+baseline, so that benchmarks whose timings vary from run to run, e.g. those
+that only take a few milliseconds, aren't reported as regressions because of
+noise.
+
+Baselines are only meaningful on the machine where they were recorded so
+none are included in the repository and benchmarks/baselines is ignored by
+git. To check a change for regressions, record a baseline on the same
+machine from the code without the change, then compare the code with the
+change with it:
+
+    git stash
+    python -m benchmarks.throughput --save-baseline before
+    git stash pop
+    python -m benchmarks.throughput --compare before
+
+Avoid running other work on the machine while the benchmarks run. If a
+benchmark is reported as a regression, run the comparison again to check
+that the result is repeatable.
+
+Run from the root of the repository:
+
+    python -m benchmarks.throughput [--sizes 64K,1M,8M]
+        [--chunk-sizes 256K,1M] [--repeat N] [--only NAME,...]
+        [--save-baseline NAME] [--compare NAME] [--threshold FRACTION]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.runner import DiscoverRunner  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+import django_drf_filepond.api as api  # noqa: E402
+import django_drf_filepond.drf_filepond_settings as local_settings  # noqa
+from django_drf_filepond.config import load_config  # noqa: E402
+from django_drf_filepond.models import StoredUpload, TemporaryUpload, \
+    TemporaryUploadChunked, get_upload_dir, storage  # noqa: E402
+from django_drf_filepond.uploaders import \
+    FilepondChunkedFileUploader  # noqa: E402
+from django_drf_filepond.utils import DrfFilepondChunkedUploadedFile, \
+    _get_file_id  # noqa: E402
+
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+
+# The directory within the file store that uploads are stored to
+STORE_DIR_NAME = 'benchmark'
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'baselines')
+
+# Units of the results, throughput is better when higher and latency when
+# lower.
+MB_PER_SEC = 'MB/s'
+MILLISECONDS = 'ms'
+
+BENCHMARKS = ('standard_upload', 'chunked_upload', 'chunks_read',
+              'reassemble', 'store_local', 'store_remote', 'load', 'restore')
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 * 1024}
+
+
+def parse_size(value):
+    """
+    Parse a size in bytes with an optional K or M suffix, e.g. "64K".
+    """
+    value = value.strip().upper()
+    multiplier = SIZE_SUFFIXES.get(value[-1:], 1)
+    if value[-1:] in SIZE_SUFFIXES:
+        value = value[:-1]
+    return int(value) * multiplier
+
+
+def format_size(size):
+    for (suffix, multiplier) in (('M', 1024 * 1024), ('K', 1024)):
+        if size >= multiplier and size % multiplier == 0:
+            return '%d%s' % (size // multiplier, suffix)
+    return str(size)
+
+
+def _mb_per_sec(size, elapsed):
+    return (size / (1024.0 * 1024.0)) / elapsed
+
+
+def _get_data(size):
+    # Use data that doesn't compress to nothing in case a storage backend
+    # or middleware compresses it.
+    return (os.urandom(64 * 1024) * (size // (64 * 1024) + 1))[:size]
+
+
+def _check_response(response):
+    if response.status_code != 200:
+        raise RuntimeError('Request failed with status %s: %s'
+                           % (response.status_code, response.content[:200]))
+    return response
+
+
+def _delete_temp_upload(upload_id):
+    for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+        tu.delete()
+
+
+def _create_temp_upload(data):
+    tu = TemporaryUpload(
+        upload_id=_get_file_id(), file_id=_get_file_id(),
+        file=SimpleUploadedFile('benchmark.bin', data),
+        upload_name='benchmark.bin', upload_type=TemporaryUpload.FILE_DATA)
+    tu.save()
+    return tu
+
+
+def _create_chunked_upload(data, chunk_size):
+    # Write the chunk files for a completed chunked upload directly to the
+    # upload directory, as they would be written by the patch endpoint.
+    upload_id = _get_file_id()
+    file_id = _get_file_id()
+    upload_dir = get_upload_dir(upload_id)
+    chunk_dir = os.path.join(storage.base_location, upload_dir)
+    os.makedirs(chunk_dir)
+    num_chunks = 0
+    for offset in range(0, len(data), chunk_size):
+        num_chunks += 1
+        with open(os.path.join(chunk_dir, '%s_%s' % (file_id, num_chunks)),
+                  'wb') as f:
+            f.write(data[offset:offset + chunk_size])
+    tuc = TemporaryUploadChunked(
+        upload_id=upload_id, file_id=file_id, upload_dir=upload_dir,
+        last_chunk=num_chunks, offset=len(data), total_size=len(data),
+        upload_name='benchmark.bin', upload_complete=True)
+    tuc.save()
+    return tuc
+
+
+def _remove_chunked_upload(tuc):
+    shutil.rmtree(os.path.join(storage.base_location, tuc.upload_dir), True)
+    TemporaryUploadChunked.objects.filter(upload_id=tuc.upload_id).delete()
+    _delete_temp_upload(tuc.upload_id)
+
+
+@contextmanager
+def _file_store(remote):
+    # Store uploads under the benchmark directory of the configured file
+    # store, which is where StoredUpload's file field reads them from, or
+    # through a FileSystemStorage in a temporary directory standing in for
+    # a remote storage backend.
+    if remote:
+        store_dir = tempfile.mkdtemp(prefix='drf_filepond_benchmark_')
+        backend = {'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                   'OPTIONS': {'location': store_dir}}
+    else:
+        store_dir = os.path.join(local_settings.FILE_STORE_PATH,
+                                 STORE_DIR_NAME)
+        backend = None
+    saved = local_settings.STORAGES_BACKEND
+    local_settings.STORAGES_BACKEND = backend
+    load_config()
+    try:
+        yield
+    finally:
+        local_settings.STORAGES_BACKEND = saved
+        load_config()
+        StoredUpload.objects.all().delete()
+        shutil.rmtree(store_dir, True)
+
+
+def bench_standard_upload(client, size, chunk_size):
+    data = _get_data(size)
+    start = time.perf_counter()
+    response = _check_response(client.post(reverse('process'), {
+        'filepond': SimpleUploadedFile('benchmark.bin', data)}))
+    elapsed = time.perf_counter() - start
+    _delete_temp_upload(response.content.decode())
+    return _mb_per_sec(size, elapsed)
+
+
+def bench_chunked_upload(client, size, chunk_size):
+    data = _get_data(size)
+    start = time.perf_counter()
+    response = _check_response(client.post(
+        reverse('process'), {'filepond': '{}'},
+        HTTP_UPLOAD_LENGTH=str(size)))
+    upload_id = response.content.decode()
+    url = reverse('patch', args=[upload_id])
+    for offset in range(0, size, chunk_size):
+        _check_response(client.patch(
+            url, data=data[offset:offset + chunk_size],
+            content_type=CHUNK_CONTENT_TYPE,
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_UPLOAD_LENGTH=str(size),
+            HTTP_UPLOAD_NAME='benchmark.bin'))
+    elapsed = time.perf_counter() - start
+    _delete_temp_upload(upload_id)
+    return _mb_per_sec(size, elapsed)
+
+
+def bench_chunks_read(client, size, chunk_size):
+    tuc = _create_chunked_upload(_get_data(size), chunk_size)
+    try:
+        start = time.perf_counter()
+        chunked_file = DrfFilepondChunkedUploadedFile(tuc)
+        chunked_file.open('rb')
+        for _ in chunked_file.chunks():
+            pass
+        chunked_file.close()
+        elapsed = time.perf_counter() - start
+    finally:
+        _remove_chunked_upload(tuc)
+    return _mb_per_sec(size, elapsed)
+
+
+def bench_reassemble(client, size, chunk_size):
+    tuc = _create_chunked_upload(_get_data(size), chunk_size)
+    try:
+        start = time.perf_counter()
+        FilepondChunkedFileUploader()._store_upload(tuc)
+        elapsed = time.perf_counter() - start
+    finally:
+        _remove_chunked_upload(tuc)
+    return _mb_per_sec(size, elapsed)
+
+
+def _bench_store(remote, size):
+    tu = _create_temp_upload(_get_data(size))
+    with _file_store(remote):
+        start = time.perf_counter()
+        api.store_upload(tu.upload_id,
+                         os.path.join(STORE_DIR_NAME, tu.upload_id + '.bin'))
+        elapsed = time.perf_counter() - start
+    return elapsed * 1000.0
+
+
+def bench_store_local(client, size, chunk_size):
+    return _bench_store(False, size)
+
+
+def bench_store_remote(client, size, chunk_size):
+    return _bench_store(True, size)
+
+
+def bench_load(client, size, chunk_size):
+    tu = _create_temp_upload(_get_data(size))
+    with _file_store(False):
+        su = api.store_upload(tu.upload_id,
+                              os.path.join(STORE_DIR_NAME, tu.upload_id))
+        start = time.perf_counter()
+        response = _check_response(client.get(
+            reverse('load') + '?id=%s' % su.upload_id))
+        b''.join(response)
+        elapsed = time.perf_counter() - start
+    return _mb_per_sec(size, elapsed)
+
+
+def bench_restore(client, size, chunk_size):
+    tu = _create_temp_upload(_get_data(size))
+    try:
+        start = time.perf_counter()
+        response = _check_response(client.get(
+            reverse('restore') + '?id=%s' % tu.upload_id))
+        b''.join(response)
+        elapsed = time.perf_counter() - start
+    finally:
+        _delete_temp_upload(tu.upload_id)
+    return _mb_per_sec(size, elapsed)
+
+
+# The benchmark functions, their units and whether they are run for each
+# chunk size
+_BENCHMARK_FUNCS = {
+    'standard_upload': (bench_standard_upload, MB_PER_SEC, False),
+    'chunked_upload': (bench_chunked_upload, MB_PER_SEC, True),
+    'chunks_read': (bench_chunks_read, MB_PER_SEC, True),
+    'reassemble': (bench_reassemble, MB_PER_SEC, True),
+    'store_local': (bench_store_local, MILLISECONDS, False),
+    'store_remote': (bench_store_remote, MILLISECONDS, False),
+    'load': (bench_load, MB_PER_SEC, False),
+    'restore': (bench_restore, MB_PER_SEC, False),
+}
+
+
+def _get_change(value, baseline, unit):
+    # The fractional improvement of value over baseline, negative if value
+    # is slower.
+    if unit == MILLISECONDS:
+        return (baseline - value) / value
+    return (value - baseline) / baseline
+
+
+def _get_cases(names, sizes, chunk_sizes):
+    # Returns a list of (key, func, unit, size, chunk_size) tuples
+    cases = []
+    for name in names:
+        (func, unit, chunked) = _BENCHMARK_FUNCS[name]
+        for size in sizes:
+            if not chunked:
+                cases.append(('%s[%s]' % (name, format_size(size)), func,
+                              unit, size, None))
+                continue
+            for chunk_size in chunk_sizes:
+                # A chunk larger than the file gives the same result as a
+                # chunk the size of the file.
+                if chunk_size > size:
+                    continue
+                cases.append(('%s[%s/%s]' % (name, format_size(size),
+                                             format_size(chunk_size)),
+                              func, unit, size, chunk_size))
+    return cases
+
+
+def run(names, sizes, chunk_sizes, repeat):
+    """
+    Run the named benchmarks, returning a dict mapping the key for each
+    benchmark case to a dict containing the best result, its unit and the
+    spread of the runs, i.e. how much slower the median run was than the
+    best as a fraction.
+    """
+    client = Client()
+    results = {}
+    for (key, func, unit, size, chunk_size) in _get_cases(
+            names, sizes, chunk_sizes):
+        values = sorted(func(client, size, chunk_size)
+                        for _ in range(repeat))
+        best = values[0] if unit == MILLISECONDS else values[-1]
+        median = values[len(values) // 2]
+        results[key] = {'value': round(best, 3), 'unit': unit,
+                        'spread': round(-_get_change(median, best, unit), 3)}
+    return results
+
+
+def _get_environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+    }
+
+
+def _get_baseline_path(name):
+    return os.path.join(BASELINE_DIR, '%s.json' % name)
+
+
+def save_baseline(name, results):
+    if not os.path.exists(BASELINE_DIR):
+        os.makedirs(BASELINE_DIR)
+    with open(_get_baseline_path(name), 'w') as f:
+        json.dump({'environment': _get_environment(), 'results': results},
+                  f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_baseline(name):
+    with open(_get_baseline_path(name)) as f:
+        return json.load(f)
+
+
+def compare(results, baseline_results, threshold):
+    """
+    Compare the results with the baseline results. Returns a list of
+    (key, result, baseline, change, tolerance, regressed) tuples for the
+    benchmarks present in both, where change is the fractional improvement
+    over the baseline (negative if slower), tolerance is the threshold plus
+    the larger of the spreads of the result and the baseline, and regressed
+    is True if the result is slower than the baseline by more than the
+    tolerance.
+    """
+    comparison = []
+    for key in sorted(results):
+        if key not in baseline_results:
+            continue
+        value = results[key]['value']
+        baseline = baseline_results[key]['value']
+        change = _get_change(value, baseline, results[key]['unit'])
+        tolerance = threshold + max(results[key].get('spread', 0.0),
+                                    baseline_results[key].get('spread', 0.0))
+        comparison.append((key, value, baseline, change, tolerance,
+                           change < -tolerance))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='64K,1M,8M',
+                        help='Comma-separated file sizes, with an optional K '
+                        'or M suffix (default: 64K,1M,8M)')
+    parser.add_argument('--chunk-sizes', default='256K,1M',
+                        help='Comma-separated chunk sizes for the chunked '
+                        'benchmarks (default: 256K,1M)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='The number of runs of each benchmark, the '
+                        'best result is reported (default: 5)')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help='Comma-separated names of the benchmarks to '
+                        'run (default: all)')
+    parser.add_argument('--save-baseline', metavar='NAME',
+                        help='Save the results as the named baseline')
+    parser.add_argument('--compare', metavar='NAME',
+                        help='Compare the results with the named baseline')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='The fractional slowdown relative to the '
+                        'baseline, in addition to the spread of the runs, '
+                        'reported as a regression (default: 0.5)')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = [name for name in names if name not in _BENCHMARK_FUNCS]
+    if unknown:
+        parser.error('Unknown benchmark(s): %s' % ', '.join(unknown))
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    chunk_sizes = [parse_size(size) for size in args.chunk_sizes.split(',')]
+    baseline = load_baseline(args.compare) if args.compare else None
+
+    # Debug logging to the console would dominate the timings
+    logging.getLogger('django_drf_filepond').setLevel(logging.WARNING)
+
+    runner = DiscoverRunner(verbosity=0)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        results = run(names, sizes, chunk_sizes, args.repeat)
+    finally:
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
+
+    print('Best of %d runs (spread):' % args.repeat)
+    for key in sorted(results):
+        print('  %-32s %10.3f %-4s (%.1f%%)'
+              % (key, results[key]['value'], results[key]['unit'],
+                 results[key]['spread'] * 100))
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+        print('Saved baseline <%s>' % _get_baseline_path(args.save_baseline))
+
+    if baseline is None:
+        return 0
+
+    if baseline['environment'] != _get_environment():
+        print('Warning: baseline <%s> was recorded in a different '
+              'environment (%s), the comparison may not be meaningful.'
+              % (args.compare, ', '.join(
+                  '%s %s' % item
+                  for item in sorted(baseline['environment'].items()))))
+    comparison = compare(results, baseline['results'], args.threshold)
+    print('Compared with baseline <%s> (change, tolerance):' % args.compare)
+    for (key, value, baseline_value, change, tolerance,
+         regressed) in comparison:
+        print('  %-32s %10.3f %10.3f %+7.1f%% %6.1f%%%s'
+              % (key, value, baseline_value, change * 100, tolerance * 100,
+                 '  REGRESSION' if regressed else ''))
+    return 1 if any(c[5] for c in comparison) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""Benchmark URL configuration
+
+Routes the filepond endpoints as in the tests URL configuration and adds a
+lean_patch endpoint handled by LeanPatchView so that both versions of the
+patch endpoint can be compared in a single run.
+"""
+from django.conf import settings
+from django.conf.urls import include
+from django.urls import re_path
+
+from django_drf_filepond.views import LeanPatchView
+
+urlpatterns = [
+    re_path(settings.URL_BASE + r'lean_patch/(?P<chunk_id>[0-9a-zA-Z]{22})$',
+            LeanPatchView.as_view(), name='lean_patch'),
+    re_path(settings.URL_BASE, include('django_drf_filepond.urls'))
+]
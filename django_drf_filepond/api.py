@@ -6,26 +6,43 @@
 #               requires that you have the DJANGO_DRF_FILEPOND_FILE_STORE_PATH
 #               setting set in your application's settings.py file.
 #
+# delete_temp_uploads: used to delete large numbers of temporary uploads and
+#                      their files efficiently.
+#
+import hashlib
 import logging
 import ntpath
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 import django_drf_filepond.drf_filepond_settings as local_settings
 from django.core.exceptions import ImproperlyConfigured
-import re
-import shortuuid
-from django_drf_filepond.models import TemporaryUpload, StoredUpload
-from django_drf_filepond.storage_utils import _get_storage_backend
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django_drf_filepond.models import TemporaryUpload, StoredUpload, \
+    get_content_path, get_upload_dir, storage
+from django_drf_filepond.cache_utils import get_cached_stored_upload, \
+    invalidate_stored_upload
+from django_drf_filepond.config import check_file_store, get_config, \
+    load_config
+from django_drf_filepond.db_utils import get_read_db
 from django_drf_filepond.exceptions import ConfigurationError
-
-# TODO: Need to refactor this into a class and put the initialisation of
-# the storage backend into the init.
-storage_backend_initialised = False
-storage_backend = None
+from django_drf_filepond.metrics import time_phase
+from django_drf_filepond.storage_utils import get_storage_backend
+from django_drf_filepond.tracing import trace_span
+from django_drf_filepond.utils import _is_valid_upload_id, \
+    _iter_keyset_batches
+from six import binary_type, text_type
 
 LOG = logging.getLogger(__name__)
 
+# The number of records handled in each batch by delete_temp_uploads
+TEMP_UPLOAD_DELETE_BATCH_SIZE = 500
+
+# The size of the blocks read when calculating the hash of a file's content
+CONTENT_HASH_CHUNK_SIZE = 1024 * 1024
+
 # There's no built in FileNotFoundError, FileExistsError in Python 2
 try:
     FileNotFoundError
@@ -39,14 +56,13 @@ except NameError:
 
 
 def _init_storage_backend():
-    global storage_backend_initialised
-    global storage_backend
-
-    storage_module_name = getattr(local_settings, 'STORAGES_BACKEND', None)
+    # Load a new configuration snapshot, creating the storage backend from
+    # the current settings, and return the backend. This is called when the
+    # app is loaded, the API functions get the shared backend instance from
+    # the registry in storage_utils using get_storage_backend.
     LOG.debug('Initialising storage backend with storage module name [%s]'
-              % storage_module_name)
-    storage_backend = _get_storage_backend(storage_module_name)
-    storage_backend_initialised = True
+              % getattr(local_settings, 'STORAGES_BACKEND', None))
+    return load_config().storage_backend
 
 
 # Store the temporary upload represented by upload_id to the specified
@@ -69,21 +85,36 @@ def store_upload(upload_id, destination_file_path):
     file. i.e. the file will be stored at
         destination_file_path + destination_file_name
     """
-    # TODO: If the storage backend is not initialised, init now - this will
-    # be removed when this module is refactored into a class.
-    if not storage_backend_initialised:
-        _init_storage_backend()
+    _check_store_upload_args(upload_id, destination_file_path)
 
+    storage_backend = get_storage_backend()
+    with trace_span('filepond.store_upload', upload_id,
+                    remote=bool(storage_backend)):
+        try:
+            tu = TemporaryUpload.objects.get(upload_id=upload_id)
+        except TemporaryUpload.DoesNotExist:
+            raise ValueError(
+                'Record for the specified upload_id doesn\'t exist')
+
+        (destination_path, destination_name) = \
+            _split_destination_file_path(destination_file_path)
+        if storage_backend:
+            return _store_upload_remote(destination_path, destination_name,
+                                        tu)
+        else:
+            return _store_upload_local(destination_path, destination_name,
+                                       tu)
+
+
+def _check_store_upload_args(upload_id, destination_file_path):
     # If there's no storage backend set then we're using local file storage
     # and FILE_STORE_PATH must be set.
-    if not storage_backend:
-        if ((not hasattr(local_settings, 'FILE_STORE_PATH')) or
-                (not local_settings.FILE_STORE_PATH)):
+    if not get_storage_backend():
+        if not get_config().file_store_path:
             raise ImproperlyConfigured('A required setting is missing in your '
                                        'application configuration.')
 
-    id_fmt = re.compile('^([%s]){22}$' % (shortuuid.get_alphabet()))
-    if not id_fmt.match(upload_id):
+    if not _is_valid_upload_id(upload_id):
         LOG.error('The provided upload ID <%s> is of an invalid format.'
                   % upload_id)
         raise ValueError('The provided upload ID is of an invalid format.')
@@ -91,11 +122,8 @@ def store_upload(upload_id, destination_file_path):
     if not destination_file_path or destination_file_path == '':
         raise ValueError('No destination file path provided.')
 
-    try:
-        tu = TemporaryUpload.objects.get(upload_id=upload_id)
-    except TemporaryUpload.DoesNotExist:
-        raise ValueError('Record for the specified upload_id doesn\'t exist')
 
+def _split_destination_file_path(destination_file_path):
     # Before this was updated, passing a path ending in os.sep, i.e. a
     # directory name, would ensure that the file was stored in the specified
     # directory using the name that the file had when it was originally
@@ -106,35 +134,61 @@ def store_upload(upload_id, destination_file_path):
     destination_name = ntpath.basename(destination_file_path)
     destination_path = ntpath.dirname(destination_file_path)
 
-    if ((not storage_backend) and (destination_name == '') and
+    if ((not get_storage_backend()) and (destination_name == '') and
             (destination_file_path.endswith(os.sep))):
         # In some cases we'll enter this block but destination path will
         # already end in a '/' so check before updating
         if not destination_path.endswith('/'):
             destination_path += os.sep
-
-    if storage_backend:
-        return _store_upload_remote(destination_path, destination_name, tu)
-    else:
-        return _store_upload_local(destination_path, destination_name, tu)
+    return (destination_path, destination_name)
 
 
 def _store_upload_local(destination_file_path, destination_file_name,
                         temp_upload):
-    file_path_base = local_settings.FILE_STORE_PATH
+    (file_path_base, destination_file_path, target_file_path) = \
+        _get_local_store_paths(destination_file_path, destination_file_name,
+                               temp_upload)
+
+    if local_settings.FILE_STORE_CONTENT_ADDRESSED:
+        return _store_upload_content_addressed(
+            file_path_base, destination_file_path, temp_upload)
+
+    # Check we're not about to overwrite anything
+    _check_local_target_file(target_file_path)
+
+    su = _get_new_stored_upload(temp_upload, destination_file_path)
+    try:
+        with time_phase('store_local'):
+            _copy_to_local_store(temp_upload.get_file_path(),
+                                 target_file_path)
+        with time_phase('store_db_write'):
+            su.save(force_insert=True)
+            temp_upload.delete()
+    except IOError as e:
+        LOG.error('Error moving temporary file to permanent storage location')
+        raise e
+
+    return su
+
+
+def _get_local_store_paths(destination_file_path, destination_file_name,
+                           temp_upload):
+    # Get the file store location, the path of the file relative to the
+    # file store and the full path of the target file for storing
+    # temp_upload in the local file store.
+    config = check_file_store()
+    file_path_base = config.file_store_path
 
     # If called via store_upload, this has already been checked but in
     # case this is called directly, double check that the store path is set
     if not file_path_base or file_path_base == '':
         raise ValueError('The FILE_STORE_PATH is not set to a directory.')
 
-    # Is this necessary? Checking on every file storage in case the directory
-    # was removed but not sure that this is really necessary.
-    if((not os.path.exists(file_path_base)) or
-            (not os.path.isdir(file_path_base))):
-        raise FileNotFoundError(
-            'The local output directory [%s] defined by FILE_STORE_PATH is '
-            'missing.' % file_path_base)
+    # The store path is checked when the configuration is loaded rather
+    # than on every file storage, it is only checked again here if there
+    # was a problem with it.
+    if config.file_store_error:
+        raise FileNotFoundError(config.file_store_error)
 
     if destination_file_path.startswith(os.sep):
         destination_file_path = destination_file_path[1:]
@@ -147,33 +201,108 @@ def _store_upload_local(destination_file_path, destination_file_name,
         target_filename = temp_upload.upload_name
     destination_file_path = os.path.join(destination_file_path,
                                          target_filename)
+    return (file_path_base, destination_file_path,
+            os.path.join(target_dir, target_filename))
 
-    # Check we're not about to overwrite anything
-    target_file_path = os.path.join(target_dir, target_filename)
+
+def _check_local_target_file(target_file_path):
     if os.path.exists(target_file_path):
         LOG.error('File with specified name and path <%s> already exists'
                   % target_file_path)
         raise FileExistsError('The specified temporary file cannot be stored'
                               ' to the specified location - file exists.')
 
+
+def _get_new_stored_upload(temp_upload, file_path, content_hash=''):
+    # Create the (unsaved) StoredUpload record for temp_upload. The user's
+    # ID is copied so that the user record isn't loaded, this also allows
+    # the record to be created from asynchronous code. The record is saved
+    # with force_insert since its upload ID is already set.
     su = StoredUpload(upload_id=temp_upload.upload_id,
-                      file=destination_file_path,
+                      file=file_path,
                       uploaded=temp_upload.uploaded,
-                      uploaded_by=temp_upload.uploaded_by)
+                      uploaded_by_id=temp_upload.uploaded_by_id,
+                      content_hash=content_hash)
+    temp_upload.copy_file_metadata(su)
+    return su
+
+
+def _copy_to_local_store(source_file_path, target_file_path):
+    target_dir = os.path.dirname(target_file_path)
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+    shutil.copy2(source_file_path, target_file_path)
+
+
+def _store_upload_content_addressed(file_path_base, destination_file_path,
+                                    temp_upload):
+    # Store the upload in the content-addressed file store. The record is
+    # saved before checking for an existing copy of the content so that a
+    # concurrent delete_stored_upload for the same content sees this
+    # reference and doesn't remove the file.
+    if StoredUpload.objects.filter(file=destination_file_path).exists():
+        _raise_stored_upload_exists(destination_file_path)
+
+    # The digest recorded when the temporary upload was created is the
+    # SHA-256 hash of its content so the file only needs to be read again
+    # for records created before the digest was recorded.
+    content_hash = (temp_upload.digest or
+                    _get_content_hash(temp_upload.get_file_path()))
+    su = _get_new_stored_upload(temp_upload, destination_file_path,
+                                content_hash)
+    with time_phase('store_db_write'):
+        su.save(force_insert=True)
 
     try:
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-        shutil.copy2(temp_upload.get_file_path(), target_file_path)
-        su.save()
+        with time_phase('store_local'):
+            _copy_to_content_store(temp_upload.get_file_path(),
+                                   file_path_base, su)
         temp_upload.delete()
-    except IOError as e:
+    except (IOError, OSError) as e:
         LOG.error('Error moving temporary file to permanent storage location')
+        su.delete()
         raise e
 
     return su
 
 
+def _raise_stored_upload_exists(destination_file_path):
+    LOG.error('Stored upload with specified name and path <%s> already '
+              'exists' % destination_file_path)
+    raise FileExistsError('The specified temporary file cannot be stored'
+                          ' to the specified location - file exists.')
+
+
+def _copy_to_content_store(source_file_path, file_path_base, su):
+    target_file_path = os.path.join(file_path_base,
+                                    get_content_path(su.content_hash))
+    if not os.path.exists(target_file_path):
+        target_dir = os.path.dirname(target_file_path)
+        if not os.path.exists(target_dir):
+            os.makedirs(target_dir)
+        # Copy to a temporary name and rename so that another request
+        # storing the same content never sees a partially written file.
+        tmp_file_path = '%s.%s' % (target_file_path, su.upload_id)
+        shutil.copy2(source_file_path, tmp_file_path)
+        os.rename(tmp_file_path, target_file_path)
+    else:
+        LOG.debug('Content for upload <%s> is already stored, not '
+                  'storing a new copy.' % su.upload_id)
+
+
+# os.replace is not available in Python 2, where os.rename replaces an
+# existing file on POSIX systems.
+_replace_file = getattr(os, 'replace', os.rename)
+
+
+def _get_content_hash(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CONTENT_HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
 def _store_upload_remote(destination_file_path, destination_file_name,
                          temp_upload):
     # Use the storage backend to write the file to the storage backend
@@ -184,13 +313,12 @@ def _store_upload_remote(destination_file_path, destination_file_name,
     su = None
     destination_file = os.path.join(destination_file_path, target_filename)
     try:
-        storage_backend.save(destination_file, temp_upload.file)
-        su = StoredUpload(upload_id=temp_upload.upload_id,
-                          file=destination_file,
-                          uploaded=temp_upload.uploaded,
-                          uploaded_by=temp_upload.uploaded_by)
-        su.save()
-        temp_upload.delete()
+        with time_phase('store_remote'):
+            get_storage_backend().save(destination_file, temp_upload.file)
+        su = _get_new_stored_upload(temp_upload, destination_file)
+        with time_phase('store_db_write'):
+            su.save(force_insert=True)
+            temp_upload.delete()
     except Exception as e:
         errorMsg = ('Error storing temporary upload to remote storage: [%s]'
                     % str(e))
@@ -207,64 +335,68 @@ def get_stored_upload(upload_id):
 
     upload_id: This function takes a 22-character unique ID assigned to the
     original upload of the requested file.
+
+    If DJANGO_DRF_FILEPOND_STORED_UPLOAD_CACHE is set, the result of the
+    lookup is cached. If DJANGO_DRF_FILEPOND_READ_REPLICA_DB is set, the
+    lookup is carried out on the read replica unless the record was written
+    recently.
     """
-    # If the parameter matched the upload ID format, we assume that it
-    # must be an upload ID and proceed accordingly. If the lookup of the
-    # record fails, then we have another go assuming a filename was
-    # instead provided.
+    return get_cached_stored_upload(
+        upload_id, lambda value: _get_stored_upload(value, get_read_db(value)))
+
+
+def _get_stored_upload(upload_id, using=None):
+    # If the parameter matches the upload ID format, we look for a record
+    # with either the upload ID or the file path matching the parameter in a
+    # single query, preferring a record matching the upload ID if there are
+    # records matching both. Otherwise we assume that a filename was
+    # provided.
 
     # NOTE: The API doesn't officially provide support for requesting stored
     # uploads by filename. This is retained here for backward compatibility
     # but it is DEPRECATED and will be removed in a future release.
-    param_filename = False
-
-    upload_id_fmt = re.compile('^([%s]){22}$'
-                               % (shortuuid.get_alphabet()))
-
-    if not upload_id_fmt.match(upload_id):
-        param_filename = True
+    if not _is_valid_upload_id(upload_id):
         LOG.debug('The provided string doesn\'t seem to be an '
                   'upload ID. Assuming it is a filename/path.')
-
-    if not param_filename:
         try:
-            su = StoredUpload.objects.get(upload_id=upload_id)
-        except StoredUpload.DoesNotExist:
-            LOG.debug('A StoredUpload with the provided ID doesn\'t '
-                      'exist. Assuming this could be a filename.')
-            param_filename = True
-
-    if param_filename:
-        # Try and lookup a StoredUpload record with the specified id
-        # as the file path
-        try:
-            su = StoredUpload.objects.get(file=upload_id)
+            return StoredUpload.objects.using(using).get(file=upload_id)
         except StoredUpload.DoesNotExist as e:
             LOG.debug('A StoredUpload with the provided file path '
                       'doesn\'t exist. Re-raising error')
             raise e
 
-    return su
+    return _select_stored_upload(
+        upload_id, list(_get_stored_upload_matches(upload_id, using)))
 
 
-def get_stored_upload_file_data(stored_upload):
-    """
-    Given a StoredUpload object, this function gets and returns the data of
-    the file associated with the StoredUpload instance.
+def _get_stored_upload_matches(upload_id, using=None):
+    # Get a queryset for the records, at most two, with either the upload ID
+    # or the file path matching upload_id.
+    return StoredUpload.objects.using(using).filter(
+        Q(upload_id=upload_id) | Q(file=upload_id))[:2]
 
-    This function provides an abstraction over the storage backend, accessing
-    the file data regardless of whether the file is stored on the local
-    filesystem or on some remote storage service, e.g. Amazon S3. Supported
-    storage backends are those supported by the django-storages library.
 
-    Returns a tuple (filename, data_bytes_io).
-        filename is a string containing the name of the stored file
-        data_bytes_io is a file-like BytesIO object containing the file data
-    """
-    # TODO: If the storage backend is not initialised, init now - this
-    # will be removed when this module is refactored into a class.
-    if not storage_backend_initialised:
-        _init_storage_backend()
+def _select_stored_upload(upload_id, matches):
+    # Select the result of a lookup from the list of matching records,
+    # preferring the record matching the upload ID.
+    for su in matches:
+        if su.upload_id == upload_id:
+            return su
+    if matches:
+        LOG.debug('A StoredUpload with the provided ID doesn\'t exist but '
+                  'the ID matches a file path.')
+        return matches[0]
+
+    LOG.debug('A StoredUpload with the provided ID or file path doesn\'t '
+              'exist.')
+    raise StoredUpload.DoesNotExist('StoredUpload matching query does not '
+                                    'exist.')
+
+
+def _get_stored_upload_file_path(stored_upload):
+    # Get the path of the file for the specified StoredUpload on the local
+    # file store or the remote storage backend, checking that it exists.
+    storage_backend = get_storage_backend()
     if storage_backend:
         LOG.debug('get_stored_upload_file_data: Using a remote storage '
                   'service: [%s]' % (type(storage_backend).__name__))
@@ -272,14 +404,12 @@ def get_stored_upload_file_data(stored_upload):
         file_path_base = ''
     else:
         LOG.debug('get_stored_upload_file_data: Using local storage backend.')
-        if ((not hasattr(local_settings, 'FILE_STORE_PATH')) or
-                (not local_settings.FILE_STORE_PATH) or
-                (not os.path.exists(local_settings.FILE_STORE_PATH)) or
-                (not os.path.isdir(local_settings.FILE_STORE_PATH))):
+        config = check_file_store()
+        if config.file_store_error:
             raise ConfigurationError('The file upload settings are not '
                                      'configured correctly.')
 
-        file_path_base = local_settings.FILE_STORE_PATH
+        file_path_base = config.file_store_path
         #  This code is redundant, this case will be picked up by the
         #  not local_settings.FILE_STORE_PATH in the above statement.
         #   if not file_path_base:
@@ -287,7 +417,8 @@ def get_stored_upload_file_data(stored_upload):
 
     # See if the stored file with the path specified in su exists
     # in the file store location
-    file_path = os.path.join(file_path_base, stored_upload.file.name)
+    file_path = os.path.join(file_path_base,
+                             stored_upload.get_stored_file_name())
     if storage_backend:
         if not storage_backend.exists(file_path):
             LOG.error('File [%s] for upload_id [%s] not found on remote '
@@ -295,7 +426,6 @@ def get_stored_upload_file_data(stored_upload):
             raise FileNotFoundError(
                 'File [%s] for upload_id [%s] not found on remote file '
                 'store.' % (file_path, stored_upload.upload_id))
-        file_data = stored_upload.file.read()
     else:
         if ((not os.path.exists(file_path)) or
                 (not os.path.isfile(file_path))):
@@ -303,14 +433,58 @@ def get_stored_upload_file_data(stored_upload):
                       % (file_path, stored_upload.upload_id))
             raise FileNotFoundError('File [%s] not found on local disk'
                                     % file_path)
+    return file_path
 
-        # We now know that the file exists locally and is not a directory
+
+def get_stored_upload_file_data(stored_upload):
+    """
+    Given a StoredUpload object, this function gets and returns the data of
+    the file associated with the StoredUpload instance.
+
+    This function provides an abstraction over the storage backend, accessing
+    the file data regardless of whether the file is stored on the local
+    filesystem or on some remote storage service, e.g. Amazon S3. Supported
+    storage backends are those supported by the django-storages library.
+
+    Returns a tuple (filename, data_bytes_io).
+        filename is a string containing the name of the stored file
+        data_bytes_io is a file-like BytesIO object containing the file data
+    """
+    file_path = _get_stored_upload_file_path(stored_upload)
+    # We now know that the file exists and, if stored locally, is not a
+    # directory
+    if (not get_storage_backend()) and stored_upload.content_hash:
+        with open(file_path, 'rb') as f:
+            file_data = f.read()
+    else:
         file_data = stored_upload.file.read()
 
     filename = os.path.basename(stored_upload.file.name)
     return (filename, file_data)
 
 
+def open_stored_upload_file(stored_upload):
+    """
+    Given a StoredUpload object, open the file associated with the
+    StoredUpload instance so that its data can be read in blocks rather than
+    being loaded into memory in one go, e.g. to stream it to a client.
+
+    Returns a tuple (filename, file_obj).
+        filename is a string containing the name of the stored file
+        file_obj is a file object opened in binary mode that the caller
+        is responsible for closing
+    """
+    file_path = _get_stored_upload_file_path(stored_upload)
+    storage_backend = get_storage_backend()
+    if storage_backend:
+        file_obj = storage_backend.open(file_path, 'rb')
+    else:
+        file_obj = open(file_path, 'rb')
+
+    filename = os.path.basename(stored_upload.file.name)
+    return (filename, file_obj)
+
+
 def delete_stored_upload(upload_id, delete_file=False):
     """
     Delete the specified stored upload AND IF delete_file=True ALSO
@@ -320,8 +494,10 @@ def delete_stored_upload(upload_id, delete_file=False):
     is made explicit that the stored file associated with the upload will be
     permanently deleted.
     """
+    # The record is looked up without using the cache or a read replica
+    # since it is about to be deleted.
     try:
-        su = get_stored_upload(upload_id)
+        su = _get_stored_upload(upload_id)
     except StoredUpload.DoesNotExist as e:
         LOG.error('No stored upload found with the specified ID [%s].'
                   % (upload_id))
@@ -331,33 +507,84 @@ def delete_stored_upload(upload_id, delete_file=False):
     upload_id = su.upload_id
 
     su.delete()
+    # The post_delete signal handler also does this but the cached entries
+    # must be removed even if signal handlers have been disconnected.
+    invalidate_stored_upload(upload_id, su.file.name)
 
     if not delete_file:
         return True
 
+    if su.content_hash:
+        _delete_content_store_file(su, upload_id)
+    else:
+        _delete_stored_upload_file(su, upload_id)
+    return True
+
+
+def _content_hash_referenced(content_hash):
+    return StoredUpload.objects.filter(content_hash=content_hash).exists()
+
+
+def _delete_content_store_file(stored_upload, upload_id):
+    # Remove the file in the content-addressed store for a deleted
+    # StoredUpload unless other stored uploads share its content. A
+    # concurrent store of the same content saves its record and then skips
+    # copying the content if the file exists, so checking the references
+    # and then removing the file could leave the new record without a file.
+    # Instead, the file is renamed to a tombstone name, so that a store
+    # from this point on writes a new copy, and the references are checked
+    # again. The tombstone is only removed if there are still no
+    # references, otherwise it is restored.
+    if _content_hash_referenced(stored_upload.content_hash):
+        LOG.debug('Stored file for upload <%s> is shared with other stored '
+                  'uploads, not removing file.' % upload_id)
+        return
+
+    config = check_file_store()
+    if config.file_store_error:
+        raise ConfigurationError('The file upload settings are not '
+                                 'configured correctly.')
+    file_path = os.path.join(config.file_store_path,
+                             stored_upload.get_stored_file_name())
+    tombstone_path = '%s.deleted.%s' % (file_path, upload_id)
+    if not os.path.isfile(file_path):
+        LOG.error('File [%s] for stored upload [%s] not found on '
+                  'local disk' % (file_path, upload_id))
+        raise FileNotFoundError('File [%s] to delete was not found on '
+                                'the local disk' % file_path)
+    os.rename(file_path, tombstone_path)
+
+    if _content_hash_referenced(stored_upload.content_hash):
+        LOG.debug('Stored file for upload <%s> was referenced by a new '
+                  'stored upload, restoring file.' % upload_id)
+        # A store that ran after the rename may have written a new copy of
+        # the same content, which the restored file replaces.
+        _replace_file(tombstone_path, file_path)
+        return
+    os.remove(tombstone_path)
+
+
+def _delete_stored_upload_file(stored_upload, upload_id):
+    # Remove the file for a deleted StoredUpload from the local file store
+    # or the remote storage backend.
     # If we got the stored file record and delete_file is True, make sure
     # that the storage backend is set up and we have access to it.
-    # TODO: If the storage backend is not initialised, init now - this
-    # will be removed when this module is refactored into a class.
-    if not storage_backend_initialised:
-        _init_storage_backend()
-
+    storage_backend = get_storage_backend()
     if storage_backend:
         LOG.debug('delete_stored_upload: Using a remote storage '
                   'service: [%s]' % (type(storage_backend).__name__))
         file_path_base = ''
     else:
         LOG.debug('delete_stored_upload: Using local storage backend.')
-        if ((not hasattr(local_settings, 'FILE_STORE_PATH')) or
-                (not local_settings.FILE_STORE_PATH) or
-                (not os.path.exists(local_settings.FILE_STORE_PATH)) or
-                (not os.path.isdir(local_settings.FILE_STORE_PATH))):
+        config = check_file_store()
+        if config.file_store_error:
             raise ConfigurationError('The file upload settings are not '
                                      'configured correctly.')
 
-        file_path_base = local_settings.FILE_STORE_PATH
+        file_path_base = config.file_store_path
 
-    file_path = os.path.join(file_path_base, su.file.name)
+    file_path = os.path.join(file_path_base,
+                             stored_upload.get_stored_file_name())
     if storage_backend:
         if not storage_backend.exists(file_path):
             LOG.error('Stored upload file [%s] with upload_id [%s] is not '
@@ -385,4 +612,86 @@ def delete_stored_upload(upload_id, delete_file=False):
         # TODO: Need to look at how best to delete directories that may have
         # been created to store the file. For now, we just delete the file.
 
-    return True
+
+def delete_temp_uploads(uploads, max_workers=8):
+    """
+    Delete the specified temporary uploads AND THEIR FILES.
+
+    uploads may be a QuerySet of TemporaryUpload objects or an iterable of
+    upload IDs. Unlike calling delete() on a QuerySet, which loads every
+    record and removes its files serially in the post_delete signal handler,
+    records are handled in batches. For each batch, the file paths are
+    obtained in a single query, the records are removed with a single bulk
+    delete and the files (and, if DELETE_UPLOAD_TMP_DIRS is set, their
+    directories) are then removed concurrently using max_workers threads.
+    The post_delete signal is not sent for the deleted records.
+
+    Returns the number of temporary uploads deleted.
+    """
+    if isinstance(uploads, (text_type, binary_type)):
+        raise ValueError('uploads must be a QuerySet or an iterable of '
+                         'upload IDs, not a single upload ID.')
+    deleted = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch in _iter_temp_upload_batches(uploads):
+            _delete_temp_upload_batch(batch, executor)
+            deleted += len(batch)
+    return deleted
+
+
+def _iter_temp_upload_batches(uploads, batch_size=None):
+    # Yield lists of (upload_id, file_name) tuples for the specified
+    # uploads. Batches from a QuerySet are obtained using keyset pagination
+    # on the primary key so that deleting records between batches is safe.
+    batch_size = batch_size or TEMP_UPLOAD_DELETE_BATCH_SIZE
+    if isinstance(uploads, QuerySet):
+        for batch in _iter_keyset_batches(uploads, ('file',), batch_size):
+            yield batch
+    else:
+        upload_ids = list(uploads)
+        for i in range(0, len(upload_ids), batch_size):
+            batch = list(TemporaryUpload.objects.filter(
+                upload_id__in=upload_ids[i:i+batch_size]).values_list(
+                    'upload_id', 'file'))
+            if batch:
+                yield batch
+
+
+def _delete_temp_upload_batch(batch, executor):
+    # Delete the records for a batch of (upload_id, file_name) tuples and
+    # then remove their files. Returns the number of files removed. The
+    # records are removed with a single DELETE query rather than delete(),
+    # which loads every record to send the post_delete signal for it.
+    # TemporaryUpload has no reverse relations so no cascades are missed.
+    queryset = TemporaryUpload.objects.filter(
+        upload_id__in=[upload_id for (upload_id, _) in batch])
+    queryset._raw_delete(queryset.db)
+    return sum(executor.map(_remove_temp_upload_files, batch))
+
+
+def _remove_temp_upload_files(upload):
+    # Remove the file for a TemporaryUpload and, if DELETE_UPLOAD_TMP_DIRS
+    # is set, the directory containing it. Returns the number of files
+    # removed.
+    (upload_id, file_name) = upload
+    removed = 0
+    if file_name:
+        file_dir = os.path.dirname(os.path.join(storage.location, file_name))
+        file_path = os.path.join(storage.location, file_name)
+        try:
+            os.remove(file_path)
+            removed += 1
+        except OSError as e:
+            LOG.debug('Unable to remove temporary upload file <%s>: %s'
+                      % (file_path, str(e)))
+
+    else:
+        file_dir = os.path.join(storage.location, get_upload_dir(upload_id))
+
+    if local_settings.DELETE_UPLOAD_TMP_DIRS:
+        try:
+            os.rmdir(file_dir)
+        except OSError as e:
+            LOG.debug('Unable to remove temporary upload dir for <%s>: %s'
+                      % (upload_id, str(e)))
+    return removed
@@ -1,6 +1,5 @@
 from django.apps import AppConfig
 
-import importlib
 import os
 import logging
 import django_drf_filepond.drf_filepond_settings as local_settings
@@ -14,6 +13,13 @@ class DjangoDrfFilepondConfig(AppConfig):
     verbose_name = 'FilePond Server-side API'
 
     def ready(self):
+        # Connect the signal handlers that invalidate cached StoredUpload
+        # lookups
+        import django_drf_filepond.cache_utils  # noqa: F401
+        # Connect the signal handlers that record recent writes for read
+        # replica routing
+        import django_drf_filepond.db_utils  # noqa: F401
+
         # Get BASE_DIR and process to ensure it works across platforms
         # Handle py3.5 where pathlib exists but os.path.join can't accept a
         # pathlib object (ensure we always pass a string to os.path.join)
@@ -49,14 +55,6 @@ class DjangoDrfFilepondConfig(AppConfig):
         if storage_class:
             LOG.info('Using django-storages with backend [%s]'
                      % storage_class)
-            (modname, clname) = storage_class.rsplit('.', 1)
-            # Either the module import or the getattr to instantiate the
-            # class will throw an exception if there's a problem
-            # creating storage backend instance due to missing configuration
-            # or dependencies.
-            mod = importlib.import_module(modname)
-            getattr(mod, clname)()
-            LOG.info('Storage backend [%s] is available...' % storage_class)
         else:
             LOG.info('App init: no django-storages backend configured, '
                      'using default (local) storage backend if set, '
@@ -81,3 +79,13 @@ class DjangoDrfFilepondConfig(AppConfig):
                     'You are using local file storage so you must set the '
                     'base file storage path using %sFILE_STORE_PATH'
                     % local_settings._app_prefix)
+
+        # Build the configuration snapshot used by the views and API
+        # functions. This creates the storage backend instance so either
+        # the module import or the instantiation of the class will throw
+        # an exception if there's a problem creating the storage backend
+        # due to missing configuration or dependencies.
+        from django_drf_filepond import api
+        api._init_storage_backend()
+        if storage_class:
+            LOG.info('Storage backend [%s] is available...' % storage_class)
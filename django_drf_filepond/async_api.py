@@ -0,0 +1,277 @@
+# Asynchronous versions of the API functions in django_drf_filepond.api for
+# use from asynchronous code, e.g. the views in
+# django_drf_filepond.async_views or an application's own async views.
+#
+# astore_upload: store a temporary upload to permanent storage.
+#
+# aget_stored_upload / aget_stored_upload_file_data: get a stored upload
+#                                                    and its file data.
+#
+# adelete_stored_upload: delete a stored upload and, optionally, its file.
+#
+# Calling the synchronous functions from asynchronous code requires wrapping
+# them with asgiref's sync_to_async which, by default, runs them one at a
+# time in a single thread. These functions use Django's asynchronous ORM
+# interface for database operations and cache operations and carry out
+# blocking file and storage backend I/O in separate worker threads so that
+# the I/O for several uploads, e.g. uploads being stored concurrently using
+# asyncio.gather, is carried out concurrently. Note that, as of Django 5.x,
+# the asynchronous ORM interface still runs queries in the thread shared by
+# sync_to_async's thread-sensitive mode.
+#
+# These functions require Django 4.2 or later.
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import _check_local_target_file, \
+    _check_store_upload_args, _copy_to_content_store, \
+    _copy_to_local_store, _delete_content_store_file, \
+    _delete_stored_upload_file, _get_content_hash, \
+    _get_local_store_paths, _get_new_stored_upload, \
+    _get_stored_upload_matches, _raise_stored_upload_exists, \
+    _select_stored_upload, _split_destination_file_path, \
+    get_stored_upload_file_data, open_stored_upload_file
+from django_drf_filepond.cache_utils import _NOT_FOUND, _get_cache, \
+    _get_cache_values, _get_cached_result, _get_lookup_key, \
+    _get_record_keys
+from django_drf_filepond.db_utils import _get_pin_cache, _get_pin_key, \
+    _select_read_db
+from django_drf_filepond.metrics import time_phase
+from django_drf_filepond.models import StoredUpload, TemporaryUpload
+from django_drf_filepond.storage_utils import get_storage_backend
+from django_drf_filepond.tracing import trace_span
+from django_drf_filepond.utils import _is_valid_upload_id
+
+LOG = logging.getLogger(__name__)
+
+
+def _run_in_thread(func, *args):
+    # Run blocking file or storage backend I/O in a worker thread of its own
+    # rather than in the thread shared by sync_to_async's thread-sensitive
+    # mode. The functions run this way must not access the database.
+    return sync_to_async(func, thread_sensitive=False)(*args)
+
+
+async def astore_upload(upload_id, destination_file_path):
+    """
+    The asynchronous version of api.store_upload. Stores the temporary
+    upload with the specified upload_id to destination_file_path and returns
+    the StoredUpload object created.
+    """
+    # Checking the arguments may build the configuration snapshot and
+    # create the storage backend so it doesn't run on the event loop.
+    await _run_in_thread(_check_store_upload_args, upload_id,
+                         destination_file_path)
+
+    storage_backend = get_storage_backend()
+    with trace_span('filepond.store_upload', upload_id,
+                    remote=bool(storage_backend)):
+        try:
+            tu = await TemporaryUpload.objects.aget(upload_id=upload_id)
+        except TemporaryUpload.DoesNotExist:
+            raise ValueError(
+                'Record for the specified upload_id doesn\'t exist')
+
+        (destination_path, destination_name) = \
+            _split_destination_file_path(destination_file_path)
+        if storage_backend:
+            return await _astore_upload_remote(destination_path,
+                                               destination_name, tu)
+        else:
+            return await _astore_upload_local(destination_path,
+                                              destination_name, tu)
+
+
+async def _astore_upload_local(destination_file_path, destination_file_name,
+                               temp_upload):
+    (file_path_base, destination_file_path, target_file_path) = \
+        _get_local_store_paths(destination_file_path, destination_file_name,
+                               temp_upload)
+
+    if local_settings.FILE_STORE_CONTENT_ADDRESSED:
+        return await _astore_upload_content_addressed(
+            file_path_base, destination_file_path, temp_upload)
+
+    # Check we're not about to overwrite anything
+    await _run_in_thread(_check_local_target_file, target_file_path)
+
+    su = _get_new_stored_upload(temp_upload, destination_file_path)
+    try:
+        with time_phase('store_local'):
+            await _run_in_thread(_copy_to_local_store,
+                                 temp_upload.get_file_path(),
+                                 target_file_path)
+        with time_phase('store_db_write'):
+            await su.asave(force_insert=True)
+            await temp_upload.adelete()
+    except IOError as e:
+        LOG.error('Error moving temporary file to permanent storage location')
+        raise e
+
+    return su
+
+
+async def _astore_upload_content_addressed(
+        file_path_base, destination_file_path, temp_upload):
+    # See api._store_upload_content_addressed, the record is saved before
+    # the content is copied to the content store.
+    if await StoredUpload.objects.filter(
+            file=destination_file_path).aexists():
+        _raise_stored_upload_exists(destination_file_path)
+
+    content_hash = temp_upload.digest
+    if not content_hash:
+        content_hash = await _run_in_thread(_get_content_hash,
+                                            temp_upload.get_file_path())
+    su = _get_new_stored_upload(temp_upload, destination_file_path,
+                                content_hash)
+    with time_phase('store_db_write'):
+        await su.asave(force_insert=True)
+
+    try:
+        with time_phase('store_local'):
+            await _run_in_thread(_copy_to_content_store,
+                                 temp_upload.get_file_path(), file_path_base,
+                                 su)
+        await temp_upload.adelete()
+    except (IOError, OSError) as e:
+        LOG.error('Error moving temporary file to permanent storage location')
+        await su.adelete()
+        raise e
+
+    return su
+
+
+async def _astore_upload_remote(destination_file_path, destination_file_name,
+                                temp_upload):
+    # Use the storage backend to write the file to the storage backend
+    target_filename = destination_file_name
+    if not target_filename:
+        target_filename = temp_upload.upload_name
+
+    su = None
+    destination_file = os.path.join(destination_file_path, target_filename)
+    try:
+        with time_phase('store_remote'):
+            await _run_in_thread(get_storage_backend().save,
+                                 destination_file, temp_upload.file)
+        su = _get_new_stored_upload(temp_upload, destination_file)
+        with time_phase('store_db_write'):
+            await su.asave(force_insert=True)
+            await temp_upload.adelete()
+    except Exception as e:
+        errorMsg = ('Error storing temporary upload to remote storage: [%s]'
+                    % str(e))
+        LOG.error(errorMsg)
+        raise e
+
+    return su
+
+
+async def aget_stored_upload(upload_id):
+    """
+    The asynchronous version of api.get_stored_upload. Gets the
+    StoredUpload with the specified upload ID using the stored upload cache
+    and the read replica database if they are configured.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return await _aget_stored_upload(upload_id,
+                                         await _aget_read_db(upload_id))
+
+    # See cache_utils.get_cached_stored_upload
+    key = _get_lookup_key(upload_id)
+    su = _get_cached_result(await cache.aget(key))
+    if su is not None:
+        return su
+
+    try:
+        su = await _aget_stored_upload(upload_id,
+                                       await _aget_read_db(upload_id))
+    except StoredUpload.DoesNotExist:
+        await cache.aset(key, _NOT_FOUND,
+                         local_settings.STORED_UPLOAD_CACHE_NEGATIVE_TIMEOUT)
+        raise
+
+    await cache.aset_many(_get_cache_values(su),
+                          local_settings.STORED_UPLOAD_CACHE_TIMEOUT)
+    return su
+
+
+async def _aget_read_db(value):
+    # See db_utils.get_read_db
+    if not local_settings.READ_REPLICA_DB:
+        return None
+    return _select_read_db(
+        value, await _get_pin_cache().aget(_get_pin_key(value)))
+
+
+async def _aget_stored_upload(upload_id, using=None):
+    # See api._get_stored_upload, the deprecated lookup by file path is
+    # also supported here.
+    if not _is_valid_upload_id(upload_id):
+        LOG.debug('The provided string doesn\'t seem to be an '
+                  'upload ID. Assuming it is a filename/path.')
+        return await StoredUpload.objects.using(using).aget(file=upload_id)
+
+    matches = []
+    async for su in _get_stored_upload_matches(upload_id, using):
+        matches.append(su)
+    return _select_stored_upload(upload_id, matches)
+
+
+async def aget_stored_upload_file_data(stored_upload):
+    """
+    The asynchronous version of api.get_stored_upload_file_data. Returns a
+    tuple (filename, data) containing the name of the stored file and its
+    data.
+    """
+    return await _run_in_thread(get_stored_upload_file_data, stored_upload)
+
+
+async def aopen_stored_upload_file(stored_upload):
+    """
+    The asynchronous version of api.open_stored_upload_file. Returns a tuple
+    (filename, file_obj) where file_obj is a file object, opened in binary
+    mode, that the caller is responsible for closing.
+    """
+    return await _run_in_thread(open_stored_upload_file, stored_upload)
+
+
+async def adelete_stored_upload(upload_id, delete_file=False):
+    """
+    The asynchronous version of api.delete_stored_upload. Deletes the
+    specified stored upload AND IF delete_file=True ALSO PERMANENTLY DELETES
+    THE FILE ASSOCIATED WITH THE UPLOAD.
+    """
+    # The record is looked up without using the cache or a read replica
+    # since it is about to be deleted.
+    try:
+        su = await _aget_stored_upload(upload_id)
+    except StoredUpload.DoesNotExist as e:
+        LOG.error('No stored upload found with the specified ID [%s].'
+                  % (upload_id))
+        raise e
+
+    upload_id = su.upload_id
+
+    await su.adelete()
+    # The post_delete signal handler also does this but the cached entries
+    # must be removed even if signal handlers have been disconnected.
+    cache = _get_cache()
+    if cache is not None:
+        await cache.adelete_many(_get_record_keys(upload_id, su.file.name))
+
+    if not delete_file:
+        return True
+
+    if su.content_hash:
+        # This checks the references to the content in the database so it
+        # runs in the thread used for database access.
+        await sync_to_async(_delete_content_store_file)(su, upload_id)
+    else:
+        await _run_in_thread(_delete_stored_upload_file, su, upload_id)
+    return True
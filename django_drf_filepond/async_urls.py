@@ -0,0 +1,29 @@
+"""FilePond server-side URL configuration using the asynchronous views
+
+This provides the same endpoints, with the same URL names, as
+django_drf_filepond.urls but uses the views in
+django_drf_filepond.async_views. To switch between the synchronous and
+asynchronous views, include either django_drf_filepond.urls or
+django_drf_filepond.async_urls in your URL configuration, e.g.:
+
+    path('fp/', include('django_drf_filepond.async_urls'))
+
+The asynchronous views require Django 4.2 or later and should be used when
+running under an ASGI server.
+"""
+from django.urls import re_path, path
+from django_drf_filepond.async_views import AsyncProcessView, \
+    AsyncRevertView, AsyncLoadView, AsyncRestoreView, AsyncFetchView, \
+    AsyncPatchView, AsyncFetchStatusView
+
+urlpatterns = [
+    path('process/', AsyncProcessView.as_view(), name='process'),
+    re_path(r'^patch/(?P<chunk_id>[0-9a-zA-Z]{22})$',
+            AsyncPatchView.as_view(), name='patch'),
+    path('revert/', AsyncRevertView.as_view(), name='revert'),
+    path('load/', AsyncLoadView.as_view(), name='load'),
+    path('restore/', AsyncRestoreView.as_view(), name='restore'),
+    path('fetch/', AsyncFetchView.as_view(), name='fetch'),
+    path('fetch/status/', AsyncFetchStatusView.as_view(),
+         name='fetch_status')
+]
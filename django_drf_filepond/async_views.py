@@ -0,0 +1,441 @@
+# Asynchronous versions of the filepond endpoints for use when running
+# under an ASGI server. These can be used in place of the views in
+# django_drf_filepond.views by including django_drf_filepond.async_urls
+# instead of django_drf_filepond.urls in your URL configuration.
+#
+# DRF's APIView doesn't support asynchronous handlers so these views are
+# based on Django's View class. They use DRF's Request class so the same
+# parsers, authentication and permission classes, and upload handlers, are
+# used by both sets of views. Under ASGI, Django receives the request body
+# incrementally and spools large bodies to a temporary file before the view
+# is called. Parsing the body, writing files and other blocking work is
+# carried out in worker threads using asgiref's sync_to_async, database
+# lookups use Django's asynchronous ORM interface and file data is streamed
+# back to the client in blocks.
+#
+# These views require Django 4.2 or later.
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed, \
+    HttpResponseNotFound, HttpResponseServerError, JsonResponse, \
+    StreamingHttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.exceptions import APIException, NotFound, ParseError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.async_api import aget_stored_upload, \
+    aopen_stored_upload_file
+from django_drf_filepond.config import get_config
+from django_drf_filepond.db_utils import get_read_db
+from django_drf_filepond.exceptions import ConfigurationError
+from django_drf_filepond.metrics import start_request_metrics
+from django_drf_filepond.models import TemporaryUpload, StoredUpload, \
+    TemporaryUploadFetch
+from django_drf_filepond.parsers import PlainTextParser, UploadChunkParser
+from django_drf_filepond.uploaders import FilepondFileUploader
+from django_drf_filepond.utils import _get_file_id, _get_user, \
+    _is_valid_upload_id
+from django_drf_filepond.views import LOAD_RESTORE_PARAM_NAME, FetchView, \
+    _get_content_type, _get_http_response, _get_not_modified_response, \
+    _import_permission_classes, _set_file_metadata_headers
+
+LOG = logging.getLogger(__name__)
+
+# The size of the blocks in which file data is streamed to the client
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def _get_text_response(text, status_code):
+    return HttpResponse(text, status=status_code, content_type='text/plain')
+
+
+def _get_file_size(file_obj):
+    size = getattr(file_obj, 'size', None)
+    if size is None:
+        size = os.fstat(file_obj.fileno()).st_size
+    return size
+
+
+async def _iter_file(file_obj, block_size=STREAM_BLOCK_SIZE):
+    # Read the file in a worker thread, one block at a time, closing it once
+    # all the data has been sent or the client has disconnected.
+    read = sync_to_async(file_obj.read, thread_sensitive=False)
+    try:
+        while True:
+            data = await read(block_size)
+            if not data:
+                break
+            yield data
+    finally:
+        await sync_to_async(file_obj.close, thread_sensitive=False)()
+
+
+class AsyncFilepondView(View):
+    '''
+    The base class for the asynchronous views. Requests are wrapped in a
+    DRF Request using the parser_classes set on the view and DRF's default
+    authentication classes, and the permission_classes set on the view are
+    checked before the handler for the request method is called. A DRF
+    APIException raised while handling a request results in an error
+    response in the same form as the one returned by DRF.
+    '''
+    parser_classes = ()
+    permission_classes = []
+    metrics_endpoint = None
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # As with DRF's APIView, CSRF checks are left to the authentication
+        # classes, SessionAuthentication enforces them.
+        view = super(AsyncFilepondView, cls).as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = None
+        if request.method.lower() in self.http_method_names:
+            handler = getattr(self, request.method.lower(), None)
+        if handler is None:
+            LOG.warning('Method Not Allowed (%s): %s'
+                        % (request.method, request.path))
+            return HttpResponseNotAllowed(self._allowed_methods())
+
+        request_metrics = start_request_metrics(self.metrics_endpoint,
+                                                request)
+        response = None
+        try:
+            response = await self._handle(handler, request, *args, **kwargs)
+            return response
+        finally:
+            if request_metrics is not None:
+                request_metrics.finish(response)
+
+    async def _handle(self, handler, request, *args, **kwargs):
+        drf_request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[auth() for auth in
+                            api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            # Authentication takes place when the permissions are checked
+            # and may need to access the database.
+            await sync_to_async(self.check_permissions)(drf_request)
+            return await handler(drf_request, *args, **kwargs)
+        except APIException as e:
+            return self._get_error_response(drf_request, e)
+
+    def check_permissions(self, request):
+        for permission in [perm() for perm in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if (request.authenticators and
+                        not request.successful_authenticator):
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(
+                    getattr(permission, 'message', None))
+
+    def _get_error_response(self, request, exc):
+        auth_header = None
+        if isinstance(exc, (exceptions.NotAuthenticated,
+                            exceptions.AuthenticationFailed)):
+            if request.authenticators:
+                auth_header = request.authenticators[0].authenticate_header(
+                    request)
+            if not auth_header:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+
+        detail = exc.detail
+        if not isinstance(detail, (list, dict)):
+            detail = {'detail': detail}
+        response = JsonResponse(detail, status=exc.status_code, safe=False)
+        if auth_header:
+            response['WWW-Authenticate'] = auth_header
+        return response
+
+
+class AsyncProcessView(AsyncFilepondView):
+    '''
+    The asynchronous version of ProcessView. The multipart request body is
+    parsed and the upload is stored in a worker thread.
+    '''
+    parser_classes = (MultiPartParser,)
+    permission_classes = _import_permission_classes('POST_PROCESS')
+    metrics_endpoint = 'process'
+
+    async def post(self, request):
+        LOG.debug('Filepond API: Async process view POST called...')
+
+        upload_tmp_error = get_config().upload_tmp_error
+        if upload_tmp_error:
+            return _get_text_response(
+                upload_tmp_error, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        file_id = _get_file_id()
+        upload_id = _get_file_id()
+        response = await sync_to_async(self._handle_upload)(
+            request, file_id, upload_id)
+        return _get_http_response(response)
+
+    def _handle_upload(self, request, file_id, upload_id):
+        uploader = FilepondFileUploader.get_uploader(request)
+        return uploader.handle_upload(request, file_id, upload_id)
+
+
+class AsyncPatchView(AsyncFilepondView):
+    '''
+    The asynchronous version of PatchView. Each chunk is stored in a worker
+    thread.
+    '''
+    parser_classes = (UploadChunkParser,)
+    permission_classes = _import_permission_classes('PATCH_PATCH')
+    metrics_endpoint = 'patch'
+
+    async def patch(self, request, chunk_id):
+        LOG.debug('Filepond API: Async patch view PATCH called...')
+        response = await sync_to_async(self._handle_upload)(request, chunk_id)
+        return _get_http_response(response)
+
+    async def head(self, request, chunk_id):
+        LOG.debug('Filepond API: Async patch view HEAD called...')
+        response = await sync_to_async(self._handle_upload)(request, chunk_id)
+        return _get_http_response(response)
+
+    def _handle_upload(self, request, chunk_id):
+        uploader = FilepondFileUploader.get_uploader(request)
+        return uploader.handle_upload(request, chunk_id)
+
+
+class AsyncRevertView(AsyncFilepondView):
+    '''
+    The asynchronous version of RevertView.
+    '''
+    parser_classes = (PlainTextParser,)
+    permission_classes = _import_permission_classes('DELETE_REVERT')
+    metrics_endpoint = 'revert'
+
+    async def delete(self, request):
+        LOG.debug('Filepond API: Async revert view DELETE called...')
+        request_data = await sync_to_async(lambda: request.data)()
+        if isinstance(request_data, bytes):
+            request_data = request_data.decode('utf-8')
+
+        upload_id = request_data.strip()
+        if len(upload_id) != 22:
+            raise ParseError('The provided data is invalid.')
+
+        try:
+            tu = await TemporaryUpload.objects.aget(upload_id=upload_id)
+        except TemporaryUpload.DoesNotExist:
+            raise NotFound('The specified file does not exist.')
+        LOG.debug('About to delete temporary upload <%s> with original '
+                  'filename <%s>' % (tu.upload_id, tu.upload_name))
+        # Deleting the record also removes the file and its directory
+        await sync_to_async(tu.delete)()
+
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+
+class AsyncLoadView(AsyncFilepondView):
+    '''
+    The asynchronous version of LoadView. The file data is streamed to the
+    client rather than being loaded into memory.
+    '''
+    permission_classes = _import_permission_classes('GET_LOAD')
+    metrics_endpoint = 'load'
+
+    async def get(self, request):
+        LOG.debug('Filepond API: Async load view GET called...')
+
+        if LOAD_RESTORE_PARAM_NAME not in request.GET:
+            return _get_text_response('A required parameter is missing.',
+                                      status.HTTP_400_BAD_REQUEST)
+
+        upload_id = request.GET[LOAD_RESTORE_PARAM_NAME]
+        if not upload_id:
+            return _get_text_response('An invalid ID has been provided.',
+                                      status.HTTP_400_BAD_REQUEST)
+
+        try:
+            su = await aget_stored_upload(upload_id)
+        except StoredUpload.DoesNotExist as e:
+            LOG.error('StoredUpload with ID [%s] not found: [%s]'
+                      % (upload_id, str(e)))
+            return _get_text_response('Not found',
+                                      status.HTTP_404_NOT_FOUND)
+
+        not_modified = _get_not_modified_response(request, su)
+        if not_modified:
+            return not_modified
+
+        try:
+            (filename, file_obj) = await aopen_stored_upload_file(su)
+            length = su.size
+            if length is None:
+                length = await sync_to_async(
+                    _get_file_size, thread_sensitive=False)(file_obj)
+        except ConfigurationError as e:
+            LOG.error('Error getting file upload: [%s]' % str(e))
+            return HttpResponseServerError('The file upload settings are '
+                                           'not configured correctly.')
+        except FileNotFoundError:
+            return HttpResponseNotFound('Error accessing file, not found.')
+        except IOError:
+            return HttpResponseServerError('Error reading file...')
+
+        ct = su.content_type or _get_content_type(filename)
+        response = StreamingHttpResponse(_iter_file(file_obj),
+                                         content_type=ct)
+        response['Content-Disposition'] = ('inline; filename=%s' %
+                                           filename)
+        _set_file_metadata_headers(response, su, length)
+        return response
+
+
+class AsyncRestoreView(AsyncFilepondView):
+    '''
+    The asynchronous version of RestoreView. The file data is streamed to
+    the client rather than being loaded into memory.
+    '''
+    permission_classes = _import_permission_classes('GET_RESTORE')
+    metrics_endpoint = 'restore'
+
+    async def get(self, request):
+        LOG.debug('Filepond API: Async restore view GET called...')
+        if LOAD_RESTORE_PARAM_NAME not in request.GET:
+            return _get_text_response('A required parameter is missing.',
+                                      status.HTTP_400_BAD_REQUEST)
+
+        upload_id = request.GET[LOAD_RESTORE_PARAM_NAME]
+        if not _is_valid_upload_id(upload_id):
+            return _get_text_response('An invalid ID has been provided.',
+                                      status.HTTP_400_BAD_REQUEST)
+
+        LOG.debug('Carrying out restore for file ID <%s>' % upload_id)
+        read_db = await sync_to_async(get_read_db)(upload_id)
+        try:
+            tu = await TemporaryUpload.objects.using(read_db).aget(
+                upload_id=upload_id)
+        except TemporaryUpload.DoesNotExist:
+            return _get_text_response('Not found',
+                                      status.HTTP_404_NOT_FOUND)
+
+        not_modified = _get_not_modified_response(request, tu)
+        if not_modified:
+            return not_modified
+
+        try:
+            file_obj = await sync_to_async(open, thread_sensitive=False)(
+                tu.file.path, 'rb')
+            length = tu.size
+            if length is None:
+                length = await sync_to_async(
+                    _get_file_size, thread_sensitive=False)(file_obj)
+        except IOError as e:
+            LOG.error('Error reading requested file: %s' % str(e))
+            return _get_text_response('Error reading file data...',
+                                      status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        upload_file_name = tu.upload_name
+        ct = tu.content_type or _get_content_type(upload_file_name)
+        response = StreamingHttpResponse(_iter_file(file_obj),
+                                         content_type=ct)
+        response['Content-Disposition'] = ('inline; filename=%s' %
+                                           upload_file_name)
+        _set_file_metadata_headers(response, tu, length)
+        return response
+
+
+class AsyncFetchView(AsyncFilepondView):
+    '''
+    The asynchronous version of FetchView. The remote file is downloaded in
+    a worker thread, using the same helper methods as FetchView.
+    '''
+    permission_classes = _import_permission_classes('GET_FETCH')
+    metrics_endpoint = 'fetch'
+
+    async def _process_request(self, request):
+        # Downloads don't access the database so they can run in any thread
+        # rather than the thread shared with the other synchronous code.
+        return await sync_to_async(FetchView()._process_request,
+                                   thread_sensitive=False)(request)
+
+    async def head(self, request):
+        LOG.debug('Filepond API: Async fetch view HEAD called...')
+        fetch_view = FetchView()
+        if local_settings.FETCH_ASYNC:
+            return _get_http_response(await sync_to_async(
+                fetch_view._register_fetch_job)(request))
+
+        result = await self._process_request(request)
+        if isinstance(result, Response):
+            return _get_http_response(result)
+        (buf, file_id, upload_file_name, content_type) = result
+
+        (upload_id, file_size) = await sync_to_async(
+            fetch_view._store_fetched_file)(
+                request, buf, file_id, upload_file_name, content_type)
+
+        response = HttpResponse(status=status.HTTP_200_OK,
+                                content_type=content_type)
+        response['Content-Length'] = file_size
+        response['X-Content-Transfer-Id'] = upload_id
+        response['Content-Disposition'] = ('inline; filename=%s' %
+                                           upload_file_name)
+        return response
+
+    async def get(self, request):
+        LOG.debug('Filepond API: Async fetch view GET called...')
+        result = await self._process_request(request)
+        if isinstance(result, Response):
+            return _get_http_response(result)
+        (buf, _, upload_file_name, content_type) = result
+        response = HttpResponse(buf.getvalue(), content_type=content_type)
+        response['Content-Disposition'] = ('inline; filename=%s' %
+                                           upload_file_name)
+        return response
+
+
+class AsyncFetchStatusView(AsyncFilepondView):
+    '''
+    The asynchronous version of FetchStatusView.
+    '''
+    permission_classes = _import_permission_classes('GET_FETCH')
+    metrics_endpoint = 'fetch_status'
+
+    async def get(self, request):
+        LOG.debug('Filepond API: Async fetch status view GET called...')
+        if LOAD_RESTORE_PARAM_NAME not in request.GET:
+            return _get_text_response('A required parameter is missing.',
+                                      status.HTTP_400_BAD_REQUEST)
+
+        upload_id = request.GET[LOAD_RESTORE_PARAM_NAME]
+        read_db = await sync_to_async(get_read_db)(upload_id)
+        try:
+            job = await TemporaryUploadFetch.objects.using(read_db).aget(
+                upload_id=upload_id)
+        except TemporaryUploadFetch.DoesNotExist:
+            return _get_text_response('Not found',
+                                      status.HTTP_404_NOT_FOUND)
+
+        # Only the user who registered a fetch job can see its status
+        if job.uploaded_by_id is not None:
+            user = await sync_to_async(_get_user)(request)
+            if (user is None) or (user.pk != job.uploaded_by_id):
+                return _get_text_response('Not found',
+                                          status.HTTP_404_NOT_FOUND)
+
+        return JsonResponse({
+            'id': job.upload_id,
+            'status': job.get_status_display().lower(),
+            'bytes_downloaded': job.bytes_downloaded,
+            'total_size': job.total_size,
+            'upload_name': job.upload_name,
+            'error': job.error,
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,175 @@
+# A module providing an optional read-through cache for StoredUpload lookups
+# carried out by api.get_stored_upload. This is enabled by setting
+# DJANGO_DRF_FILEPOND_STORED_UPLOAD_CACHE to the name of one of the caches
+# configured in the CACHES setting.
+#
+# StoredUpload records are not modified after they're created so the field
+# values of a resolved record are cached both under its upload ID and its
+# file path. Lookups that don't match any record are also cached, for a
+# shorter time. Cached entries are invalidated when a StoredUpload is saved
+# or deleted.
+import hashlib
+import logging
+import threading
+
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+import six
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.models import StoredUpload
+from django_drf_filepond.utils import _is_valid_upload_id
+
+LOG = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'drf_filepond:su'
+
+# The value cached for lookups that don't match a StoredUpload record
+_NOT_FOUND = 'not-found'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'negative_hits': 0, 'misses': 0}
+
+
+def _get_cache():
+    cache_name = local_settings.STORED_UPLOAD_CACHE
+    if not cache_name:
+        return None
+    return caches[cache_name]
+
+
+def _get_cache_key(key_type, value):
+    # File paths may be long and contain characters that aren't permitted in
+    # some cache backends' keys so the lookup value is hashed.
+    return '%s:%s:%s' % (CACHE_KEY_PREFIX, key_type, hashlib.sha256(
+        six.ensure_binary(value)).hexdigest())
+
+
+def _get_lookup_key(value):
+    # A value in the upload ID format may match either an upload ID or a
+    # file path (see api.get_stored_upload) so it has a separate key from a
+    # value that can only match a file path.
+    if _is_valid_upload_id(value):
+        return _get_cache_key('id', value)
+    return _get_cache_key('path', value)
+
+
+def _get_record_keys(upload_id, file_name):
+    # The keys of all lookups that may resolve to the specified record
+    keys = [_get_cache_key('id', upload_id)]
+    if file_name:
+        keys.append(_get_lookup_key(file_name))
+    return keys
+
+
+def _record_stat(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _to_cache_value(su):
+    return tuple(getattr(su, f.attname)
+                 for f in StoredUpload._meta.concrete_fields)
+
+
+def _from_cache_value(value):
+    field_names = [f.attname for f in StoredUpload._meta.concrete_fields]
+    return StoredUpload.from_db(None, field_names, list(value))
+
+
+def _get_cached_result(cached):
+    # Get the result of a lookup from the value held in the cache for its
+    # key: the StoredUpload for a hit, None for a miss, or raise
+    # StoredUpload.DoesNotExist for a cached negative result. Also used by
+    # async_api.aget_stored_upload.
+    if cached == _NOT_FOUND:
+        _record_stat('negative_hits')
+        raise StoredUpload.DoesNotExist(
+            'StoredUpload matching query does not exist.')
+    # Values cached with a different set of fields (i.e. before a change to
+    # the StoredUpload model) are treated as a miss.
+    if (cached is not None and
+            len(cached) == len(StoredUpload._meta.concrete_fields)):
+        _record_stat('hits')
+        return _from_cache_value(cached)
+    _record_stat('misses')
+    return None
+
+
+def _get_cache_values(su):
+    # Get the entries to cache for a StoredUpload that has been looked up.
+    # The lookup key is one of the record's keys since the record matched
+    # either by upload ID or by file path.
+    value = _to_cache_value(su)
+    return dict((record_key, value) for record_key in
+                _get_record_keys(su.upload_id, su.file.name))
+
+
+def get_cached_stored_upload(upload_id, lookup_fn):
+    """
+    Get the StoredUpload for upload_id (an upload ID or file path) from the
+    cache. If it isn't cached, lookup_fn(upload_id) is called to get the
+    record from the database and the result is cached. Raises
+    StoredUpload.DoesNotExist if there's no matching record.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return lookup_fn(upload_id)
+
+    key = _get_lookup_key(upload_id)
+    su = _get_cached_result(cache.get(key))
+    if su is not None:
+        return su
+
+    try:
+        su = lookup_fn(upload_id)
+    except StoredUpload.DoesNotExist:
+        cache.set(key, _NOT_FOUND,
+                  local_settings.STORED_UPLOAD_CACHE_NEGATIVE_TIMEOUT)
+        raise
+
+    cache.set_many(_get_cache_values(su),
+                   local_settings.STORED_UPLOAD_CACHE_TIMEOUT)
+    return su
+
+
+def invalidate_stored_upload(upload_id, file_name):
+    """
+    Remove any cached entries, including cached negative results, for the
+    StoredUpload with the specified upload ID and file path.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return
+    cache.delete_many(_get_record_keys(upload_id, file_name))
+
+
+def get_stored_upload_cache_stats():
+    """
+    Get the numbers of StoredUpload lookups in this process that were
+    served from the cache (hits and negative_hits) or required a database
+    query (misses), along with the resulting hit_rate.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+    stats['hit_rate'] = (
+        float(stats['hits'] + stats['negative_hits']) / lookups
+        if lookups else 0.0)
+    return stats
+
+
+def reset_stored_upload_cache_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+# A new record may match a lookup with a cached negative result and a
+# deleted record must no longer be returned so invalidate the entries for
+# the record when it is saved or deleted.
+@receiver(post_save, sender=StoredUpload)
+@receiver(post_delete, sender=StoredUpload)
+def invalidate_stored_upload_on_change(sender, instance, **kwargs):
+    invalidate_stored_upload(instance.upload_id, instance.file.name)
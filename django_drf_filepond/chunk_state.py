@@ -0,0 +1,258 @@
+# A module providing pluggable backends for holding the progress of chunked
+# uploads. By default, the TemporaryUploadChunked record for an upload is
+# read and updated for every chunk received. The backend class used is set
+# by DJANGO_DRF_FILEPOND_CHUNK_STATE_BACKEND. Alternative backends hold the
+# progress of an upload in the Django cache or in a file in the upload's
+# chunk directory and the TemporaryUploadChunked record is only updated
+# ("checkpointed") when the first chunk is received, when the upload is
+# complete and periodically in between, as set by
+# CHUNK_STATE_CHECKPOINT_CHUNKS and CHUNK_STATE_CHECKPOINT_SECONDS.
+#
+# If the progress of an upload isn't held by the backend, e.g. because the
+# cache entry has been evicted, it is loaded from the TemporaryUploadChunked
+# record. The offset recorded at the last checkpoint may then be behind the
+# data received and the client will need to resume the upload from there.
+# Any chunk files received after the checkpoint are removed at this point.
+import importlib
+import json
+import logging
+import os
+import time
+
+from django.core.cache import caches
+from django.utils import timezone
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.models import TemporaryUploadChunked, \
+    get_upload_dir, storage
+
+LOG = logging.getLogger(__name__)
+
+# The TemporaryUploadChunked fields held by chunk state backends
+CHUNK_STATE_FIELDS = ('upload_id', 'file_id', 'upload_dir', 'last_chunk',
+                      'offset', 'total_size', 'upload_name', 'upload_complete',
+                      'uploaded_by_id')
+
+# The TemporaryUploadChunked fields updated when progress is checkpointed
+CHECKPOINT_FIELDS = ('last_chunk', 'offset', 'upload_name', 'upload_complete')
+
+# The name of the file in the chunk directory used by FileChunkStateBackend
+CHUNK_STATE_FILE_NAME = '.chunk_state'
+
+CACHE_KEY_PREFIX = 'drf_filepond:chunk'
+
+_backend = None
+_backend_classname = None
+
+
+class DatabaseChunkStateBackend(object):
+    """
+    Holds the progress of chunked uploads only in the TemporaryUploadChunked
+    records. Every chunk received is checkpointed.
+    """
+    checkpoint_every_chunk = True
+
+    def get(self, upload_id):
+        return None
+
+    def set(self, state):
+        pass
+
+    def delete(self, upload_id, upload_dir):
+        pass
+
+
+class CacheChunkStateBackend(object):
+    """
+    Holds the progress of chunked uploads in the cache named by
+    CHUNK_STATE_CACHE. This must be a shared cache if requests for an upload
+    may be handled by more than one process.
+    """
+    checkpoint_every_chunk = False
+
+    def _get_cache(self):
+        return caches[local_settings.CHUNK_STATE_CACHE]
+
+    def _get_key(self, upload_id):
+        return '%s:%s' % (CACHE_KEY_PREFIX, upload_id)
+
+    def get(self, upload_id):
+        return self._get_cache().get(self._get_key(upload_id))
+
+    def set(self, state):
+        self._get_cache().set(self._get_key(state['upload_id']), state,
+                              local_settings.TEMP_UPLOAD_MAX_AGE)
+
+    def delete(self, upload_id, upload_dir):
+        self._get_cache().delete(self._get_key(upload_id))
+
+
+class FileChunkStateBackend(object):
+    """
+    Holds the progress of chunked uploads in a file in each upload's chunk
+    directory. The file is replaced atomically each time it is updated.
+    """
+    checkpoint_every_chunk = False
+
+    def _get_path(self, upload_dir):
+        return os.path.join(storage.base_location, upload_dir,
+                            CHUNK_STATE_FILE_NAME)
+
+    def get(self, upload_id):
+        try:
+            with open(self._get_path(get_upload_dir(upload_id)), 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def set(self, state):
+        path = self._get_path(state['upload_dir'])
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.rename(tmp_path, path)
+
+    def delete(self, upload_id, upload_dir):
+        try:
+            os.remove(self._get_path(upload_dir))
+        except OSError:
+            pass
+
+
+def get_chunk_state_backend():
+    """
+    Get the instance of the chunk state backend class set by
+    DJANGO_DRF_FILEPOND_CHUNK_STATE_BACKEND, creating it if necessary.
+    """
+    global _backend, _backend_classname
+    fq_classname = local_settings.CHUNK_STATE_BACKEND
+    if _backend is None or _backend_classname != fq_classname:
+        (modname, clname) = fq_classname.rsplit('.', 1)
+        mod = importlib.import_module(modname)
+        _backend = getattr(mod, clname)()
+        _backend_classname = fq_classname
+        LOG.debug('Chunk state backend instance [%s] created...'
+                  % fq_classname)
+    return _backend
+
+
+def _to_state(tuc):
+    state = dict((name, getattr(tuc, name)) for name in CHUNK_STATE_FIELDS)
+    (state['checkpoint_chunk'], state['checkpoint_time']) = \
+        tuc._chunk_checkpoint
+    return state
+
+
+def _from_state(state):
+    tuc = TemporaryUploadChunked.from_db(
+        None, list(CHUNK_STATE_FIELDS),
+        [state[name] for name in CHUNK_STATE_FIELDS])
+    tuc._chunk_checkpoint = (state['checkpoint_chunk'],
+                             state['checkpoint_time'])
+    return tuc
+
+
+def init_chunk_state(tuc):
+    """
+    Record the initial progress of a new chunked upload, provided as the
+    TemporaryUploadChunked instance that has just been saved, in the chunk
+    state backend.
+    """
+    tuc._chunk_checkpoint = (tuc.last_chunk, time.time())
+    get_chunk_state_backend().set(_to_state(tuc))
+
+
+def load_chunk_state(upload_id):
+    """
+    Get a TemporaryUploadChunked instance holding the current progress of
+    the chunked upload with the specified ID. Raises
+    TemporaryUploadChunked.DoesNotExist if there's no such upload.
+    """
+    backend = get_chunk_state_backend()
+    state = backend.get(upload_id)
+    if state is not None:
+        return _from_state(state)
+    tuc = TemporaryUploadChunked.objects.get(upload_id=upload_id)
+    tuc._chunk_checkpoint = (tuc.last_chunk, time.time())
+    if not backend.checkpoint_every_chunk:
+        # The progress has been loaded from a checkpoint that may be behind
+        # the data received. The client resends the data from the
+        # checkpoint's offset, possibly with different chunk boundaries, so
+        # the chunk files after the checkpoint are removed.
+        _remove_chunks_after(tuc)
+    return tuc
+
+
+def _remove_chunks_after(tuc):
+    # Remove the chunk files for a chunked upload numbered after
+    # tuc.last_chunk.
+    chunk_dir = os.path.join(storage.base_location, tuc.upload_dir)
+    chunk_prefix = '%s_' % tuc.file_id
+    try:
+        entries = os.listdir(chunk_dir)
+    except OSError:
+        return
+    for entry in entries:
+        chunk_num = entry[len(chunk_prefix):]
+        if (entry.startswith(chunk_prefix) and chunk_num.isdigit() and
+                int(chunk_num) > tuc.last_chunk):
+            LOG.debug('Removing chunk file <%s> received after the last '
+                      'checkpoint.' % entry)
+            try:
+                os.remove(os.path.join(chunk_dir, entry))
+            except OSError as e:
+                LOG.warning('Unable to remove chunk file <%s>: %s'
+                            % (entry, str(e)))
+
+
+def save_chunk_state(tuc):
+    """
+    Save the progress of a chunked upload, provided as a
+    TemporaryUploadChunked instance obtained from load_chunk_state, to the
+    chunk state backend and checkpoint it to the database if required.
+    Raises TemporaryUploadChunked.DoesNotExist if the record has been
+    removed, e.g. by the purge_temp_uploads command.
+    """
+    backend = get_chunk_state_backend()
+    (checkpoint_chunk, checkpoint_time) = getattr(
+        tuc, '_chunk_checkpoint', (0, 0))
+    if (backend.checkpoint_every_chunk or tuc.upload_complete or
+            tuc.last_chunk == 1 or
+            (tuc.last_chunk - checkpoint_chunk) >=
+            local_settings.CHUNK_STATE_CHECKPOINT_CHUNKS or
+            (time.time() - checkpoint_time) >=
+            local_settings.CHUNK_STATE_CHECKPOINT_SECONDS):
+        updated = TemporaryUploadChunked.objects.filter(
+            upload_id=tuc.upload_id).update(
+                last_upload_time=timezone.now(),
+                **dict((name, getattr(tuc, name))
+                       for name in CHECKPOINT_FIELDS))
+        if not updated:
+            backend.delete(tuc.upload_id, tuc.upload_dir)
+            raise TemporaryUploadChunked.DoesNotExist(
+                'TemporaryUploadChunked matching query does not exist.')
+        tuc._chunk_checkpoint = (tuc.last_chunk, time.time())
+    backend.set(_to_state(tuc))
+
+
+def delete_chunk_state(tuc):
+    """
+    Remove the progress of a chunked upload held by the chunk state backend.
+    """
+    get_chunk_state_backend().delete(tuc.upload_id, tuc.upload_dir)
+
+
+def move_chunk_state(upload_id, upload_dir):
+    """
+    Update the chunk directory recorded in the progress held by the chunk
+    state backend for the chunked upload with the specified ID after the
+    directory has been moved to upload_dir, e.g. by the
+    migrate_upload_tmp_layout command. The progress is otherwise preferred
+    to the TemporaryUploadChunked record and chunks would still be written
+    to the old directory.
+    """
+    backend = get_chunk_state_backend()
+    state = backend.get(upload_id)
+    if state is not None:
+        state['upload_dir'] = upload_dir
+        backend.set(state)
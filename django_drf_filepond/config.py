@@ -0,0 +1,149 @@
+# A module providing a snapshot of the app's configuration. The settings
+# used by the views and API functions are resolved and validated, and the
+# storage backend is instantiated, once when the app is loaded (see
+# DjangoDrfFilepondConfig.ready) rather than on every request. If the
+# settings are changed after the app has been loaded, e.g. in tests,
+# load_config must be called to build a new snapshot. A missing
+# FILE_STORE_PATH directory is checked for again when it is needed (see
+# check_file_store) rather than until the app is restarted.
+import logging
+import os
+
+import django_drf_filepond
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.models import storage
+from django_drf_filepond.storage_utils import get_storage_backend, \
+    reset_storage_backends
+from django_drf_filepond.utils import get_local_settings_base_dir
+
+LOG = logging.getLogger(__name__)
+
+UPLOAD_SETTINGS_ERROR = ('The file upload path settings are not configured '
+                         'correctly.')
+UPLOAD_LOCATION_ERROR = 'An invalid storage location has been specified.'
+
+_config = None
+
+
+class FilepondConfig(object):
+    """
+    An immutable snapshot of the app's configuration with the following
+    attributes:
+
+    base_dir: The project base directory as a string.
+    upload_tmp: The temporary upload directory (UPLOAD_TMP).
+    upload_tmp_error: The error message returned by the process endpoint
+        if the temporary upload location is invalid, otherwise None.
+    storage_backend: The instance of the django-storages backend set by
+        STORAGES_BACKEND, or None if local storage is used.
+    file_store_path: The local file store directory (FILE_STORE_PATH).
+    file_store_error: A description of the problem if local storage is used
+        and FILE_STORE_PATH isn't set to an existing directory, otherwise
+        None.
+    """
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('The filepond configuration can\'t be modified, '
+                             'use load_config to load a new configuration.')
+
+    def __delattr__(self, name):
+        raise AttributeError('The filepond configuration can\'t be modified, '
+                             'use load_config to load a new configuration.')
+
+
+def _get_upload_tmp_error(base_dir, upload_tmp):
+    if upload_tmp is None:
+        return UPLOAD_SETTINGS_ERROR
+
+    # By default, enforce that the temporary upload location must be a
+    # sub-directory of the project base directory.
+    if ((not storage.location.startswith(base_dir)) and
+            (base_dir != os.path.dirname(django_drf_filepond.__file__)) and
+            (not local_settings.ALLOW_EXTERNAL_UPLOAD_DIR)):
+        return UPLOAD_SETTINGS_ERROR
+
+    # Check that a relative path is not being used to store uploads outside
+    # the specified UPLOAD_TMP directory.
+    if not upload_tmp.startswith(os.path.abspath(storage.location)):
+        return UPLOAD_LOCATION_ERROR
+    return None
+
+
+def _get_file_store_error(storage_backend, file_store_path):
+    if storage_backend:
+        return None
+    if not file_store_path:
+        return 'The FILE_STORE_PATH is not set to a directory.'
+    if ((not os.path.exists(file_store_path)) or
+            (not os.path.isdir(file_store_path))):
+        return ('The local output directory [%s] defined by FILE_STORE_PATH '
+                'is missing.' % file_store_path)
+    return None
+
+
+def build_config():
+    """
+    Build a FilepondConfig from the current settings.
+    """
+    base_dir = get_local_settings_base_dir()
+    upload_tmp = getattr(local_settings, 'UPLOAD_TMP', None)
+    storage_backend = get_storage_backend()
+    file_store_path = getattr(local_settings, 'FILE_STORE_PATH', None)
+    config = FilepondConfig(
+        base_dir=base_dir,
+        upload_tmp=upload_tmp,
+        upload_tmp_error=_get_upload_tmp_error(base_dir, upload_tmp),
+        storage_backend=storage_backend,
+        file_store_path=file_store_path,
+        file_store_error=_get_file_store_error(storage_backend,
+                                               file_store_path))
+    for error in (config.upload_tmp_error, config.file_store_error):
+        if error:
+            LOG.warning('Filepond configuration: %s' % error)
+    return config
+
+
+def load_config():
+    """
+    Build a new configuration snapshot from the current settings and make
+    it the snapshot returned by get_config. The storage backends held in
+    the registry in storage_utils are also recreated from the current
+    settings.
+    """
+    global _config
+    reset_storage_backends()
+    _config = build_config()
+    return _config
+
+
+def check_file_store():
+    """
+    Get the current configuration snapshot, checking FILE_STORE_PATH again
+    if the snapshot records a problem with it. The directory may not have
+    been available when the snapshot was built, e.g. if it is on a mount
+    that only appears after the app has started, so a new snapshot is built
+    once the problem has been resolved.
+    """
+    global _config
+    config = get_config()
+    if (config.file_store_error and not _get_file_store_error(
+            config.storage_backend, config.file_store_path)):
+        LOG.info('Filepond configuration: The FILE_STORE_PATH [%s] is now '
+                 'available.' % config.file_store_path)
+        config = _config = build_config()
+    return config
+
+
+def get_config():
+    """
+    Get the current configuration snapshot, building it if necessary. The
+    storage backends held in the registry aren't recreated when the
+    snapshot is built here since they may already be in use.
+    """
+    global _config
+    if _config is None:
+        _config = build_config()
+    return _config
@@ -0,0 +1,84 @@
+# A module providing optional routing of read-only lookups to a database
+# read replica. This is enabled by setting DJANGO_DRF_FILEPOND_READ_REPLICA_DB
+# to the alias of a database configured in the DATABASES setting.
+#
+# Replication is asynchronous so a record that has just been saved may not
+# yet be on the replica, and a record that has just been deleted may still
+# be there. To avoid this, the upload IDs (and, for StoredUpload records,
+# file paths) of records that are saved or deleted are recorded in a cache
+# for READ_REPLICA_PIN_SECONDS and lookups of these values are "pinned" to
+# the database selected by Django's normal routing.
+import hashlib
+import logging
+
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+import six
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.models import StoredUpload, TemporaryUpload, \
+    TemporaryUploadFetch
+
+LOG = logging.getLogger(__name__)
+
+PIN_KEY_PREFIX = 'drf_filepond:pin'
+
+
+def _get_pin_key(value):
+    return '%s:%s' % (PIN_KEY_PREFIX,
+                      hashlib.sha256(six.ensure_binary(value)).hexdigest())
+
+
+def pin_to_primary(*values):
+    """
+    Record that the records with the specified upload IDs or file paths have
+    just been written so that lookups of these values aren't sent to the
+    read replica for the next READ_REPLICA_PIN_SECONDS seconds.
+    """
+    if not local_settings.READ_REPLICA_DB:
+        return
+    _get_pin_cache().set_many(
+        dict((_get_pin_key(value), True) for value in values if value),
+        local_settings.READ_REPLICA_PIN_SECONDS)
+
+
+def _get_pin_cache():
+    return caches[local_settings.READ_REPLICA_PIN_CACHE]
+
+
+def _select_read_db(value, pinned):
+    # Get the database to use for a lookup of value when a read replica is
+    # configured, given whether the value is pinned to the primary. Also
+    # used by async_api.aget_stored_upload.
+    if pinned:
+        LOG.debug('Record <%s> was written recently, not using the read '
+                  'replica.' % value)
+        return None
+    return local_settings.READ_REPLICA_DB
+
+
+def get_read_db(value):
+    """
+    Get the alias of the database to use for a read-only lookup of the
+    record with the specified upload ID or file path. Returns None, i.e.
+    use Django's normal routing, if no read replica is configured or the
+    record has been written recently.
+    """
+    if not local_settings.READ_REPLICA_DB:
+        return None
+    return _select_read_db(value, _get_pin_cache().get(_get_pin_key(value)))
+
+
+@receiver(post_save, sender=TemporaryUpload)
+@receiver(post_delete, sender=TemporaryUpload)
+@receiver(post_save, sender=TemporaryUploadFetch)
+@receiver(post_delete, sender=TemporaryUploadFetch)
+def pin_upload_on_change(sender, instance, **kwargs):
+    pin_to_primary(instance.upload_id)
+
+
+@receiver(post_save, sender=StoredUpload)
+@receiver(post_delete, sender=StoredUpload)
+def pin_stored_upload_on_change(sender, instance, **kwargs):
+    pin_to_primary(instance.upload_id, instance.file.name)
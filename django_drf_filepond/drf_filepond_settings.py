@@ -42,6 +42,20 @@ UPLOAD_TMP = getattr(settings, _app_prefix+'UPLOAD_TMP',
 DELETE_UPLOAD_TMP_DIRS = getattr(settings,
                                  _app_prefix+'DELETE_UPLOAD_TMP_DIRS', True)
 
+# The number of levels of shard directories used when creating the
+# temporary directories for uploads within UPLOAD_TMP. By default (0), the
+# directory for each upload is created directly under UPLOAD_TMP. When there
+# are very large numbers of uploads in progress, a single flat directory can
+# become slow to access on some filesystems. Setting this to a value greater
+# than 0 places the directory for each upload in nested shard directories
+# named using successive pairs of characters from the start of the upload
+# ID, e.g. with a value of 2, upload ID "abcd..." is stored in
+# UPLOAD_TMP/ab/cd/abcd.../. If you change this value when there are
+# existing temporary uploads, run the migrate_upload_tmp_layout management
+# command to move them to the new layout.
+UPLOAD_TMP_SHARD_DEPTH = getattr(settings,
+                                 _app_prefix+'UPLOAD_TMP_SHARD_DEPTH', 0)
+
 # Specifies the django-storages backend to be used. See the list at:
 # https://django-storages.readthedocs.io
 # If this is not set, then the default local filesystem backend is used.
@@ -49,6 +63,19 @@ DELETE_UPLOAD_TMP_DIRS = getattr(settings,
 # for your chosen backend as described in the django-storages documentation.
 STORAGES_BACKEND = getattr(settings, _app_prefix+'STORAGES_BACKEND', None)
 
+# Additional named storage backends that can be obtained from the storage
+# backend registry using django_drf_filepond.storage_utils.
+# get_storage_backend(name). This is a dict mapping each name to either the
+# fully-qualified class name of the backend or to a dict with a "BACKEND"
+# key giving the class name and an optional "OPTIONS" key giving a dict of
+# keyword arguments passed to the class, e.g.
+#   {'archive': {'BACKEND': 'storages.backends.s3.S3Storage',
+#                'OPTIONS': {'bucket_name': 'archive'}}}
+# The backend set by STORAGES_BACKEND is available with the name "default".
+# Each backend is created once, when it's first requested, and the same
+# instance, along with its connections, is shared by all threads.
+STORAGES_BACKENDS = getattr(settings, _app_prefix+'STORAGES_BACKENDS', {})
+
 # The file storage location used by the top-level application. This needs to
 # be set if the load endpoint is going to be used to access files that have
 # been permanently stored after being uploaded as TemporaryUpload objects.
@@ -60,6 +87,74 @@ STORAGES_BACKEND = getattr(settings, _app_prefix+'STORAGES_BACKEND', None)
 # will not be usable - you will need to manage file storage in your code.
 FILE_STORE_PATH = getattr(settings, _app_prefix+'FILE_STORE_PATH', None)
 
+# When using local storage, setting this to True stores the data for each
+# stored upload in a content-addressed layout within FILE_STORE_PATH rather
+# than at the destination path passed to store_upload. Files are stored in
+# a ".content" directory, in shard directories named using the start of the
+# SHA-256 hash of the file content, e.g. .content/ab/cd/abcd.... The
+# destination path is still recorded in the StoredUpload record and is used
+# as the file name when the upload is loaded. Uploads with identical content
+# share a single stored file, which is removed by delete_stored_upload only
+# when no other StoredUpload records refer to it. This setting has no effect
+# when a remote STORAGES_BACKEND is used.
+FILE_STORE_CONTENT_ADDRESSED = getattr(
+    settings, _app_prefix+'FILE_STORE_CONTENT_ADDRESSED', False)
+
+# The class used to hold the progress of chunked uploads between requests.
+# By default, DatabaseChunkStateBackend reads and updates the
+# TemporaryUploadChunked record for every chunk received. The alternatives
+# are django_drf_filepond.chunk_state.CacheChunkStateBackend, which holds
+# progress in the cache named by CHUNK_STATE_CACHE, and
+# django_drf_filepond.chunk_state.FileChunkStateBackend, which holds
+# progress in a file in each upload's chunk directory. When using these,
+# the TemporaryUploadChunked record is only updated when the first chunk of
+# an upload is received, when the upload is complete, and otherwise every
+# CHUNK_STATE_CHECKPOINT_CHUNKS chunks or CHUNK_STATE_CHECKPOINT_SECONDS
+# seconds, whichever comes first.
+CHUNK_STATE_BACKEND = getattr(
+    settings, _app_prefix+'CHUNK_STATE_BACKEND',
+    'django_drf_filepond.chunk_state.DatabaseChunkStateBackend')
+CHUNK_STATE_CACHE = getattr(settings, _app_prefix+'CHUNK_STATE_CACHE',
+                            'default')
+CHUNK_STATE_CHECKPOINT_CHUNKS = getattr(
+    settings, _app_prefix+'CHUNK_STATE_CHECKPOINT_CHUNKS', 20)
+CHUNK_STATE_CHECKPOINT_SECONDS = getattr(
+    settings, _app_prefix+'CHUNK_STATE_CHECKPOINT_SECONDS', 60)
+
+# The name of a cache, defined in the CACHES setting, to use for caching
+# StoredUpload records looked up by api.get_stored_upload, e.g. when files
+# are requested from the load endpoint. Caching is disabled if this is not
+# set. Records are cached for STORED_UPLOAD_CACHE_TIMEOUT seconds and the
+# fact that no record exists for a requested upload ID or file path is
+# cached for STORED_UPLOAD_CACHE_NEGATIVE_TIMEOUT seconds. Cached entries
+# are removed when a StoredUpload is saved or deleted. If StoredUpload
+# records are modified or deleted other than via the Django ORM (e.g. by
+# using QuerySet.update), cached entries may be out of date until they
+# expire.
+STORED_UPLOAD_CACHE = getattr(settings, _app_prefix+'STORED_UPLOAD_CACHE',
+                              None)
+STORED_UPLOAD_CACHE_TIMEOUT = getattr(
+    settings, _app_prefix+'STORED_UPLOAD_CACHE_TIMEOUT', 300)
+STORED_UPLOAD_CACHE_NEGATIVE_TIMEOUT = getattr(
+    settings, _app_prefix+'STORED_UPLOAD_CACHE_NEGATIVE_TIMEOUT', 30)
+
+# The alias of a database, defined in the DATABASES setting, that is a
+# read replica of the database holding the filepond tables. If this is set,
+# the lookups carried out by the load, restore and fetch status endpoints,
+# and by api.get_stored_upload, are sent to the replica. All writes, and
+# lookups of records that are about to be modified, use the database
+# selected by Django's normal routing. Records that have been saved or
+# deleted within the last READ_REPLICA_PIN_SECONDS seconds are looked up
+# using normal routing so that recent changes not yet replicated are seen
+# ("read-your-writes"). Recent writes are recorded in the cache named by
+# READ_REPLICA_PIN_CACHE which should be a shared cache if there are
+# multiple processes.
+READ_REPLICA_DB = getattr(settings, _app_prefix+'READ_REPLICA_DB', None)
+READ_REPLICA_PIN_SECONDS = getattr(
+    settings, _app_prefix+'READ_REPLICA_PIN_SECONDS', 10)
+READ_REPLICA_PIN_CACHE = getattr(
+    settings, _app_prefix+'READ_REPLICA_PIN_CACHE', 'default')
+
 # If you want to use an external directory (a directory outside of your
 # project directory) to store temporary uploads, this setting needs to be
 # set to true. By default it is False to prevent uploads being stored
@@ -98,3 +193,111 @@ PERMISSION_CLASSES = getattr(settings, _app_prefix+'PERMISSION_CLASSES', {})
 TEMPFILE_READ_CHUNK_SIZE = getattr(settings,
                                    _app_prefix+'TEMPFILE_READ_CHUNK_SIZE',
                                    1048576)
+
+# When several requests to the fetch endpoint ask for the same remote URL at
+# the same time (e.g. a page with many filepond instances loading the same
+# file, or many users following one shared link), only one download of the
+# remote file is carried out. The other requests wait for this download to
+# complete and then share its result. This keeps the load on the remote
+# server and the bandwidth used constant regardless of how many concurrent
+# requests are received. Set this to False to make every fetch request
+# download the remote file independently.
+FETCH_COALESCE_REQUESTS = getattr(settings,
+                                  _app_prefix+'FETCH_COALESCE_REQUESTS', True)
+
+# By default, concurrent fetch requests are only coalesced within a single
+# process. If you run multiple worker processes on the same host (e.g.
+# gunicorn workers), setting this to True also coalesces requests across
+# processes using lock files stored in a ".fetch_locks" directory within
+# UPLOAD_TMP. The result of a download is shared with waiting processes via
+# a file in the same directory. This is only supported on platforms that
+# provide fcntl (i.e. not on Windows).
+FETCH_COALESCE_LOCK_FILES = getattr(settings,
+                                    _app_prefix+'FETCH_COALESCE_LOCK_FILES',
+                                    False)
+
+# When FETCH_COALESCE_LOCK_FILES is enabled, this is the time in seconds for
+# which the result of a remote download that has been shared with other
+# processes is retained before being removed from the lock directory.
+FETCH_COALESCE_RESULT_TTL = getattr(settings,
+                                    _app_prefix+'FETCH_COALESCE_RESULT_TTL',
+                                    60)
+
+# By default, a HEAD request to the fetch endpoint downloads the remote file
+# and stores it as a temporary upload before the response is returned, so
+# the web worker handling the request is held for the whole download. If
+# this is set to True, a HEAD request instead registers a fetch job and
+# returns a 202 Accepted response straight away, with the ID of the
+# eventual temporary upload in the X-Content-Transfer-Id header. The
+# download is carried out by a pool of background worker threads and the
+# client polls the fetch/status/ endpoint with this ID to track progress.
+# NOTE: The standard filepond client does not support this mode, it is
+# intended for use with custom clients.
+FETCH_ASYNC = getattr(settings, _app_prefix+'FETCH_ASYNC', False)
+
+# The number of background worker threads per process used to carry out
+# asynchronous fetch jobs when FETCH_ASYNC is enabled.
+FETCH_ASYNC_WORKERS = getattr(settings, _app_prefix+'FETCH_ASYNC_WORKERS', 4)
+
+# Limits applied to the download of remote files by the fetch endpoint to
+# protect the worker processes handling requests.
+#
+# FETCH_MAX_SIZE: The maximum size in bytes of a remote file. This is
+# checked against the Content-Length reported by the remote server and
+# while the file is being downloaded. Fetch requests for larger files
+# receive a 413 response. If None, there is no limit.
+#
+# FETCH_TIMEOUT: The maximum total time in seconds permitted for retrieving
+# a remote file. Fetch requests that exceed this receive a 504 response.
+# If None, there is no limit.
+#
+# FETCH_MAX_CONCURRENT: The maximum number of remote downloads that may be
+# in progress at once within a process. Fetch requests received when this
+# limit has been reached receive a 503 response with a Retry-After header
+# set to FETCH_RETRY_AFTER seconds rather than being queued. Asynchronous
+# fetch jobs (see FETCH_ASYNC) wait for a download slot instead. If None,
+# there is no limit.
+FETCH_MAX_SIZE = getattr(settings, _app_prefix+'FETCH_MAX_SIZE', None)
+FETCH_TIMEOUT = getattr(settings, _app_prefix+'FETCH_TIMEOUT', None)
+FETCH_MAX_CONCURRENT = getattr(settings, _app_prefix+'FETCH_MAX_CONCURRENT',
+                               None)
+FETCH_RETRY_AFTER = getattr(settings, _app_prefix+'FETCH_RETRY_AFTER', 5)
+
+# The age in seconds after which temporary uploads, incomplete chunked
+# uploads and asynchronous fetch jobs are considered to have expired. This
+# is the default age used by the purge_temp_uploads management command
+# which removes expired records and their files.
+TEMP_UPLOAD_MAX_AGE = getattr(settings, _app_prefix+'TEMP_UPLOAD_MAX_AGE',
+                              86400)
+
+# If True, the patch endpoint that receives the chunks of a chunked upload
+# is handled by views.LeanPatchView, a view based on Django's View class,
+# rather than the DRF APIView-based PatchView. This avoids DRF's request
+# handling overhead for each chunk. If permission classes are set for the
+# PATCH_PATCH endpoint in PERMISSION_CLASSES, requests are still handled by
+# PatchView. This setting is read when django_drf_filepond.urls is imported.
+LEAN_PATCH_VIEW = getattr(settings, _app_prefix+'LEAN_PATCH_VIEW', False)
+
+# The class used to record metrics for the filepond endpoints and the
+# phases of handling uploads, see django_drf_filepond.metrics. Metrics are
+# disabled if this is None. django_drf_filepond.metrics.InMemoryMetricsSink
+# holds the metrics for each process in memory and these can be exposed in
+# the Prometheus text format by views.MetricsView.
+# django_drf_filepond.metrics.StatsdMetricsSink sends metrics to a statsd
+# server. METRICS_SINK_OPTIONS is a dict of keyword arguments passed when
+# creating the sink, e.g. {'host': 'statsd.example.com', 'port': 8125}.
+METRICS_SINK = getattr(settings, _app_prefix+'METRICS_SINK', None)
+METRICS_SINK_OPTIONS = getattr(settings, _app_prefix+'METRICS_SINK_OPTIONS',
+                               {})
+
+# The class used to record tracing spans around the handling of uploads,
+# see django_drf_filepond.tracing. Spans are opened for the handling of
+# standard uploads and chunks, the reassembly of chunked uploads, storing
+# uploads and fetching remote files, with the upload ID set as the
+# filepond.upload_id attribute. Tracing is disabled if this is None.
+# django_drf_filepond.tracing.OpenTelemetryTracer records the spans using
+# the OpenTelemetry API, this requires the opentelemetry-api package.
+# TRACER_OPTIONS is a dict of keyword arguments passed when creating the
+# tracer, e.g. {'tracer_name': 'my_app.uploads'}.
+TRACER = getattr(settings, _app_prefix+'TRACER', None)
+TRACER_OPTIONS = getattr(settings, _app_prefix+'TRACER_OPTIONS', {})
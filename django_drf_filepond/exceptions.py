@@ -17,3 +17,16 @@ class ChunkedUploadError(Exception):
     Raised when an error occurs processing a chunked upload.
     '''
     pass
+
+
+class FetchError(Exception):
+    '''
+    Raised when a problem occurs retrieving a remote file for the fetch
+    endpoint that should result in an error response to the client.
+    status_code is the HTTP status of the error response and, if set,
+    retry_after is the number of seconds after which the client may retry.
+    '''
+    def __init__(self, message, status_code=500, retry_after=None):
+        super(FetchError, self).__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
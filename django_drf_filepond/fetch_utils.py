@@ -0,0 +1,619 @@
+# A module containing helpers used by the fetch endpoint when retrieving
+# files from remote URLs.
+#
+# download_remote_file: downloads the file at a remote URL.
+#
+# download_remote_file_to: downloads the file at a remote URL into a file
+#                          object rather than into memory.
+#
+# coalesce_fetch: used to ensure that when many concurrent requests are made
+#                 for the same remote URL, only one download of the remote
+#                 file takes place and its result is shared between all the
+#                 requests waiting for it.
+#
+# submit_fetch_job: registers an asynchronous fetch job that downloads a
+#                   remote file into a TemporaryUpload using a pool of
+#                   background worker threads.
+#
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from io import BytesIO
+
+import requests
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import close_old_connections
+from requests.exceptions import ConnectionError, Timeout
+from rest_framework.exceptions import NotFound, ParseError
+from six.moves.urllib.parse import urlparse, urlunparse
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.db_utils import pin_to_primary
+from django_drf_filepond.exceptions import FetchError
+from django_drf_filepond.metrics import FETCHED_BYTES, increment, time_phase
+from django_drf_filepond.models import TemporaryUpload, TemporaryUploadFetch
+from django_drf_filepond.tracing import trace_span
+from django_drf_filepond.utils import _get_file_id
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG = logging.getLogger(__name__)
+
+# The name of the directory, within UPLOAD_TMP, used to hold lock files and
+# shared download results when cross-process coalescing is enabled.
+FETCH_LOCK_DIR_NAME = '.fetch_locks'
+
+# The number of hex characters of the URL hash used to select a lock file.
+# Lock files are never removed (removing a lock file that another process
+# may have open would break the mutual exclusion it provides) so URLs are
+# spread over a fixed number (16^3 = 4096) of lock files.
+LOCK_FILE_PREFIX_LEN = 3
+
+# The minimum time in seconds between updates of the download progress
+# stored in the TemporaryUploadFetch record for an asynchronous fetch job.
+PROGRESS_UPDATE_INTERVAL = 1.0
+
+# The size of the blocks in which remote file content is read
+DOWNLOAD_CHUNK_SIZE = 1048576
+
+
+# The per-process semaphore limiting the number of concurrent remote
+# downloads. This is created on first use, and re-created if the
+# FETCH_MAX_CONCURRENT setting changes, by _get_fetch_semaphore.
+_fetch_semaphore = None
+_fetch_semaphore_size = None
+_fetch_semaphore_lock = threading.Lock()
+
+
+def _get_fetch_semaphore():
+    global _fetch_semaphore
+    global _fetch_semaphore_size
+    max_concurrent = local_settings.FETCH_MAX_CONCURRENT
+    with _fetch_semaphore_lock:
+        if _fetch_semaphore_size != max_concurrent:
+            _fetch_semaphore = (threading.BoundedSemaphore(max_concurrent)
+                                if max_concurrent else None)
+            _fetch_semaphore_size = max_concurrent
+        return _fetch_semaphore
+
+
+def _check_fetch_size(size):
+    max_size = local_settings.FETCH_MAX_SIZE
+    if max_size and size > max_size:
+        LOG.error('Remote file size <%s> exceeds the maximum fetch size '
+                  '<%s>.' % (size, max_size))
+        raise FetchError('The remote file exceeds the maximum permitted '
+                         'size.', status_code=413)
+
+
+def _get_content_length(headers):
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _get_request_timeout(deadline):
+    # requests applies its timeout to the connection and to each read from
+    # the socket. Use the time remaining before the deadline as the timeout
+    # for each operation, the total time is checked as data is received.
+    if deadline is None:
+        return None
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise FetchError('Timed out retrieving the remote file.',
+                         status_code=504)
+    return remaining
+
+
+def download_remote_file(target_url, progress_callback=None,
+                         wait_for_slot=False):
+    """
+    Download the file at target_url. Returns a tuple (data,
+    upload_file_name, content_type) where data is a bytes object containing
+    the file content and upload_file_name is None if the filename couldn't
+    be obtained from the Content-Disposition header.
+
+    If progress_callback is provided, it is called with the number of bytes
+    downloaded so far and the total size of the remote file (or None if the
+    remote server didn't provide the size) as each block of data is read.
+
+    If FETCH_MAX_CONCURRENT is set and the maximum number of downloads are
+    already in progress in this process, a FetchError with status 503 is
+    raised unless wait_for_slot is True, in which case we wait for one of
+    the other downloads to complete.
+    """
+    buf = BytesIO()
+    (_, upload_file_name, content_type) = download_remote_file_to(
+        target_url, buf, progress_callback, wait_for_slot)
+    return (buf.getvalue(), upload_file_name, content_type)
+
+
+def download_remote_file_to(target_url, out_file, progress_callback=None,
+                            wait_for_slot=False):
+    """
+    Download the file at target_url, writing the data to the file object
+    out_file as it is received so that the file is never held in memory.
+    Returns a tuple (size, upload_file_name, content_type) where size is
+    the number of bytes written. See download_remote_file for the other
+    parameters.
+    """
+    semaphore = _get_fetch_semaphore()
+    if semaphore is not None:
+        if not semaphore.acquire(wait_for_slot):
+            LOG.warning('Maximum number of concurrent fetches reached, '
+                        'rejecting fetch of <%s>.' % target_url)
+            raise FetchError(
+                'Too many remote file requests are in progress, please '
+                'try again later.', status_code=503,
+                retry_after=local_settings.FETCH_RETRY_AFTER)
+    try:
+        with trace_span('filepond.fetch',
+                        url=_get_trace_url(target_url)) as span, \
+                time_phase('fetch'):
+            result = _download_remote_file(target_url, out_file,
+                                           progress_callback)
+            span.set_attribute('filepond.size', result[0])
+        increment(FETCHED_BYTES, result[0])
+        return result
+    finally:
+        if semaphore is not None:
+            semaphore.release()
+
+
+def _get_trace_url(target_url):
+    # Only the scheme, host and path of the URL are recorded in traces. The
+    # query string and any user information are removed since they may
+    # hold credentials, e.g. the signature of a pre-signed URL.
+    parsed = urlparse(target_url)
+    return urlunparse((parsed.scheme, parsed.netloc.rpartition('@')[2],
+                       parsed.path, '', '', ''))
+
+
+def _download_remote_file(target_url, out_file, progress_callback):
+    deadline = None
+    if local_settings.FETCH_TIMEOUT:
+        deadline = time.time() + local_settings.FETCH_TIMEOUT
+
+    content_type = _get_remote_content_type(target_url, deadline)
+    try:
+        with requests.get(target_url,
+                          allow_redirects=True, stream=True,
+                          timeout=_get_request_timeout(deadline)) as r:
+            upload_file_name = _get_disposition_file_name(r.headers)
+            bytes_downloaded = _write_remote_content(
+                target_url, r, out_file, deadline, progress_callback)
+    except Timeout:
+        raise FetchError('Timed out retrieving the remote file.',
+                         status_code=504)
+    except ConnectionError as e:
+        raise NotFound('Unable to access the requested remote file: %s'
+                       % str(e))
+
+    return (bytes_downloaded, upload_file_name, content_type)
+
+
+def _get_remote_content_type(target_url, deadline):
+    # Check the headers of the remote file before downloading it and return
+    # its content type.
+    #
+    # TODO: SHould we check the headers returned when we request the
+    # download to see that we're getting a file rather than an HTML page?
+    # For now this check is enabled on the basis that we assume target
+    # data file will not be HTML. However, there should be a way to turn
+    # this off if the client knows that they want to get an HTML file.
+    # TODO: *** Looks like this use of head can be removed since with
+    # the new approach of streaming content to a BytesIO object, when
+    # stream=True, the connection begins by being opened and only
+    # fetching the headers. We could do this check then.
+    try:
+        header = requests.head(target_url, allow_redirects=True,
+                               timeout=_get_request_timeout(deadline))
+    except Timeout:
+        raise FetchError('Timed out retrieving the remote file headers.',
+                         status_code=504)
+    except ConnectionError as e:
+        msg = ('Unable to access the requested remote file headers: %s'
+               % str(e))
+        LOG.error(msg)
+        raise FetchError(msg)
+
+    if header.status_code == 404:
+        raise NotFound('The remote file was not found.')
+
+    content_type = header.headers.get('Content-Type', '')
+
+    # If the URL has returned URL content but an HTML file was not
+    # requested then assume that the URL has linked to a download page or
+    # some sort of error page or similar and raise an error.
+    if 'html' in content_type.lower() and '.html' not in target_url:
+        LOG.error('The requested data seems to be in HTML format. '
+                  'Assuming this is not valid data file.')
+        raise ParseError('Provided URL links to HTML content.')
+
+    # Reject files that we know will exceed the maximum size before
+    # starting the download. The size is also checked as data is received
+    # since the Content-Length header may be missing or incorrect.
+    header_size = _get_content_length(header.headers)
+    if header_size is not None:
+        _check_fetch_size(header_size)
+    return content_type
+
+
+def _get_disposition_file_name(headers):
+    # Get the filename from the Content-Disposition header, if there is one
+    if 'Content-Disposition' in headers:
+        matches = re.findall('filename=(.+)', headers['Content-Disposition'])
+        if len(matches):
+            return matches[0]
+    return None
+
+
+def _check_fetch_deadline(target_url, deadline):
+    if (deadline is not None) and (time.time() > deadline):
+        LOG.error('Fetch of <%s> exceeded the deadline of <%s> seconds.'
+                  % (target_url, local_settings.FETCH_TIMEOUT))
+        raise FetchError('Timed out retrieving the remote file.',
+                         status_code=504)
+
+
+def _write_remote_content(target_url, response, out_file, deadline,
+                          progress_callback):
+    # Write the content of the remote file to out_file as it is received,
+    # checking the size and the deadline as each block arrives. Returns the
+    # number of bytes written.
+    total_size = _get_content_length(response.headers)
+    if total_size is not None:
+        _check_fetch_size(total_size)
+    bytes_downloaded = 0
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        out_file.write(chunk)
+        bytes_downloaded += len(chunk)
+        _check_fetch_size(bytes_downloaded)
+        _check_fetch_deadline(target_url, deadline)
+        if progress_callback:
+            progress_callback(bytes_downloaded, total_size)
+    return bytes_downloaded
+
+
+def get_upload_file_name(target_url, upload_file_name, file_id):
+    """
+    If a filename wasn't extracted from the Content-Disposition header of
+    the remote file download, get the name from the URL or otherwise use
+    the auto-generated file_id.
+    """
+    if upload_file_name:
+        return upload_file_name
+    if not target_url.endswith('/'):
+        split = target_url.rsplit('/', 1)
+        return split[1] if len(split) > 1 else split[0]
+    return file_id
+
+
+def _get_fetch_key(target_url):
+    if not isinstance(target_url, bytes):
+        target_url = target_url.encode('utf-8')
+    return hashlib.sha256(target_url).hexdigest()
+
+
+class _InFlightFetch(object):
+    """
+    Holds the state of a remote download that is in progress. Requests
+    that arrive for the same URL while the download is in progress wait on
+    the done event and then pick up the result or the error.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class FetchCoalescer(object):
+    """
+    Coalesces concurrent calls for the same key within a single process.
+
+    The first caller for a key (the "leader") runs the fetch function. Any
+    callers for the same key that arrive before the leader has finished
+    wait for it and then receive the same result, or have the same error
+    raised, as the leader.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def fetch(self, key, fetch_fn, *args):
+        with self._lock:
+            flight = self._in_flight.get(key, None)
+            leader = flight is None
+            if leader:
+                flight = _InFlightFetch()
+                self._in_flight[key] = flight
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            LOG.debug('Waiting for in-progress fetch of [%s]...' % key)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fetch_fn(*args)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+            if flight.waiters:
+                LOG.debug('Fetch of [%s] shared with <%s> waiting requests.'
+                          % (key, flight.waiters))
+
+        return flight.result
+
+    def in_flight_count(self):
+        with self._lock:
+            return len(self._in_flight)
+
+
+class LockFileCoalescer(object):
+    """
+    Coalesces calls for the same key across processes on the same host
+    using lock files in a directory within UPLOAD_TMP.
+
+    The fetch function must return a tuple (data, upload_file_name,
+    content_type) where data is a bytes object. The process that obtains
+    the lock for a key runs the fetch function and writes the result to the
+    lock directory. Processes that had to wait for the lock pick up this
+    result rather than carrying out the download again.
+    """
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+
+    def _paths(self, key):
+        lock_path = os.path.join(self.lock_dir,
+                                 '%s.lock' % key[:LOCK_FILE_PREFIX_LEN])
+        data_path = os.path.join(self.lock_dir, '%s.data' % key)
+        meta_path = os.path.join(self.lock_dir, '%s.json' % key)
+        return (lock_path, data_path, meta_path)
+
+    def fetch(self, key, fetch_fn, *args):
+        if not os.path.exists(self.lock_dir):
+            try:
+                os.makedirs(self.lock_dir, mode=0o700)
+            except OSError:
+                # The directory may have been created by another process
+                if not os.path.isdir(self.lock_dir):
+                    raise
+
+        (lock_path, data_path, meta_path) = self._paths(key)
+        wait_start = time.time()
+        with open(lock_path, 'a+') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                contended = False
+            except (IOError, OSError):
+                LOG.debug('Waiting for fetch of [%s] in another process...'
+                          % key)
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                contended = True
+
+            try:
+                if contended:
+                    result = self._read_result(data_path, meta_path,
+                                               wait_start)
+                    if result is not None:
+                        LOG.debug('Using result of fetch of [%s] from '
+                                  'another process.' % key)
+                        return result
+
+                result = fetch_fn(*args)
+                self._write_result(data_path, meta_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_result(self, data_path, meta_path, not_before):
+        # Only a result completed after we started waiting is from the
+        # download that we were waiting for, anything older may be stale.
+        try:
+            with open(meta_path, 'r') as meta_file:
+                meta = json.load(meta_file)
+            if meta['completed'] < not_before:
+                return None
+            with open(data_path, 'rb') as data_file:
+                data = data_file.read()
+        except (IOError, OSError, ValueError, KeyError) as e:
+            LOG.debug('No shared fetch result available: %s' % str(e))
+            return None
+        return (data, meta['upload_file_name'], meta['content_type'])
+
+    def _write_result(self, data_path, meta_path, result):
+        self._prune_results()
+        (data, upload_file_name, content_type) = result
+        tmp_data_path = '%s.%s.tmp' % (data_path, os.getpid())
+        with open(tmp_data_path, 'wb') as data_file:
+            data_file.write(data)
+        os.rename(tmp_data_path, data_path)
+        tmp_meta_path = '%s.%s.tmp' % (meta_path, os.getpid())
+        with open(tmp_meta_path, 'w') as meta_file:
+            json.dump({'upload_file_name': upload_file_name,
+                       'content_type': content_type,
+                       'completed': time.time()}, meta_file)
+        os.rename(tmp_meta_path, meta_path)
+
+    def _prune_results(self):
+        # Remove shared results that are older than the configured TTL.
+        # Lock files are never removed, see LOCK_FILE_PREFIX_LEN.
+        expiry = time.time() - local_settings.FETCH_COALESCE_RESULT_TTL
+        try:
+            entries = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for entry in entries:
+            if entry.endswith('.lock'):
+                continue
+            entry_path = os.path.join(self.lock_dir, entry)
+            try:
+                if os.path.getmtime(entry_path) < expiry:
+                    os.remove(entry_path)
+            except OSError:
+                # The entry may have been removed by another process
+                pass
+
+
+_coalescer = FetchCoalescer()
+
+
+def get_fetch_lock_dir():
+    return os.path.join(local_settings.UPLOAD_TMP, FETCH_LOCK_DIR_NAME)
+
+
+def coalesce_fetch(target_url, fetch_fn, *args):
+    """
+    Call fetch_fn(*args) to download the file at target_url, sharing the
+    download with any other concurrent requests for the same URL.
+
+    fetch_fn must return a tuple (data, upload_file_name, content_type)
+    where data is a bytes object containing the downloaded file. All callers
+    receive the same tuple so it must not be modified. If fetch_fn raises an
+    exception, the same exception is raised for all waiting callers.
+    """
+    if not local_settings.FETCH_COALESCE_REQUESTS:
+        return fetch_fn(*args)
+
+    key = _get_fetch_key(target_url)
+    if local_settings.FETCH_COALESCE_LOCK_FILES:
+        if fcntl is None:
+            LOG.warning('Cross-process fetch coalescing is not supported '
+                        'on this platform, using in-process coalescing.')
+        else:
+            lock_file_coalescer = LockFileCoalescer(get_fetch_lock_dir())
+            return _coalescer.fetch(key, lock_file_coalescer.fetch, key,
+                                    fetch_fn, *args)
+
+    return _coalescer.fetch(key, fetch_fn, *args)
+
+
+# The pool of worker threads used to run asynchronous fetch jobs. This is
+# created on first use.
+_fetch_executor = None
+_fetch_executor_lock = threading.Lock()
+
+
+def _get_fetch_executor():
+    global _fetch_executor
+    with _fetch_executor_lock:
+        if _fetch_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _fetch_executor = ThreadPoolExecutor(
+                max_workers=local_settings.FETCH_ASYNC_WORKERS)
+        return _fetch_executor
+
+
+class _FetchJobProgress(object):
+    """
+    Progress callback for an asynchronous fetch job. Stores the download
+    progress in the job's TemporaryUploadFetch record, limiting database
+    updates to one every PROGRESS_UPDATE_INTERVAL seconds.
+    """
+
+    def __init__(self, upload_id):
+        self.upload_id = upload_id
+        self.last_update = 0
+
+    def __call__(self, bytes_downloaded, total_size):
+        now = time.time()
+        if (now - self.last_update) < PROGRESS_UPDATE_INTERVAL:
+            return
+        self.last_update = now
+        TemporaryUploadFetch.objects.filter(upload_id=self.upload_id).update(
+            bytes_downloaded=bytes_downloaded, total_size=total_size)
+
+
+def submit_fetch_job(target_url, uploaded_by=None):
+    """
+    Register an asynchronous fetch job for the file at target_url and
+    submit it to the pool of fetch worker threads. Returns the upload_id
+    assigned to the job. When the download completes, a TemporaryUpload
+    with this upload_id is created.
+    """
+    upload_id = _get_file_id()
+    TemporaryUploadFetch.objects.create(upload_id=upload_id,
+                                        target_url=target_url,
+                                        uploaded_by=uploaded_by)
+    _get_fetch_executor().submit(_run_fetch_job, upload_id)
+    LOG.debug('Submitted fetch job <%s> for URL <%s>'
+              % (upload_id, target_url))
+    return upload_id
+
+
+def _run_fetch_job(upload_id):
+    # This runs in a worker thread so database connections are not managed
+    # by the request cycle, close any stale connection before and after.
+    close_old_connections()
+    try:
+        try:
+            job = TemporaryUploadFetch.objects.get(upload_id=upload_id)
+        except TemporaryUploadFetch.DoesNotExist:
+            LOG.error('Fetch job <%s> not found.' % upload_id)
+            return
+
+        jobs = TemporaryUploadFetch.objects.filter(upload_id=upload_id)
+        jobs.update(status=TemporaryUploadFetch.RUNNING)
+        # Asynchronous fetches are intended for large files so the download
+        # is written to a temporary file, which is moved into place when the
+        # TemporaryUpload is saved, rather than held in memory. Jobs aren't
+        # coalesced with other fetches of the same URL since each job needs
+        # a file of its own. A job waits for a download slot rather than
+        # failing when FETCH_MAX_CONCURRENT downloads are in progress and it
+        # reports the progress of its own download.
+        file_id = _get_file_id()
+        tmp_file = TemporaryUploadedFile(file_id, None, 0, None)
+        try:
+            (size, upload_file_name, content_type) = download_remote_file_to(
+                job.target_url, tmp_file, _FetchJobProgress(upload_id), True)
+            tmp_file.flush()
+            tmp_file.size = size
+            tmp_file.content_type = content_type
+
+            upload_file_name = get_upload_file_name(
+                job.target_url, upload_file_name, file_id)
+            tu = TemporaryUpload(upload_id=upload_id, file_id=file_id,
+                                 file=tmp_file, upload_name=upload_file_name,
+                                 upload_type=TemporaryUpload.URL,
+                                 uploaded_by_id=job.uploaded_by_id)
+            tu.save(force_insert=True)
+        except Exception as e:
+            LOG.error('Fetch job <%s> for URL <%s> failed: %s'
+                      % (upload_id, job.target_url, str(e)))
+            jobs.update(status=TemporaryUploadFetch.FAILED,
+                        error=str(e)[:512])
+            # Status lookups by the fetch status view may use a read replica
+            # and QuerySet.update() doesn't send the post_save signal.
+            pin_to_primary(upload_id)
+            return
+        finally:
+            # Removes the temporary file if it wasn't moved into place
+            tmp_file.close()
+
+        jobs.update(status=TemporaryUploadFetch.COMPLETE,
+                    bytes_downloaded=size, total_size=size,
+                    upload_name=upload_file_name)
+        pin_to_primary(upload_id)
+        LOG.debug('Fetch job <%s> complete.' % upload_id)
+    finally:
+        close_old_connections()
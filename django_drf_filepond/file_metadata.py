@@ -0,0 +1,136 @@
+# A module containing functions for obtaining the metadata stored with
+# TemporaryUpload and StoredUpload records: the size of the file, its content
+# type as determined from the file name, its content type as determined from
+# the start of the file data ("sniffed" type) and the SHA-256 digest of the
+# file data. The metadata is obtained in a single pass over the file data
+# when a record is created so that it doesn't need to be worked out each
+# time a file is served.
+import hashlib
+import mimetypes
+
+from django.core.files import File
+
+# The content types detected from signatures at the start of the file data,
+# as (offset, signature, content type) tuples.
+CONTENT_SIGNATURES = (
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (8, b'WEBP', 'image/webp'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'%!PS', 'application/postscript'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'OggS', 'audio/ogg'),
+    (4, b'ftyp', 'video/mp4'),
+    (0, b'<?xml', 'application/xml'),
+)
+
+# The number of bytes at the start of the file data used to sniff the type
+SNIFF_LENGTH = 512
+
+# The size of the blocks in which file data is read
+METADATA_CHUNK_SIZE = 1024 * 1024
+
+
+def guess_content_type(file_name):
+    return mimetypes.guess_type(file_name)[0] or ''
+
+
+def sniff_content_type(data):
+    """
+    Get the content type of a file from the bytes at the start of its data.
+    Data that doesn't match a known signature is reported as text/plain if
+    it is valid UTF-8 text without NUL bytes, otherwise as
+    application/octet-stream.
+    """
+    if not data:
+        return ''
+    for (offset, signature, content_type) in CONTENT_SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            return content_type
+    if b'\x00' not in data:
+        try:
+            data.decode('utf-8')
+            return 'text/plain'
+        except UnicodeDecodeError:
+            # The sample may end part way through a multi-byte character
+            try:
+                data[:-3].decode('utf-8')
+                return 'text/plain'
+            except UnicodeDecodeError:
+                pass
+    return 'application/octet-stream'
+
+
+class FileMetadataCollector(object):
+    """
+    Collects the metadata for file data that is passed to update() in
+    blocks, in order, e.g. while the data is being written to storage.
+    """
+
+    def __init__(self):
+        self._sha256 = hashlib.sha256()
+        self._size = 0
+        self._head = b''
+
+    def update(self, chunk):
+        if len(self._head) < SNIFF_LENGTH:
+            self._head += chunk[:SNIFF_LENGTH - len(self._head)]
+        self._sha256.update(chunk)
+        self._size += len(chunk)
+
+    def get_metadata(self, file_name):
+        """
+        Returns a dict containing size, content_type, sniffed_type and
+        digest values for the data collected so far. file_name is the name
+        used to guess the content type.
+        """
+        return {'size': self._size,
+                'content_type': guess_content_type(file_name),
+                'sniffed_type': sniff_content_type(self._head),
+                'digest': self._sha256.hexdigest()}
+
+
+class MetadataCollectingFile(File):
+    """
+    Wraps a django File so that the data returned by chunks() is passed to
+    a FileMetadataCollector. Storing an instance of this class obtains the
+    file's metadata in the same pass over the data that writes the file.
+    """
+
+    def __init__(self, file, collector):
+        super(MetadataCollectingFile, self).__init__(file, file.name)
+        self.collector = collector
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.file.chunks(chunk_size):
+            self.collector.update(chunk)
+            yield chunk
+
+
+def get_file_metadata(chunks, file_name):
+    """
+    Get the metadata for a file whose data is provided by the iterable of
+    byte strings, chunks. file_name is the name used to guess the content
+    type. Returns a dict containing size, content_type, sniffed_type and
+    digest values.
+    """
+    collector = FileMetadataCollector()
+    for chunk in chunks:
+        collector.update(chunk)
+    return collector.get_metadata(file_name)
+
+
+def get_file_path_metadata(file_path, file_name):
+    """
+    Get the metadata for the file at file_path, see get_file_metadata.
+    """
+    with open(file_path, 'rb') as f:
+        return get_file_metadata(
+            iter(lambda: f.read(METADATA_CHUNK_SIZE), b''), file_name)
@@ -0,0 +1,128 @@
+'''
+A management command to set the file metadata (size, content_type,
+sniffed_type and digest, see django_drf_filepond.file_metadata) for
+TemporaryUpload and StoredUpload records created before these fields were
+added.
+
+Records without metadata are selected in batches using keyset pagination on
+the primary key. The files for each batch are read in parallel using a pool
+of threads and the metadata for the batch is then saved in a transaction of
+its own so that a large backfill doesn't run as one long transaction.
+Records whose files can't be read, for any reason, are reported and left
+unchanged.
+
+Obtaining the digest requires reading the whole of each file. When stored
+uploads are held by a remote storage backend (STORAGES_BACKEND) this means
+downloading every stored file so stored uploads are skipped unless
+--include-remote is given.
+'''
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.file_metadata import get_file_metadata
+from django_drf_filepond.models import TemporaryUpload, StoredUpload, \
+    get_content_path, storage
+from django_drf_filepond.utils import _iter_keyset_batches
+
+LOG = logging.getLogger(__name__)
+
+
+def _read_file_metadata(file_storage, upload):
+    # Get the metadata for an upload provided as a (pk, stored_name,
+    # file_name) tuple, returning a (pk, metadata, error) tuple. Any error
+    # reading the file, including errors raised by remote storage backends,
+    # is returned rather than raised so that one failure doesn't stop the
+    # backfill.
+    (pk, stored_name, file_name) = upload
+    try:
+        f = file_storage.open(stored_name, 'rb')
+        try:
+            return (pk, get_file_metadata(f.chunks(), file_name), None)
+        finally:
+            f.close()
+    except Exception as e:
+        return (pk, None, str(e))
+
+
+class Command(BaseCommand):
+    help = ('Set the size, content type, sniffed type and digest of '
+            'temporary and stored uploads created before this metadata was '
+            'recorded.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='The number of records processed in each batch.')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='The number of threads used to read files.')
+        parser.add_argument(
+            '--include-remote', action='store_true', default=False,
+            help=('Also set the metadata of stored uploads held by a remote '
+                  'storage backend. Every stored file without metadata is '
+                  'downloaded.'))
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at '
+                               'least 1.')
+        self.batch_size = options['batch_size']
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            self._backfill(
+                'temporary uploads',
+                TemporaryUpload.objects.filter(size__isnull=True),
+                ('file', 'upload_name'), storage,
+                lambda file_name, upload_name: (file_name, upload_name),
+                executor)
+
+            if (local_settings.STORAGES_BACKEND and
+                    not options['include_remote']):
+                self.stdout.write(
+                    'Skipping stored uploads held by a remote storage '
+                    'backend, use --include-remote to include them.')
+                return
+            self._backfill(
+                'stored uploads',
+                StoredUpload.objects.filter(size__isnull=True),
+                ('file', 'content_hash'),
+                StoredUpload._meta.get_field('file').storage,
+                lambda file_name, content_hash: (
+                    get_content_path(content_hash) if content_hash
+                    else file_name, os.path.basename(file_name)),
+                executor)
+
+    def _backfill(self, description, queryset, fields, file_storage,
+                  get_names, executor):
+        # Set the metadata for the records in queryset. get_names is called
+        # with the values of fields for each record and returns the name of
+        # its file in file_storage and the name used to guess its content
+        # type.
+        start = time.time()
+        updated = 0
+        failed = 0
+        for batch in _iter_keyset_batches(queryset, fields, self.batch_size):
+            uploads = [(row[0],) + get_names(*row[1:]) for row in batch]
+            results = list(executor.map(
+                lambda upload: _read_file_metadata(file_storage, upload),
+                uploads))
+            with transaction.atomic(using=queryset.db):
+                for (pk, metadata, error) in results:
+                    if metadata is None:
+                        LOG.warning('Unable to read file for upload <%s> to '
+                                    'set its metadata: %s' % (pk, error))
+                        self.stderr.write('Unable to read file for %s: %s'
+                                          % (pk, error))
+                        failed += 1
+                        continue
+                    queryset.model.objects.filter(pk=pk).update(**metadata)
+                    updated += 1
+        self.stdout.write('Set metadata for %d %s (%d unreadable) in %.2fs'
+                          % (updated, description, failed,
+                             time.time() - start))
@@ -0,0 +1,107 @@
+'''
+A management command to move existing temporary uploads to the directory
+layout specified by the UPLOAD_TMP_SHARD_DEPTH setting.
+
+The directory for each TemporaryUpload and TemporaryUploadChunked record
+that isn't in the location given by models.get_upload_dir is moved there
+and the file/upload_dir value stored in the record is updated, along with
+the upload_dir held by the chunk state backend for chunked uploads. Shard
+directories that are left empty are removed.
+
+Uploads should not be in progress while this command is run.
+'''
+import logging
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_drf_filepond.chunk_state import move_chunk_state
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, get_upload_dir, storage
+from django_drf_filepond.utils import _iter_keyset_batches
+
+LOG = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Move existing temporary uploads to the directory layout '
+            'specified by the UPLOAD_TMP_SHARD_DEPTH setting.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='The number of records processed in each batch.')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Report what would be moved without moving anything.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.moved = 0
+
+        for batch in _iter_keyset_batches(TemporaryUpload.objects.all(),
+                                          ('file',), self.batch_size):
+            for (upload_id, file_name) in batch:
+                new_dir = get_upload_dir(upload_id)
+                old_dir = os.path.dirname(file_name)
+                if old_dir == new_dir:
+                    continue
+                self._move(old_dir, new_dir)
+                if not self.dry_run:
+                    TemporaryUpload.objects.filter(upload_id=upload_id).update(
+                        file=os.path.join(new_dir,
+                                          os.path.basename(file_name)))
+
+        for batch in _iter_keyset_batches(
+                TemporaryUploadChunked.objects.all(), ('upload_dir',),
+                self.batch_size):
+            for (upload_id, old_dir) in batch:
+                new_dir = get_upload_dir(upload_id)
+                if old_dir == new_dir:
+                    continue
+                self._move(old_dir, new_dir)
+                if not self.dry_run:
+                    TemporaryUploadChunked.objects.filter(
+                        upload_id=upload_id).update(upload_dir=new_dir)
+                    move_chunk_state(upload_id, new_dir)
+
+        self.stdout.write('%s %d temporary upload directories'
+                          % ('Would move' if self.dry_run else 'Moved',
+                             self.moved))
+
+    def _move(self, old_dir, new_dir):
+        self.stdout.write('%s %s -> %s' % (
+            'Would move' if self.dry_run else 'Moving', old_dir, new_dir))
+        old_path = os.path.join(storage.location, old_dir)
+        new_path = os.path.join(storage.location, new_dir)
+        # A chunked upload and the TemporaryUpload created from it share a
+        # directory so it may already have been moved.
+        if not os.path.isdir(old_path):
+            if not os.path.isdir(new_path):
+                LOG.warning('Temporary upload directory <%s> not found.'
+                            % old_path)
+            return
+        self.moved += 1
+        if self.dry_run:
+            return
+
+        parent = os.path.dirname(new_path)
+        if not os.path.exists(parent):
+            os.makedirs(parent)
+        os.rename(old_path, new_path)
+        self._remove_empty_shard_dirs(os.path.dirname(old_path))
+
+    def _remove_empty_shard_dirs(self, path):
+        # Remove empty shard directories left behind after moving an upload
+        # directory, stopping at the temporary upload storage location.
+        location = os.path.abspath(storage.location)
+        path = os.path.abspath(path)
+        while path.startswith(location + os.sep):
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+            path = os.path.dirname(path)
@@ -0,0 +1,159 @@
+'''
+A management command to remove expired temporary uploads.
+
+Temporary uploads (TemporaryUpload records) that are never stored using the
+store_upload API function or reverted by the client, and chunked uploads
+(TemporaryUploadChunked records) that are never completed, are otherwise
+left in the database with their files remaining in UPLOAD_TMP.
+
+Expired records are selected in batches using keyset pagination on the
+primary key. The database records for each batch are removed with a
+single delete query and the files and chunk directories are then removed in
+parallel using a pool of threads. Temporary uploads are removed using the
+same approach as the delete_temp_uploads API function so the per-instance
+post_delete signal handler doesn't remove their files. The progress of
+purged chunked uploads held by the chunk state backend is also removed.
+'''
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import _delete_temp_upload_batch, \
+    _iter_temp_upload_batches
+from django_drf_filepond.chunk_state import CHUNK_STATE_FILE_NAME, \
+    get_chunk_state_backend
+from django_drf_filepond.metrics import CHUNK_DIRS, adjust_gauge
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, TemporaryUploadFetch, storage
+from django_drf_filepond.utils import _iter_keyset_batches
+
+LOG = logging.getLogger(__name__)
+
+
+def _remove_chunk_files(upload):
+    # Remove the progress of a purged TemporaryUploadChunked held by the
+    # chunk state backend, so that PATCH requests for the upload are no
+    # longer accepted, then remove its chunk files and the chunk directory
+    # if it is now empty. Only files named using the upload's file_id, and
+    # the file holding the upload's progress when using
+    # FileChunkStateBackend, are removed. Returns the number of files
+    # removed.
+    (upload_id, upload_dir, file_id) = upload
+    get_chunk_state_backend().delete(upload_id, upload_dir)
+    chunk_dir = os.path.join(storage.base_location, upload_dir)
+    try:
+        entries = os.listdir(chunk_dir)
+    except OSError:
+        return 0
+    adjust_gauge(CHUNK_DIRS, -1)
+
+    removed = 0
+    chunk_prefix = '%s_' % file_id
+    for entry in entries:
+        if (entry.startswith(chunk_prefix) or
+                entry == CHUNK_STATE_FILE_NAME):
+            try:
+                os.remove(os.path.join(chunk_dir, entry))
+                removed += 1
+            except OSError as e:
+                LOG.debug('Unable to remove chunk file <%s>: %s'
+                          % (entry, str(e)))
+    try:
+        os.rmdir(chunk_dir)
+    except OSError:
+        # Directory not empty - it may also hold a TemporaryUpload
+        pass
+    return removed
+
+
+class Command(BaseCommand):
+    help = ('Remove expired temporary uploads, incomplete chunked uploads '
+            'and asynchronous fetch jobs along with their files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int,
+            default=local_settings.TEMP_UPLOAD_MAX_AGE,
+            help=('Remove temporary uploads older than this many seconds '
+                  '(default: %(default)s).'))
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='The number of records processed in each batch.')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='The number of threads used to remove files.')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Report what would be removed without removing anything.')
+
+    def handle(self, *args, **options):
+        if options['max_age'] < 0:
+            raise CommandError('--max-age must not be negative.')
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at '
+                               'least 1.')
+
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(seconds=options['max_age'])
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            self._purge_temp_uploads(
+                TemporaryUpload.objects.filter(uploaded__lt=cutoff),
+                executor)
+            self._purge(
+                'chunked uploads',
+                TemporaryUploadChunked.objects.filter(
+                    last_upload_time__lt=cutoff),
+                ('upload_dir', 'file_id'), executor, _remove_chunk_files)
+            self._purge(
+                'fetch jobs',
+                TemporaryUploadFetch.objects.filter(
+                    last_update_time__lt=cutoff),
+                ('upload_id',), executor, None)
+
+    def _purge_temp_uploads(self, queryset, executor):
+        start = time.time()
+        records = 0
+        files = 0
+        for batch in _iter_temp_upload_batches(queryset, self.batch_size):
+            records += len(batch)
+            if self.dry_run:
+                self._report_batch(batch)
+            else:
+                files += _delete_temp_upload_batch(batch, executor)
+        self._report('temporary uploads', records, files, start)
+
+    def _purge(self, description, queryset, fields, executor, remove_fn):
+        start = time.time()
+        records = 0
+        files = 0
+        for batch in _iter_keyset_batches(queryset, fields, self.batch_size):
+            records += len(batch)
+            if self.dry_run:
+                self._report_batch(batch)
+                continue
+
+            queryset.model.objects.filter(
+                pk__in=[row[0] for row in batch]).delete()
+            if remove_fn:
+                files += sum(executor.map(remove_fn, batch))
+        self._report(description, records, files, start)
+
+    def _report_batch(self, batch):
+        for row in batch:
+            self.stdout.write('Would remove %s' % (row[0],))
+
+    def _report(self, description, records, files, start):
+        elapsed = time.time() - start
+        rate = (records / elapsed) if elapsed > 0 else 0
+        self.stdout.write(
+            '%s %d %s (%d files) in %.2fs (%.1f records/s)'
+            % ('Would remove' if self.dry_run else 'Removed', records,
+               description, files, elapsed, rate))
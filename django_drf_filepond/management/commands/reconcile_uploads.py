@@ -0,0 +1,330 @@
+'''
+A management command to find, and optionally repair, differences between
+the files on disk and the upload records in the database.
+
+A failure part way through handling an upload, e.g. between saving a chunk
+and updating the TemporaryUploadChunked record, or between copying a file
+to the file store and deleting the TemporaryUpload in _store_upload_local,
+can leave directories in UPLOAD_TMP with no corresponding record, or
+records with no corresponding files. The following are reported:
+
+    orphan-temp-dir     A directory in UPLOAD_TMP with no TemporaryUpload or
+                        TemporaryUploadChunked record.
+    missing-temp-file   A TemporaryUpload record whose file doesn't exist.
+    missing-chunk-dir   A TemporaryUploadChunked record whose chunk
+                        directory doesn't exist.
+    orphan-stored-file  A file under FILE_STORE_PATH with no StoredUpload
+                        record (local storage only). Files in the
+                        content-addressed store are not checked.
+    missing-stored-file A StoredUpload record whose file doesn't exist
+                        (local storage only).
+
+Directories are scanned with os.scandir using a pool of threads. Entries
+found are streamed through a bounded queue and compared against the
+database in batches using set lookups so memory use doesn't grow with the
+number of entries.
+'''
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from six.moves import queue
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import delete_temp_uploads
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, StoredUpload, get_content_path, storage
+from django_drf_filepond.utils import _iter_keyset_batches
+
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+LOG = logging.getLogger(__name__)
+
+# The maximum number of scanned entries held in the queue between the
+# scanning threads and the thread comparing entries against the database.
+SCAN_QUEUE_SIZE = 10000
+
+
+class ParallelScanner(object):
+    """
+    Scans a directory tree using a pool of threads, yielding the paths,
+    relative to root, of the entries found.
+
+    If dir_depth is None, the whole tree is scanned and the paths of files
+    are yielded. Otherwise, only directories are yielded, those found
+    dir_depth levels below the top level of the tree (0 for the directories
+    directly within root). Entries with names starting with '.' are ignored.
+
+    Scanned entries are passed to the consumer via a bounded queue so the
+    scanning threads wait if the consumer falls behind.
+    """
+
+    _DONE = object()
+
+    def __init__(self, root, workers, dir_depth=None,
+                 queue_size=SCAN_QUEUE_SIZE):
+        self.root = root
+        self.workers = workers
+        self.dir_depth = dir_depth
+        self.results = queue.Queue(maxsize=queue_size)
+        self._dirs = []
+        self._pending = 0
+        self._errors = []
+        self._cond = threading.Condition()
+
+    def __iter__(self):
+        self._dirs.append(('', 0))
+        self._pending = 1
+        threads = [threading.Thread(target=self._worker)
+                   for _ in range(self.workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        finished = 0
+        while finished < self.workers:
+            item = self.results.get()
+            if item is self._DONE:
+                finished += 1
+            else:
+                yield item
+
+        for t in threads:
+            t.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._dirs and self._pending:
+                    self._cond.wait()
+                if not self._dirs:
+                    # No directories left to scan and none being scanned
+                    self._cond.notify_all()
+                    break
+                (rel_dir, depth) = self._dirs.pop()
+
+            try:
+                self._scan(rel_dir, depth)
+            except OSError as e:
+                LOG.error('Error scanning <%s>: %s'
+                          % (os.path.join(self.root, rel_dir), str(e)))
+                self._errors.append(e)
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
+
+        self.results.put(self._DONE)
+
+    def _scan(self, rel_dir, depth):
+        for entry in scandir(os.path.join(self.root, rel_dir)):
+            if entry.name.startswith('.'):
+                continue
+            rel_path = os.path.join(rel_dir, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                if self.dir_depth is None or depth < self.dir_depth:
+                    with self._cond:
+                        self._dirs.append((rel_path, depth + 1))
+                        self._pending += 1
+                        self._cond.notify()
+                else:
+                    self.results.put(rel_path)
+            elif self.dir_depth is None:
+                self.results.put(rel_path)
+
+
+def _batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Find differences between the files in the temporary upload '
+            'and file store directories and the upload records in the '
+            'database and optionally repair them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair', action='store_true', default=False,
+            help=('Remove orphaned temporary upload directories and '
+                  'temporary upload records whose files are missing.'))
+        parser.add_argument(
+            '--repair-stored', action='store_true', default=False,
+            help=('Remove orphaned files under FILE_STORE_PATH and '
+                  'StoredUpload records whose files are missing. USE WITH '
+                  'CARE: any other files stored under FILE_STORE_PATH are '
+                  'treated as orphaned files.'))
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help=('Only treat temporary directories and stored files '
+                  'that have not been modified for this many seconds as '
+                  'orphaned, to avoid including uploads in progress '
+                  '(default: %(default)s).'))
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='The number of entries compared in each batch.')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='The number of threads used to scan directories.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at '
+                               'least 1.')
+        self.batch_size = options['batch_size']
+        self.workers = options['workers']
+        self.min_age = options['min_age']
+        self.counts = {}
+        start = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.executor = executor
+            self._check_temp_dirs(options['repair'])
+            self._check_temp_records(options['repair'])
+            if (local_settings.STORAGES_BACKEND or
+                    not local_settings.FILE_STORE_PATH):
+                LOG.info('Not using a local file store, skipping checks '
+                         'of stored uploads.')
+            else:
+                self._check_stored_files(options['repair_stored'])
+                self._check_stored_records(options['repair_stored'])
+
+        self.stdout.write(
+            'Reconciliation complete in %.2fs: %s' % (
+                time.time() - start,
+                ', '.join('%s=%d' % (key, self.counts.get(key, 0)) for key in
+                          ('orphan-temp-dir', 'missing-temp-file',
+                           'missing-chunk-dir', 'orphan-stored-file',
+                           'missing-stored-file'))))
+
+    def _report(self, kind, items):
+        self.counts[kind] = self.counts.get(kind, 0) + len(items)
+        for item in items:
+            self.stdout.write('%s %s' % (kind, item))
+
+    def _check_temp_dirs(self, repair):
+        if not os.path.isdir(storage.location):
+            return
+        # Upload directories are nested within UPLOAD_TMP_SHARD_DEPTH levels
+        # of shard directories. Directories using a different layout should
+        # be moved using the migrate_upload_tmp_layout command first.
+        scanner = ParallelScanner(
+            storage.location, self.workers,
+            dir_depth=local_settings.UPLOAD_TMP_SHARD_DEPTH or 0)
+        for batch in _batched(scanner, self.batch_size):
+            names = set(batch)
+            names -= set(TemporaryUploadChunked.objects.filter(
+                upload_dir__in=names).values_list('upload_dir', flat=True))
+            known_ids = set(TemporaryUpload.objects.filter(
+                upload_id__in=[os.path.basename(name) for name in names]
+            ).values_list('upload_id', flat=True))
+            orphans = sorted(
+                name for name in names
+                if (os.path.basename(name) not in known_ids and
+                    self._older_than_min_age(storage.location, name)))
+            self._report('orphan-temp-dir', orphans)
+            if repair and orphans:
+                list(self.executor.map(
+                    lambda name: shutil.rmtree(
+                        os.path.join(storage.location, name), True),
+                    orphans))
+
+    def _older_than_min_age(self, root, name):
+        try:
+            mtime = os.path.getmtime(os.path.join(root, name))
+        except OSError:
+            return False
+        return (time.time() - mtime) >= self.min_age
+
+    def _missing(self, paths):
+        # Return a list of flags indicating which of the paths don't exist,
+        # checking the paths concurrently.
+        return list(self.executor.map(
+            lambda path: not os.path.exists(path), paths))
+
+    def _check_temp_records(self, repair):
+        for batch in _iter_keyset_batches(TemporaryUpload.objects.all(),
+                                          ('file',), self.batch_size):
+            paths = [os.path.join(storage.location, file_name)
+                     for (_, file_name) in batch]
+            missing = [row[0] for (row, is_missing)
+                       in zip(batch, self._missing(paths)) if is_missing]
+            self._report('missing-temp-file', missing)
+            if repair and missing:
+                delete_temp_uploads(missing)
+
+        for batch in _iter_keyset_batches(
+                TemporaryUploadChunked.objects.all(), ('upload_dir',),
+                self.batch_size):
+            paths = [os.path.join(storage.base_location, upload_dir)
+                     for (_, upload_dir) in batch]
+            missing = [row[0] for (row, is_missing)
+                       in zip(batch, self._missing(paths)) if is_missing]
+            self._report('missing-chunk-dir', missing)
+            if repair and missing:
+                TemporaryUploadChunked.objects.filter(
+                    upload_id__in=missing).delete()
+
+    def _check_stored_files(self, repair):
+        file_store = local_settings.FILE_STORE_PATH
+        if not os.path.isdir(file_store):
+            return
+        scanner = ParallelScanner(file_store, self.workers)
+        for batch in _batched(scanner, self.batch_size):
+            paths = set(batch)
+            paths -= set(StoredUpload.objects.filter(
+                file__in=paths).values_list('file', flat=True))
+            # A file is copied into the file store before its StoredUpload
+            # record is saved so recently modified files are skipped.
+            orphans = sorted(
+                path for path in paths
+                if self._older_than_min_age(file_store, path))
+            self._report('orphan-stored-file', orphans)
+            if repair and orphans:
+                for error in self.executor.map(
+                        lambda path: self._remove_file(file_store, path),
+                        orphans):
+                    if error:
+                        self.stderr.write(error)
+
+    def _remove_file(self, root, path):
+        # Remove a file, returning an error message if it couldn't be
+        # removed so that one failure doesn't stop the repair.
+        try:
+            os.remove(os.path.join(root, path))
+        except OSError as e:
+            LOG.error('Unable to remove orphaned file <%s>: %s'
+                      % (path, str(e)))
+            return 'Unable to remove orphaned file %s: %s' % (path, str(e))
+        return None
+
+    def _check_stored_records(self, repair):
+        file_store = local_settings.FILE_STORE_PATH
+        for batch in _iter_keyset_batches(StoredUpload.objects.all(),
+                                          ('file', 'content_hash'),
+                                          self.batch_size):
+            paths = [os.path.join(file_store, get_content_path(content_hash)
+                                  if content_hash else file_name)
+                     for (_, file_name, content_hash) in batch]
+            missing = [row[0] for (row, is_missing)
+                       in zip(batch, self._missing(paths)) if is_missing]
+            self._report('missing-stored-file', missing)
+            if repair and missing:
+                # The post_delete signal handler invalidates the cached
+                # lookups for the deleted records.
+                StoredUpload.objects.filter(upload_id__in=missing).delete()
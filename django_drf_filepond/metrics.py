@@ -0,0 +1,377 @@
+# A module providing optional instrumentation of the filepond endpoints and
+# of the main phases of handling uploads. Metrics are recorded by a "sink",
+# an instance of the class set by DJANGO_DRF_FILEPOND_METRICS_SINK created
+# with the keyword arguments in DJANGO_DRF_FILEPOND_METRICS_SINK_OPTIONS.
+# Metrics are disabled if no sink is set, in which case the instrumentation
+# functions return after checking the setting.
+#
+# The following metrics are recorded:
+#
+# drf_filepond_requests_total: counter of requests to each endpoint, with
+#     endpoint, method and status labels.
+# drf_filepond_request_duration_seconds: histogram of the time taken to
+#     handle requests, with endpoint and method labels.
+# drf_filepond_phase_duration_seconds: histogram of the time taken by each
+#     phase of handling an upload, with a phase label (see PHASES).
+# drf_filepond_received_bytes_total / drf_filepond_sent_bytes_total:
+#     counters of request and response body bytes, with an endpoint label.
+# drf_filepond_fetched_bytes_total: counter of bytes downloaded from remote
+#     URLs by the fetch endpoint.
+# drf_filepond_active_uploads: gauge of the process and patch requests
+#     currently being handled.
+# drf_filepond_chunk_dirs: gauge of the chunk directories of incomplete
+#     chunked uploads. This is recorded as changes to the gauge so, with
+#     more than one process, the value is the sum across the processes.
+import logging
+import socket
+import threading
+from timeit import default_timer
+
+from django_drf_filepond.utils import _SettingInstance
+
+LOG = logging.getLogger(__name__)
+
+REQUESTS = 'drf_filepond_requests_total'
+REQUEST_DURATION = 'drf_filepond_request_duration_seconds'
+PHASE_DURATION = 'drf_filepond_phase_duration_seconds'
+RECEIVED_BYTES = 'drf_filepond_received_bytes_total'
+SENT_BYTES = 'drf_filepond_sent_bytes_total'
+FETCHED_BYTES = 'drf_filepond_fetched_bytes_total'
+ACTIVE_UPLOADS = 'drf_filepond_active_uploads'
+CHUNK_DIRS = 'drf_filepond_chunk_dirs'
+
+# The phases timed by the phase duration histogram
+PHASES = (
+    'parse',              # Parsing the request body
+    'temp_upload_save',   # Writing a standard upload's file and record
+    'chunk_upload_init',  # Creating the record for a new chunked upload
+    'chunk_write',        # Writing a chunk's data to disk
+    'chunk_state_save',   # Saving the progress of a chunked upload
+    'reassemble',         # Combining the chunks of a completed upload
+    'store_local',        # Copying a file to the local file store
+    'store_remote',       # Saving a file to a remote storage backend
+    'store_db_write',     # Saving the StoredUpload record
+    'fetch',              # Downloading a remote file
+)
+
+# The endpoints counted by the active uploads gauge
+UPLOAD_ENDPOINTS = ('process', 'patch')
+
+# The default upper bounds, in seconds, of the histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0)
+
+# The content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_sink = _SettingInstance('METRICS_SINK', 'METRICS_SINK_OPTIONS',
+                         'metrics sink')
+
+
+class MetricsSink(object):
+    """
+    The interface implemented by metrics sinks. labels is a dict mapping
+    label names to string values.
+    """
+
+    def increment(self, name, value=1, labels=None):
+        """Add value to a counter."""
+        raise NotImplementedError()
+
+    def observe(self, name, value, labels=None):
+        """Record a value, a duration in seconds, in a histogram."""
+        raise NotImplementedError()
+
+    def adjust_gauge(self, name, delta, labels=None):
+        """Add delta, which may be negative, to a gauge."""
+        raise NotImplementedError()
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """
+    Holds the metrics recorded by the current process in memory. The
+    metrics can be exposed in the Prometheus text format by
+    views.MetricsView and accessed directly, e.g. in tests, using
+    get_counter, get_gauge and get_histogram.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._histograms = {}
+
+    def _get_key(self, name, labels):
+        return (name, tuple(sorted((labels or {}).items())))
+
+    def increment(self, name, value=1, labels=None):
+        key = self._get_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def adjust_gauge(self, name, delta, labels=None):
+        key = self._get_key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, value, labels=None):
+        key = self._get_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': [0] * len(self.buckets),
+                             'sum': 0.0, 'count': 0}
+                self._histograms[key] = histogram
+            # The bucket counts are cumulative, as in the Prometheus format
+            for (i, bound) in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def get_counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(self._get_key(name, labels), 0)
+
+    def get_gauge(self, name, **labels):
+        with self._lock:
+            return self._gauges.get(self._get_key(name, labels), 0)
+
+    def get_histogram(self, name, **labels):
+        """
+        Returns a dict with the cumulative bucket counts, sum and count of
+        the values recorded, or None if no values have been recorded.
+        """
+        with self._lock:
+            histogram = self._histograms.get(self._get_key(name, labels))
+            if histogram is None:
+                return None
+            return {'buckets': list(zip(self.buckets, histogram['buckets'])),
+                    'sum': histogram['sum'], 'count': histogram['count']}
+
+    def render_prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for (metric_type, values) in (('counter', self._counters),
+                                          ('gauge', self._gauges)):
+                for name in sorted(set(key[0] for key in values)):
+                    lines.append('# TYPE %s %s' % (name, metric_type))
+                    for key in sorted(k for k in values if k[0] == name):
+                        lines.append('%s%s %s' % (
+                            name, _format_labels(key[1]),
+                            str(values[key])))
+
+            for name in sorted(set(key[0] for key in self._histograms)):
+                lines.append('# TYPE %s histogram' % name)
+                for key in sorted(k for k in self._histograms
+                                  if k[0] == name):
+                    histogram = self._histograms[key]
+                    for (bound, count) in zip(self.buckets,
+                                              histogram['buckets']):
+                        lines.append('%s_bucket%s %d' % (
+                            name, _format_labels(
+                                key[1] + (('le', str(bound)),)),
+                            count))
+                    lines.append('%s_bucket%s %d' % (
+                        name, _format_labels(key[1] + (('le', '+Inf'),)),
+                        histogram['count']))
+                    lines.append('%s_sum%s %s' % (
+                        name, _format_labels(key[1]),
+                        str(histogram['sum'])))
+                    lines.append('%s_count%s %d' % (
+                        name, _format_labels(key[1]), histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdMetricsSink(MetricsSink):
+    """
+    Sends metrics to a statsd server over UDP. The metric name and label
+    values are combined into a dotted statsd name with the drf_filepond_
+    prefix replaced by prefix, e.g. drf_filepond.requests_total.patch.PATCH.
+    200. Histogram values are sent as timings in milliseconds. Errors
+    sending metrics are logged and otherwise ignored.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='drf_filepond'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _get_name(self, name, labels):
+        if name.startswith('drf_filepond_'):
+            name = name[len('drf_filepond_'):]
+        parts = [self.prefix, name] if self.prefix else [name]
+        parts.extend(str(labels[label]).replace('.', '_')
+                     for label in sorted(labels or {}))
+        return '.'.join(parts)
+
+    def _send(self, data):
+        try:
+            self._socket.sendto(data.encode('utf-8'), self.address)
+        except (socket.error, OSError) as e:
+            LOG.debug('Unable to send metric to statsd server: %s' % str(e))
+
+    def increment(self, name, value=1, labels=None):
+        self._send('%s:%s|c' % (self._get_name(name, labels), value))
+
+    def observe(self, name, value, labels=None):
+        self._send('%s:%.3f|ms' % (self._get_name(name, labels),
+                                   value * 1000))
+
+    def adjust_gauge(self, name, delta, labels=None):
+        self._send('%s:%+d|g' % (self._get_name(name, labels), delta))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                     .replace('"', '\\"').replace('\n', '\\n'))
+        for (name, value) in labels)
+
+
+def get_metrics_sink():
+    """
+    Get the sink set by METRICS_SINK, creating it the first time it is
+    requested. Returns None if metrics are disabled.
+    """
+    return _sink.get()
+
+
+def reset_metrics_sink():
+    """
+    Discard the current sink so that a new one is created when metrics are
+    next recorded.
+    """
+    _sink.reset()
+
+
+def increment(name, value=1, **labels):
+    sink = get_metrics_sink()
+    if sink is not None:
+        sink.increment(name, value, labels)
+
+
+def adjust_gauge(name, delta, **labels):
+    sink = get_metrics_sink()
+    if sink is not None:
+        sink.adjust_gauge(name, delta, labels)
+
+
+class _PhaseTimer(object):
+
+    def __init__(self, sink, phase):
+        self.sink = sink
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.sink.observe(PHASE_DURATION, default_timer() - self.start,
+                          {'phase': self.phase})
+        return False
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def time_phase(phase):
+    """
+    Returns a context manager that records the time taken by the code it
+    wraps in the phase duration histogram for the specified phase.
+    """
+    sink = get_metrics_sink()
+    if sink is None:
+        return _NULL_TIMER
+    return _PhaseTimer(sink, phase)
+
+
+class RequestMetrics(object):
+    """
+    Records the metrics for a request to one of the endpoints. Created by
+    start_request_metrics, finish must be called with the response, or None
+    if an exception was raised, once the request has been handled.
+    """
+
+    def __init__(self, sink, endpoint, request):
+        self.sink = sink
+        self.endpoint = endpoint
+        self.method = request.method
+        self.received = _get_content_length(request.META)
+        if endpoint in UPLOAD_ENDPOINTS:
+            sink.adjust_gauge(ACTIVE_UPLOADS, 1, {})
+        self.start = default_timer()
+
+    def finish(self, response):
+        labels = {'endpoint': self.endpoint, 'method': self.method}
+        self.sink.observe(REQUEST_DURATION, default_timer() - self.start,
+                          labels)
+        status = response.status_code if response is not None else 500
+        self.sink.increment(REQUESTS, 1, dict(labels, status=str(status)))
+        if self.received:
+            self.sink.increment(RECEIVED_BYTES, self.received,
+                                {'endpoint': self.endpoint})
+        if (response is not None and
+                not getattr(response, 'is_rendered', True)):
+            # DRF responses are rendered after the view returns them so the
+            # bytes sent are recorded once the response has been rendered.
+            response.add_post_render_callback(self._record_sent_bytes)
+        else:
+            self._record_sent_bytes(response)
+        if self.endpoint in UPLOAD_ENDPOINTS:
+            self.sink.adjust_gauge(ACTIVE_UPLOADS, -1, {})
+
+    def _record_sent_bytes(self, response):
+        sent = _get_response_length(response)
+        if sent:
+            self.sink.increment(SENT_BYTES, sent,
+                                {'endpoint': self.endpoint})
+
+
+def start_request_metrics(endpoint, request):
+    """
+    Start recording the metrics for a request to the specified endpoint.
+    Returns a RequestMetrics instance, or None if metrics are disabled.
+    """
+    sink = get_metrics_sink()
+    if sink is None:
+        return None
+    return RequestMetrics(sink, endpoint, request)
+
+
+def _get_content_length(meta):
+    try:
+        return int(meta.get('CONTENT_LENGTH') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _get_response_length(response):
+    # The length of streamed responses is taken from the Content-Length
+    # header.
+    if response is None:
+        return 0
+    if response.has_header('Content-Length'):
+        return _get_content_length(
+            {'CONTENT_LENGTH': response['Content-Length']})
+    if getattr(response, 'streaming', False):
+        return 0
+    return len(response.content)
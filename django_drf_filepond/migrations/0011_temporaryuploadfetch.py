@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:44
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('django_drf_filepond', '0010_temp_chunked_biginteger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemporaryUploadFetch',
+            fields=[
+                ('upload_id',
+                 models.CharField(
+                     max_length=22, primary_key=True, serialize=False,
+                     validators=[
+                         django.core.validators.MinLengthValidator(22)])),
+                ('target_url', models.CharField(max_length=2048)),
+                ('status',
+                 models.CharField(
+                     choices=[('P', 'Pending'), ('R', 'Running'),
+                              ('C', 'Complete'), ('F', 'Failed')],
+                     default='P', max_length=1)),
+                ('bytes_downloaded', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(blank=True, null=True)),
+                ('upload_name', models.CharField(default='', max_length=512)),
+                ('error',
+                 models.CharField(blank=True, default='', max_length=512)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_update_time', models.DateTimeField(auto_now=True)),
+                ('uploaded_by',
+                 models.ForeignKey(
+                     blank=True, null=True,
+                     on_delete=django.db.models.deletion.CASCADE,
+                     to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_drf_filepond', '0011_temporaryuploadfetch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedupload',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='',
+                                   max_length=64),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:20
+
+from django.db import migrations, models
+
+STORED_UPLOAD_FILE_INDEX = 'drf_filepond_su_file_idx'
+
+
+# StoredUpload.file is a 2048 character column. PostgreSQL can't create a
+# b-tree index on values of this length so a hash index (which supports the
+# equality lookups carried out by get_stored_upload) is used. MySQL limits
+# the length of index keys so a prefix index is used. Other databases use a
+# regular index.
+def create_stored_upload_file_index(apps, schema_editor):
+    table = schema_editor.quote_name(
+        apps.get_model('django_drf_filepond',
+                       'StoredUpload')._meta.db_table)
+    index = schema_editor.quote_name(STORED_UPLOAD_FILE_INDEX)
+    column = schema_editor.quote_name('file')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        sql = 'CREATE INDEX %s ON %s USING hash (%s)' % (index, table, column)
+    elif vendor == 'mysql':
+        sql = 'CREATE INDEX %s ON %s (%s(255))' % (index, table, column)
+    else:
+        sql = 'CREATE INDEX %s ON %s (%s)' % (index, table, column)
+    schema_editor.execute(sql)
+
+
+def drop_stored_upload_file_index(apps, schema_editor):
+    index = schema_editor.quote_name(STORED_UPLOAD_FILE_INDEX)
+    if schema_editor.connection.vendor == 'mysql':
+        table = schema_editor.quote_name(
+            apps.get_model('django_drf_filepond',
+                           'StoredUpload')._meta.db_table)
+        schema_editor.execute('DROP INDEX %s ON %s' % (index, table))
+    else:
+        schema_editor.execute('DROP INDEX %s' % index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_drf_filepond', '0012_storedupload_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='temporaryupload',
+            name='uploaded',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='temporaryuploadchunked',
+            name='last_upload_time',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='temporaryuploadfetch',
+            name='last_update_time',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        # The index is recorded in the model state so that it's recreated
+        # when SQLite rebuilds the table in later migrations.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_stored_upload_file_index,
+                                     drop_stored_upload_file_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='storedupload',
+                    index=models.Index(fields=['file'],
+                                       name=STORED_UPLOAD_FILE_INDEX),
+                ),
+            ],
+        ),
+    ]
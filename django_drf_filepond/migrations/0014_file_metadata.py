@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_drf_filepond', '0013_add_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedupload',
+            name='content_type',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='storedupload',
+            name='digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='storedupload',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='storedupload',
+            name='sniffed_type',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='temporaryupload',
+            name='content_type',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='temporaryupload',
+            name='digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='temporaryupload',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='temporaryupload',
+            name='sniffed_type',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
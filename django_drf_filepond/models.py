@@ -3,6 +3,8 @@ from __future__ import unicode_literals
 
 import logging
 import os
+import threading
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
@@ -13,8 +15,11 @@ from django.dispatch import receiver
 from django.utils.deconstruct import deconstructible
 
 import django_drf_filepond.drf_filepond_settings as local_settings
-from django.utils.functional import LazyObject
-from django_drf_filepond.storage_utils import _get_storage_backend
+from django.utils.functional import LazyObject, empty
+from django_drf_filepond.file_metadata import FileMetadataCollector, \
+    MetadataCollectingFile, get_file_metadata
+from django_drf_filepond.storage_utils import get_storage_backend, \
+    on_storage_backends_reset
 
 
 LOG = logging.getLogger(__name__)
@@ -80,20 +85,40 @@ class FilePondLocalStoredStorage(FileSystemStorage):
 class DrfFilePondStoredStorage(LazyObject):
 
     def _setup(self):
-        # Work out which storage backend we need to use and then
-        # instantiate it and assign it to self._wrapped
-        storage_module_name = getattr(local_settings, 'STORAGES_BACKEND', None)
+        # Work out which storage backend we need to use and assign it to
+        # self._wrapped. A remote backend is the shared instance from the
+        # storage backend registry.
         LOG.debug('Initialising storage backend with storage module name [%s]'
-                  % storage_module_name)
-        storage_backend = _get_storage_backend(storage_module_name)
+                  % getattr(local_settings, 'STORAGES_BACKEND', None))
+        storage_backend = get_storage_backend()
         if not storage_backend:
             self._wrapped = FilePondLocalStoredStorage()
         else:
             self._wrapped = storage_backend
 
 
+# The number of characters of the upload ID used to name each level of
+# shard directory when UPLOAD_TMP_SHARD_DEPTH is set.
+UPLOAD_TMP_SHARD_WIDTH = 2
+
+
+# Get the path, relative to the temporary upload storage location, of the
+# directory used to hold the file (or chunks) for the specified upload ID.
+# If UPLOAD_TMP_SHARD_DEPTH is set, the directory is nested within shard
+# directories named using the start of the upload ID.
+def get_upload_dir(upload_id):
+    depth = local_settings.UPLOAD_TMP_SHARD_DEPTH or 0
+    shards = [upload_id[i*UPLOAD_TMP_SHARD_WIDTH:(i+1)*UPLOAD_TMP_SHARD_WIDTH]
+              for i in range(depth)]
+    return os.path.join(*(shards + [upload_id]))
+
+
+# The fields holding file metadata on TemporaryUpload and StoredUpload
+FILE_METADATA_FIELDS = ('size', 'content_type', 'sniffed_type', 'digest')
+
+
 def get_upload_path(instance, filename):
-    return os.path.join(instance.upload_id, filename)
+    return os.path.join(get_upload_dir(instance.upload_id), filename)
 
 
 class TemporaryUpload(models.Model):
@@ -114,15 +139,51 @@ class TemporaryUpload(models.Model):
                                validators=[MinLengthValidator(22)])
     file = models.FileField(storage=storage, upload_to=get_upload_path)
     upload_name = models.CharField(max_length=512)
-    uploaded = models.DateTimeField(auto_now_add=True)
+    uploaded = models.DateTimeField(auto_now_add=True, db_index=True)
     upload_type = models.CharField(max_length=1,
                                    choices=UPLOAD_TYPE_CHOICES)
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True,
                                     blank=True, on_delete=models.CASCADE)
+    # The size, content type (guessed from the file name), content type
+    # detected from the start of the file data and SHA-256 digest of the
+    # file. These are set when the record is created, see file_metadata.
+    size = models.BigIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    sniffed_type = models.CharField(max_length=255, blank=True, default='')
+    digest = models.CharField(max_length=64, blank=True, default='')
+
+    def save(self, *args, **kwargs):
+        # If a new file is being saved, write it to storage here, rather
+        # than when the record is saved, so that its metadata is obtained
+        # in the same pass over the file data. A file with a temporary file
+        # path is moved into place without being read, so its metadata is
+        # obtained from the temporary file first.
+        if (self.size is None and self.file and
+                not getattr(self.file, '_committed', True)):
+            content = self.file.file
+            collector = None
+            if hasattr(content, 'temporary_file_path'):
+                metadata = get_file_metadata(content.chunks(),
+                                             self.upload_name)
+            else:
+                collector = FileMetadataCollector()
+                content = MetadataCollectingFile(content, collector)
+            self.file.save(self.file.name, content, save=False)
+            if collector:
+                metadata = collector.get_metadata(self.upload_name)
+            for (name, value) in metadata.items():
+                setattr(self, name, value)
+        super(TemporaryUpload, self).save(*args, **kwargs)
 
     def get_file_path(self):
         return self.file.path
 
+    def copy_file_metadata(self, instance):
+        # Copy the file metadata from this record to another record, e.g. a
+        # StoredUpload created from this record.
+        for name in FILE_METADATA_FIELDS:
+            setattr(instance, name, getattr(self, name))
+
 
 class TemporaryUploadChunked(models.Model):
     # The unique ID returned to the client and the name of the temporary
@@ -141,11 +202,55 @@ class TemporaryUploadChunked(models.Model):
     total_size = models.BigIntegerField(default=0)
     upload_name = models.CharField(max_length=512, default='')
     upload_complete = models.BooleanField(default=False)
-    last_upload_time = models.DateTimeField(auto_now=True)
+    last_upload_time = models.DateTimeField(auto_now=True, db_index=True)
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True,
+                                    blank=True, on_delete=models.CASCADE)
+
+
+class TemporaryUploadFetch(models.Model):
+
+    PENDING = 'P'
+    RUNNING = 'R'
+    COMPLETE = 'C'
+    FAILED = 'F'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    )
+
+    # The unique ID returned to the client when an asynchronous fetch job
+    # is registered. This is re-used as the upload_id of the TemporaryUpload
+    # record that is created when the download of the remote file completes.
+    upload_id = models.CharField(primary_key=True, max_length=22,
+                                 validators=[MinLengthValidator(22)])
+    target_url = models.CharField(max_length=2048)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES,
+                              default=PENDING)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    # The size of the remote file, if provided by the remote server
+    total_size = models.BigIntegerField(null=True, blank=True)
+    upload_name = models.CharField(max_length=512, default='')
+    error = models.CharField(max_length=512, default='', blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    last_update_time = models.DateTimeField(auto_now=True, db_index=True)
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True,
                                     blank=True, on_delete=models.CASCADE)
 
 
+# The directory within FILE_STORE_PATH holding the files for stored
+# uploads when FILE_STORE_CONTENT_ADDRESSED is set.
+CONTENT_STORE_DIR = '.content'
+
+
+# Get the path, relative to FILE_STORE_PATH, of the file holding the content
+# with the specified SHA-256 hash in the content-addressed file store.
+def get_content_path(content_hash):
+    return os.path.join(CONTENT_STORE_DIR, content_hash[:2],
+                        content_hash[2:4], content_hash)
+
+
 class StoredUpload(models.Model):
 
     # The unique upload ID assigned to this file when it was originally
@@ -160,18 +265,80 @@ class StoredUpload(models.Model):
     stored = models.DateTimeField(auto_now_add=True)
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True,
                                     blank=True, on_delete=models.CASCADE)
+    # The SHA-256 hash of the file content if the upload was stored in the
+    # content-addressed file store (see FILE_STORE_CONTENT_ADDRESSED). The
+    # file is then stored at the path given by get_content_path rather than
+    # at the path in the file field. Records with the same hash share the
+    # stored file.
+    content_hash = models.CharField(max_length=64, blank=True, default='',
+                                    db_index=True)
+    # The size, content type (guessed from the file name), content type
+    # detected from the start of the file data and SHA-256 digest of the
+    # file. These are set when the record is created, see file_metadata.
+    size = models.BigIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    sniffed_type = models.CharField(max_length=255, blank=True, default='')
+    digest = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        # The index on file is created by migration 0013 using a
+        # backend-specific index type.
+        indexes = [models.Index(fields=['file'],
+                                name='drf_filepond_su_file_idx')]
+
+    def get_stored_file_name(self):
+        # Get the path, relative to the file store, where the file data for
+        # this upload is stored.
+        if self.content_hash:
+            return get_content_path(self.content_hash)
+        return self.file.name
 
     def get_absolute_file_path(self):
         fsp = local_settings.FILE_STORE_PATH
         if not fsp:
             fsp = ''
-        return os.path.join(fsp, self.file.name)
+        return os.path.join(fsp, self.get_stored_file_name())
+
+
+def _reset_stored_storage():
+    # The storage used for stored uploads holds the default backend instance
+    # once it has been set up. Discard it when the storage backend registry
+    # is reset so that the instance created from the current settings is
+    # used instead.
+    StoredUpload._meta.get_field('file').storage._wrapped = empty
+
+
+on_storage_backends_reset(_reset_stored_storage)
+
+
+# Thread-local state used to suppress the per-instance post_delete file
+# removal below while a bulk deletion that handles file removal itself is
+# in progress in the current thread.
+_signal_state = threading.local()
+
+
+@contextmanager
+def suppress_delete_temp_upload_file():
+    """
+    Context manager that disables the removal of files by the
+    delete_temp_upload_file post_delete signal handler in the current
+    thread. The caller is responsible for removing the files of any
+    TemporaryUpload records deleted within the context.
+    """
+    previous = getattr(_signal_state, 'suppressed', False)
+    _signal_state.suppressed = True
+    try:
+        yield
+    finally:
+        _signal_state.suppressed = previous
 
 
 # When a TemporaryUpload record is deleted, we need to delete the
 # corresponding file from the filesystem by catching the post_delete signal.
 @receiver(post_delete, sender=TemporaryUpload)
 def delete_temp_upload_file(sender, instance, **kwargs):
+    if getattr(_signal_state, 'suppressed', False):
+        return
     # Check that the file parameter for the instance is not None
     # and that the file exists and is not a directory! Then we can delete it
     LOG.debug('*** post_delete signal handler called. Deleting file.')
@@ -183,8 +350,18 @@ def delete_temp_upload_file(sender, instance, **kwargs):
     LOG.debug('*** post_delete <%s> - Value of DELETE_UPLOAD_TMP_DIRS: %s'
               % (instance.upload_id, str(local_settings.DELETE_UPLOAD_TMP_DIRS)))
     if local_settings.DELETE_UPLOAD_TMP_DIRS:
-        file_dir = os.path.join(storage.location, instance.upload_id)
-        if (os.path.exists(file_dir) and os.path.isdir(file_dir)):
+        # Use the directory containing the file, rather than the directory
+        # for the current UPLOAD_TMP_SHARD_DEPTH, so that the directory of
+        # an upload created with a different shard depth is also removed.
+        # The storage location itself is never removed.
+        if instance.file:
+            file_dir = os.path.dirname(instance.file.path)
+        else:
+            file_dir = os.path.join(storage.location,
+                                    get_upload_dir(instance.upload_id))
+        if (os.path.normpath(file_dir) !=
+                os.path.normpath(storage.location) and
+                os.path.exists(file_dir) and os.path.isdir(file_dir)):
             os.rmdir(file_dir)
             LOG.debug('*** post_delete signal handler called. Deleting temp '
                       'dir that contained file.')
@@ -1,11 +1,29 @@
 import importlib
 import logging
+import threading
+import time
 
+import django_drf_filepond.drf_filepond_settings as local_settings
 
 LOG = logging.getLogger(__name__)
 
+# The name of the backend set by the STORAGES_BACKEND setting
+DEFAULT_STORAGE_BACKEND = 'default'
 
-def _get_storage_backend(fq_classname):
+# The registry of storage backend instances, keyed by backend name. Each
+# entry is a dict holding the instance along with the details reported by
+# get_storage_backend_stats. The lock is held while an instance is created
+# so that each backend is only instantiated once, even if it is first
+# requested from several threads at the same time.
+_storage_backends = {}
+_storage_backends_lock = threading.Lock()
+
+# The functions called by reset_storage_backends, see
+# on_storage_backends_reset
+_reset_callbacks = []
+
+
+def _get_storage_backend(fq_classname, **options):
     """
     Load the specified django-storages storage backend class. This is called
     regardless of whether a beckend is specified so if fq_classname is not
@@ -14,6 +32,9 @@ def _get_storage_backend(fq_classname):
     fq_classname is a string specifying the fully-qualified class name of
     the django-storages backend to use, e.g.
         'storages.backends.sftpstorage.SFTPStorage'
+
+    Any options provided are passed to the backend class as keyword
+    arguments.
     """
     LOG.debug('Running _get_storage_backend with fq_classname [%s]'
               % fq_classname)
@@ -26,7 +47,115 @@ def _get_storage_backend(fq_classname):
     # at app startup in django_drf_filepond.apps.ready so any failure
     # importing the backend should have been picked up then.
     mod = importlib.import_module(modname)
-    storage_backend = getattr(mod, clname)()
+    storage_backend = getattr(mod, clname)(**options)
     LOG.info('Storage backend instance [%s] created...' % fq_classname)
 
     return storage_backend
+
+
+def _get_backend_setting(name):
+    """
+    Get the class name and options for the named backend. The default
+    backend is set by STORAGES_BACKEND, other backends are set in the
+    STORAGES_BACKENDS dictionary either as a class name or as a dict with
+    BACKEND and OPTIONS keys.
+    """
+    backends = getattr(local_settings, 'STORAGES_BACKENDS', None) or {}
+    if name in backends:
+        backend = backends[name]
+    elif name == DEFAULT_STORAGE_BACKEND:
+        backend = getattr(local_settings, 'STORAGES_BACKEND', None)
+    else:
+        raise KeyError('No storage backend named [%s] has been configured.'
+                       % name)
+
+    if isinstance(backend, dict):
+        return (backend.get('BACKEND'), backend.get('OPTIONS', {}))
+    return (backend, {})
+
+
+def get_storage_backend(name=DEFAULT_STORAGE_BACKEND):
+    """
+    Get the shared instance of the named storage backend, creating it the
+    first time it is requested. None is returned for the default backend
+    if STORAGES_BACKEND isn't set since local storage is being used.
+
+    A KeyError is raised if name doesn't refer to a configured backend.
+    """
+    entry = _storage_backends.get(name)
+    if entry is None:
+        with _storage_backends_lock:
+            entry = _storage_backends.get(name)
+            if entry is None:
+                (fq_classname, options) = _get_backend_setting(name)
+                entry = {
+                    'backend': _get_storage_backend(fq_classname, **options),
+                    'class': fq_classname,
+                    'created': time.time(),
+                    'lookups': 0,
+                }
+                _storage_backends[name] = entry
+    # This count is only used for reporting so isn't updated under the lock
+    entry['lookups'] += 1
+    return entry['backend']
+
+
+def reset_storage_backends():
+    """
+    Remove all the backend instances from the registry so that they're
+    created again from the current settings when they're next requested.
+    """
+    with _storage_backends_lock:
+        _storage_backends.clear()
+    for callback in _reset_callbacks:
+        callback()
+
+
+def on_storage_backends_reset(callback):
+    """
+    Register a function to be called when the registry is reset, e.g. to
+    discard a reference to a backend instance obtained from the registry.
+    """
+    _reset_callbacks.append(callback)
+
+
+def _get_connection_pool_stats(backend):
+    # Backends can report their own connection pool details by providing
+    # a get_connection_pool_stats method. For the django-storages S3
+    # backends, report the pool size set in the botocore client
+    # configuration. Their pools are held per thread so the connections in
+    # use aren't reported.
+    get_stats = getattr(backend, 'get_connection_pool_stats', None)
+    if callable(get_stats):
+        return get_stats()
+
+    client_config = (getattr(backend, 'client_config', None) or
+                     getattr(backend, 'config', None))
+    max_pool_connections = getattr(client_config, 'max_pool_connections',
+                                   None)
+    if not isinstance(max_pool_connections, int):
+        return None
+    return {'max_pool_connections': max_pool_connections}
+
+
+def get_storage_backend_stats():
+    """
+    Get a dict, keyed by backend name, describing each storage backend that
+    has been created. For each backend, this gives the class name, the time
+    that the instance was created, the number of times it has been looked
+    up, and the connection pool details if these are available, otherwise
+    None.
+    """
+    with _storage_backends_lock:
+        entries = list(_storage_backends.items())
+    stats = {}
+    for (name, entry) in entries:
+        stats[name] = {
+            'class': entry['class'],
+            'created': entry['created'],
+            'lookups': entry['lookups'],
+            'connection_pool': (
+                _get_connection_pool_stats(entry['backend'])
+                if entry['backend'] is not None else None),
+        }
+    return stats
@@ -0,0 +1,218 @@
+# A module providing optional tracing of the handling of uploads. The life
+# of an upload spans several requests, e.g. the request starting a chunked
+# upload, a PATCH request for each chunk, HEAD requests to restart the
+# upload and, finally, the call to api.store_upload. Spans are opened
+# around each of these and have the upload's ID set as the
+# filepond.upload_id attribute so that the spans for an upload can be
+# found and correlated.
+#
+# Spans are recorded by the tracer set by DJANGO_DRF_FILEPOND_TRACER. By
+# default, no tracer is set and opening a span returns a shared no-op
+# context manager. OpenTelemetryTracer records spans using the
+# OpenTelemetry API, when it is installed, so that they form part of the
+# trace for the request being handled. RecordingTracer holds finished spans
+# in memory, e.g. for use in tests.
+import logging
+import threading
+from timeit import default_timer
+
+from django.core.exceptions import ImproperlyConfigured
+
+from django_drf_filepond.utils import _SettingInstance
+
+# contextvars is available in Python 3.7 and later
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+LOG = logging.getLogger(__name__)
+
+# The name of the span attribute holding the upload ID
+UPLOAD_ID_ATTRIBUTE = 'filepond.upload_id'
+
+_tracer = _SettingInstance('TRACER', 'TRACER_OPTIONS', 'tracer')
+
+
+class Tracer(object):
+    """
+    The interface implemented by tracers.
+    """
+
+    def start_span(self, name, attributes):
+        """
+        Returns a context manager that opens a span with the specified name
+        and attributes dict. The object returned when entering the context
+        must provide set_attribute(key, value). If an exception is raised
+        within the context, it should be recorded on the span.
+        """
+        raise NotImplementedError()
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Records spans using the OpenTelemetry API. The spans are children of
+    the current span, e.g. the span for the request created by
+    OpenTelemetry's Django instrumentation. Requires the opentelemetry-api
+    package.
+    """
+
+    def __init__(self, tracer_name='django_drf_filepond'):
+        if otel_trace is None:
+            raise ImproperlyConfigured(
+                'The opentelemetry-api package is required to use '
+                'OpenTelemetryTracer.')
+        self._tracer = otel_trace.get_tracer(tracer_name)
+
+    def start_span(self, name, attributes):
+        return self._tracer.start_as_current_span(
+            name, attributes=attributes, record_exception=True,
+            set_status_on_exception=True)
+
+
+class RecordedSpan(object):
+    """
+    A span recorded by RecordingTracer. duration is in seconds and error is
+    the exception raised within the span, if any.
+    """
+
+    def __init__(self, tracer, name, attributes, parent):
+        self._tracer = tracer
+        self.name = name
+        self.attributes = dict(attributes)
+        self.parent = parent
+        self.duration = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._tracer._push(self)
+        self._start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.duration = default_timer() - self._start
+        self.error = exc_value
+        self._tracer._pop(self)
+        return False
+
+
+class RecordingTracer(Tracer):
+    """
+    Holds the spans finished in the current process in memory, in the
+    order in which they finish. Each span's parent is the span that was
+    open in the same context when it was started. The open spans are held
+    in a context variable so that the spans of coroutines running
+    concurrently as separate asyncio tasks, e.g. using asyncio.gather, are
+    kept apart. On Python versions before 3.7, which don't have
+    contextvars, the open spans are held per thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        if contextvars is not None:
+            self._stack = contextvars.ContextVar(
+                'drf_filepond_open_spans_%d' % id(self), default=())
+        else:
+            self._local = threading.local()
+        self.spans = []
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+
+    def _get_stack(self):
+        if contextvars is not None:
+            return self._stack.get()
+        return getattr(self._local, 'stack', ())
+
+    def _set_stack(self, stack):
+        # The stack is a tuple, it is replaced rather than modified since
+        # an asyncio task started within a span shares the stack with the
+        # context it was started from.
+        if contextvars is not None:
+            self._stack.set(stack)
+        else:
+            self._local.stack = stack
+
+    def _push(self, span):
+        self._set_stack(self._get_stack() + (span,))
+
+    def _pop(self, span):
+        self._set_stack(tuple(open_span for open_span in self._get_stack()
+                              if open_span is not span))
+        with self._lock:
+            self.spans.append(span)
+
+    def start_span(self, name, attributes):
+        stack = self._get_stack()
+        return RecordedSpan(self, name, attributes,
+                            stack[-1] if stack else None)
+
+    def get_spans(self, name=None, upload_id=None):
+        """
+        Get the finished spans, optionally only those with the specified
+        name and/or upload ID.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        return [span for span in spans
+                if (name is None or span.name == name) and
+                (upload_id is None or
+                 span.attributes.get(UPLOAD_ID_ATTRIBUTE) == upload_id)]
+
+
+class _NullSpan(object):
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def get_tracer():
+    """
+    Get the tracer set by TRACER, creating it the first time it is
+    requested. Returns None if tracing is disabled.
+    """
+    return _tracer.get()
+
+
+def reset_tracer():
+    """
+    Discard the current tracer so that a new one is created when a span is
+    next opened.
+    """
+    _tracer.reset()
+
+
+def trace_span(name, upload_id=None, **attributes):
+    """
+    Returns a context manager that opens a span with the specified name.
+    The upload ID, if provided, is set as the filepond.upload_id attribute
+    and the keyword arguments, with their names prefixed with "filepond.",
+    as further attributes.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return _NULL_SPAN
+    span_attributes = dict(('filepond.%s' % key, value)
+                           for (key, value) in attributes.items()
+                           if value is not None)
+    if upload_id:
+        span_attributes[UPLOAD_ID_ATTRIBUTE] = upload_id
+    return tracer.start_span(name, span_attributes)
@@ -6,8 +6,13 @@ from rest_framework import status
 from rest_framework.exceptions import ParseError, MethodNotAllowed
 from rest_framework.response import Response
 
+from django_drf_filepond.chunk_state import delete_chunk_state, \
+    init_chunk_state, load_chunk_state, save_chunk_state
+from django_drf_filepond.metrics import CHUNK_DIRS, adjust_gauge, \
+    time_phase
 from django_drf_filepond.models import TemporaryUpload, storage,\
-    TemporaryUploadChunked
+    TemporaryUploadChunked, get_upload_dir
+from django_drf_filepond.tracing import trace_span
 from io import BytesIO, StringIO
 from django_drf_filepond.utils import DrfFilepondChunkedUploadedFile, _get_user
 from six import text_type, binary_type
@@ -115,41 +120,49 @@ class FilepondStandardFileUploader(FilepondFileUploader):
                             content_type='text/plain',
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        file_obj = self._get_file_obj(request)
-
-        # The type of parsed data should be a descendant of an UploadedFile
-        # type.
-        if not isinstance(file_obj, UploadedFile):
-            raise ParseError('Invalid data type has been parsed.')
-
-        # Save original file name and set name of saved file to the unique ID
-        upload_filename = file_obj.name
-        file_obj.name = file_id
-
-        # Before we attempt to save the file, make sure that the upload
-        # directory we're going to save to exists.
-        # *** It's not necessary to explicitly create the directory since
-        # *** the FileSystemStorage object creates the directory on save
-        # if not os.path.exists(storage.location):
-        #    LOG.debug('Filepond app: Creating file upload directory '
-        #             '<%s>...' % storage.location)
-        #    os.makedirs(storage.location, mode=0o700)
-
-        LOG.debug('About to store uploaded temp file with filename: %s'
-                  % (upload_filename))
-
-        # We now need to create the temporary upload object and store the
-        # file and metadata.
-        tu = TemporaryUpload(upload_id=upload_id, file_id=file_id,
-                             file=file_obj, upload_name=upload_filename,
-                             upload_type=TemporaryUpload.FILE_DATA,
-                             uploaded_by=_get_user(request))
-        tu.save()
-
-        response = Response(upload_id, status=status.HTTP_200_OK,
-                            content_type='text/plain')
+        with trace_span('filepond.handle_upload', upload_id,
+                        uploader='standard', method='POST') as span:
+            with time_phase('parse'):
+                file_obj = self._get_file_obj(request)
+
+            # The type of parsed data should be a descendant of an
+            # UploadedFile type.
+            if not isinstance(file_obj, UploadedFile):
+                raise ParseError('Invalid data type has been parsed.')
+
+            # Save original file name and set name of saved file to the
+            # unique ID
+            upload_filename = file_obj.name
+            file_obj.name = file_id
+            span.set_attribute('filepond.size', file_obj.size)
+
+            # Before we attempt to save the file, make sure that the upload
+            # directory we're going to save to exists.
+            # *** It's not necessary to explicitly create the directory since
+            # *** the FileSystemStorage object creates the directory on save
+            # if not os.path.exists(storage.location):
+            #    LOG.debug('Filepond app: Creating file upload directory '
+            #             '<%s>...' % storage.location)
+            #    os.makedirs(storage.location, mode=0o700)
+
+            LOG.debug('About to store uploaded temp file with filename: %s'
+                      % (upload_filename))
+
+            # We now need to create the temporary upload object and store the
+            # file and metadata.
+            tu = TemporaryUpload(upload_id=upload_id, file_id=file_id,
+                                 file=file_obj, upload_name=upload_filename,
+                                 upload_type=TemporaryUpload.FILE_DATA,
+                                 uploaded_by=_get_user(request))
+            # The upload ID is set so, without force_insert, Django would
+            # try an UPDATE before inserting the new record.
+            with time_phase('temp_upload_save'):
+                tu.save(force_insert=True)
+
+            response = Response(upload_id, status=status.HTTP_200_OK,
+                                content_type='text/plain')
 
-        return response
+            return response
 
 
 # Handles chunked file uploads as per the approach described in filepond's
@@ -165,18 +178,22 @@ class FilepondChunkedFileUploader(FilepondFileUploader):
             return Response('Invalid ID for handling upload.',
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        if request.method == 'PATCH':
-            return self._handle_chunk_upload(request, upload_id)
-        elif request.method == 'HEAD':
-            return self._handle_chunk_restart(request, upload_id)
-        elif request.method == 'POST':
-            if not self._file_id_valid(file_id):
-                return Response('Invalid ID for handling upload.',
-                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            return self._handle_new_chunk_upload(request, upload_id, file_id)
-        else:
-            return Response('Invalid method.',
-                            status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        with trace_span('filepond.handle_upload', upload_id,
+                        uploader='chunked', method=request.method):
+            if request.method == 'PATCH':
+                return self._handle_chunk_upload(request, upload_id)
+            elif request.method == 'HEAD':
+                return self._handle_chunk_restart(request, upload_id)
+            elif request.method == 'POST':
+                if not self._file_id_valid(file_id):
+                    return Response(
+                        'Invalid ID for handling upload.',
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                return self._handle_new_chunk_upload(request, upload_id,
+                                                     file_id)
+            else:
+                return Response('Invalid method.',
+                                status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
     def _handle_new_chunk_upload(self, request, upload_id, file_id):
         LOG.debug('Processing a new chunked upload request...')
@@ -199,13 +216,15 @@ class FilepondChunkedFileUploader(FilepondFileUploader):
         # outside the base storage location. Then create the new
         # temporary directory into which chunks will be stored
         base_loc = storage.base_location
-        chunk_dir = os.path.abspath(os.path.join(base_loc, upload_id))
+        upload_dir = get_upload_dir(upload_id)
+        chunk_dir = os.path.abspath(os.path.join(base_loc, upload_dir))
         if not chunk_dir.startswith(base_loc):
             return Response('Unable to create storage for upload data.',
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         if os.path.exists(base_loc):
             try:
                 os.makedirs(chunk_dir)
+                adjust_gauge(CHUNK_DIRS, 1)
             except OSError as e:
                 LOG.debug('Unable to create chunk storage dir: %s' %
                           (str(e)))
@@ -221,9 +240,12 @@ class FilepondChunkedFileUploader(FilepondFileUploader):
         # We now create the temporary chunked upload object
         # this will be updated as we receive the chunks.
         tuc = TemporaryUploadChunked(upload_id=upload_id, file_id=file_id,
-                                     upload_dir=upload_id, total_size=ulen,
+                                     upload_dir=upload_dir,
+                                     total_size=ulen,
                                      uploaded_by=_get_user(request))
-        tuc.save()
+        with time_phase('chunk_upload_init'):
+            tuc.save(force_insert=True)
+            init_chunk_state(tuc)
 
         return Response(upload_id, status=status.HTTP_200_OK,
                         content_type='text/plain')
@@ -233,7 +255,8 @@ class FilepondChunkedFileUploader(FilepondFileUploader):
         # content type was invalid then we want to raise an error here
         # Trying to access request data should result in a 415 response if
         # the data couldn't be handled by the configured parser.
-        file_data = request.data
+        with time_phase('parse'):
+            file_data = request.data
 
         # Get the required header information to handle the new data
         uoffset = request.META.get('HTTP_UPLOAD_OFFSET', None)
@@ -265,9 +288,9 @@ class FilepondChunkedFileUploader(FilepondFileUploader):
             return Response('Upload data type not recognised.',
                             status=status.HTTP_400_BAD_REQUEST)
 
-        # Try to load a temporary chunked upload object for the provided id
+        # Try to load the progress of the chunked upload for the provided id
         try:
-            tuc = TemporaryUploadChunked.objects.get(upload_id=chunk_id)
+            tuc = load_chunk_state(chunk_id)
         except TemporaryUploadChunked.DoesNotExist:
             return Response('Invalid chunk upload request data',
                             status=status.HTTP_400_BAD_REQUEST)
@@ -316,19 +339,30 @@ class FilepondChunkedFileUploader(FilepondFileUploader):
             return Response('Chunk storage location error',
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        storage.save(upload_file, fd)
+        with trace_span('filepond.chunk_upload', chunk_id,
+                        chunk=tuc.last_chunk+1, offset=tuc.offset,
+                        size=file_data_len), time_phase('chunk_write'):
+            storage.save(upload_file, fd)
         # Set the updated chunk number and the new offset
         tuc.last_chunk = tuc.last_chunk + 1
         tuc.offset = tuc.offset + file_data_len
         if tuc.offset == tuc.total_size:
             tuc.upload_complete = True
-        tuc.save()
+        try:
+            with time_phase('chunk_state_save'):
+                save_chunk_state(tuc)
+        except TemporaryUploadChunked.DoesNotExist:
+            return Response('Invalid chunk upload request data',
+                            status=status.HTTP_400_BAD_REQUEST)
 
         # At this point, if the upload is complete, we can rebuild the chunks
         # into the complete file and store it with a TemporaryUpload object.
         if tuc.upload_complete:
             try:
-                self._store_upload(tuc)
+                with trace_span('filepond.reassemble', chunk_id,
+                                chunks=tuc.last_chunk, size=tuc.total_size), \
+                        time_phase('reassemble'):
+                    self._store_upload(tuc)
             except (ValueError, FileNotFoundError) as e:
                 LOG.error('Error storing upload: %s' % (str(e)))
                 return Response('Error storing uploaded file.',
@@ -371,7 +405,7 @@ class FilepondChunkedFileUploader(FilepondFileUploader):
                              file=chunked_file, upload_name=tuc.upload_name,
                              upload_type=TemporaryUpload.FILE_DATA,
                              uploaded_by=tuc.uploaded_by)
-        tu.save()
+        tu.save(force_insert=True)
 
         # Check that the final file is stored and of the correct size
         chunk_dir = os.path.join(storage.base_location, tuc.upload_dir)
@@ -386,11 +420,13 @@ class FilepondChunkedFileUploader(FilepondFileUploader):
         for i in range(1, tuc.last_chunk+1):
             chunk_file = os.path.join(chunk_dir, '%s_%s' % (tuc.file_id, i))
             os.remove(chunk_file)
+        delete_chunk_state(tuc)
         tuc.delete()
+        adjust_gauge(CHUNK_DIRS, -1)
 
     def _handle_chunk_restart(self, request, upload_id):
         try:
-            tuc = TemporaryUploadChunked.objects.get(upload_id=upload_id)
+            tuc = load_chunk_state(upload_id)
         except TemporaryUploadChunked.DoesNotExist:
             return Response('Invalid upload ID specified.',
                             status=status.HTTP_404_NOT_FOUND,
@@ -9,8 +9,16 @@ if six.PY2:
     from django.conf.urls import url
 else:
     from django.urls import re_path, path
+import django_drf_filepond.drf_filepond_settings as local_settings
 from django_drf_filepond.views import ProcessView, RevertView, LoadView,\
-     RestoreView, FetchView, PatchView
+     RestoreView, FetchView, PatchView, FetchStatusView, LeanPatchView
+
+# The chunk upload PATCH requests can optionally be handled by a view that
+# bypasses DRF's request handling, see the LEAN_PATCH_VIEW setting.
+if local_settings.LEAN_PATCH_VIEW:
+    patch_view = LeanPatchView.as_view()
+else:
+    patch_view = PatchView.as_view()
 
 #############################################################################
 # PYTHON 2 SUPPORT
@@ -25,20 +33,24 @@ from django_drf_filepond.views import ProcessView, RevertView, LoadView,\
 if six.PY2:
     urlpatterns = [
         url(r'^process/$', ProcessView.as_view(), name='process'),
-        url(r'^patch/(?P<chunk_id>[0-9a-zA-Z]{22})$', PatchView.as_view(),
+        url(r'^patch/(?P<chunk_id>[0-9a-zA-Z]{22})$', patch_view,
             name='patch'),
         url(r'^revert/$', RevertView.as_view(), name='revert'),
         url(r'^load/$', LoadView.as_view(), name='load'),
         url(r'^restore/$', RestoreView.as_view(), name='restore'),
-        url(r'^fetch/$', FetchView.as_view(), name='fetch')
+        url(r'^fetch/$', FetchView.as_view(), name='fetch'),
+        url(r'^fetch/status/$', FetchStatusView.as_view(),
+            name='fetch_status')
     ]
 else:
     urlpatterns = [
         path('process/', ProcessView.as_view(), name='process'),
-        re_path(r'^patch/(?P<chunk_id>[0-9a-zA-Z]{22})$', PatchView.as_view(),
+        re_path(r'^patch/(?P<chunk_id>[0-9a-zA-Z]{22})$', patch_view,
                 name='patch'),
         path('revert/', RevertView.as_view(), name='revert'),
         path('load/', LoadView.as_view(), name='load'),
         path('restore/', RestoreView.as_view(), name='restore'),
-        path('fetch/', FetchView.as_view(), name='fetch')
+        path('fetch/', FetchView.as_view(), name='fetch'),
+        path('fetch/status/', FetchStatusView.as_view(),
+             name='fetch_status')
     ]
@@ -1,7 +1,10 @@
 # A module containing some utility functions used by the views and uploaders
 from django_drf_filepond.exceptions import ChunkedUploadError
+import importlib
 import logging
 import os
+import re
+import threading
 from io import UnsupportedOperation
 
 import shortuuid
@@ -32,6 +35,16 @@ def _get_file_id():
     return six.ensure_text(file_id)
 
 
+# A precompiled regular expression matching the 22-character IDs generated
+# by _get_file_id, shared by the API functions and views that need to check
+# whether a value provided by a client is a valid upload ID.
+UPLOAD_ID_FORMAT = re.compile('^([%s]){22}$' % (shortuuid.get_alphabet()))
+
+
+def _is_valid_upload_id(upload_id):
+    return bool(UPLOAD_ID_FORMAT.match(upload_id))
+
+
 # There's no built in FileNotFoundError in Python 2
 try:
     FileNotFoundError
@@ -39,6 +52,73 @@ except NameError:
     FileNotFoundError = IOError
 
 
+class _SettingInstance(object):
+    """
+    Holds the shared instance of the class named by the class_setting
+    setting, e.g. the metrics sink or the tracer. The instance is created
+    the first time it is requested, with the keyword arguments held in the
+    options_setting setting, and is created again if class_setting changes.
+    """
+
+    def __init__(self, class_setting, options_setting, description):
+        self.class_setting = class_setting
+        self.options_setting = options_setting
+        self.description = description
+        self._instance = None
+        self._classname = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Get the instance, creating it if necessary. Returns None if the
+        class_setting setting isn't set.
+        """
+        fq_classname = getattr(local_settings, self.class_setting)
+        if not fq_classname:
+            return None
+        if self._instance is None or self._classname != fq_classname:
+            with self._lock:
+                if (self._instance is None or
+                        self._classname != fq_classname):
+                    (modname, clname) = fq_classname.rsplit('.', 1)
+                    mod = importlib.import_module(modname)
+                    self._instance = getattr(mod, clname)(
+                        **getattr(local_settings, self.options_setting))
+                    self._classname = fq_classname
+                    LOG.debug('Created %s [%s]'
+                              % (self.description, fq_classname))
+        return self._instance
+
+    def reset(self):
+        """
+        Discard the instance so that a new one is created when it is next
+        requested.
+        """
+        with self._lock:
+            self._instance = None
+            self._classname = None
+
+
+# Iterate over the records selected by queryset in batches of batch_size,
+# yielding each batch as a list of tuples containing the primary key followed
+# by the values of the specified fields. Batches are obtained using keyset
+# pagination on the primary key so the cost of each query doesn't grow as we
+# progress through a large table and records can safely be deleted between
+# batches.
+def _iter_keyset_batches(queryset, fields, batch_size):
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        batch_qs = queryset
+        if last_pk is not None:
+            batch_qs = batch_qs.filter(pk__gt=last_pk)
+        batch = list(batch_qs.values_list('pk', *fields)[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+        yield batch
+
+
 # Get the BASE_DIR variable from local_settings and process it to ensure that
 # it can be used in django_drf_filepond across Python 2.7, 3.5 and 3.6+.
 # Need to take into account that this may be a regular string or a
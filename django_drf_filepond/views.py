@@ -7,31 +7,37 @@ import mimetypes
 
 import django_drf_filepond.drf_filepond_settings as local_settings
 import os
-import re
-import requests
-import shortuuid
-import django_drf_filepond
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.validators import URLValidator
 from django.http.response import HttpResponse, HttpResponseNotFound, \
-    HttpResponseServerError
+    HttpResponseNotModified, HttpResponseServerError
+from django.utils.decorators import classonlymethod
+from django.utils.http import parse_etags
+from django.views import View
 from django_drf_filepond.api import get_stored_upload, \
     get_stored_upload_file_data
-from django_drf_filepond.exceptions import ConfigurationError
-from django_drf_filepond.models import TemporaryUpload, storage, StoredUpload
+from django_drf_filepond.config import get_config
+from django_drf_filepond.db_utils import get_read_db
+from django_drf_filepond.exceptions import ConfigurationError, FetchError
+from django_drf_filepond.fetch_utils import coalesce_fetch, \
+    download_remote_file, get_upload_file_name, submit_fetch_job
+from django_drf_filepond.metrics import PROMETHEUS_CONTENT_TYPE, \
+    InMemoryMetricsSink, get_metrics_sink, start_request_metrics
+from django_drf_filepond.models import TemporaryUpload, \
+    StoredUpload, TemporaryUploadFetch
 from django_drf_filepond.parsers import PlainTextParser, UploadChunkParser
 from django_drf_filepond.renderers import PlainTextRenderer
 from io import BytesIO
-from requests.exceptions import ConnectionError
 from rest_framework import status
-from rest_framework.exceptions import ParseError, NotFound
+from rest_framework.exceptions import APIException, ParseError, NotFound, \
+    UnsupportedMediaType
 from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_drf_filepond.uploaders import FilepondFileUploader
-from django_drf_filepond.utils import _get_file_id, _get_user,\
-    get_local_settings_base_dir
+from django_drf_filepond.utils import _get_file_id, _get_user, \
+    _is_valid_upload_id
 
 LOG = logging.getLogger(__name__)
 
@@ -61,6 +67,49 @@ def _get_content_type(data, temporary=True):
     return mimetypes.guess_type(data)[0]
 
 
+def _get_etag(upload):
+    # The ETag for a TemporaryUpload or StoredUpload is its content digest
+    return ('"%s"' % upload.digest) if upload.digest else None
+
+
+def _get_not_modified_response(request, upload):
+    # If the client already has the current content of the requested upload,
+    # as indicated by an If-None-Match header matching its ETag, get a 304
+    # response so that the file doesn't need to be read.
+    etag = _get_etag(upload)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if etag and if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags or etag in etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+    return None
+
+
+def _set_file_metadata_headers(response, upload, length):
+    response['Content-Length'] = str(length)
+    etag = _get_etag(upload)
+    if etag:
+        response['ETag'] = etag
+
+
+def _get_http_response(response):
+    # The upload handlers return DRF Response objects. These are normally
+    # rendered by APIView, views that aren't based on APIView render them
+    # here using the PlainTextRenderer.
+    if not isinstance(response, Response):
+        return response
+    content = PlainTextRenderer().render(response.data)
+    http_response = HttpResponse(
+        content or b'', status=response.status_code,
+        content_type=response.content_type or PlainTextRenderer.media_type)
+    for (header, value) in response.items():
+        if header.lower() != 'content-type':
+            http_response[header] = value
+    return http_response
+
+
 def _import_permission_classes(endpoint):
     """
     Iterates over array of string representations of permission classes from
@@ -76,7 +125,30 @@ def _import_permission_classes(endpoint):
     return permission_classes
 
 
-class ProcessView(APIView):
+class _MetricsMixin(object):
+    '''
+    Records the metrics for each request handled by a view when metrics are
+    enabled, see django_drf_filepond.metrics. metrics_endpoint is the name
+    of the endpoint used in the metrics labels.
+    '''
+    metrics_endpoint = None
+
+    def dispatch(self, request, *args, **kwargs):
+        request_metrics = start_request_metrics(self.metrics_endpoint,
+                                                request)
+        if request_metrics is None:
+            return super(_MetricsMixin, self).dispatch(request, *args,
+                                                       **kwargs)
+        response = None
+        try:
+            response = super(_MetricsMixin, self).dispatch(request, *args,
+                                                           **kwargs)
+            return response
+        finally:
+            request_metrics.finish(response)
+
+
+class ProcessView(_MetricsMixin, APIView):
     '''
     This view receives an uploaded file from the filepond client. It
     stores the file in a temporary location and generates a unique ID which
@@ -90,36 +162,16 @@ class ProcessView(APIView):
     parser_classes = (MultiPartParser,)
     renderer_classes = (PlainTextRenderer,)
     permission_classes = _import_permission_classes('POST_PROCESS')
+    metrics_endpoint = 'process'
 
     def post(self, request):
         LOG.debug('Filepond API: Process view POST called...')
 
-        # Check that the temporary upload directory has been set
-        if not hasattr(local_settings, 'UPLOAD_TMP'):
-            return Response('The file upload path settings are not '
-                            'configured correctly.',
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # By default, enforce that the temporary upload location must be a
-        # sub-directory of the project base directory.
-        # TODO: Check whether this is necessary - maybe add a security
-        # parameter that can be disabled to turn off this check if the
-        # developer wishes?
-        LOCAL_BASE_DIR = get_local_settings_base_dir()
-        if ((not (storage.location).startswith(LOCAL_BASE_DIR)) and
-                (LOCAL_BASE_DIR !=
-                 os.path.dirname(django_drf_filepond.__file__))):
-            if not local_settings.ALLOW_EXTERNAL_UPLOAD_DIR:
-                return Response('The file upload path settings are not '
-                                'configured correctly.',
-                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # Check that a relative path is not being used to store the
-        # upload outside the specified UPLOAD_TMP directory.
-        if not getattr(local_settings, 'UPLOAD_TMP').startswith(
-                os.path.abspath(storage.location)):
-            return Response('An invalid storage location has been '
-                            'specified.',
+        # The temporary upload location is validated when the configuration
+        # is loaded.
+        upload_tmp_error = get_config().upload_tmp_error
+        if upload_tmp_error:
+            return Response(upload_tmp_error,
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         # Check that we've received a file and then generate a unique ID
@@ -137,7 +189,7 @@ class ProcessView(APIView):
         return response
 
 
-class PatchView(APIView):
+class PatchView(_MetricsMixin, APIView):
     '''
     This view handles a PATCH request containing a file chunk as part of the
     filepond chunked upload support. The chunk will relate to an existing
@@ -155,6 +207,7 @@ class PatchView(APIView):
     parser_classes = (UploadChunkParser,)
     renderer_classes = (PlainTextRenderer,)
     permission_classes = _import_permission_classes('PATCH_PATCH')
+    metrics_endpoint = 'patch'
 
     def patch(self, request, chunk_id):
         LOG.debug('Filepond API: Patch view PATCH called...')
@@ -170,11 +223,91 @@ class PatchView(APIView):
         return uploader.handle_upload(request, chunk_id)
 
 
-class RevertView(APIView):
+class _ChunkRequest(object):
+    '''
+    Provides the parts of a DRF Request used by FilepondChunkedFileUploader
+    when handling a chunk PATCH or HEAD request. As with a DRF Request using
+    the UploadChunkParser, data is the raw request body, an empty dict for a
+    request with no body, and UnsupportedMediaType is raised if a body with
+    a different content type is accessed. The body is read from the request
+    stream so DATA_UPLOAD_MAX_MEMORY_SIZE doesn't limit the chunk size.
+    '''
+    def __init__(self, request):
+        self._request = request
+        self.method = request.method
+        self.META = request.META
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            try:
+                content_length = int(self.META.get('CONTENT_LENGTH') or 0)
+            except (ValueError, TypeError):
+                content_length = 0
+            if content_length == 0:
+                self._data = {}
+            elif (self._request.content_type !=
+                    UploadChunkParser.media_type):
+                raise UnsupportedMediaType(self._request.content_type)
+            else:
+                self._data = self._request.read()
+        return self._data
+
+
+class LeanPatchView(_MetricsMixin, View):
+    '''
+    A version of PatchView based on Django's View class rather than DRF's
+    APIView. Chunk requests are passed straight to the chunked uploader,
+    avoiding DRF's content negotiation, request parsing, authentication and
+    response rendering which, with small chunks, are a significant part of
+    the time taken to handle each request. This view is used for the patch
+    endpoint when DJANGO_DRF_FILEPOND_LEAN_PATCH_VIEW is True.
+
+    If permission classes are set for the PATCH_PATCH endpoint, requests
+    are handled by PatchView so that authentication and permissions are
+    handled in the same way as for the other endpoints.
+    '''
+    http_method_names = ['patch', 'head']
+    permission_classes = _import_permission_classes('PATCH_PATCH')
+    metrics_endpoint = 'patch'
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # As with DRF's APIView, this view is exempt from CSRF checks.
+        view = super(LeanPatchView, cls).as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.permission_classes:
+            return PatchView.as_view()(request, *args, **kwargs)
+        return super(LeanPatchView, self).dispatch(request, *args, **kwargs)
+
+    def patch(self, request, chunk_id):
+        LOG.debug('Filepond API: Lean patch view PATCH called...')
+        return self._handle_upload(request, chunk_id)
+
+    def head(self, request, chunk_id):
+        LOG.debug('Filepond API: Lean patch view HEAD called...')
+        return self._handle_upload(request, chunk_id)
+
+    def _handle_upload(self, request, chunk_id):
+        chunk_request = _ChunkRequest(request)
+        try:
+            uploader = FilepondFileUploader.get_uploader(chunk_request)
+            response = uploader.handle_upload(chunk_request, chunk_id)
+        except APIException as e:
+            response = Response({'detail': e.detail}, status=e.status_code)
+        return _get_http_response(response)
+
+
+class RevertView(_MetricsMixin, APIView):
 
     parser_classes = (PlainTextParser,)
     renderer_classes = (PlainTextRenderer,)
     permission_classes = _import_permission_classes('DELETE_REVERT')
+    metrics_endpoint = 'revert'
     '''
     This is called when we need to revert the uploaded file - i.e. undo is
     pressed and we remove the previously uploaded temporary file.
@@ -207,7 +340,7 @@ class RevertView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class LoadView(APIView):
+class LoadView(_MetricsMixin, APIView):
     """
     Expect the upload ID to be provided with the 'id' parameter
     This may be either an upload_id that is stored in the StoredUpload
@@ -216,6 +349,7 @@ class LoadView(APIView):
     setting parameter).
     """
     permission_classes = _import_permission_classes('GET_LOAD')
+    metrics_endpoint = 'load'
 
     def get(self, request):
         LOG.debug('Filepond API: Load view GET called...')
@@ -238,6 +372,10 @@ class LoadView(APIView):
             return Response('Not found', status=status.HTTP_404_NOT_FOUND)
 
         # su is now the StoredUpload record for the requested file
+        not_modified = _get_not_modified_response(request, su)
+        if not_modified:
+            return not_modified
+
         try:
             (filename, data_bytes) = get_stored_upload_file_data(su)
         except ConfigurationError as e:
@@ -249,17 +387,19 @@ class LoadView(APIView):
         except IOError:
             return HttpResponseServerError('Error reading file...')
 
-        ct = _get_content_type(filename)
+        ct = su.content_type or _get_content_type(filename)
 
         response = HttpResponse(data_bytes, content_type=ct)
         response['Content-Disposition'] = ('inline; filename=%s' %
                                            filename)
+        _set_file_metadata_headers(response, su, len(data_bytes))
 
         return response
 
 
-class RestoreView(APIView):
+class RestoreView(_MetricsMixin, APIView):
     permission_classes = _import_permission_classes('GET_RESTORE')
+    metrics_endpoint = 'restore'
 
     # Expect the upload ID to be provided with the 'name' parameter
     def get(self, request):
@@ -270,20 +410,22 @@ class RestoreView(APIView):
 
         upload_id = request.GET[LOAD_RESTORE_PARAM_NAME]
 
-        upload_id_fmt = re.compile('^([%s]){22}$' %
-                                   (shortuuid.get_alphabet()))
-
-        if not upload_id_fmt.match(upload_id):
+        if not _is_valid_upload_id(upload_id):
             return Response('An invalid ID has been provided.',
                             status=status.HTTP_400_BAD_REQUEST)
 
         LOG.debug('Carrying out restore for file ID <%s>' % upload_id)
 
         try:
-            tu = TemporaryUpload.objects.get(upload_id=upload_id)
+            tu = TemporaryUpload.objects.using(get_read_db(upload_id)).get(
+                upload_id=upload_id)
         except TemporaryUpload.DoesNotExist:
             return Response('Not found', status=status.HTTP_404_NOT_FOUND)
 
+        not_modified = _get_not_modified_response(request, tu)
+        if not_modified:
+            return not_modified
+
         upload_file_name = tu.upload_name
         try:
             with open(tu.file.path, 'rb') as f:
@@ -293,29 +435,21 @@ class RestoreView(APIView):
             return Response('Error reading file data...',
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        ct = _get_content_type(upload_file_name)
+        ct = tu.content_type or _get_content_type(upload_file_name)
 
         response = HttpResponse(data, content_type=ct)
         response['Content-Disposition'] = ('inline; filename=%s' %
                                            upload_file_name)
+        _set_file_metadata_headers(response, tu, len(data))
 
         return response
 
 
-class FetchView(APIView):
+class FetchView(_MetricsMixin, APIView):
     permission_classes = _import_permission_classes('GET_FETCH')
+    metrics_endpoint = 'fetch'
 
-    def _process_request(self, request):
-        LOG.debug('Filepond API: Fetch view GET called...')
-        '''
-        Supports retrieving a file on the server side that the user has
-        specified by calling addFile on the filepond API and passing a
-        URL to a file.
-        '''
-        # Retrieve the target URL from the request query string target
-        # target parameter, pull the file into temp upload storage and
-        # return a file object.
-
+    def _get_target_url(self, request):
         # First check we have a URL and parse to check it's valid
         target_url = request.query_params.get('target', None)
         if not target_url:
@@ -329,66 +463,71 @@ class FetchView(APIView):
         except ValidationError as e:
             raise ParseError(str(e))
 
-        # TODO: SHould we check the headers returned when we request the
-        # download to see that we're getting a file rather than an HTML page?
-        # For now this check is enabled on the basis that we assume target
-        # data file will not be HTML. However, there should be a way to turn
-        # this off if the client knows that they want to get an HTML file.
-        # TODO: *** Looks like this use of head can be removed since with
-        # the new approach of streaming content to a BytesIO object, when
-        # stream=True, the connection begins by being opened and only
-        # fetching the headers. We could do this check then.
-        try:
-            header = requests.head(target_url, allow_redirects=True)
-        except ConnectionError as e:
-            msg = ('Unable to access the requested remote file headers: %s'
-                   % str(e))
-            LOG.error(msg)
-            return Response(msg, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        if header.status_code == 404:
-            raise NotFound('The remote file was not found.')
-
-        content_type = header.headers.get('Content-Type', '')
-
-        # If the URL has returned URL content but an HTML file was not
-        # requested then assume that the URL has linked to a download page or
-        # some sort of error page or similar and raise an error.
-        if 'html' in content_type.lower() and '.html' not in target_url:
-            LOG.error('The requested data seems to be in HTML format. '
-                      'Assuming this is not valid data file.')
-            raise ParseError('Provided URL links to HTML content.')
-
-        buf = BytesIO()
-        upload_file_name = None
-        try:
-            with requests.get(target_url,
-                              allow_redirects=True, stream=True) as r:
-                if 'Content-Disposition' in r.headers:
-                    cd = r.headers['Content-Disposition']
-                    matches = re.findall('filename=(.+)', cd)
-                    if len(matches):
-                        upload_file_name = matches[0]
-                for chunk in r.iter_content(chunk_size=1048576):
-                    buf.write(chunk)
-        except ConnectionError as e:
-            raise NotFound('Unable to access the requested remote file: %s'
-                           % str(e))
+        return target_url
 
+    def _register_fetch_job(self, request):
+        # Register an asynchronous fetch job and return immediately. The
+        # client polls the fetch status endpoint with the returned transfer
+        # ID to find out when the file is available as a temporary upload.
+        target_url = self._get_target_url(request)
+        upload_id = submit_fetch_job(target_url, _get_user(request))
+        response = Response(status=status.HTTP_202_ACCEPTED)
+        response['X-Content-Transfer-Id'] = upload_id
+        return response
+
+    def _process_request(self, request):
+        LOG.debug('Filepond API: Fetch view GET called...')
+        '''
+        Supports retrieving a file on the server side that the user has
+        specified by calling addFile on the filepond API and passing a
+        URL to a file.
+        '''
+        # Retrieve the target URL from the request query string target
+        # target parameter, pull the file into temp upload storage and
+        # return a file object.
+        target_url = self._get_target_url(request)
+
+        # The remote file is downloaded via coalesce_fetch so that if there
+        # are other requests for the same URL in progress, only one download
+        # takes place and its result is shared.
+        try:
+            (data, upload_file_name, content_type) = coalesce_fetch(
+                target_url, download_remote_file, target_url)
+        except FetchError as e:
+            response = Response(str(e), status=e.status_code)
+            if e.retry_after:
+                response['Retry-After'] = str(e.retry_after)
+            return response
+
+        buf = BytesIO(data)
         file_id = _get_file_id()
-        # If filename wasn't extracted from Content-Disposition header, get
-        # from the URL or otherwise set it to the auto-generated file_id
-        if not upload_file_name:
-            if not target_url.endswith('/'):
-                split = target_url.rsplit('/', 1)
-                upload_file_name = split[1] if len(split) > 1 else split[0]
-            else:
-                upload_file_name = file_id
+        upload_file_name = get_upload_file_name(target_url, upload_file_name,
+                                                file_id)
 
         return (buf, file_id, upload_file_name, content_type)
 
+    def _store_fetched_file(self, request, buf, file_id, upload_file_name,
+                            content_type):
+        # Store the data of a fetched file as a TemporaryUpload, returning
+        # the ID of the new upload and the size of the file.
+        file_size = buf.seek(0, os.SEEK_END)
+        buf.seek(0)
+
+        upload_id = _get_file_id()
+        memfile = InMemoryUploadedFile(buf, None, file_id, content_type,
+                                       file_size, None)
+        tu = TemporaryUpload(upload_id=upload_id, file_id=file_id,
+                             file=memfile, upload_name=upload_file_name,
+                             upload_type=TemporaryUpload.URL,
+                             uploaded_by=_get_user(request))
+        tu.save(force_insert=True)
+        return (upload_id, file_size)
+
     def head(self, request):
         LOG.debug('Filepond API: Fetch view HEAD called...')
+        if local_settings.FETCH_ASYNC:
+            return self._register_fetch_job(request)
+
         result = self._process_request(request)
         if isinstance(result, tuple):
             buf, file_id, upload_file_name, content_type = result
@@ -397,23 +536,14 @@ class FetchView(APIView):
         else:
             raise ValueError('process_request result is of an unexpected type')
 
-        file_size = buf.seek(0, os.SEEK_END)
-        buf.seek(0)
-
         # The addressing of filepond issue #154
         # (https://github.com/pqina/filepond/issues/154) means that fetch
         # can now store a file downloaded from a remote URL and return file
         # metadata in the header if a HEAD request is received. If we get a
         # GET request then the standard approach of proxying the file back
         # to the client is used.
-        upload_id = _get_file_id()
-        memfile = InMemoryUploadedFile(buf, None, file_id, content_type,
-                                       file_size, None)
-        tu = TemporaryUpload(upload_id=upload_id, file_id=file_id,
-                             file=memfile, upload_name=upload_file_name,
-                             upload_type=TemporaryUpload.URL,
-                             uploaded_by=_get_user(request))
-        tu.save()
+        (upload_id, file_size) = self._store_fetched_file(
+            request, buf, file_id, upload_file_name, content_type)
 
         response = Response(status=status.HTTP_200_OK)
         response['Content-Type'] = content_type
@@ -435,3 +565,62 @@ class FetchView(APIView):
         response['Content-Disposition'] = ('inline; filename=%s' %
                                            upload_file_name)
         return response
+
+
+class FetchStatusView(_MetricsMixin, APIView):
+    '''
+    Reports the status of an asynchronous fetch job registered by a HEAD
+    request to the fetch endpoint when DJANGO_DRF_FILEPOND_FETCH_ASYNC is
+    enabled. Expects the transfer ID returned in the X-Content-Transfer-Id
+    header of the HEAD response to be provided with the 'id' parameter.
+    '''
+    permission_classes = _import_permission_classes('GET_FETCH')
+    metrics_endpoint = 'fetch_status'
+
+    def get(self, request):
+        LOG.debug('Filepond API: Fetch status view GET called...')
+        if LOAD_RESTORE_PARAM_NAME not in request.GET:
+            return Response('A required parameter is missing.',
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        upload_id = request.GET[LOAD_RESTORE_PARAM_NAME]
+        try:
+            job = TemporaryUploadFetch.objects.using(
+                get_read_db(upload_id)).get(upload_id=upload_id)
+        except TemporaryUploadFetch.DoesNotExist:
+            return Response('Not found', status=status.HTTP_404_NOT_FOUND)
+
+        # Only the user who registered a fetch job can see its status
+        if job.uploaded_by_id is not None:
+            user = _get_user(request)
+            if (user is None) or (user.pk != job.uploaded_by_id):
+                return Response('Not found',
+                                status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'id': job.upload_id,
+            'status': job.get_status_display().lower(),
+            'bytes_downloaded': job.bytes_downloaded,
+            'total_size': job.total_size,
+            'upload_name': job.upload_name,
+            'error': job.error,
+        }, status=status.HTTP_200_OK)
+
+
+class MetricsView(View):
+    '''
+    Exposes the metrics recorded by the current process in the Prometheus
+    text exposition format when DJANGO_DRF_FILEPOND_METRICS_SINK is set to
+    django_drf_filepond.metrics.InMemoryMetricsSink. This view isn't
+    included in django_drf_filepond.urls, add it to your URL configuration,
+    with any access restrictions you require, to make the metrics available.
+    '''
+    http_method_names = ['get']
+
+    def get(self, request):
+        sink = get_metrics_sink()
+        if not isinstance(sink, InMemoryMetricsSink):
+            return HttpResponseNotFound('Metrics are not being recorded in '
+                                        'memory.')
+        return HttpResponse(sink.render_prometheus(),
+                            content_type=PROMETHEUS_CONTENT_TYPE)
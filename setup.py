@@ -18,6 +18,8 @@ setup(
     packages=[
         "django_drf_filepond",
         "django_drf_filepond.migrations",
+        "django_drf_filepond.management",
+        "django_drf_filepond.management.commands",
     ],
     include_package_data=True,
     install_requires=[
@@ -31,7 +33,9 @@ setup(
         "requests>=2.20.1",
         "django-storages==1.9.1;python_version=='2.7'",
         "django-storages>=1.9.1;python_version>='3.5'",
-        "six>=1.14.0"
+        "six>=1.14.0",
+        "futures>=3.3.0;python_version=='2.7'",
+        "scandir>=1.10.0;python_version=='2.7'"
     ],
     tests_require=[
         "nose",
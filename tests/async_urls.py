@@ -0,0 +1,12 @@
+"""tests URL Configuration for the asynchronous views
+
+Used by the tests in test_async_views to route the filepond endpoints to
+the views in django_drf_filepond.async_views.
+"""
+from django.conf import settings
+from django.conf.urls import include
+from django.urls import re_path
+
+urlpatterns = [
+    re_path(settings.URL_BASE, include('django_drf_filepond.async_urls'))
+]
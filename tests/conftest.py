@@ -0,0 +1,16 @@
+"""pytest configuration for the tests
+
+The asynchronous views and API functions require Django 4.2 or later. They,
+and the tests that use them, contain async generators and comprehensions
+that can't be parsed by the older Python versions used with earlier Django
+releases, so the test modules that import them aren't collected there.
+"""
+import django
+
+collect_ignore = []
+if django.VERSION < (4, 2):
+    collect_ignore += [
+        'test_async_api.py',
+        'test_async_views.py',
+        'test_async_memory_budgets.py',
+    ]
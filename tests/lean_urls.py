@@ -0,0 +1,17 @@
+"""tests URL Configuration for the lean patch view
+
+Used by the tests in test_lean_patch_view to route the patch endpoint to
+django_drf_filepond.views.LeanPatchView, as is done by
+django_drf_filepond.urls when DJANGO_DRF_FILEPOND_LEAN_PATCH_VIEW is set.
+"""
+from django.conf import settings
+from django.conf.urls import include
+from django.urls import re_path
+
+from django_drf_filepond.views import LeanPatchView
+
+urlpatterns = [
+    re_path(settings.URL_BASE + r'patch/(?P<chunk_id>[0-9a-zA-Z]{22})$',
+            LeanPatchView.as_view(), name='patch'),
+    re_path(settings.URL_BASE, include('django_drf_filepond.urls'))
+]
@@ -83,7 +83,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR_STR, 'filepond_tests.db'),
-    }
+    },
+    # A database alias used to test read replica routing. When running
+    # tests this is a separate database to the default database so the
+    # database that a record is looked up from can be determined.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR_STR, 'filepond_tests_replica.db'),
+    },
 }
 
 
@@ -24,6 +24,7 @@ from django_drf_filepond.models import TemporaryUpload, StoredUpload
 import django_drf_filepond.drf_filepond_settings as local_settings
 from django.core.exceptions import ImproperlyConfigured
 from django_drf_filepond.api import _store_upload_local
+from django_drf_filepond.config import load_config
 
 # There's no built in FileNotFoundError, FileExistsError in Python 2
 try:
@@ -128,11 +129,16 @@ class ApiTestCase(TestCase):
     def test_store_upload_unset_file_store_path(self):
         fsp = local_settings.FILE_STORE_PATH
         local_settings.FILE_STORE_PATH = None
-        with self.assertRaisesMessage(
-                ImproperlyConfigured, 'A required setting is missing in '
-                'your application configuration.'):
-            store_upload('hsdfiuysh78sdhiu', '/test_storage/test_file.txt')
-        local_settings.FILE_STORE_PATH = fsp
+        try:
+            load_config()
+            with self.assertRaisesMessage(
+                    ImproperlyConfigured, 'A required setting is missing in '
+                    'your application configuration.'):
+                store_upload('hsdfiuysh78sdhiu',
+                             '/test_storage/test_file.txt')
+        finally:
+            local_settings.FILE_STORE_PATH = fsp
+            load_config()
 
     def test_store_upload_invalid_id(self):
         with self.assertRaisesMessage(ValueError, 'The provided upload ID '
@@ -303,22 +309,30 @@ class ApiTestCase(TestCase):
         fsp = local_settings.FILE_STORE_PATH
         local_settings.FILE_STORE_PATH = None
         tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
-        with self.assertRaisesMessage(
-                ValueError,
-                'The FILE_STORE_PATH is not set to a directory.'):
-            _store_upload_local('/test_storage', 'test_file.txt', tu)
-        local_settings.FILE_STORE_PATH = fsp
+        try:
+            load_config()
+            with self.assertRaisesMessage(
+                    ValueError,
+                    'The FILE_STORE_PATH is not set to a directory.'):
+                _store_upload_local('/test_storage', 'test_file.txt', tu)
+        finally:
+            local_settings.FILE_STORE_PATH = fsp
+            load_config()
 
     def test_store_upload_local_direct_missing_store_path(self):
         fsp = local_settings.FILE_STORE_PATH
         test_dir = '/tmp/%s' % _get_file_id()
         local_settings.FILE_STORE_PATH = test_dir
-        with self.assertRaisesMessage(
-                FileNotFoundError,
-                'The local output directory [%s] defined by '
-                'FILE_STORE_PATH is missing.' % test_dir):
-            _store_upload_local('/test_storage', 'test_file.txt', None)
-        local_settings.FILE_STORE_PATH = fsp
+        try:
+            load_config()
+            with self.assertRaisesMessage(
+                    FileNotFoundError,
+                    'The local output directory [%s] defined by '
+                    'FILE_STORE_PATH is missing.' % test_dir):
+                _store_upload_local('/test_storage', 'test_file.txt', None)
+        finally:
+            local_settings.FILE_STORE_PATH = fsp
+            load_config()
 
     def test_store_upload_local_direct_file_exists(self):
         filestore_base = getattr(local_settings, 'FILE_STORE_PATH', None)
@@ -338,7 +352,7 @@ class ApiTestCase(TestCase):
         with patch('shutil.copy2') as copy2_patch:
             with patch('os.path.exists') as exists_patch:
                 with patch('os.path.isdir') as isdir_patch:
-                    exists_patch.side_effect = [True, False, True]
+                    exists_patch.side_effect = [False, True]
                     isdir_patch.return_value = True
                     copy2_patch.side_effect = IOError(
                         'Error moving temporary file to permanent storage '
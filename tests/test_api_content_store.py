@@ -0,0 +1,196 @@
+'''
+Tests for the content-addressed file store layout that can be enabled for
+local storage using the DJANGO_DRF_FILEPOND_FILE_STORE_CONTENT_ADDRESSED
+setting.
+
+When enabled, store_upload stores the file data at a path derived from the
+SHA-256 hash of the content and uploads with identical content share the
+stored file. get_stored_upload_file_data and delete_stored_upload resolve
+the location of the data from the StoredUpload record.
+'''
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+
+import django_drf_filepond.api
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import store_upload, delete_stored_upload, \
+    get_stored_upload_file_data
+from django_drf_filepond.config import load_config
+from django_drf_filepond.models import TemporaryUpload, StoredUpload, \
+    get_content_path
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+# There's no built in FileExistsError in Python 2
+try:
+    FileExistsError
+except NameError:
+    FileExistsError = OSError
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the content-addressed file store:
+#
+# test_store_content_addressed: Check that a stored upload's data is placed
+#    at the content path for its hash, that the record holds the destination
+#    path, hash and file metadata and that the temporary upload is removed.
+#
+# test_store_duplicate_content: Check that storing two uploads with the
+#    same content results in a single stored file shared by both records.
+#
+# test_store_existing_destination: Check that storing an upload to a
+#    destination path used by an existing stored upload raises an error
+#    and leaves the temporary upload in place.
+#
+# test_get_stored_upload_file_data: Check that the data is read from the
+#    content path and the destination file name is returned.
+#
+# test_delete_shared_content: Check that deleting a stored upload whose
+#    content is shared doesn't remove the file until the last reference is
+#    deleted.
+#
+# test_delete_content_concurrent_store: Check that when a stored upload
+#    with the same content is saved while the file is being deleted, the
+#    file is restored rather than removed.
+#
+class ContentAddressedStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        # Cleanups run in reverse order so the configuration snapshot is
+        # rebuilt once the settings have been restored.
+        self.addCleanup(load_config)
+        patchers = [
+            patch.object(local_settings, 'FILE_STORE_PATH', self.store_dir),
+            patch.object(local_settings, 'FILE_STORE_CONTENT_ADDRESSED',
+                         True),
+            patch.object(local_settings, 'STORAGES_BACKEND', None)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        load_config()
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir, True)
+
+    def _create_temp_upload(self, data=b'Some test data'):
+        tu = TemporaryUpload(
+            upload_id=_get_file_id(), file_id=_get_file_id(),
+            file=SimpleUploadedFile('test.txt', data),
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        return tu
+
+    def _content_file(self, data):
+        return os.path.join(self.store_dir, get_content_path(
+            hashlib.sha256(data).hexdigest()))
+
+    def test_store_content_addressed(self):
+        tu = self._create_temp_upload()
+        su = store_upload(tu.upload_id, os.path.join('dir1', 'file1.txt'))
+
+        su = StoredUpload.objects.get(upload_id=su.upload_id)
+        self.assertEqual(su.file.name, os.path.join('dir1', 'file1.txt'))
+        self.assertEqual(su.content_hash,
+                         hashlib.sha256(b'Some test data').hexdigest())
+        self.assertEqual(su.digest, su.content_hash)
+        self.assertEqual(su.size, 14)
+        self.assertEqual(su.content_type, 'text/plain')
+        self.assertEqual(su.get_absolute_file_path(),
+                         self._content_file(b'Some test data'))
+        with open(self._content_file(b'Some test data'), 'rb') as f:
+            self.assertEqual(f.read(), b'Some test data')
+        self.assertFalse(os.path.exists(os.path.join(self.store_dir,
+                                                     'dir1')))
+        self.assertFalse(TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).exists())
+
+    def test_store_duplicate_content(self):
+        su1 = store_upload(self._create_temp_upload().upload_id,
+                           os.path.join('dir1', 'file1.txt'))
+        su2 = store_upload(self._create_temp_upload().upload_id,
+                           os.path.join('dir2', 'file2.txt'))
+        su3 = store_upload(self._create_temp_upload(b'Other data').upload_id,
+                           os.path.join('dir2', 'file3.txt'))
+
+        self.assertEqual(su1.content_hash, su2.content_hash)
+        self.assertNotEqual(su1.content_hash, su3.content_hash)
+        content_dir = os.path.dirname(self._content_file(b'Some test data'))
+        self.assertEqual(os.listdir(content_dir), [su1.content_hash])
+
+    def test_store_existing_destination(self):
+        store_upload(self._create_temp_upload().upload_id,
+                     os.path.join('dir1', 'file1.txt'))
+        tu = self._create_temp_upload(b'Other data')
+        with self.assertRaises(FileExistsError):
+            store_upload(tu.upload_id, os.path.join('dir1', 'file1.txt'))
+        self.assertTrue(TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).exists())
+        self.assertFalse(os.path.exists(self._content_file(b'Other data')))
+        tu.delete()
+
+    def test_get_stored_upload_file_data(self):
+        su = store_upload(self._create_temp_upload().upload_id,
+                          os.path.join('dir1', 'file1.txt'))
+        (filename, data) = get_stored_upload_file_data(
+            StoredUpload.objects.get(upload_id=su.upload_id))
+        self.assertEqual(filename, 'file1.txt')
+        self.assertEqual(data, b'Some test data')
+
+    def test_delete_shared_content(self):
+        su1 = store_upload(self._create_temp_upload().upload_id,
+                           os.path.join('dir1', 'file1.txt'))
+        su2 = store_upload(self._create_temp_upload().upload_id,
+                           os.path.join('dir1', 'file2.txt'))
+        content_file = self._content_file(b'Some test data')
+
+        self.assertTrue(delete_stored_upload(su1.upload_id, delete_file=True))
+        self.assertFalse(StoredUpload.objects.filter(
+            upload_id=su1.upload_id).exists())
+        self.assertTrue(os.path.exists(content_file))
+
+        self.assertTrue(delete_stored_upload(su2.upload_id, delete_file=True))
+        self.assertFalse(os.path.exists(content_file))
+
+    def test_delete_content_concurrent_store(self):
+        su1 = store_upload(self._create_temp_upload().upload_id,
+                           os.path.join('dir1', 'file1.txt'))
+        content_file = self._content_file(b'Some test data')
+        referenced = django_drf_filepond.api._content_hash_referenced
+        calls = []
+
+        def store_after_check(content_hash):
+            # Save a record with the same content after the first check of
+            # the references, as a concurrent store_upload would.
+            result = referenced(content_hash)
+            if not calls:
+                StoredUpload.objects.create(
+                    upload_id=_get_file_id(),
+                    file=os.path.join('dir1', 'file2.txt'),
+                    uploaded=timezone.now(), content_hash=content_hash)
+            calls.append(result)
+            return result
+
+        with patch('django_drf_filepond.api._content_hash_referenced',
+                   side_effect=store_after_check):
+            self.assertTrue(delete_stored_upload(su1.upload_id,
+                                                 delete_file=True))
+        self.assertEqual(calls, [False, True])
+        self.assertEqual(os.listdir(os.path.dirname(content_file)),
+                         [su1.content_hash])
+        with open(content_file, 'rb') as f:
+            self.assertEqual(f.read(), b'Some test data')
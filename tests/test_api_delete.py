@@ -112,14 +112,13 @@ class ApiDeleteTestCase(TestCase):
         # backend class.
         import django_drf_filepond.api
         self.api = django_drf_filepond.api
-        django_drf_filepond.api.storage_backend_initialised = False
-        django_drf_filepond.api._init_storage_backend()
-        self.mock_storage_backend = django_drf_filepond.api.storage_backend
+        self.mock_storage_backend = \
+            django_drf_filepond.api._init_storage_backend()
         self.delete_upload = django_drf_filepond.api.delete_stored_upload
 
         # Check that we're using a mocked storage backend
         self.assertTrue(
-            isinstance(django_drf_filepond.api.storage_backend, MagicMock),
+            isinstance(self.mock_storage_backend, MagicMock),
             ('The created storage backend should be mocked but it is not of '
              'type unittest.mock.MagicMock...'))
 
@@ -141,7 +140,7 @@ class ApiDeleteTestCase(TestCase):
         # is called on the FileSystemStorage backend.
         # Set the storage backend to None to force use of local storage.
         local_settings.STORAGES_BACKEND = None
-        self.api.storage_backend_initialised = False
+        self.api._init_storage_backend()
 
         # Get the target file path that we want to check that delete has been
         # called with. This is the file path from the DB plus the base file
@@ -171,7 +170,7 @@ class ApiDeleteTestCase(TestCase):
         # is called on the FileSystemStorage backend.
         # Set the storage backend to None to force use of local storage.
         local_settings.STORAGES_BACKEND = None
-        self.api.storage_backend_initialised = False
+        self.api._init_storage_backend()
 
         with patch('os.remove') as os_patcher:
             with patch('os.path.exists') as exists:
@@ -204,7 +203,7 @@ class ApiDeleteTestCase(TestCase):
         # Need to set storage backend to None and make it reinitialise to
         # ensure that we're not using a remote backend for this test.
         local_settings.STORAGES_BACKEND = None
-        self.api.storage_backend_initialised = False
+        self.api._init_storage_backend()
         with self.assertRaisesMessage(
                 ConfigurationError,
                 'The file upload settings are not configured correctly.'):
@@ -215,11 +214,11 @@ class ApiDeleteTestCase(TestCase):
         # Need to set storage backend to None and make it reinitialise to
         # ensure that we're not using a remote backend for this test.
         local_settings.STORAGES_BACKEND = None
-        self.api.storage_backend_initialised = False
         with patch('os.path.exists') as exists:
             with patch('os.path.isdir') as isdir:
                 exists.return_value = False
                 isdir.return_value = True
+                self.api._init_storage_backend()
                 with self.assertRaisesMessage(
                         ConfigurationError,
                         ('The file upload settings are not configured '
@@ -230,11 +229,11 @@ class ApiDeleteTestCase(TestCase):
         # Need to set storage backend to None and make it reinitialise to
         # ensure that we're not using a remote backend for this test.
         local_settings.STORAGES_BACKEND = None
-        self.api.storage_backend_initialised = False
         with patch('os.path.exists') as exists:
             with patch('os.path.isdir') as isdir:
                 exists.return_value = True
                 isdir.return_value = False
+                self.api._init_storage_backend()
                 with self.assertRaisesMessage(
                         ConfigurationError,
                         ('The file upload settings are not configured '
@@ -252,7 +251,7 @@ class ApiDeleteTestCase(TestCase):
 
     def test_delete_stored_upload_local_file_missing(self):
         local_settings.STORAGES_BACKEND = None
-        self.api.storage_backend_initialised = False
+        self.api._init_storage_backend()
         target_filepath = os.path.join(
             local_settings.FILE_STORE_PATH, self.test_target_filepath)
         with patch('os.path.exists') as exists:
@@ -268,7 +267,7 @@ class ApiDeleteTestCase(TestCase):
         # is called on the FileSystemStorage backend.
         # Set the storage backend to None to force use of local storage.
         local_settings.STORAGES_BACKEND = None
-        self.api.storage_backend_initialised = False
+        self.api._init_storage_backend()
 
         # Get the target file path that we want to check that delete has been
         # called with. This is the file path from the DB plus the base file
@@ -293,4 +292,4 @@ class ApiDeleteTestCase(TestCase):
 
         self.su.delete()
 
-        self.api.storage_backend_initialised = False
+        self.api._init_storage_backend()
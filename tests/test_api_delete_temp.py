@@ -0,0 +1,153 @@
+'''
+Tests for the delete_temp_uploads api function provided by
+django-drf-filepond
+
+delete_temp_uploads:
+    Deletes temporary uploads in bulk along with their files. Records are
+    removed in batches with a single bulk delete per batch and the files are
+    then removed concurrently. The per-instance post_delete signal handler
+    that otherwise removes files is not triggered.
+'''
+import logging
+import os
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+import django_drf_filepond.api
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import delete_temp_uploads
+from django_drf_filepond.models import TemporaryUpload, \
+    suppress_delete_temp_upload_file
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for delete_temp_uploads:
+#
+# test_delete_temp_uploads_queryset: Call delete_temp_uploads with a
+#    QuerySet and check that only the selected records and their files and
+#    directories are removed.
+#
+# test_delete_temp_uploads_ids: Call delete_temp_uploads with a list of
+#    upload IDs, including an ID that doesn't exist, and check that the
+#    existing records and their files are removed.
+#
+# test_delete_temp_uploads_batches: Call delete_temp_uploads with more
+#    records than the batch size and check all records are removed.
+#
+# test_delete_temp_uploads_query_count: Check that a batch of records is
+#    removed with a fixed number of queries rather than per record.
+#
+# test_delete_temp_uploads_keep_dirs: Check that temporary directories are
+#    retained when DELETE_UPLOAD_TMP_DIRS is False.
+#
+# test_delete_temp_uploads_missing_file: Check that a record whose file
+#    has already been removed is deleted without an error.
+#
+# test_delete_temp_uploads_string: Check that passing a single upload ID
+#    string, rather than an iterable of IDs, raises a ValueError.
+#
+# test_suppress_delete_temp_upload_file: Check that deleting a record
+#    inside the suppress_delete_temp_upload_file context doesn't remove
+#    its file and that file removal is restored after the context.
+#
+class DeleteTempUploadsTestCase(TestCase):
+
+    def _create_temp_uploads(self, count):
+        uploads = []
+        for _ in range(count):
+            tu = TemporaryUpload(
+                upload_id=_get_file_id(), file_id=_get_file_id(),
+                file=SimpleUploadedFile('test.txt', b'Some test data'),
+                upload_name='test.txt',
+                upload_type=TemporaryUpload.FILE_DATA)
+            tu.save()
+            uploads.append(tu)
+        return uploads
+
+    def _assert_removed(self, tu):
+        self.assertFalse(TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).exists())
+        self.assertFalse(os.path.exists(tu.get_file_path()))
+        self.assertFalse(os.path.exists(os.path.dirname(
+            tu.get_file_path())))
+
+    def test_delete_temp_uploads_queryset(self):
+        uploads = self._create_temp_uploads(3)
+        deleted = delete_temp_uploads(TemporaryUpload.objects.filter(
+            upload_id__in=[tu.upload_id for tu in uploads[:2]]))
+        self.assertEqual(deleted, 2)
+        for tu in uploads[:2]:
+            self._assert_removed(tu)
+        self.assertTrue(os.path.exists(uploads[2].get_file_path()))
+        uploads[2].delete()
+
+    def test_delete_temp_uploads_ids(self):
+        uploads = self._create_temp_uploads(2)
+        deleted = delete_temp_uploads(
+            [tu.upload_id for tu in uploads] + [_get_file_id()])
+        self.assertEqual(deleted, 2)
+        for tu in uploads:
+            self._assert_removed(tu)
+
+    def test_delete_temp_uploads_batches(self):
+        uploads = self._create_temp_uploads(5)
+        with patch.object(django_drf_filepond.api,
+                          'TEMP_UPLOAD_DELETE_BATCH_SIZE', 2):
+            deleted = delete_temp_uploads(TemporaryUpload.objects.all(),
+                                          max_workers=2)
+        self.assertEqual(deleted, 5)
+        for tu in uploads:
+            self._assert_removed(tu)
+
+    def test_delete_temp_uploads_query_count(self):
+        uploads = self._create_temp_uploads(10)
+        # One query to select the batch, one to delete it and one to find
+        # that there are no more records.
+        with self.assertNumQueries(3):
+            delete_temp_uploads(TemporaryUpload.objects.all())
+        for tu in uploads:
+            self._assert_removed(tu)
+
+    def test_delete_temp_uploads_keep_dirs(self):
+        uploads = self._create_temp_uploads(1)
+        with patch.object(local_settings, 'DELETE_UPLOAD_TMP_DIRS', False):
+            delete_temp_uploads([uploads[0].upload_id])
+        file_dir = os.path.dirname(uploads[0].get_file_path())
+        self.assertFalse(os.path.exists(uploads[0].get_file_path()))
+        self.assertTrue(os.path.exists(file_dir))
+        os.rmdir(file_dir)
+
+    def test_delete_temp_uploads_missing_file(self):
+        uploads = self._create_temp_uploads(1)
+        os.remove(uploads[0].get_file_path())
+        self.assertEqual(delete_temp_uploads([uploads[0].upload_id]), 1)
+        self._assert_removed(uploads[0])
+
+    def test_delete_temp_uploads_string(self):
+        uploads = self._create_temp_uploads(1)
+        with self.assertRaisesRegex(ValueError, 'not a single upload ID'):
+            delete_temp_uploads(uploads[0].upload_id)
+        self.assertTrue(os.path.exists(uploads[0].get_file_path()))
+        uploads[0].delete()
+
+    def test_suppress_delete_temp_upload_file(self):
+        uploads = self._create_temp_uploads(2)
+        file_path = uploads[0].get_file_path()
+        with suppress_delete_temp_upload_file():
+            uploads[0].delete()
+        self.assertTrue(os.path.exists(file_path))
+        os.remove(file_path)
+        os.rmdir(os.path.dirname(file_path))
+
+        uploads[1].delete()
+        self._assert_removed(uploads[1])
@@ -20,6 +20,7 @@ import django_drf_filepond.api
 import django_drf_filepond.drf_filepond_settings as local_settings
 from django_drf_filepond.exceptions import ConfigurationError
 from django_drf_filepond.models import StoredUpload
+from django_drf_filepond.storage_utils import get_storage_backend
 from django_drf_filepond.utils import _get_file_id
 
 # Python 2/3 support
@@ -49,8 +50,9 @@ LOG = logging.getLogger(__name__)
 # test_get_remote_stored_upload_data: Check that data is correctly
 #    returned for a remote upload - test with a mocked SFTP backend.
 #
-# test_storage_backend_initialised_when_required: Check that when the
-#    storage backend is uninitialised, it is set up correctly.
+# test_storage_backend_not_reinitialised: Check that getting file data
+#    uses the shared storage backend instance rather than reloading the
+#    configuration and creating a new instance.
 #
 # test_get_remote_upload_not_on_remote_store: Check that when requesting
 #    a file from a remote store that doesn't exist, we get a suitable error
@@ -99,11 +101,15 @@ class ApiGetUploadTestCase(TestCase):
     def test_get_local_stored_upload_no_filestore(self):
         fsp = local_settings.FILE_STORE_PATH
         local_settings.FILE_STORE_PATH = None
-        with self.assertRaisesMessage(
-                ConfigurationError,
-                'The file upload settings are not configured correctly.'):
-            get_stored_upload_file_data(self.su)
-        local_settings.FILE_STORE_PATH = fsp
+        try:
+            django_drf_filepond.api._init_storage_backend()
+            with self.assertRaisesMessage(
+                    ConfigurationError,
+                    'The file upload settings are not configured correctly.'):
+                get_stored_upload_file_data(self.su)
+        finally:
+            local_settings.FILE_STORE_PATH = fsp
+            django_drf_filepond.api._init_storage_backend()
 
     def test_get_remote_stored_upload_data(self):
         # Set up the mock_storage_backend.open to return the file content
@@ -115,30 +121,23 @@ class ApiGetUploadTestCase(TestCase):
         (filename, byte_data) = get_stored_upload_file_data(self.su)
         file_data = byte_data.decode()
         local_settings.STORAGES_BACKEND = None
-        django_drf_filepond.api.storage_backend = None
+        django_drf_filepond.api._init_storage_backend()
         self.assertEqual(file_data, self.file_content,
                          'Returned file content not correct.')
         self.assertEqual(filename, os.path.basename(self.test_target_filename),
                          'Returned file name is not correct.')
 
-    def test_storage_backend_initialised_when_required(self):
+    def test_storage_backend_not_reinitialised(self):
         mock_storage_backend = self._setup_mock_storage_backend()
         mock_storage_backend.open.return_value = BytesIO(
             self.file_content.encode())
         mock_storage_backend.exists.return_value = True
-        with patch('django_drf_filepond.api._init_storage_backend') as m:
-            django_drf_filepond.api.storage_backend_initialised = False
+        with patch('django_drf_filepond.api.load_config') as m:
             get_stored_upload_file_data(self.su)
-            local_settings.STORAGES_BACKEND = None
-            django_drf_filepond.api.storage_backend = None
-            try:
-                m.assert_called_once()
-            # No assert_called_once on Python 3.5
-            except AttributeError:
-                self.assertEqual(
-                    m.call_count, 1,
-                    ('Expected _init_storage_backend to be called once but '
-                     'it has been called %s times.' % m.call_count))
+        self.assertIs(get_storage_backend(), mock_storage_backend)
+        local_settings.STORAGES_BACKEND = None
+        django_drf_filepond.api._init_storage_backend()
+        m.assert_not_called()
 
     def test_get_remote_upload_not_on_remote_store(self):
         # File store path for remote testing should be ''
@@ -152,7 +151,7 @@ class ApiGetUploadTestCase(TestCase):
                  'file store.' % (file_path, self.su.upload_id))):
             get_stored_upload_file_data(self.su)
             local_settings.STORAGES_BACKEND = None
-            django_drf_filepond.api.storage_backend = None
+            django_drf_filepond.api._init_storage_backend()
 
     def _setup_mock_storage_backend(self):
         # Set storage backend to sftp storage
@@ -173,10 +172,7 @@ class ApiGetUploadTestCase(TestCase):
         patcher2.start()
         self.addCleanup(patcher2.stop)
         # Set the backend initialisation flag to false to force re-init
-        django_drf_filepond.api.storage_backend_initialised = False
-        django_drf_filepond.api._init_storage_backend()
-        mock_storage_backend = django_drf_filepond.api.storage_backend
-        return mock_storage_backend
+        return django_drf_filepond.api._init_storage_backend()
 
     def tearDown(self):
         # Delete stored upload
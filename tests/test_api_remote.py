@@ -103,14 +103,13 @@ class ApiRemoteTestCase(TestCase):
         # backend class.
         import django_drf_filepond.api
         self.api = django_drf_filepond.api
-        django_drf_filepond.api.storage_backend_initialised = False
-        django_drf_filepond.api._init_storage_backend()
-        self.mock_storage_backend = django_drf_filepond.api.storage_backend
+        self.mock_storage_backend = \
+            django_drf_filepond.api._init_storage_backend()
         store_upload = django_drf_filepond.api.store_upload
 
         # Check that we're using a mocked storage backend
         self.assertTrue(
-            isinstance(django_drf_filepond.api.storage_backend, MagicMock),
+            isinstance(self.mock_storage_backend, MagicMock),
             ('The created storage backend should be mocked but it is not of '
              'type unittest.mock.MagicMock...'))
 
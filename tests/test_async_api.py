@@ -0,0 +1,270 @@
+'''
+Tests for the asynchronous API functions in django_drf_filepond.async_api.
+'''
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import _check_store_upload_args
+from django_drf_filepond.async_api import adelete_stored_upload, \
+    aget_stored_upload, aget_stored_upload_file_data, astore_upload
+from django_drf_filepond.cache_utils import get_stored_upload_cache_stats, \
+    reset_stored_upload_cache_stats
+from django_drf_filepond.config import load_config
+from django_drf_filepond.models import StoredUpload, TemporaryUpload
+from django_drf_filepond.tracing import RecordingTracer
+from django_drf_filepond.utils import _get_file_id
+from tests.test_query_budgets import QUERY_BUDGETS
+
+# Python 2/3 support
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the asynchronous API functions:
+#
+# test_astore_upload: Check that a temporary upload is stored to the local
+#    file store and the temporary upload is removed.
+#
+# test_astore_upload_concurrent: Check that several uploads stored
+#    concurrently using asyncio.gather are all stored.
+#
+# test_astore_upload_not_found: Check that a ValueError is raised for an
+#    upload ID with no temporary upload.
+#
+# test_astore_upload_file_exists: Check that storing an upload to the
+#    location of an existing file raises an error and leaves the temporary
+#    upload in place.
+#
+# test_astore_upload_args_checked_in_thread: Check that the arguments are
+#    checked, which may build the configuration snapshot, in a worker thread
+#    rather than on the event loop.
+#
+# test_astore_upload_remote: Check that the file is saved using the storage
+#    backend when one is configured.
+#
+# test_recording_tracer_concurrent_tasks: Check that the parents of spans
+#    opened by coroutines running concurrently on the event loop are the
+#    spans opened by the same coroutine.
+#
+# test_aget_stored_upload: Check that a stored upload is found by upload ID
+#    and by file path.
+#
+# test_aget_stored_upload_not_found: Check that StoredUpload.DoesNotExist is
+#    raised for an unknown upload ID.
+#
+# test_aget_stored_upload_cached: Check that the stored upload cache is used
+#    when it is enabled.
+#
+# test_aget_stored_upload_file_data: Check that the data of a file stored in
+#    the content-addressed store is returned.
+#
+# test_adelete_stored_upload: Check that the record and the file are
+#    deleted.
+#
+# test_async_api_query_budgets: Check the queries made by astore_upload,
+#    aget_stored_upload and adelete_stored_upload against the budgets in
+#    tests/test_query_budgets.py.
+#
+class AsyncApiTestCase(TestCase):
+
+    def setUp(self):
+        self.file_content = b'This is some test file data for an upload.'
+        self.store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.store_dir, True)
+        # Cleanups run in reverse order so the configuration snapshot is
+        # rebuilt once the settings have been restored.
+        self.addCleanup(load_config)
+        patchers = [
+            patch.object(local_settings, 'FILE_STORE_PATH', self.store_dir),
+            patch.object(local_settings, 'STORAGES_BACKEND', None)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        load_config()
+
+    def _create_temp_upload(self, data=None):
+        tu = TemporaryUpload(
+            upload_id=_get_file_id(), file_id=_get_file_id(),
+            file=SimpleUploadedFile('test.txt', data or self.file_content),
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        self.addCleanup(self._delete_temp_upload, tu.upload_id)
+        return tu
+
+    async def _acreate_temp_upload(self, data=None):
+        # Creating the upload saves its file so it's done in a thread
+        return await sync_to_async(self._create_temp_upload)(data)
+
+    def _delete_temp_upload(self, upload_id):
+        for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+            tu.delete()
+
+    def _read_stored_file(self, file_name):
+        with open(os.path.join(self.store_dir, file_name), 'rb') as f:
+            return f.read()
+
+    async def test_astore_upload(self):
+        tu = await self._acreate_temp_upload()
+        su = await astore_upload(tu.upload_id,
+                                 os.path.join('dir1', 'file1.txt'))
+        self.assertEqual(su.file.name, os.path.join('dir1', 'file1.txt'))
+        self.assertEqual(su.size, len(self.file_content))
+        self.assertEqual(self._read_stored_file(su.file.name),
+                         self.file_content)
+        self.assertTrue(await StoredUpload.objects.filter(
+            upload_id=tu.upload_id).aexists())
+        self.assertFalse(await TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).aexists())
+
+    async def test_astore_upload_concurrent(self):
+        tus = [await self._acreate_temp_upload(b'Upload %d' % i)
+               for i in range(10)]
+        sus = await asyncio.gather(*[
+            astore_upload(tu.upload_id, os.path.join('dir1', 'file%d.txt' % i))
+            for (i, tu) in enumerate(tus)])
+        self.assertEqual(await StoredUpload.objects.filter(
+            upload_id__in=[tu.upload_id for tu in tus]).acount(), 10)
+        self.assertEqual(await TemporaryUpload.objects.filter(
+            upload_id__in=[tu.upload_id for tu in tus]).acount(), 0)
+        for (i, su) in enumerate(sus):
+            self.assertEqual(su.upload_id, tus[i].upload_id)
+            self.assertEqual(self._read_stored_file(su.file.name),
+                             b'Upload %d' % i)
+
+    async def test_astore_upload_not_found(self):
+        with self.assertRaisesMessage(
+                ValueError, 'Record for the specified upload_id doesn\'t '
+                'exist'):
+            await astore_upload(_get_file_id(), 'file1.txt')
+
+    async def test_astore_upload_file_exists(self):
+        with open(os.path.join(self.store_dir, 'file1.txt'), 'wb') as f:
+            f.write(b'Existing data')
+        tu = await self._acreate_temp_upload()
+        with self.assertRaisesMessage(
+                OSError, 'The specified temporary file cannot be stored to '
+                'the specified location - file exists.'):
+            await astore_upload(tu.upload_id, 'file1.txt')
+        self.assertTrue(await TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).aexists())
+        self.assertEqual(self._read_stored_file('file1.txt'),
+                         b'Existing data')
+
+    async def test_astore_upload_args_checked_in_thread(self):
+        tu = await self._acreate_temp_upload()
+        check_threads = []
+
+        def check_args(*args):
+            check_threads.append(threading.current_thread())
+            _check_store_upload_args(*args)
+        with patch('django_drf_filepond.async_api._check_store_upload_args',
+                   check_args):
+            await astore_upload(tu.upload_id,
+                                os.path.join('dir1', 'file1.txt'))
+        self.assertEqual(len(check_threads), 1)
+        self.assertIsNot(check_threads[0], threading.current_thread())
+
+    async def test_astore_upload_remote(self):
+        tu = await self._acreate_temp_upload()
+        storage_backend = MagicMock()
+        with patch('django_drf_filepond.api.get_storage_backend',
+                   return_value=storage_backend), \
+                patch('django_drf_filepond.async_api.get_storage_backend',
+                      return_value=storage_backend):
+            su = await astore_upload(tu.upload_id,
+                                     os.path.join('dir1', 'file1.txt'))
+        self.assertEqual(storage_backend.save.call_count, 1)
+        self.assertEqual(storage_backend.save.call_args[0][0],
+                         os.path.join('dir1', 'file1.txt'))
+        self.assertEqual(su.file.name, os.path.join('dir1', 'file1.txt'))
+        self.assertFalse(await TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).aexists())
+
+    async def test_recording_tracer_concurrent_tasks(self):
+        tracer = RecordingTracer()
+
+        async def run(name):
+            with tracer.start_span(name, {}):
+                await asyncio.sleep(0)
+                with tracer.start_span('%s.child' % name, {}):
+                    await asyncio.sleep(0)
+        await asyncio.gather(run('a'), run('b'))
+        spans = dict((span.name, span) for span in tracer.get_spans())
+        self.assertIs(spans['a.child'].parent, spans['a'])
+        self.assertIs(spans['b.child'].parent, spans['b'])
+        self.assertIsNone(spans['a'].parent)
+        self.assertIsNone(spans['b'].parent)
+
+    async def test_aget_stored_upload(self):
+        tu = await self._acreate_temp_upload()
+        su = await astore_upload(tu.upload_id, 'file1.txt')
+        self.assertEqual((await aget_stored_upload(su.upload_id)).file.name,
+                         'file1.txt')
+        self.assertEqual((await aget_stored_upload('file1.txt')).upload_id,
+                         su.upload_id)
+
+    async def test_aget_stored_upload_not_found(self):
+        with self.assertRaises(StoredUpload.DoesNotExist):
+            await aget_stored_upload(_get_file_id())
+
+    async def test_aget_stored_upload_cached(self):
+        tu = await self._acreate_temp_upload()
+        su = await astore_upload(tu.upload_id, 'file1.txt')
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        reset_stored_upload_cache_stats()
+        with patch.object(local_settings, 'STORED_UPLOAD_CACHE', 'default'):
+            for _ in range(2):
+                self.assertEqual(
+                    (await aget_stored_upload(su.upload_id)).file.name,
+                    'file1.txt')
+        stats = get_stored_upload_cache_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    async def test_aget_stored_upload_file_data(self):
+        tu = await self._acreate_temp_upload()
+        with patch.object(local_settings, 'FILE_STORE_CONTENT_ADDRESSED',
+                          True):
+            su = await astore_upload(tu.upload_id, 'file1.txt')
+            (filename, data) = await aget_stored_upload_file_data(
+                await aget_stored_upload(su.upload_id))
+        self.assertEqual(filename, 'file1.txt')
+        self.assertEqual(data, self.file_content)
+
+    async def test_adelete_stored_upload(self):
+        tu = await self._acreate_temp_upload()
+        su = await astore_upload(tu.upload_id, 'file1.txt')
+        self.assertTrue(await adelete_stored_upload(su.upload_id,
+                                                    delete_file=True))
+        self.assertFalse(await StoredUpload.objects.filter(
+            upload_id=su.upload_id).aexists())
+        self.assertFalse(os.path.exists(os.path.join(self.store_dir,
+                                                     'file1.txt')))
+
+    def test_async_api_query_budgets(self):
+        # The test isn't a coroutine so that the queries, run by the async
+        # ORM interface in the thread calling async_to_sync, are captured.
+        tu = self._create_temp_upload()
+        with self.assertNumQueries(QUERY_BUDGETS['astore_upload']):
+            su = async_to_sync(astore_upload)(tu.upload_id, 'file1.txt')
+        with self.assertNumQueries(QUERY_BUDGETS['aget_stored_upload']):
+            async_to_sync(aget_stored_upload)(su.upload_id)
+        with self.assertNumQueries(QUERY_BUDGETS['adelete_stored_upload']):
+            async_to_sync(adelete_stored_upload)(su.upload_id,
+                                                 delete_file=True)
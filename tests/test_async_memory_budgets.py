@@ -0,0 +1,45 @@
+'''
+Tests that check the peak memory allocated by the asynchronous load and
+restore views, using the budgets and helpers in test_memory_budgets.
+
+The asynchronous views require Django 4.2 or later so this module isn't
+collected with earlier versions, see conftest.py.
+'''
+import logging
+
+from asgiref.sync import async_to_sync
+
+from django_drf_filepond.async_views import AsyncLoadView, AsyncRestoreView
+from tests.test_memory_budgets import MemoryBudgetTestBase
+
+LOG = logging.getLogger(__name__)
+
+
+def _consume_async_response(coroutine):
+    # Await the response of an asynchronous view and read its streaming
+    # content.
+    async def consume():
+        response = await coroutine
+        async for _ in response.streaming_content:
+            pass
+    async_to_sync(consume)()
+
+
+#########################################################################
+# Tests for the peak memory used by the asynchronous views:
+#
+# test_async_load_memory: Check that the asynchronous load view streams
+#    the file data.
+#
+# test_async_restore_memory: Check that the asynchronous restore view
+#    streams the file data.
+#
+class AsyncMemoryBudgetTestCase(MemoryBudgetTestBase):
+
+    def test_async_load_memory(self):
+        self._check_load('async_load', AsyncLoadView.as_view(),
+                         _consume_async_response)
+
+    def test_async_restore_memory(self):
+        self._check_restore('async_restore', AsyncRestoreView.as_view(),
+                            _consume_async_response)
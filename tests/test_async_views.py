@@ -0,0 +1,253 @@
+'''
+Tests for the asynchronous versions of the filepond endpoints provided by
+django_drf_filepond.async_views. The endpoints are routed to these views
+using the django_drf_filepond.async_urls URL configuration.
+'''
+import logging
+import os
+import shutil
+import tempfile
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.async_views import AsyncProcessView, \
+    AsyncRestoreView
+from django_drf_filepond.config import load_config
+from django_drf_filepond.models import StoredUpload, TemporaryUpload, \
+    TemporaryUploadChunked
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the asynchronous views:
+#
+# test_async_urlconf: Check that the async URL configuration routes the
+#    endpoints to the asynchronous views.
+#
+# test_process_upload: Upload a file to the process endpoint and check that
+#    a temporary upload is created.
+#
+# test_process_missing_field: Check that an upload without the filepond
+#    field is rejected with a 400 error.
+#
+# test_chunked_upload: Carry out a chunked upload using the process and
+#    patch endpoints, including a HEAD request for the upload's progress.
+#
+# test_revert: Check that a DELETE request to the revert endpoint removes
+#    a temporary upload.
+#
+# test_revert_not_found: Check that reverting an unknown upload gives 404.
+#
+# test_restore: Check that a temporary upload's data is streamed back with
+#    the metadata headers.
+#
+# test_restore_not_found: Check that restoring an unknown upload gives 404.
+#
+# test_restore_method_not_allowed: Check that a POST request to the restore
+#    endpoint is rejected with a 405 error.
+#
+# test_restore_permission_denied: Check that the view's permission classes
+#    are enforced.
+#
+# test_load: Check that a stored upload's data is streamed back.
+#
+# test_load_not_found: Check that loading an unknown upload gives 404.
+#
+# test_fetch_get: Check that a GET request to the fetch endpoint returns the
+#    data of the remote file.
+#
+# test_fetch_head: Check that a HEAD request to the fetch endpoint stores
+#    the remote file as a temporary upload.
+#
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class AsyncViewsTestCase(TestCase):
+
+    def setUp(self):
+        self.file_content = b'This is some test file data for an upload.'
+
+    def _create_temp_upload(self):
+        tu = TemporaryUpload(
+            upload_id=_get_file_id(), file_id=_get_file_id(),
+            file=SimpleUploadedFile('test.txt', self.file_content),
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        self.addCleanup(self._delete_temp_upload, tu.upload_id)
+        return tu
+
+    async def _acreate_temp_upload(self):
+        # Creating the upload saves its file so it's done in a thread
+        return await sync_to_async(self._create_temp_upload)()
+
+    def _delete_temp_upload(self, upload_id):
+        for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+            tu.delete()
+
+    async def _get_streamed_content(self, response):
+        content = b''
+        async for data in response.streaming_content:
+            content += data
+        return content
+
+    def test_async_urlconf(self):
+        match = resolve(reverse('process'))
+        self.assertIs(match.func.view_class, AsyncProcessView)
+        self.assertTrue(iscoroutinefunction(match.func))
+
+    async def test_process_upload(self):
+        response = await self.async_client.post(reverse('process'), {
+            'filepond': SimpleUploadedFile('test.txt', self.file_content)})
+        self.assertEqual(response.status_code, 200)
+        upload_id = response.content.decode()
+        self.addCleanup(self._delete_temp_upload, upload_id)
+        tu = await TemporaryUpload.objects.aget(upload_id=upload_id)
+        self.assertEqual(tu.upload_name, 'test.txt')
+        self.assertEqual(tu.size, len(self.file_content))
+
+    async def test_process_missing_field(self):
+        response = await self.async_client.post(reverse('process'), {
+            'somefield': SimpleUploadedFile('test.txt', self.file_content)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'detail': 'Could not find upload_field_name in request data.'})
+
+    async def test_chunked_upload(self):
+        response = await self.async_client.post(
+            reverse('process'), {'filepond': '{}'},
+            headers={'Upload-Length': str(len(self.file_content))})
+        self.assertEqual(response.status_code, 200)
+        upload_id = response.content.decode()
+        self.addCleanup(self._delete_temp_upload, upload_id)
+        self.assertTrue(await TemporaryUploadChunked.objects.filter(
+            upload_id=upload_id).aexists())
+
+        patch_url = reverse('patch', args=[upload_id])
+        half = len(self.file_content) // 2
+        for (offset, chunk) in ((0, self.file_content[:half]),
+                                (half, self.file_content[half:])):
+            response = await self.async_client.patch(
+                patch_url, data=chunk,
+                content_type='application/offset+octet-stream',
+                headers={'Upload-Offset': str(offset),
+                         'Upload-Length': str(len(self.file_content)),
+                         'Upload-Name': 'test.txt'})
+            self.assertEqual(response.status_code, 200)
+            if offset == 0:
+                response = await self.async_client.head(patch_url)
+                self.assertEqual(response['Upload-Offset'], str(half))
+
+        tu = await TemporaryUpload.objects.aget(upload_id=upload_id)
+        self.assertEqual(tu.upload_name, 'test.txt')
+        self.assertEqual(tu.size, len(self.file_content))
+
+    async def test_revert(self):
+        tu = await self._acreate_temp_upload()
+        file_path = tu.file.path
+        response = await self.async_client.delete(
+            reverse('revert'), data=tu.upload_id, content_type='text/plain')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).aexists())
+        self.assertFalse(os.path.exists(file_path))
+
+    async def test_revert_not_found(self):
+        response = await self.async_client.delete(
+            reverse('revert'), data=_get_file_id(), content_type='text/plain')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_restore(self):
+        tu = await self._acreate_temp_upload()
+        response = await self.async_client.get(
+            reverse('restore') + '?id=%s' % tu.upload_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(await self._get_streamed_content(response),
+                         self.file_content)
+        self.assertEqual(response['Content-Length'],
+                         str(len(self.file_content)))
+        self.assertEqual(response['ETag'], '"%s"' % tu.digest)
+        self.assertEqual(response['Content-Disposition'],
+                         'inline; filename=test.txt')
+
+    async def test_restore_not_found(self):
+        response = await self.async_client.get(
+            reverse('restore') + '?id=%s' % _get_file_id())
+        self.assertContains(response, 'Not found', status_code=404)
+
+    async def test_restore_method_not_allowed(self):
+        response = await self.async_client.post(
+            reverse('restore') + '?id=%s' % _get_file_id())
+        self.assertEqual(response.status_code, 405)
+
+    async def test_restore_permission_denied(self):
+        with patch.object(AsyncRestoreView, 'permission_classes',
+                          [IsAuthenticated]):
+            response = await self.async_client.get(
+                reverse('restore') + '?id=%s' % _get_file_id())
+        self.assertIn(response.status_code, (401, 403))
+
+    async def test_load(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, True)
+        with open(os.path.join(store_dir, 'test.txt'), 'wb') as f:
+            f.write(self.file_content)
+        su = await StoredUpload.objects.acreate(
+            upload_id=_get_file_id(), file='test.txt',
+            uploaded=timezone.now())
+
+        self.addCleanup(load_config)
+        with patch.object(local_settings, 'FILE_STORE_PATH', store_dir), \
+                patch.object(local_settings, 'STORAGES_BACKEND', None):
+            load_config()
+            response = await self.async_client.get(
+                reverse('load') + '?id=%s' % su.upload_id)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(await self._get_streamed_content(response),
+                             self.file_content)
+        self.assertEqual(response['Content-Length'],
+                         str(len(self.file_content)))
+        self.assertEqual(response['Content-Disposition'],
+                         'inline; filename=test.txt')
+
+    async def test_load_not_found(self):
+        response = await self.async_client.get(
+            reverse('load') + '?id=%s' % _get_file_id())
+        self.assertContains(response, 'Not found', status_code=404)
+
+    @patch('django_drf_filepond.views.coalesce_fetch')
+    async def test_fetch_get(self, coalesce_patch):
+        coalesce_patch.return_value = (self.file_content, 'test.txt',
+                                       'text/plain')
+        response = await self.async_client.get(
+            reverse('fetch') + '?target=https://example.com/test.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.file_content)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+
+    @patch('django_drf_filepond.views.coalesce_fetch')
+    async def test_fetch_head(self, coalesce_patch):
+        coalesce_patch.return_value = (self.file_content, 'test.txt',
+                                       'text/plain')
+        response = await self.async_client.head(
+            reverse('fetch') + '?target=https://example.com/test.txt')
+        self.assertEqual(response.status_code, 200)
+        upload_id = response['X-Content-Transfer-Id']
+        self.addCleanup(self._delete_temp_upload, upload_id)
+        self.assertEqual(response['Content-Length'],
+                         str(len(self.file_content)))
+        tu = await TemporaryUpload.objects.aget(upload_id=upload_id)
+        self.assertEqual(tu.upload_type, TemporaryUpload.URL)
+        self.assertEqual(tu.upload_name, 'test.txt')
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import shutil
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from six import StringIO
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.config import load_config
+from django_drf_filepond.models import StoredUpload, TemporaryUpload, \
+    get_content_path
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the backfill_file_metadata management command:
+#
+# test_backfill_temp_uploads: Check that the metadata is set for temporary
+#    uploads without it, in batches, and that a record whose file is
+#    missing is reported and left unchanged.
+#
+# test_backfill_stored_uploads: Check that the metadata is set for stored
+#    uploads in the local file store, including uploads held in the
+#    content-addressed store.
+#
+# test_backfill_read_error: Check that an error other than an IOError
+#    raised while reading a file, e.g. by a remote storage backend, is
+#    reported and doesn't stop the backfill.
+#
+# test_backfill_skips_remote: Check that stored uploads held by a remote
+#    storage backend are only read when --include-remote is given.
+#
+# test_backfill_invalid_options: Check that invalid option values result in
+#    a CommandError.
+#
+class BackfillFileMetadataTestCase(TestCase):
+
+    def setUp(self):
+        self.file_content = b'Some test data'
+        self.digest = hashlib.sha256(self.file_content).hexdigest()
+        # Cleanups run in reverse order so the configuration snapshot is
+        # rebuilt once the setting has been restored.
+        self.addCleanup(load_config)
+        patcher = patch.object(local_settings, 'STORAGES_BACKEND', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        load_config()
+
+    def _call_command(self, *args):
+        out = StringIO()
+        err = StringIO()
+        call_command('backfill_file_metadata', *args, stdout=out,
+                     stderr=err)
+        return (out.getvalue(), err.getvalue())
+
+    def _create_temp_upload(self):
+        tu = TemporaryUpload(
+            upload_id=_get_file_id(), file_id=_get_file_id(),
+            file=SimpleUploadedFile('test.txt', self.file_content),
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        self.addCleanup(self._delete_temp_upload, tu.upload_id)
+        TemporaryUpload.objects.filter(upload_id=tu.upload_id).update(
+            size=None, content_type='', sniffed_type='', digest='')
+        return tu
+
+    def _delete_temp_upload(self, upload_id):
+        for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+            tu.delete()
+
+    def _create_stored_upload(self, stored_name, file_name,
+                              content_hash=''):
+        # The file is created in the configured file store since the stored
+        # storage location is fixed on import.
+        file_path = os.path.join(local_settings.FILE_STORE_PATH, stored_name)
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, 'wb') as f:
+            f.write(self.file_content)
+        self.addCleanup(os.remove, file_path)
+        su = StoredUpload(upload_id=_get_file_id(), file=file_name,
+                          content_hash=content_hash, uploaded=timezone.now())
+        su.save()
+        return su
+
+    def _assert_metadata(self, record, content_type='text/plain'):
+        record = type(record).objects.get(pk=record.pk)
+        self.assertEqual(record.size, len(self.file_content))
+        self.assertEqual(record.content_type, content_type)
+        self.assertEqual(record.sniffed_type, 'text/plain')
+        self.assertEqual(record.digest, self.digest)
+
+    def test_backfill_temp_uploads(self):
+        uploads = [self._create_temp_upload() for _ in range(3)]
+        os.remove(uploads[0].get_file_path())
+
+        (out, err) = self._call_command('--batch-size', '1')
+
+        self.assertIn('Set metadata for 2 temporary uploads (1 unreadable)',
+                      out)
+        self.assertIn(uploads[0].upload_id, err)
+        self.assertIsNone(TemporaryUpload.objects.get(
+            upload_id=uploads[0].upload_id).size)
+        for tu in uploads[1:]:
+            self._assert_metadata(tu)
+
+    def test_backfill_stored_uploads(self):
+        store_dir = _get_file_id()
+        self.addCleanup(shutil.rmtree, os.path.join(
+            local_settings.FILE_STORE_PATH, store_dir), True)
+        su = self._create_stored_upload(
+            os.path.join(store_dir, 'test.txt'),
+            os.path.join(store_dir, 'test.txt'))
+        su_hashed = self._create_stored_upload(
+            get_content_path(self.digest),
+            os.path.join(store_dir, 'test.pdf'), content_hash=self.digest)
+
+        (out, err) = self._call_command()
+
+        self.assertIn('Set metadata for 2 stored uploads (0 unreadable)',
+                      out)
+        self._assert_metadata(su)
+        self._assert_metadata(su_hashed, content_type='application/pdf')
+
+    def test_backfill_read_error(self):
+        uploads = [self._create_temp_upload() for _ in range(2)]
+        real_open = TemporaryUpload._meta.get_field('file').storage.open
+
+        def _open(name, mode='rb'):
+            if uploads[0].upload_id in name:
+                raise RuntimeError('Simulated storage error')
+            return real_open(name, mode)
+
+        with patch('django_drf_filepond.management.commands.'
+                   'backfill_file_metadata.storage.open', side_effect=_open):
+            (out, err) = self._call_command()
+
+        self.assertIn('Simulated storage error', err)
+        self.assertIsNone(TemporaryUpload.objects.get(
+            upload_id=uploads[0].upload_id).size)
+        self._assert_metadata(uploads[1])
+
+    def test_backfill_skips_remote(self):
+        su = StoredUpload(upload_id=_get_file_id(), file='test.txt',
+                          uploaded=timezone.now())
+        su.save()
+        with patch.object(local_settings, 'STORAGES_BACKEND',
+                          'storages.backends.s3boto3.S3Boto3Storage'), \
+                patch.object(StoredUpload._meta.get_field('file'),
+                             'storage') as mock_storage:
+            (out, err) = self._call_command()
+            self.assertIn('Skipping stored uploads', out)
+            mock_storage.open.assert_not_called()
+
+            mock_storage.open.side_effect = RuntimeError(
+                'Simulated ClientError')
+            (out, err) = self._call_command('--include-remote')
+            mock_storage.open.assert_called_once_with('test.txt', 'rb')
+        self.assertIn('Set metadata for 0 stored uploads (1 unreadable)', out)
+        self.assertIn('Simulated ClientError', err)
+
+    def test_backfill_invalid_options(self):
+        with self.assertRaises(CommandError):
+            self._call_command('--batch-size', '0')
+        with self.assertRaises(CommandError):
+            self._call_command('--workers', '0')
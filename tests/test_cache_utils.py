@@ -0,0 +1,158 @@
+'''
+Tests for the optional read-through cache for StoredUpload lookups that is
+enabled using the DJANGO_DRF_FILEPOND_STORED_UPLOAD_CACHE setting.
+'''
+import logging
+import os
+import shutil
+
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import delete_stored_upload, get_stored_upload
+from django_drf_filepond.cache_utils import get_stored_upload_cache_stats, \
+    reset_stored_upload_cache_stats
+from django_drf_filepond.config import load_config
+from django_drf_filepond.models import StoredUpload
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the StoredUpload cache:
+#
+# test_cache_disabled: Check that every lookup queries the database when
+#    the cache is not enabled.
+#
+# test_cache_hit_by_id: Check that a second lookup by upload ID is served
+#    from the cache without a query and returns the same record.
+#
+# test_cache_hit_by_path: Check that a lookup by file path caches the
+#    record under both its file path and upload ID.
+#
+# test_cache_negative: Check that a lookup that doesn't match a record is
+#    cached and that the cached result is removed when a matching record
+#    is created.
+#
+# test_cache_invalidated_on_delete: Check that a record deleted using
+#    delete_stored_upload is no longer returned from the cache.
+#
+# test_cache_stats: Check that hits, negative hits, misses and the hit rate
+#    are recorded.
+#
+# test_load_view_cached: Check that repeated requests to the load endpoint
+#    for the same upload don't query the database.
+#
+class StoredUploadCacheTestCase(TestCase):
+
+    def setUp(self):
+        # Cleanups run in reverse order so the configuration snapshot is
+        # rebuilt once the settings have been restored.
+        self.addCleanup(load_config)
+        patchers = [
+            patch.object(local_settings, 'STORED_UPLOAD_CACHE', 'default'),
+            patch.object(local_settings, 'STORAGES_BACKEND', None)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        load_config()
+        caches['default'].clear()
+        reset_stored_upload_cache_stats()
+
+        # The file is stored in a uniquely named directory in the configured
+        # file store since the stored storage location is fixed on import.
+        self.upload_id = _get_file_id()
+        self.store_dir = os.path.join(local_settings.FILE_STORE_PATH,
+                                      self.upload_id)
+        self.file_name = os.path.join(self.upload_id, 'test.txt')
+        os.makedirs(self.store_dir)
+        with open(os.path.join(local_settings.FILE_STORE_PATH,
+                               self.file_name), 'wb') as f:
+            f.write(b'Some test data')
+        StoredUpload.objects.create(upload_id=self.upload_id,
+                                    file=self.file_name,
+                                    uploaded=timezone.now())
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir, True)
+        caches['default'].clear()
+
+    def test_cache_disabled(self):
+        with patch.object(local_settings, 'STORED_UPLOAD_CACHE', None):
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    get_stored_upload(self.upload_id)
+
+    def test_cache_hit_by_id(self):
+        with self.assertNumQueries(1):
+            su1 = get_stored_upload(self.upload_id)
+        with self.assertNumQueries(0):
+            su2 = get_stored_upload(self.upload_id)
+        self.assertEqual(su2.upload_id, su1.upload_id)
+        self.assertEqual(su2.file.name, self.file_name)
+        self.assertEqual(su2.uploaded, su1.uploaded)
+        self.assertEqual(su2.stored, su1.stored)
+
+    def test_cache_hit_by_path(self):
+        with self.assertNumQueries(1):
+            get_stored_upload(self.file_name)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_stored_upload(self.file_name).upload_id,
+                             self.upload_id)
+            self.assertEqual(get_stored_upload(self.upload_id).file.name,
+                             self.file_name)
+
+    def test_cache_negative(self):
+        upload_id = _get_file_id()
+        with self.assertNumQueries(1):
+            with self.assertRaises(StoredUpload.DoesNotExist):
+                get_stored_upload(upload_id)
+        with self.assertNumQueries(0):
+            with self.assertRaises(StoredUpload.DoesNotExist):
+                get_stored_upload(upload_id)
+
+        StoredUpload.objects.create(upload_id=upload_id, file='test2.txt',
+                                    uploaded=timezone.now())
+        self.assertEqual(get_stored_upload(upload_id).file.name, 'test2.txt')
+
+    def test_cache_invalidated_on_delete(self):
+        get_stored_upload(self.upload_id)
+        get_stored_upload(self.file_name)
+        delete_stored_upload(self.upload_id, delete_file=True)
+        with self.assertRaises(StoredUpload.DoesNotExist):
+            get_stored_upload(self.upload_id)
+        with self.assertRaises(StoredUpload.DoesNotExist):
+            get_stored_upload(self.file_name)
+
+    def test_cache_stats(self):
+        get_stored_upload(self.upload_id)
+        get_stored_upload(self.upload_id)
+        get_stored_upload(self.upload_id)
+        missing_id = _get_file_id()
+        for _ in range(2):
+            with self.assertRaises(StoredUpload.DoesNotExist):
+                get_stored_upload(missing_id)
+        stats = get_stored_upload_cache_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['negative_hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertAlmostEqual(stats['hit_rate'], 0.6)
+
+    def test_load_view_cached(self):
+        url = reverse('load') + '?id=%s' % self.upload_id
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'Some test data')
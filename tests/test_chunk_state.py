@@ -0,0 +1,258 @@
+'''
+Tests for the pluggable backends holding the progress of chunked uploads
+that are selected using the DJANGO_DRF_FILEPOND_CHUNK_STATE_BACKEND setting.
+'''
+import logging
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.request import Request
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.chunk_state import CHUNK_STATE_FILE_NAME, \
+    CacheChunkStateBackend, DatabaseChunkStateBackend, \
+    FileChunkStateBackend, get_chunk_state_backend, init_chunk_state, \
+    load_chunk_state
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, storage
+from django_drf_filepond.uploaders import FilepondChunkedFileUploader
+from django_drf_filepond.utils import _get_file_id
+
+from tests.utils import prep_response
+
+# Python 2/3 support
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+LOG = logging.getLogger(__name__)
+
+CACHE_BACKEND = 'django_drf_filepond.chunk_state.CacheChunkStateBackend'
+FILE_BACKEND = 'django_drf_filepond.chunk_state.FileChunkStateBackend'
+
+
+#########################################################################
+# Tests for the chunk state backends:
+#
+# test_default_backend: Check that the database backend is used by default.
+#
+# test_backend_setting: Check that the backend class set by the
+#    CHUNK_STATE_BACKEND setting is used.
+#
+# test_database_backend_checkpoints_every_chunk: Check that the
+#    TemporaryUploadChunked record is updated for every chunk when using the
+#    database backend.
+#
+# test_cache_backend_checkpoints: Check that when using the cache backend,
+#    the record is only updated for the first chunk and every
+#    CHUNK_STATE_CHECKPOINT_CHUNKS chunks, and that other chunks are
+#    handled without any queries.
+#
+# test_cache_backend_checkpoint_seconds: Check that the record is updated
+#    when CHUNK_STATE_CHECKPOINT_SECONDS have passed since the last
+#    checkpoint.
+#
+# test_cache_backend_upload_complete: Check that a completed upload is
+#    stored as a TemporaryUpload and the progress removed from the cache.
+#
+# test_cache_backend_state_lost: Check that if the cached progress is lost,
+#    the upload resumes from the last checkpoint and resent chunks replace
+#    the existing chunk files.
+#
+# test_cache_backend_resume_different_chunks: Check that if the cached
+#    progress is lost and the client resends the data from the checkpoint
+#    using different chunk sizes, the chunk files received after the
+#    checkpoint are removed and the file is reassembled correctly.
+#
+# test_cache_backend_restart: Check that a HEAD request to restart an upload
+#    returns the offset held in the cache.
+#
+# test_cache_backend_record_removed: Check that a chunk for an upload whose
+#    record has been removed is rejected when it is checkpointed.
+#
+# test_file_backend_upload_complete: Check that the progress is held in a
+#    file in the chunk directory that is removed when the upload completes.
+#
+class ChunkStateTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+        patchers = [
+            patch.object(storage, 'location', self.tmp_dir),
+            patch.object(storage, 'base_location', self.tmp_dir),
+            patch.object(local_settings, 'CHUNK_STATE_CHECKPOINT_CHUNKS', 3)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        caches[local_settings.CHUNK_STATE_CACHE].clear()
+        self.addCleanup(caches[local_settings.CHUNK_STATE_CACHE].clear)
+        self.uploader = FilepondChunkedFileUploader()
+        self.upload_id = _get_file_id()
+        self.file_id = _get_file_id()
+        self.chunk_data = b'0123456789'
+        self.num_chunks = 8
+
+    def _create_upload(self):
+        os.makedirs(os.path.join(self.tmp_dir, self.upload_id))
+        tuc = TemporaryUploadChunked.objects.create(
+            upload_id=self.upload_id, file_id=self.file_id,
+            upload_dir=self.upload_id,
+            total_size=len(self.chunk_data) * self.num_chunks)
+        init_chunk_state(tuc)
+        return tuc
+
+    def _send_chunk(self, chunk_num):
+        return self._send_data(len(self.chunk_data) * (chunk_num - 1),
+                               self.chunk_data)
+
+    def _send_data(self, offset, data):
+        request = MagicMock(spec=Request)
+        request.user = AnonymousUser()
+        request.data = data
+        request.META = {
+            'HTTP_UPLOAD_OFFSET': str(offset),
+            'HTTP_UPLOAD_LENGTH': str(len(self.chunk_data) * self.num_chunks),
+            'HTTP_UPLOAD_NAME': 'test.txt'}
+        return prep_response(
+            self.uploader._handle_chunk_upload(request, self.upload_id))
+
+    def _get_record(self):
+        return TemporaryUploadChunked.objects.get(upload_id=self.upload_id)
+
+    def test_default_backend(self):
+        self.assertIsInstance(get_chunk_state_backend(),
+                              DatabaseChunkStateBackend)
+
+    def test_backend_setting(self):
+        with patch.object(local_settings, 'CHUNK_STATE_BACKEND',
+                          CACHE_BACKEND):
+            self.assertIsInstance(get_chunk_state_backend(),
+                                  CacheChunkStateBackend)
+        with patch.object(local_settings, 'CHUNK_STATE_BACKEND',
+                          FILE_BACKEND):
+            self.assertIsInstance(get_chunk_state_backend(),
+                                  FileChunkStateBackend)
+
+    def test_database_backend_checkpoints_every_chunk(self):
+        self._create_upload()
+        for chunk_num in range(1, 4):
+            self.assertContains(self._send_chunk(chunk_num), self.upload_id)
+            self.assertEqual(self._get_record().last_chunk, chunk_num)
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND', CACHE_BACKEND)
+    def test_cache_backend_checkpoints(self):
+        self._create_upload()
+        self.assertContains(self._send_chunk(1), self.upload_id)
+        tuc = self._get_record()
+        self.assertEqual(tuc.last_chunk, 1)
+        self.assertEqual(tuc.upload_name, 'test.txt')
+        for chunk_num in (2, 3):
+            with self.assertNumQueries(0):
+                self.assertContains(self._send_chunk(chunk_num),
+                                    self.upload_id)
+        self.assertEqual(self._get_record().last_chunk, 1)
+        self.assertEqual(load_chunk_state(self.upload_id).offset, 30)
+        self.assertContains(self._send_chunk(4), self.upload_id)
+        self.assertEqual(self._get_record().offset, 40)
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND', CACHE_BACKEND)
+    def test_cache_backend_checkpoint_seconds(self):
+        self._create_upload()
+        self._send_chunk(1)
+        with patch.object(local_settings, 'CHUNK_STATE_CHECKPOINT_SECONDS',
+                          0):
+            self._send_chunk(2)
+        self.assertEqual(self._get_record().last_chunk, 2)
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND', CACHE_BACKEND)
+    def test_cache_backend_upload_complete(self):
+        self._create_upload()
+        for chunk_num in range(1, self.num_chunks + 1):
+            self.assertContains(self._send_chunk(chunk_num), self.upload_id)
+        self.assertFalse(TemporaryUploadChunked.objects.filter(
+            upload_id=self.upload_id).exists())
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        self.assertEqual(tu.upload_name, 'test.txt')
+        self.assertEqual(tu.size, len(self.chunk_data) * self.num_chunks)
+        self.assertIsNone(get_chunk_state_backend().get(self.upload_id))
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND', CACHE_BACKEND)
+    def test_cache_backend_state_lost(self):
+        self._create_upload()
+        for chunk_num in range(1, 4):
+            self._send_chunk(chunk_num)
+        caches[local_settings.CHUNK_STATE_CACHE].clear()
+        # The upload resumes from the checkpoint made for the first chunk
+        self.assertContains(self._send_chunk(4),
+                            'ERROR: Chunked upload metadata is invalid.',
+                            status_code=400)
+        for chunk_num in range(2, self.num_chunks + 1):
+            self.assertContains(self._send_chunk(chunk_num), self.upload_id)
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        self.assertEqual(tu.size, len(self.chunk_data) * self.num_chunks)
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND', CACHE_BACKEND)
+    def test_cache_backend_resume_different_chunks(self):
+        self._create_upload()
+        for chunk_num in range(1, 4):
+            self._send_chunk(chunk_num)
+        caches[local_settings.CHUNK_STATE_CACHE].clear()
+        # Resend the remaining 70 bytes from the checkpoint made for the
+        # first chunk as two chunks rather than seven.
+        data = self.chunk_data * self.num_chunks
+        for offset in (10, 45):
+            self.assertContains(
+                self._send_data(offset, data[offset:offset + 35]),
+                self.upload_id)
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        with open(tu.get_file_path(), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir,
+                                                 self.upload_id)),
+                         [self.file_id])
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND', CACHE_BACKEND)
+    def test_cache_backend_restart(self):
+        self._create_upload()
+        for chunk_num in range(1, 3):
+            self._send_chunk(chunk_num)
+        request = MagicMock(spec=Request)
+        res = prep_response(self.uploader._handle_chunk_restart(
+            request, self.upload_id))
+        self.assertContains(res, self.upload_id)
+        self.assertEqual(res['Upload-Offset'], '20')
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND', CACHE_BACKEND)
+    def test_cache_backend_record_removed(self):
+        self._create_upload()
+        self._send_chunk(1)
+        TemporaryUploadChunked.objects.filter(
+            upload_id=self.upload_id).delete()
+        self._send_chunk(2)
+        self._send_chunk(3)
+        self.assertContains(self._send_chunk(4),
+                            'Invalid chunk upload request data',
+                            status_code=400)
+        self.assertIsNone(get_chunk_state_backend().get(self.upload_id))
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND', FILE_BACKEND)
+    def test_file_backend_upload_complete(self):
+        self._create_upload()
+        state_file = os.path.join(self.tmp_dir, self.upload_id,
+                                  CHUNK_STATE_FILE_NAME)
+        self._send_chunk(1)
+        self._send_chunk(2)
+        self.assertTrue(os.path.exists(state_file))
+        self.assertEqual(load_chunk_state(self.upload_id).offset, 20)
+        self.assertEqual(self._get_record().offset, 10)
+        for chunk_num in range(3, self.num_chunks + 1):
+            self.assertContains(self._send_chunk(chunk_num), self.upload_id)
+        self.assertFalse(os.path.exists(state_file))
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        self.assertEqual(tu.size, len(self.chunk_data) * self.num_chunks)
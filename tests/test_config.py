@@ -6,6 +6,8 @@ Django project configuration, that it gets set to a sensible default.
 '''
 import logging
 import os
+import shutil
+import tempfile
 
 from django.test import TestCase
 from django.conf import settings
@@ -13,9 +15,26 @@ from six.moves import reload_module
 
 from django_drf_filepond.utils import _get_file_id
 import django_drf_filepond
+from django.core.files.storage import FileSystemStorage
 from django.test.utils import override_settings
 
+import django_drf_filepond.config as config
 import django_drf_filepond.drf_filepond_settings as local_settings
+import django_drf_filepond.api as api
+from django_drf_filepond.api import get_stored_upload_file_data
+from django_drf_filepond.models import StoredUpload
+
+# Python 2/3 support
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+# There's no built in FileNotFoundError in Python 2
+try:
+    FileNotFoundError
+except NameError:
+    FileNotFoundError = IOError
 
 LOG = logging.getLogger(__name__)
 
@@ -62,3 +81,114 @@ class AppSettingsTestCase(TestCase):
         LOG.debug('File id list generated...')
         self.assertEqual(len(file_id_set), GENERATED_IDS, 'There were '
                          'clashes in the generated file IDs!')
+
+
+#########################################################################
+# Tests for the configuration snapshot built when the app is loaded:
+#
+# test_config_immutable: Check that the attributes of the configuration
+#    snapshot can't be changed or removed.
+#
+# test_get_config_returns_snapshot: Check that get_config returns the same
+#    snapshot until load_config is called to build a new one.
+#
+# test_valid_config: Check that the snapshot built from the test settings
+#    has no errors and holds the resolved paths.
+#
+# test_upload_tmp_not_set: Check that an error is recorded for the
+#    process endpoint if UPLOAD_TMP isn't set.
+#
+# test_upload_tmp_outside_storage_location: Check that an error is recorded
+#    if UPLOAD_TMP is outside the temporary upload storage location.
+#
+# test_file_store_path_missing: Check that an error is recorded if the
+#    FILE_STORE_PATH directory doesn't exist.
+#
+# test_file_store_path_created_later: Check that a missing FILE_STORE_PATH
+#    directory is checked for again, and a new snapshot without the error is
+#    built, once the directory has been created.
+#
+# test_file_store_path_remote_backend: Check that FILE_STORE_PATH isn't
+#    checked when a django-storages backend is configured.
+#
+# test_no_filesystem_checks_on_access: Check that getting a stored upload's
+#    data doesn't check the FILE_STORE_PATH directory on every call.
+#
+class FilepondConfigTestCase(TestCase):
+
+    def setUp(self):
+        # Rebuild the snapshot from the restored settings after each test
+        self.addCleanup(config.load_config)
+
+    def test_config_immutable(self):
+        cfg = config.get_config()
+        with self.assertRaises(AttributeError):
+            cfg.upload_tmp = '/tmp'
+        with self.assertRaises(AttributeError):
+            del cfg.file_store_path
+
+    def test_get_config_returns_snapshot(self):
+        cfg = config.get_config()
+        self.assertIs(config.get_config(), cfg)
+        new_cfg = config.load_config()
+        self.assertIsNot(new_cfg, cfg)
+        self.assertIs(config.get_config(), new_cfg)
+
+    def test_valid_config(self):
+        cfg = config.load_config()
+        self.assertIsNone(cfg.upload_tmp_error)
+        self.assertIsNone(cfg.file_store_error)
+        self.assertIsNone(cfg.storage_backend)
+        self.assertEqual(cfg.upload_tmp, local_settings.UPLOAD_TMP)
+        self.assertEqual(cfg.file_store_path, local_settings.FILE_STORE_PATH)
+        self.assertIsInstance(cfg.base_dir, str)
+
+    def test_upload_tmp_not_set(self):
+        with patch.object(local_settings, 'UPLOAD_TMP', None):
+            cfg = config.load_config()
+        self.assertEqual(cfg.upload_tmp_error, config.UPLOAD_SETTINGS_ERROR)
+
+    def test_upload_tmp_outside_storage_location(self):
+        with patch.object(local_settings, 'UPLOAD_TMP', os.path.join(
+                local_settings.BASE_DIR, '..', '..', 'some_dir')):
+            cfg = config.load_config()
+        self.assertEqual(cfg.upload_tmp_error, config.UPLOAD_LOCATION_ERROR)
+
+    def test_file_store_path_missing(self):
+        test_dir = '/tmp/%s' % _get_file_id()
+        with patch.object(local_settings, 'FILE_STORE_PATH', test_dir):
+            cfg = config.load_config()
+        self.assertEqual(cfg.file_store_error,
+                         'The local output directory [%s] defined by '
+                         'FILE_STORE_PATH is missing.' % test_dir)
+
+    def test_file_store_path_created_later(self):
+        test_dir = os.path.join(tempfile.mkdtemp(), 'filestore')
+        self.addCleanup(shutil.rmtree, os.path.dirname(test_dir), True)
+        with patch.object(local_settings, 'FILE_STORE_PATH', test_dir):
+            cfg = config.load_config()
+            self.assertIsNotNone(cfg.file_store_error)
+            self.assertIs(config.check_file_store(), cfg)
+            os.mkdir(test_dir)
+            new_cfg = config.check_file_store()
+        self.assertIsNot(new_cfg, cfg)
+        self.assertIsNone(new_cfg.file_store_error)
+        self.assertEqual(new_cfg.file_store_path, test_dir)
+        self.assertIs(config.get_config(), new_cfg)
+
+    @patch('django_drf_filepond.config.get_storage_backend')
+    def test_file_store_path_remote_backend(self, get_backend_patch):
+        get_backend_patch.return_value = MagicMock(spec=FileSystemStorage)
+        with patch.object(local_settings, 'FILE_STORE_PATH', None):
+            cfg = config.load_config()
+        self.assertIs(cfg.storage_backend, get_backend_patch.return_value)
+        self.assertIsNone(cfg.file_store_error)
+
+    def test_no_filesystem_checks_on_access(self):
+        api._init_storage_backend()
+        su = StoredUpload(upload_id=_get_file_id(),
+                          file='test_storage/test.txt')
+        with patch('os.path.isdir') as isdir_patch:
+            with self.assertRaises(FileNotFoundError):
+                get_stored_upload_file_data(su)
+        isdir_patch.assert_not_called()
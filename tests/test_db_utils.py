@@ -0,0 +1,145 @@
+'''
+Tests for the optional routing of read-only lookups to a read replica that
+is enabled using the DJANGO_DRF_FILEPOND_READ_REPLICA_DB setting. The
+replica alias used in the tests is a separate database so records are
+created on it explicitly to simulate replication.
+'''
+import logging
+
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import delete_stored_upload, get_stored_upload
+from django_drf_filepond.db_utils import get_read_db, pin_to_primary
+from django_drf_filepond.models import StoredUpload, TemporaryUploadFetch
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for read replica routing:
+#
+# test_read_db_not_configured: Check that no database is selected when a
+#    read replica is not configured.
+#
+# test_read_db_replica: Check that the replica is selected for a record
+#    that hasn't been written recently.
+#
+# test_read_db_pinned_after_save: Check that lookups by the upload ID and
+#    file path of a StoredUpload that has just been saved aren't sent to
+#    the replica.
+#
+# test_read_db_pinned_after_delete: Check that lookups of a StoredUpload
+#    that has just been deleted aren't sent to the replica.
+#
+# test_pin_not_recorded_when_disabled: Check that writes aren't recorded
+#    when a read replica is not configured.
+#
+# test_get_stored_upload_replica: Check that get_stored_upload looks up a
+#    record that hasn't been written recently on the replica.
+#
+# test_get_stored_upload_pinned: Check that get_stored_upload finds a
+#    record that has just been saved and hasn't reached the replica.
+#
+# test_delete_stored_upload_primary: Check that delete_stored_upload looks
+#    up and deletes the record on the default database.
+#
+# test_fetch_status_replica: Check that the fetch status endpoint looks up
+#    the fetch job on the replica.
+#
+class ReadReplicaRoutingTestCase(TestCase):
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        patcher = patch.object(local_settings, 'READ_REPLICA_DB', 'replica')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = caches[local_settings.READ_REPLICA_PIN_CACHE]
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+        self.upload_id = _get_file_id()
+        self.file_id = _get_file_id()
+
+    def _create_stored_upload(self, using='default'):
+        su = StoredUpload.objects.using(using).create(
+            upload_id=self.upload_id,
+            file='test_storage/%s.txt' % self.file_id,
+            uploaded=timezone.now())
+        # Simulate the write having been made long enough ago for it to
+        # have been replicated
+        self.cache.clear()
+        return su
+
+    def test_read_db_not_configured(self):
+        with patch.object(local_settings, 'READ_REPLICA_DB', None):
+            self.assertIsNone(get_read_db(self.upload_id))
+
+    def test_read_db_replica(self):
+        self.assertEqual(get_read_db(self.upload_id), 'replica')
+
+    def test_read_db_pinned_after_save(self):
+        su = StoredUpload.objects.create(
+            upload_id=self.upload_id,
+            file='test_storage/%s.txt' % self.file_id,
+            uploaded=timezone.now())
+        self.assertIsNone(get_read_db(self.upload_id))
+        self.assertIsNone(get_read_db(su.file.name))
+        self.assertEqual(get_read_db(_get_file_id()), 'replica')
+
+    def test_read_db_pinned_after_delete(self):
+        su = self._create_stored_upload()
+        self.assertEqual(get_read_db(self.upload_id), 'replica')
+        su.delete()
+        self.assertIsNone(get_read_db(self.upload_id))
+
+    def test_pin_not_recorded_when_disabled(self):
+        with patch.object(local_settings, 'READ_REPLICA_DB', None):
+            pin_to_primary(self.upload_id)
+        self.assertEqual(get_read_db(self.upload_id), 'replica')
+
+    def test_get_stored_upload_replica(self):
+        self._create_stored_upload(using='replica')
+        su = get_stored_upload(self.upload_id)
+        self.assertEqual(su.upload_id, self.upload_id)
+        self.assertEqual(su._state.db, 'replica')
+        self.assertFalse(StoredUpload.objects.filter(
+            upload_id=self.upload_id).exists())
+
+    def test_get_stored_upload_pinned(self):
+        StoredUpload.objects.create(
+            upload_id=self.upload_id,
+            file='test_storage/%s.txt' % self.file_id,
+            uploaded=timezone.now())
+        su = get_stored_upload(self.upload_id)
+        self.assertEqual(su.upload_id, self.upload_id)
+        self.assertEqual(su._state.db, 'default')
+
+    def test_delete_stored_upload_primary(self):
+        self._create_stored_upload()
+        self._create_stored_upload(using='replica')
+        delete_stored_upload(self.upload_id)
+        self.assertFalse(StoredUpload.objects.filter(
+            upload_id=self.upload_id).exists())
+        self.assertTrue(StoredUpload.objects.using('replica').filter(
+            upload_id=self.upload_id).exists())
+
+    def test_fetch_status_replica(self):
+        TemporaryUploadFetch.objects.using('replica').create(
+            upload_id=self.upload_id, target_url='http://localhost/test.txt',
+            status=TemporaryUploadFetch.COMPLETE)
+        self.cache.clear()
+        response = self.client.get(reverse('fetch_status') +
+                                   ('?id=%s' % self.upload_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'complete')
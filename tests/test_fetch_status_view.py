@@ -0,0 +1,253 @@
+import logging
+import os
+import threading
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.test.testcases import TestCase
+from django.urls import reverse
+from rest_framework.exceptions import NotFound
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond import fetch_utils
+from django_drf_filepond.exceptions import FetchError
+from django_drf_filepond.fetch_utils import _run_fetch_job
+from django_drf_filepond.models import TemporaryUpload, TemporaryUploadFetch
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for asynchronous fetch jobs. When DJANGO_DRF_FILEPOND_FETCH_ASYNC
+# is enabled, a HEAD request to the fetch endpoint registers a fetch job
+# and returns a 202 response. The download is carried out by a background
+# worker and the fetch/status/ endpoint reports on the job's progress.
+#
+# test_fetch_head_async_registers_job: Make a HEAD request to the fetch
+#    endpoint with async fetch enabled. Check that a 202 response with a
+#    transfer ID is returned and a job is registered and submitted.
+#
+# test_fetch_head_async_invalid_url: Make a HEAD request with async fetch
+#    enabled and an invalid URL. Check a 400 response is returned and no
+#    job is registered.
+#
+# test_run_fetch_job_success: Run a fetch job and check that a
+#    TemporaryUpload is created with the job's upload_id and that the job
+#    is marked as complete.
+#
+# test_run_fetch_job_failure: Run a fetch job where the remote file is not
+#    found. Check that the job is marked as failed with the error message.
+#
+# test_run_fetch_job_missing: Run a fetch job for an ID that has no job
+#    record. Check that this is handled without an error being raised.
+#
+# test_run_fetch_job_temp_file: Run a fetch job and check that the download
+#    is written to a temporary file, which is moved into place, rather than
+#    held in memory and that the temporary file is removed if the job fails.
+#
+# test_run_fetch_job_not_coalesced: Run a fetch job while a fetch request
+#    for the same URL, that will fail with a 503 error, is in progress.
+#    Check that the job carries out its own download rather than waiting
+#    for the request and failing with its error.
+#
+# test_fetch_status_missing_param: Make a GET request to the status
+#    endpoint without an id parameter (400).
+#
+# test_fetch_status_not_found: Make a GET request to the status endpoint
+#    with an unknown ID (404).
+#
+# test_fetch_status_complete: Make a GET request to the status endpoint for
+#    a completed job and check the returned status data.
+#
+# test_fetch_status_other_user: Make a GET request to the status endpoint
+#    for a job registered by a different user (404).
+#
+class FetchJobTestCase(TestCase):
+
+    def setUp(self):
+        self.test_url = 'http://localhost/test.txt'
+        self.upload_id = _get_file_id()
+
+    def _patch_downloads(self, content=b'Some test file content...'):
+        patcher_head = patch('requests.head')
+        patcher_get = patch('requests.get')
+        mock_head = patcher_head.start()
+        mock_get = patcher_get.start()
+        self.addCleanup(patcher_head.stop)
+        self.addCleanup(patcher_get.stop)
+        mock_head.return_value.headers = {'Content-Type': 'text/plain'}
+        mock_head.return_value.status_code = 200
+        mock_response = mock_get.return_value.__enter__.return_value
+        mock_response.headers = {'Content-Length': str(len(content))}
+        mock_response.iter_content.return_value = [content]
+        return (mock_head, mock_get)
+
+    def test_fetch_head_async_registers_job(self):
+        mock_executor = MagicMock()
+        with patch.object(local_settings, 'FETCH_ASYNC', True), \
+                patch.object(fetch_utils, '_get_fetch_executor',
+                             return_value=mock_executor):
+            response = self.client.head(reverse('fetch') +
+                                        ('?target=%s' % self.test_url))
+        self.assertEqual(response.status_code, 202)
+        transfer_id = response['X-Content-Transfer-Id']
+        self.assertEqual(len(transfer_id), 22)
+        job = TemporaryUploadFetch.objects.get(upload_id=transfer_id)
+        self.assertEqual(job.target_url, self.test_url)
+        self.assertEqual(job.status, TemporaryUploadFetch.PENDING)
+        mock_executor.submit.assert_called_once_with(_run_fetch_job,
+                                                     transfer_id)
+
+    def test_fetch_head_async_invalid_url(self):
+        mock_executor = MagicMock()
+        with patch.object(local_settings, 'FETCH_ASYNC', True), \
+                patch.object(fetch_utils, '_get_fetch_executor',
+                             return_value=mock_executor):
+            response = self.client.head(reverse('fetch') +
+                                        '?target=htt://localhost23/test')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(TemporaryUploadFetch.objects.count(), 0)
+        mock_executor.submit.assert_not_called()
+
+    def test_run_fetch_job_success(self):
+        self._patch_downloads()
+        TemporaryUploadFetch.objects.create(upload_id=self.upload_id,
+                                            target_url=self.test_url)
+        _run_fetch_job(self.upload_id)
+
+        job = TemporaryUploadFetch.objects.get(upload_id=self.upload_id)
+        self.assertEqual(job.status, TemporaryUploadFetch.COMPLETE)
+        self.assertEqual(job.bytes_downloaded, 25)
+        self.assertEqual(job.total_size, 25)
+        self.assertEqual(job.upload_name, 'test.txt')
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        self.assertEqual(tu.upload_type, TemporaryUpload.URL)
+        self.assertEqual(tu.upload_name, 'test.txt')
+        with open(tu.get_file_path(), 'rb') as f:
+            self.assertEqual(f.read(), b'Some test file content...')
+        tu.delete()
+
+    def test_run_fetch_job_failure(self):
+        mock_head, _ = self._patch_downloads()
+        mock_head.return_value.status_code = 404
+        TemporaryUploadFetch.objects.create(upload_id=self.upload_id,
+                                            target_url=self.test_url)
+        _run_fetch_job(self.upload_id)
+
+        job = TemporaryUploadFetch.objects.get(upload_id=self.upload_id)
+        self.assertEqual(job.status, TemporaryUploadFetch.FAILED)
+        self.assertEqual(job.error, str(NotFound(
+            'The remote file was not found.').detail))
+        self.assertFalse(TemporaryUpload.objects.filter(
+            upload_id=self.upload_id).exists())
+
+    def test_run_fetch_job_missing(self):
+        _run_fetch_job(self.upload_id)
+        self.assertFalse(TemporaryUpload.objects.filter(
+            upload_id=self.upload_id).exists())
+
+    def test_run_fetch_job_temp_file(self):
+        self._patch_downloads()
+        temp_files = []
+
+        def _temp_file(*args):
+            temp_files.append(TemporaryUploadedFile(*args))
+            return temp_files[-1]
+
+        TemporaryUploadFetch.objects.create(upload_id=self.upload_id,
+                                            target_url=self.test_url)
+        with patch.object(fetch_utils, 'TemporaryUploadedFile',
+                          side_effect=_temp_file):
+            _run_fetch_job(self.upload_id)
+        temp_path = temp_files[0].temporary_file_path()
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        self.addCleanup(tu.delete)
+        self.assertFalse(os.path.exists(temp_path))
+        with open(tu.get_file_path(), 'rb') as f:
+            self.assertEqual(f.read(), b'Some test file content...')
+
+        upload_id = _get_file_id()
+        TemporaryUploadFetch.objects.create(upload_id=upload_id,
+                                            target_url=self.test_url)
+        with patch.object(fetch_utils, 'TemporaryUploadedFile',
+                          side_effect=_temp_file), \
+                patch.object(local_settings, 'FETCH_MAX_SIZE', 10):
+            _run_fetch_job(upload_id)
+        self.assertEqual(TemporaryUploadFetch.objects.get(
+            upload_id=upload_id).status, TemporaryUploadFetch.FAILED)
+        self.assertFalse(os.path.exists(temp_files[1].temporary_file_path()))
+
+    def test_run_fetch_job_not_coalesced(self):
+        # A fetch request for the same URL is in progress and will fail
+        # with a 503 error. The job must not wait for it and inherit this.
+        self._patch_downloads()
+        started = threading.Event()
+        release = threading.Event()
+
+        def _fetch():
+            started.set()
+            release.wait(5)
+            raise FetchError('Too many remote file requests are in '
+                             'progress.', status_code=503)
+
+        def _request():
+            try:
+                fetch_utils.coalesce_fetch(self.test_url, _fetch)
+            except FetchError:
+                pass
+
+        request_thread = threading.Thread(target=_request)
+        request_thread.start()
+        self.addCleanup(request_thread.join)
+        self.addCleanup(release.set)
+        started.wait(5)
+
+        TemporaryUploadFetch.objects.create(upload_id=self.upload_id,
+                                            target_url=self.test_url)
+        release_timer = threading.Timer(1, release.set)
+        release_timer.start()
+        self.addCleanup(release_timer.cancel)
+        _run_fetch_job(self.upload_id)
+        self.assertFalse(release.is_set())
+
+        job = TemporaryUploadFetch.objects.get(upload_id=self.upload_id)
+        self.assertEqual(job.status, TemporaryUploadFetch.COMPLETE)
+        TemporaryUpload.objects.get(upload_id=self.upload_id).delete()
+
+    def test_fetch_status_missing_param(self):
+        response = self.client.get(reverse('fetch_status'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_fetch_status_not_found(self):
+        response = self.client.get(reverse('fetch_status') +
+                                   ('?id=%s' % self.upload_id))
+        self.assertEqual(response.status_code, 404)
+
+    def test_fetch_status_complete(self):
+        TemporaryUploadFetch.objects.create(
+            upload_id=self.upload_id, target_url=self.test_url,
+            status=TemporaryUploadFetch.COMPLETE, bytes_downloaded=25,
+            total_size=25, upload_name='test.txt')
+        response = self.client.get(reverse('fetch_status') +
+                                   ('?id=%s' % self.upload_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'id': self.upload_id, 'status': 'complete',
+            'bytes_downloaded': 25, 'total_size': 25,
+            'upload_name': 'test.txt', 'error': ''})
+
+    def test_fetch_status_other_user(self):
+        user = User.objects.create_user('fetch_test_user')
+        TemporaryUploadFetch.objects.create(
+            upload_id=self.upload_id, target_url=self.test_url,
+            uploaded_by=user)
+        response = self.client.get(reverse('fetch_status') +
+                                   ('?id=%s' % self.upload_id))
+        self.assertEqual(response.status_code, 404)
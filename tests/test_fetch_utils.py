@@ -0,0 +1,340 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from tempfile import mkdtemp
+
+from django.test import TestCase
+from rest_framework.exceptions import NotFound
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond import fetch_utils
+from django_drf_filepond.exceptions import FetchError
+from django_drf_filepond.fetch_utils import FetchCoalescer, \
+    LockFileCoalescer, coalesce_fetch, _get_fetch_key, download_remote_file, \
+    _get_fetch_semaphore
+from django.urls import reverse
+from requests.exceptions import ReadTimeout
+
+# Python 2/3 support
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the fetch coalescing helpers in fetch_utils:
+#
+# test_coalescer_single_call: Check that a call with no other calls in
+#    progress runs the fetch function and returns its result.
+#
+# test_coalescer_concurrent_calls_share_result: Start several threads
+#    fetching the same key while the fetch function is blocked. Check that
+#    the fetch function is called only once and all threads get its result.
+#
+# test_coalescer_concurrent_calls_share_error: As above, but the fetch
+#    function raises an exception. Check that all threads see the error.
+#
+# test_coalescer_different_keys_not_coalesced: Check that fetches for
+#    different keys each run the fetch function.
+#
+# test_coalesce_fetch_disabled: Check that with FETCH_COALESCE_REQUESTS
+#    set to False, the fetch function is called directly.
+#
+# test_lock_file_coalescer_uncontended: Check that an uncontended fetch
+#    runs the fetch function and stores its result in the lock directory.
+#
+# test_lock_file_coalescer_contended_uses_result: Hold the lock for a key
+#    while another thread fetches it, write a result and release the lock.
+#    Check that the waiting thread uses the shared result.
+#
+# test_lock_file_coalescer_stale_result_ignored: Check that a shared
+#    result completed before the caller started waiting is not used.
+#
+class FetchCoalescerTestCase(TestCase):
+
+    def _run_threads(self, coalescer, key, fetch_fn, num_threads):
+        results = []
+        errors = []
+
+        def _worker():
+            try:
+                results.append(coalescer.fetch(key, fetch_fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=_worker)
+                   for _ in range(num_threads)]
+        for t in threads:
+            t.start()
+        return (threads, results, errors)
+
+    def _wait_for_waiters(self, coalescer, key, num_waiters):
+        # Wait until the expected number of threads are waiting on the
+        # in-progress fetch for the key.
+        for _ in range(500):
+            with coalescer._lock:
+                flight = coalescer._in_flight.get(key, None)
+                if flight and flight.waiters == num_waiters:
+                    return
+            time.sleep(0.01)
+        self.fail('Threads did not start waiting for the fetch.')
+
+    def test_coalescer_single_call(self):
+        coalescer = FetchCoalescer()
+        fetch_fn = MagicMock(return_value=(b'data', 'test.txt',
+                                           'text/plain'))
+        result = coalescer.fetch('key', fetch_fn)
+        self.assertEqual(result, (b'data', 'test.txt', 'text/plain'))
+        self.assertEqual(fetch_fn.call_count, 1)
+        self.assertEqual(coalescer.in_flight_count(), 0)
+
+    def test_coalescer_concurrent_calls_share_result(self):
+        coalescer = FetchCoalescer()
+        release = threading.Event()
+        calls = []
+
+        def fetch_fn():
+            calls.append(1)
+            release.wait(5)
+            return (b'data', 'test.txt', 'text/plain')
+
+        threads, results, errors = self._run_threads(coalescer, 'key',
+                                                     fetch_fn, 5)
+        self._wait_for_waiters(coalescer, 'key', 4)
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(len(calls), 1, 'Fetch function called more than '
+                         'once for concurrent requests.')
+        self.assertEqual(len(errors), 0)
+        self.assertEqual(len(results), 5)
+        for result in results:
+            self.assertEqual(result, (b'data', 'test.txt', 'text/plain'))
+        self.assertEqual(coalescer.in_flight_count(), 0)
+
+    def test_coalescer_concurrent_calls_share_error(self):
+        coalescer = FetchCoalescer()
+        release = threading.Event()
+
+        def fetch_fn():
+            release.wait(5)
+            raise NotFound('The remote file was not found.')
+
+        threads, results, errors = self._run_threads(coalescer, 'key',
+                                                     fetch_fn, 3)
+        self._wait_for_waiters(coalescer, 'key', 2)
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(len(results), 0)
+        self.assertEqual(len(errors), 3)
+        for error in errors:
+            self.assertIsInstance(error, NotFound)
+        self.assertEqual(coalescer.in_flight_count(), 0)
+
+    def test_coalescer_different_keys_not_coalesced(self):
+        coalescer = FetchCoalescer()
+        fetch_fn = MagicMock(return_value=(b'data', None, 'text/plain'))
+        coalescer.fetch('key1', fetch_fn)
+        coalescer.fetch('key2', fetch_fn)
+        self.assertEqual(fetch_fn.call_count, 2)
+
+    def test_coalesce_fetch_disabled(self):
+        fetch_fn = MagicMock(return_value=(b'data', None, 'text/plain'))
+        with patch.object(local_settings, 'FETCH_COALESCE_REQUESTS', False):
+            with patch.object(fetch_utils, '_coalescer') as mock_coalescer:
+                result = coalesce_fetch('http://localhost/test.txt',
+                                        fetch_fn, 'arg')
+        fetch_fn.assert_called_once_with('arg')
+        mock_coalescer.fetch.assert_not_called()
+        self.assertEqual(result, (b'data', None, 'text/plain'))
+
+
+class LockFileCoalescerTestCase(TestCase):
+
+    def setUp(self):
+        if fetch_utils.fcntl is None:
+            self.skipTest('fcntl is not available on this platform.')
+        self.tmp_dir = mkdtemp(prefix='django_test_')
+        self.lock_dir = os.path.join(self.tmp_dir,
+                                     fetch_utils.FETCH_LOCK_DIR_NAME)
+        self.key = _get_fetch_key('http://localhost/test.txt')
+        self.coalescer = LockFileCoalescer(self.lock_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lock_file_coalescer_uncontended(self):
+        fetch_fn = MagicMock(return_value=(b'data', 'test.txt',
+                                           'text/plain'))
+        result = self.coalescer.fetch(self.key, fetch_fn)
+        self.assertEqual(result, (b'data', 'test.txt', 'text/plain'))
+        self.assertEqual(fetch_fn.call_count, 1)
+        (_, data_path, meta_path) = self.coalescer._paths(self.key)
+        self.assertTrue(os.path.exists(data_path))
+        self.assertTrue(os.path.exists(meta_path))
+
+    def test_lock_file_coalescer_contended_uses_result(self):
+        os.makedirs(self.lock_dir)
+        (lock_path, data_path, meta_path) = self.coalescer._paths(self.key)
+        fetch_fn = MagicMock(return_value=(b'other', None, 'text/plain'))
+        results = []
+
+        # Take the lock via a separate open file to simulate a download in
+        # progress in another process.
+        lock_file = open(lock_path, 'a+')
+        fetch_utils.fcntl.flock(lock_file, fetch_utils.fcntl.LOCK_EX)
+        t = threading.Thread(target=lambda: results.append(
+            self.coalescer.fetch(self.key, fetch_fn)))
+        t.start()
+        time.sleep(0.1)
+        self.coalescer._write_result(data_path, meta_path,
+                                     (b'data', 'test.txt', 'text/plain'))
+        fetch_utils.fcntl.flock(lock_file, fetch_utils.fcntl.LOCK_UN)
+        lock_file.close()
+        t.join(5)
+
+        fetch_fn.assert_not_called()
+        self.assertEqual(results, [(b'data', 'test.txt', 'text/plain')])
+
+    def test_lock_file_coalescer_stale_result_ignored(self):
+        os.makedirs(self.lock_dir)
+        (_, data_path, meta_path) = self.coalescer._paths(self.key)
+        self.coalescer._write_result(data_path, meta_path,
+                                     (b'old', 'test.txt', 'text/plain'))
+        self.assertIsNone(self.coalescer._read_result(
+            data_path, meta_path, time.time() + 1))
+        self.assertEqual(
+            self.coalescer._read_result(data_path, meta_path,
+                                        time.time() - 60),
+            (b'old', 'test.txt', 'text/plain'))
+
+
+#########################################################################
+# Tests for the limits applied to remote downloads by download_remote_file:
+#
+# test_download_max_size_content_length: Check that a remote file with a
+#    Content-Length larger than FETCH_MAX_SIZE is rejected with a 413 error
+#    before the download starts.
+#
+# test_download_max_size_streaming: Check that a remote file without a
+#    Content-Length header is rejected with a 413 error when the data
+#    received exceeds FETCH_MAX_SIZE.
+#
+# test_download_within_max_size: Check that a file within the size limit is
+#    downloaded successfully.
+#
+# test_download_read_timeout: Check that a timeout from requests results
+#    in a 504 error.
+#
+# test_download_deadline_exceeded: Check that a download that takes longer
+#    than FETCH_TIMEOUT in total is aborted with a 504 error.
+#
+# test_download_max_concurrent_reached: Check that when all download slots
+#    are in use, a 503 error with a retry time is raised.
+#
+# test_download_max_concurrent_slot_released: Check that the download slot
+#    is released after a download, including a failed download.
+#
+# test_fetch_view_max_concurrent_response: Check that the fetch endpoint
+#    returns a 503 response with a Retry-After header when all download
+#    slots are in use.
+#
+class FetchLimitsTestCase(TestCase):
+
+    def setUp(self):
+        self.test_url = 'http://localhost/test.txt'
+        patcher_head = patch('requests.head')
+        patcher_get = patch('requests.get')
+        self.mock_head = patcher_head.start()
+        self.mock_get = patcher_get.start()
+        self.addCleanup(patcher_head.stop)
+        self.addCleanup(patcher_get.stop)
+        self.mock_head.return_value.headers = {'Content-Type': 'text/plain'}
+        self.mock_head.return_value.status_code = 200
+        self.mock_response = self.mock_get.return_value.__enter__.return_value
+        self.mock_response.headers = {}
+        self.mock_response.iter_content.return_value = [b'0123456789'] * 3
+
+    def test_download_max_size_content_length(self):
+        self.mock_head.return_value.headers['Content-Length'] = '30'
+        with patch.object(local_settings, 'FETCH_MAX_SIZE', 20):
+            with self.assertRaises(FetchError) as cm:
+                download_remote_file(self.test_url)
+        self.assertEqual(cm.exception.status_code, 413)
+        self.mock_get.assert_not_called()
+
+    def test_download_max_size_streaming(self):
+        with patch.object(local_settings, 'FETCH_MAX_SIZE', 20):
+            with self.assertRaises(FetchError) as cm:
+                download_remote_file(self.test_url)
+        self.assertEqual(cm.exception.status_code, 413)
+
+    def test_download_within_max_size(self):
+        with patch.object(local_settings, 'FETCH_MAX_SIZE', 30):
+            (data, _, content_type) = download_remote_file(self.test_url)
+        self.assertEqual(data, b'0123456789' * 3)
+        self.assertEqual(content_type, 'text/plain')
+
+    def test_download_read_timeout(self):
+        self.mock_get.side_effect = ReadTimeout('Read timed out.')
+        with patch.object(local_settings, 'FETCH_TIMEOUT', 10):
+            with self.assertRaises(FetchError) as cm:
+                download_remote_file(self.test_url)
+        self.assertEqual(cm.exception.status_code, 504)
+        self.assertIsNotNone(self.mock_get.call_args[1]['timeout'])
+
+    def test_download_deadline_exceeded(self):
+        def slow_content(chunk_size=None):
+            for _ in range(3):
+                time.sleep(0.05)
+                yield b'0123456789'
+        self.mock_response.iter_content.side_effect = slow_content
+        with patch.object(local_settings, 'FETCH_TIMEOUT', 0.04):
+            with self.assertRaises(FetchError) as cm:
+                download_remote_file(self.test_url)
+        self.assertEqual(cm.exception.status_code, 504)
+
+    def test_download_max_concurrent_reached(self):
+        with patch.object(local_settings, 'FETCH_MAX_CONCURRENT', 1):
+            semaphore = _get_fetch_semaphore()
+            semaphore.acquire()
+            try:
+                with self.assertRaises(FetchError) as cm:
+                    download_remote_file(self.test_url)
+            finally:
+                semaphore.release()
+        self.assertEqual(cm.exception.status_code, 503)
+        self.assertEqual(cm.exception.retry_after,
+                         local_settings.FETCH_RETRY_AFTER)
+        self.mock_head.assert_not_called()
+
+    def test_download_max_concurrent_slot_released(self):
+        with patch.object(local_settings, 'FETCH_MAX_CONCURRENT', 1):
+            download_remote_file(self.test_url)
+            self.mock_head.return_value.status_code = 404
+            with self.assertRaises(NotFound):
+                download_remote_file(self.test_url)
+            semaphore = _get_fetch_semaphore()
+            self.assertTrue(semaphore.acquire(False))
+            semaphore.release()
+
+    def test_fetch_view_max_concurrent_response(self):
+        with patch.object(local_settings, 'FETCH_MAX_CONCURRENT', 1):
+            semaphore = _get_fetch_semaphore()
+            semaphore.acquire()
+            try:
+                response = self.client.get(reverse('fetch') +
+                                           ('?target=%s' % self.test_url))
+            finally:
+                semaphore.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'],
+                         str(local_settings.FETCH_RETRY_AFTER))
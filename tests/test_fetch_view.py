@@ -86,6 +86,10 @@ LOG = logging.getLogger(__name__)
 #    it's difficult to see where head may succeed and get fail straight after
 #    but testing this case for completeness.
 #
+# test_fetch_process_req_connection_error_head: Check that a connection
+#    error when requests.head is called in _process_request results in a
+#    500 response being returned.
+#
 # test_fetch_head_response_object_returned: When fetch receives a HEAD
 #    request, if _process_request returns a response object (in the case of
 #    an error occurring), test that this is correctly returned without
@@ -429,6 +433,20 @@ class FetchTestCase(TestCase):
                 'Unable to access the requested remote file: test_file'):
             fv._process_request(mock_req)
 
+    def test_fetch_process_req_connection_error_head(self):
+        patcher_head = patch('requests.head')
+        patcher_head.start()
+        self.addCleanup(patcher_head.stop)
+        requests.head.side_effect = ConnectionError('test_file')
+        mock_req = MagicMock()
+        mock_req.query_params = {'target': 'http://localhost/test'}
+        fv = FetchView()
+        result = fv._process_request(mock_req)
+        self.assertIsInstance(result, Response)
+        self.assertEqual(result.status_code, 500)
+        self.assertEqual(result.data, 'Unable to access the requested '
+                         'remote file headers: test_file')
+
     def test_fetch_head_response_object_returned(self):
         patcher = patch('django_drf_filepond.views.FetchView._process_request')
         patcher.start()
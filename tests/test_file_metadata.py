@@ -0,0 +1,70 @@
+import hashlib
+import logging
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from django_drf_filepond.file_metadata import get_file_metadata, \
+    sniff_content_type
+from django_drf_filepond.models import TemporaryUpload
+from django_drf_filepond.utils import _get_file_id
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the file metadata stored with TemporaryUpload and StoredUpload
+# records:
+#
+# test_sniff_content_type: Check that content types are detected from the
+#    signatures at the start of file data and that text and binary data
+#    without a known signature are distinguished.
+#
+# test_get_file_metadata: Check that the size, content types and digest are
+#    obtained from data provided in several chunks.
+#
+# test_temp_upload_metadata: Check that the metadata is set when a
+#    TemporaryUpload is saved with a new file.
+#
+class FileMetadataTestCase(TestCase):
+
+    def test_sniff_content_type(self):
+        self.assertEqual(sniff_content_type(b'\x89PNG\r\n\x1a\n\x00\x00'),
+                         'image/png')
+        self.assertEqual(sniff_content_type(b'\xff\xd8\xff\xe0\x00\x10'),
+                         'image/jpeg')
+        self.assertEqual(sniff_content_type(b'%PDF-1.7\n'), 'application/pdf')
+        self.assertEqual(sniff_content_type(b'RIFF\x00\x00\x00\x00WEBPVP8'),
+                         'image/webp')
+        self.assertEqual(sniff_content_type(b'Some text data\n'),
+                         'text/plain')
+        # Text ending part way through a multi-byte character
+        self.assertEqual(sniff_content_type(u'caf\xe9'.encode('utf-8')[:-1]),
+                         'text/plain')
+        self.assertEqual(sniff_content_type(b'\x00\x01\x02\xfe'),
+                         'application/octet-stream')
+        self.assertEqual(sniff_content_type(b''), '')
+
+    def test_get_file_metadata(self):
+        chunks = [b'\x89PNG\r\n', b'\x1a\n', b'more data']
+        metadata = get_file_metadata(iter(chunks), 'image.jpg')
+        self.assertEqual(metadata, {
+            'size': 17, 'content_type': 'image/jpeg',
+            'sniffed_type': 'image/png',
+            'digest': hashlib.sha256(b''.join(chunks)).hexdigest()})
+
+    def test_temp_upload_metadata(self):
+        tu = TemporaryUpload(
+            upload_id=_get_file_id(), file_id=_get_file_id(),
+            file=SimpleUploadedFile('test.txt', b'Some test data'),
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        tu = TemporaryUpload.objects.get(upload_id=tu.upload_id)
+        self.assertEqual(tu.size, 14)
+        self.assertEqual(tu.content_type, 'text/plain')
+        self.assertEqual(tu.sniffed_type, 'text/plain')
+        self.assertEqual(tu.digest,
+                         hashlib.sha256(b'Some test data').hexdigest())
+        with open(tu.get_file_path(), 'rb') as f:
+            self.assertEqual(f.read(), b'Some test data')
+        tu.delete()
@@ -0,0 +1,163 @@
+'''
+Tests for LeanPatchView, the version of the patch endpoint that handles
+chunk upload requests without using DRF's APIView.
+'''
+import importlib
+import logging
+import os
+import shutil
+
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+from rest_framework.permissions import IsAuthenticated
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+import django_drf_filepond.urls
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, storage
+from django_drf_filepond.utils import _get_file_id
+from django_drf_filepond.views import LeanPatchView, PatchView
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the lean patch view:
+#
+# test_lean_patch_view_setting: Check that the patch endpoint in
+#    django_drf_filepond.urls uses LeanPatchView when LEAN_PATCH_VIEW is
+#    set and PatchView otherwise.
+#
+# test_chunked_upload: Carry out a chunked upload, sending the chunks to
+#    the lean patch view, and check that the temporary upload is created.
+#
+# test_chunk_larger_than_memory_limit: Check that a chunk larger than
+#    DATA_UPLOAD_MAX_MEMORY_SIZE is accepted, as it is by PatchView.
+#
+# test_patch_invalid_content_type: Check that a chunk with a content type
+#    other than application/offset+octet-stream is rejected with a 415
+#    error.
+#
+# test_patch_empty_final_request: Check that an empty PATCH request for an
+#    upload where all the data has been sent is accepted.
+#
+# test_head_request: Check that a HEAD request returns the offset of a
+#    partially completed upload.
+#
+# test_head_invalid_id: Check that a HEAD request for an unknown upload
+#    gives a 404 error.
+#
+# test_permission_classes: Check that PatchView handles the request when
+#    permission classes are set for the patch endpoint.
+#
+@override_settings(ROOT_URLCONF='tests.lean_urls')
+class LeanPatchViewTestCase(TestCase):
+
+    def setUp(self):
+        self.file_content = b'This is some test file data for an upload.'
+
+    def _delete_temp_upload(self, upload_id):
+        for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+            tu.delete()
+
+    def _delete_chunked_upload(self, upload_id):
+        # Remove the chunk directory of an upload that wasn't completed
+        for tuc in TemporaryUploadChunked.objects.filter(upload_id=upload_id):
+            shutil.rmtree(os.path.join(storage.base_location, tuc.upload_dir),
+                          True)
+            tuc.delete()
+
+    def _start_chunked_upload(self):
+        response = self.client.post(
+            reverse('process'), {'filepond': '{}'},
+            HTTP_UPLOAD_LENGTH=str(len(self.file_content)))
+        self.assertEqual(response.status_code, 200)
+        upload_id = response.content.decode()
+        self.addCleanup(self._delete_temp_upload, upload_id)
+        self.addCleanup(self._delete_chunked_upload, upload_id)
+        return upload_id
+
+    def _patch_chunk(self, upload_id, offset, chunk,
+                     content_type='application/offset+octet-stream'):
+        return self.client.patch(
+            reverse('patch', args=[upload_id]), data=chunk,
+            content_type=content_type,
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_LENGTH=str(len(self.file_content)),
+            HTTP_UPLOAD_NAME='test.txt')
+
+    def test_lean_patch_view_setting(self):
+        self.addCleanup(importlib.reload, django_drf_filepond.urls)
+        for (lean, view_class) in ((True, LeanPatchView),
+                                   (False, PatchView)):
+            with patch.object(local_settings, 'LEAN_PATCH_VIEW', lean):
+                importlib.reload(django_drf_filepond.urls)
+            patch_url = [p for p in django_drf_filepond.urls.urlpatterns
+                         if p.name == 'patch'][0]
+            self.assertIs(patch_url.callback.view_class, view_class)
+
+    def test_chunked_upload(self):
+        upload_id = self._start_chunked_upload()
+        self.assertIs(resolve(reverse('patch', args=[upload_id])).func
+                      .view_class, LeanPatchView)
+        half = len(self.file_content) // 2
+        for (offset, chunk) in ((0, self.file_content[:half]),
+                                (half, self.file_content[half:])):
+            response = self._patch_chunk(upload_id, offset, chunk)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content.decode(), upload_id)
+
+        tu = TemporaryUpload.objects.get(upload_id=upload_id)
+        self.assertEqual(tu.upload_name, 'test.txt')
+        with tu.file.open('rb') as f:
+            self.assertEqual(f.read(), self.file_content)
+        self.assertFalse(TemporaryUploadChunked.objects.filter(
+            upload_id=upload_id).exists())
+
+    def test_chunk_larger_than_memory_limit(self):
+        upload_id = self._start_chunked_upload()
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=10):
+            response = self._patch_chunk(upload_id, 0, self.file_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(TemporaryUpload.objects.filter(
+            upload_id=upload_id).exists())
+
+    def test_patch_invalid_content_type(self):
+        response = self._patch_chunk(_get_file_id(), 0, self.file_content,
+                                     content_type='image/png')
+        self.assertContains(response, 'Unsupported media type',
+                            status_code=415)
+
+    def test_patch_empty_final_request(self):
+        response = self.client.patch(
+            reverse('patch', args=[_get_file_id()]), data=b'',
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(len(self.file_content)),
+            HTTP_UPLOAD_LENGTH=str(len(self.file_content)))
+        self.assertEqual(response.status_code, 200)
+
+    def test_head_request(self):
+        upload_id = self._start_chunked_upload()
+        self._patch_chunk(upload_id, 0, self.file_content[:10])
+        response = self.client.head(reverse('patch', args=[upload_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], '10')
+
+    def test_head_invalid_id(self):
+        response = self.client.head(reverse('patch', args=[_get_file_id()]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_permission_classes(self):
+        with patch.object(LeanPatchView, 'permission_classes',
+                          [IsAuthenticated]), \
+                patch.object(PatchView, 'permission_classes',
+                             [IsAuthenticated]):
+            response = self._patch_chunk(_get_file_id(), 0,
+                                         self.file_content)
+        self.assertIn(response.status_code, (401, 403))
@@ -5,11 +5,11 @@ import shutil
 # checking header params since cgi is deprecated and will be removed in py3.13
 from email.message import Message
 
-import django_drf_filepond.api
 import django_drf_filepond.drf_filepond_settings as local_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test.testcases import TestCase
 from django.urls import reverse
+from django_drf_filepond.config import load_config
 from django_drf_filepond.models import StoredUpload, TemporaryUpload
 from django_drf_filepond.utils import _get_file_id
 
@@ -49,6 +49,18 @@ LOG = logging.getLogger(__name__)
 #
 # test_load_ambiguous_id_file: Make a GET request to the load endpoint
 #     a 22-character ID in the URL query string that is a file name.
+#
+# test_load_id_preferred_over_file: Make a GET request to the load endpoint
+#     with an upload ID that is also the file name of another stored upload
+#     and check that the upload with the matching ID is returned.
+#
+# test_load_metadata_headers: Check that the Content-Type and ETag headers
+#     are set from the metadata stored with the upload and that a 304 response
+#     is returned for a request with a matching If-None-Match header.
+#
+# test_load_query_count: Check that a stored upload is looked up with a
+#     single query whether an upload ID, a file name or a 22-character file
+#     name is provided.
 class LoadTestCase(TestCase):
 
     def _check_file_response(self, response, filename, file_content):
@@ -82,7 +94,7 @@ class LoadTestCase(TestCase):
                   % (__name__, file_store_path))
         cls.FILE_STORE_PATH = file_store_path
         local_settings.STORAGES_BACKEND = None
-        django_drf_filepond.api.storage_backend = None
+        load_config()
 
     def setUp(self):
         # Set up an initial file upload
@@ -188,11 +200,69 @@ class LoadTestCase(TestCase):
         self._check_file_response(response, self.test_filename,
                                   self.file_content)
 
+    def test_load_id_preferred_over_file(self):
+        su = StoredUpload.objects.get(upload_id=self.upload_id)
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        shutil.copy2(tu.get_file_path(), os.path.join(
+            LoadTestCase.FILE_STORE_PATH, su.file.name))
+        StoredUpload(upload_id=_get_file_id(), file=self.upload_id,
+                     uploaded=tu.uploaded).save()
+
+        response = self.client.get((reverse('load') +
+                                    ('?id=%s' % self.upload_id)))
+        self._check_file_response(response, self.fn, self.file_content)
+
+    def test_load_metadata_headers(self):
+        su = StoredUpload.objects.get(upload_id=self.upload_id)
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        shutil.copy2(tu.get_file_path(), os.path.join(
+            LoadTestCase.FILE_STORE_PATH, su.file.name))
+        tu.copy_file_metadata(su)
+        su.content_type = 'application/x-test'
+        su.save()
+
+        response = self.client.get((reverse('load') +
+                                    ('?id=%s' % self.upload_id)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-test')
+        self.assertEqual(response['Content-Length'],
+                         str(len(self.file_content)))
+        etag = '"%s"' % tu.digest
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(
+            (reverse('load') + ('?id=%s' % self.upload_id)),
+            HTTP_IF_NONE_MATCH='"other", %s' % etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_load_query_count(self):
+        su = StoredUpload.objects.get(upload_id=self.upload_id)
+        tu = TemporaryUpload.objects.get(upload_id=self.upload_id)
+        shutil.copy2(tu.get_file_path(), os.path.join(
+            LoadTestCase.FILE_STORE_PATH, su.file.name))
+        for load_id in (self.upload_id, self.fn):
+            with self.assertNumQueries(1):
+                response = self.client.get((reverse('load') +
+                                            ('?id=%s' % load_id)))
+            self._check_file_response(response, self.fn, self.file_content)
+
+        su.file.name = self.test_filename
+        su.save()
+        os.rename(os.path.join(LoadTestCase.FILE_STORE_PATH, self.fn),
+                  os.path.join(LoadTestCase.FILE_STORE_PATH,
+                               self.test_filename))
+        with self.assertNumQueries(1):
+            response = self.client.get((reverse('load') +
+                                        ('?id=%s' % self.test_filename)))
+        self._check_file_response(response, self.test_filename,
+                                  self.file_content)
+
     def test_load_filename_invalid_filestore_setting(self):
         su = StoredUpload.objects.get(upload_id=self.upload_id)
         fspath = local_settings.FILE_STORE_PATH
         local_settings.FILE_STORE_PATH = None
         try:
+            load_config()
             response = self.client.get((reverse('load') + '?id=%s'
                                         % su.upload_id))
             self.assertContains(
@@ -201,6 +271,7 @@ class LoadTestCase(TestCase):
                 status_code=500)
         finally:
             local_settings.FILE_STORE_PATH = fspath
+            load_config()
 
     def tearDown(self):
         upload_tmp_base = getattr(local_settings, 'UPLOAD_TMP', None)
@@ -109,9 +109,8 @@ class LoadStoragesTestCase(TestCase):
         # class name above. This ensures that we're looking at the mocked
         # backend class.
         import django_drf_filepond.api
-        django_drf_filepond.api.storage_backend_initialised = False
-        django_drf_filepond.api._init_storage_backend()
-        self.mock_storage_backend = django_drf_filepond.api.storage_backend
+        self.mock_storage_backend = \
+            django_drf_filepond.api._init_storage_backend()
 
         # Set up an initial file upload
         self.upload_id = _get_file_id()
@@ -130,8 +129,12 @@ class LoadStoragesTestCase(TestCase):
             self.file_content)
 
         # Override storage object configured for the FileField in StoredUpload
-        # at original init time since this happens before setUp is run.
-        StoredUpload.file.field.storage = self.mock_storage_backend
+        # at original init time since this happens before setUp is run. The
+        # original storage object is restored after the test.
+        patcher = patch.object(StoredUpload.file.field, 'storage',
+                               self.mock_storage_backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
         # Now set up a stored version of this upload
         su = StoredUpload(upload_id=self.upload_id,
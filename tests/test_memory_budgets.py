@@ -0,0 +1,284 @@
+'''
+Tests that check the peak memory allocated while handling large uploads,
+fetches, loads and restores, measured using tracemalloc.
+
+Each path has a declared memory budget made up of a fixed allowance and a
+number of copies of the file data that the path is expected to hold in
+memory. Paths that stream data have no copies in their budget, so these
+tests fail if a change results in them buffering whole files. Paths that
+currently buffer whole files (the synchronous load and restore views and
+the fetch view) have the number of copies they hold declared so that
+additional buffering is detected.
+
+Each path is run with a small and a large file. The size of the large file
+is set in MB by the DRF_FILEPOND_MEMORY_TEST_SIZE_MB environment variable
+(default: 32) so that the tests can be run with multi-hundred-MB files,
+e.g. before a release. The small file is a quarter of this size.
+
+The budgets for the asynchronous views are checked in
+test_async_memory_budgets, which is only run with Django 4.2 or later.
+tracemalloc isn't available with Python 2 so these tests are skipped there.
+'''
+import gc
+import logging
+import os
+import shutil
+from unittest import skipIf
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.config import load_config
+from django_drf_filepond.models import StoredUpload, TemporaryUpload
+from django_drf_filepond.utils import _get_file_id
+from django_drf_filepond.views import FetchView, LoadView, PatchView, \
+    ProcessView, RestoreView
+
+# Python 2/3 support
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+LOG = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+LARGE_SIZE = int(os.environ.get('DRF_FILEPOND_MEMORY_TEST_SIZE_MB',
+                                32)) * MB
+SMALL_SIZE = LARGE_SIZE // 4
+
+# The size of the chunks sent for chunked uploads
+CHUNK_SIZE = MB
+
+# The size of the blocks returned by the mocked remote server for fetches
+FETCH_BLOCK_SIZE = 64 * 1024
+
+# The directory within the file store that stored uploads are written to
+STORE_DIR_NAME = 'memory_test'
+
+# The memory budget for each path as a tuple (fixed allowance in bytes,
+# copies of the file data).
+MEMORY_BUDGETS = {
+    'process': (4 * MB, 0),
+    # The peak for a single chunk request. The chunk data is created with
+    # the request, copied into the test client's payload, read fully by the
+    # parser and wrapped in a BytesIO object to be stored.
+    'chunked_upload': (2 * MB + 4 * CHUNK_SIZE, 0),
+    'async_load': (2 * MB, 0),
+    'async_restore': (2 * MB, 0),
+    # The file data is read into memory and returned in the response
+    'load': (2 * MB, 1),
+    'restore': (2 * MB, 1),
+    # The file data is downloaded into a BytesIO buffer which is returned
+    # in the response. A second copy is allowed for since whether getting
+    # the buffer's value copies the data depends on the Python
+    # implementation.
+    'fetch': (4 * MB, 2),
+}
+
+# The allowance, as a fraction of the file size, for variation in the peak
+# when comparing it with the expected growth between file sizes.
+GROWTH_TOLERANCE = 0.1
+
+
+def _get_data(size):
+    return (os.urandom(MB) * (size // MB + 1))[:size]
+
+
+def _measure_peak(func):
+    # Returns the peak memory, in bytes, allocated while running func.
+    # Memory allocated before tracing starts, e.g. the request data, isn't
+    # counted.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+#########################################################################
+# Tests for the peak memory used by each path:
+#
+# test_process_memory: Check the memory used by a standard upload to the
+#    process endpoint.
+#
+# test_chunked_upload_memory: Check the memory used by sending the chunks
+#    of a chunked upload, including reassembling the chunks.
+#
+# test_load_memory: Check the memory used by the load endpoint.
+#
+# test_restore_memory: Check the memory used by the restore endpoint.
+#
+# test_fetch_memory: Check the memory used by a GET request to the fetch
+#    endpoint.
+#
+@skipIf(tracemalloc is None, 'tracemalloc is not available')
+class MemoryBudgetTestBase(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.data = _get_data(LARGE_SIZE)
+        self.store_dir = os.path.join(local_settings.FILE_STORE_PATH,
+                                      STORE_DIR_NAME)
+        self.addCleanup(shutil.rmtree, self.store_dir, True)
+
+    def _delete_temp_upload(self, upload_id):
+        for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+            tu.delete()
+
+    def _check_budget(self, path, run):
+        # run is called with a file size and returns the peak memory used.
+        (fixed, copies) = MEMORY_BUDGETS[path]
+        peaks = {}
+        for size in (SMALL_SIZE, LARGE_SIZE):
+            peaks[size] = run(size)
+            LOG.debug('Peak memory for <%s> with a %s byte file: %s bytes'
+                      % (path, size, peaks[size]))
+            self.assertLessEqual(
+                peaks[size], fixed + copies * size,
+                'Peak memory for <%s> with a %s byte file exceeds the '
+                'budget.' % (path, size))
+        growth = peaks[LARGE_SIZE] - peaks[SMALL_SIZE]
+        self.assertLessEqual(
+            growth, (copies + GROWTH_TOLERANCE) * (LARGE_SIZE - SMALL_SIZE),
+            'Peak memory for <%s> grows with the file size by more than '
+            'the budget.' % path)
+
+    def _create_temp_upload(self, size):
+        tu = TemporaryUpload(
+            upload_id=_get_file_id(), file_id=_get_file_id(),
+            file=SimpleUploadedFile('memory_test.bin', self.data[:size]),
+            upload_name='memory_test.bin',
+            upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        self.addCleanup(self._delete_temp_upload, tu.upload_id)
+        return tu
+
+    def _create_stored_upload(self, size):
+        upload_id = _get_file_id()
+        file_path = os.path.join(STORE_DIR_NAME, '%s.bin' % upload_id)
+        if not os.path.exists(self.store_dir):
+            os.makedirs(self.store_dir)
+        with open(os.path.join(local_settings.FILE_STORE_PATH, file_path),
+                  'wb') as f:
+            f.write(self.data[:size])
+        su = StoredUpload(upload_id=upload_id, file=file_path,
+                          uploaded=timezone.now())
+        su.save()
+        return su
+
+    def _check_load(self, path, view, consume):
+        self.addCleanup(load_config)
+        with patch.object(local_settings, 'STORAGES_BACKEND', None):
+            load_config()
+
+            def run(size):
+                su = self._create_stored_upload(size)
+                request = self.factory.get(reverse('load'),
+                                           {'id': su.upload_id})
+                peak = _measure_peak(lambda: consume(view(request)))
+                su.delete()
+                return peak
+            self._check_budget(path, run)
+
+    def _check_restore(self, path, view, consume):
+        def run(size):
+            tu = self._create_temp_upload(size)
+            request = self.factory.get(reverse('restore'),
+                                       {'id': tu.upload_id})
+            return _measure_peak(lambda: consume(view(request)))
+        self._check_budget(path, run)
+
+
+class MemoryBudgetTestCase(MemoryBudgetTestBase):
+
+    def test_process_memory(self):
+        view = ProcessView.as_view()
+
+        def run(size):
+            request = self.factory.post(reverse('process'), {
+                'filepond': SimpleUploadedFile('memory_test.bin',
+                                               self.data[:size])})
+            responses = []
+            peak = _measure_peak(lambda: responses.append(view(request)))
+            # Close the uploaded file as the request handler would
+            request.close()
+            self.assertEqual(responses[0].status_code, 200)
+            self._delete_temp_upload(responses[0].data)
+            return peak
+        self._check_budget('process', run)
+
+    def test_chunked_upload_memory(self):
+        view = PatchView.as_view()
+
+        def run(size):
+            response = self.client.post(
+                reverse('process'), {'filepond': '{}'},
+                HTTP_UPLOAD_LENGTH=str(size))
+            upload_id = response.content.decode()
+            self.addCleanup(self._delete_temp_upload, upload_id)
+            url = reverse('patch', args=[upload_id])
+            statuses = []
+
+            def send_chunk(offset):
+                request = self.factory.patch(
+                    url, data=self.data[offset:offset + CHUNK_SIZE],
+                    content_type='application/offset+octet-stream',
+                    HTTP_UPLOAD_OFFSET=str(offset),
+                    HTTP_UPLOAD_LENGTH=str(size),
+                    HTTP_UPLOAD_NAME='memory_test.bin')
+                statuses.append(view(request, chunk_id=upload_id).status_code)
+
+            # The peak is measured for each request separately, the final
+            # request also reassembles the chunks. Requests and their data
+            # are only freed when reference cycles are collected.
+            peak = max(_measure_peak(lambda: send_chunk(offset))
+                       for offset in range(0, size, CHUNK_SIZE))
+            self.assertEqual(set(statuses), {200})
+            self.assertTrue(TemporaryUpload.objects.filter(
+                upload_id=upload_id).exists())
+            return peak
+        self._check_budget('chunked_upload', run)
+
+    def test_load_memory(self):
+        self._check_load('load', LoadView.as_view(),
+                         lambda response: response.content)
+
+    def test_restore_memory(self):
+        self._check_restore('restore', RestoreView.as_view(),
+                            lambda response: response.content)
+
+    def test_fetch_memory(self):
+        view = FetchView.as_view()
+        block = self.data[:FETCH_BLOCK_SIZE]
+
+        def run(size):
+            get_response = MagicMock()
+            get_response.__enter__.return_value = get_response
+            get_response.headers = {'Content-Length': str(size)}
+            get_response.iter_content.side_effect = lambda chunk_size: (
+                block for _ in range(size // FETCH_BLOCK_SIZE))
+            head_response = MagicMock(status_code=200, headers={
+                'Content-Type': 'application/octet-stream',
+                'Content-Length': str(size)})
+            request = self.factory.get(reverse('fetch'), {
+                'target': 'https://example.com/memory_test.bin'})
+            responses = []
+            with patch('requests.head', return_value=head_response), \
+                    patch('requests.get', return_value=get_response):
+                peak = _measure_peak(
+                    lambda: responses.append(view(request).content))
+            self.assertEqual(len(responses[0]), size)
+            return peak
+        self._check_budget('fetch', run)
@@ -0,0 +1,251 @@
+'''
+Tests for the optional instrumentation of the filepond endpoints provided by
+django_drf_filepond.metrics.
+'''
+import logging
+import os
+import shutil
+import socket
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import store_upload
+from django_drf_filepond.config import load_config
+from django_drf_filepond.metrics import ACTIVE_UPLOADS, CHUNK_DIRS, \
+    PHASE_DURATION, PROMETHEUS_CONTENT_TYPE, RECEIVED_BYTES, \
+    REQUEST_DURATION, REQUESTS, SENT_BYTES, InMemoryMetricsSink, \
+    StatsdMetricsSink, get_metrics_sink, reset_metrics_sink, time_phase
+from django_drf_filepond.models import TemporaryUpload
+from django_drf_filepond.utils import _get_file_id
+from django_drf_filepond.views import MetricsView
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+IN_MEMORY_SINK = 'django_drf_filepond.metrics.InMemoryMetricsSink'
+
+
+#########################################################################
+# Tests for the metrics instrumentation:
+#
+# test_metrics_disabled: Check that no sink is created and phases aren't
+#    timed when METRICS_SINK isn't set.
+#
+# test_sink_created_once: Check that the sink is created once with the
+#    options in METRICS_SINK_OPTIONS.
+#
+# test_process_metrics: Check the request, bytes received and phase metrics
+#    recorded for a standard upload.
+#
+# test_process_sent_bytes: Check that the size of the upload ID returned by
+#    the process endpoint, a DRF response that is rendered after the view
+#    returns it, is recorded.
+#
+# test_chunked_upload_metrics: Check the phases recorded for a chunked
+#    upload and that the chunk directory gauge is updated.
+#
+# test_restore_sent_bytes: Check that the size of the file data returned by
+#    the restore endpoint is recorded.
+#
+# test_store_upload_phases: Check the phases recorded by store_upload.
+#
+# test_histogram_buckets: Check that values are counted in the cumulative
+#    histogram buckets.
+#
+# test_render_prometheus: Check the Prometheus text format output.
+#
+# test_metrics_view: Check that MetricsView returns the metrics, or a 404
+#    error when metrics aren't recorded in memory.
+#
+# test_statsd_sink: Check the data sent by the statsd sink.
+#
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.file_content = b'This is some test file data for an upload.'
+        patcher = patch.object(local_settings, 'METRICS_SINK',
+                               IN_MEMORY_SINK)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reset_metrics_sink()
+        self.addCleanup(reset_metrics_sink)
+        self.sink = get_metrics_sink()
+
+    def _delete_temp_upload(self, upload_id):
+        for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+            tu.delete()
+
+    def _create_temp_upload(self):
+        tu = TemporaryUpload(
+            upload_id=_get_file_id(), file_id=_get_file_id(),
+            file=SimpleUploadedFile('test.txt', self.file_content),
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        self.addCleanup(self._delete_temp_upload, tu.upload_id)
+        return tu
+
+    def _phase_count(self, phase):
+        histogram = self.sink.get_histogram(PHASE_DURATION, phase=phase)
+        return histogram['count'] if histogram else 0
+
+    def test_metrics_disabled(self):
+        with patch.object(local_settings, 'METRICS_SINK', None):
+            self.assertIsNone(get_metrics_sink())
+            with time_phase('parse'):
+                pass
+            response = self.client.post(reverse('process'), {
+                'filepond': SimpleUploadedFile('test.txt',
+                                               self.file_content)})
+        self.assertEqual(response.status_code, 200)
+        self._delete_temp_upload(response.content.decode())
+        self.assertEqual(self._phase_count('parse'), 0)
+        self.assertEqual(self.sink.get_counter(
+            REQUESTS, endpoint='process', method='POST', status='200'), 0)
+
+    def test_sink_created_once(self):
+        reset_metrics_sink()
+        with patch.object(local_settings, 'METRICS_SINK_OPTIONS',
+                          {'buckets': (1.0, 0.5)}):
+            sink = get_metrics_sink()
+        self.assertIsInstance(sink, InMemoryMetricsSink)
+        self.assertEqual(sink.buckets, (0.5, 1.0))
+        self.assertIs(get_metrics_sink(), sink)
+
+    def test_process_metrics(self):
+        response = self.client.post(reverse('process'), {
+            'filepond': SimpleUploadedFile('test.txt', self.file_content)})
+        self.assertEqual(response.status_code, 200)
+        self._delete_temp_upload(response.content.decode())
+
+        self.assertEqual(self.sink.get_counter(
+            REQUESTS, endpoint='process', method='POST', status='200'), 1)
+        self.assertEqual(self.sink.get_histogram(
+            REQUEST_DURATION, endpoint='process', method='POST')['count'], 1)
+        self.assertGreater(self.sink.get_counter(
+            RECEIVED_BYTES, endpoint='process'), len(self.file_content))
+        self.assertEqual(self._phase_count('parse'), 1)
+        self.assertEqual(self._phase_count('temp_upload_save'), 1)
+        self.assertEqual(self.sink.get_gauge(ACTIVE_UPLOADS), 0)
+
+    def test_process_sent_bytes(self):
+        response = self.client.post(reverse('process'), {
+            'filepond': SimpleUploadedFile('test.txt', self.file_content)})
+        self.assertEqual(response.status_code, 200)
+        self._delete_temp_upload(response.content.decode())
+        self.assertEqual(self.sink.get_counter(SENT_BYTES,
+                                               endpoint='process'),
+                         len(response.content))
+
+    def test_chunked_upload_metrics(self):
+        response = self.client.post(
+            reverse('process'), {'filepond': '{}'},
+            HTTP_UPLOAD_LENGTH=str(len(self.file_content)))
+        upload_id = response.content.decode()
+        self.addCleanup(self._delete_temp_upload, upload_id)
+        self.assertEqual(self.sink.get_gauge(CHUNK_DIRS), 1)
+        self.assertEqual(self._phase_count('chunk_upload_init'), 1)
+
+        half = len(self.file_content) // 2
+        for (offset, chunk) in ((0, self.file_content[:half]),
+                                (half, self.file_content[half:])):
+            response = self.client.patch(
+                reverse('patch', args=[upload_id]), data=chunk,
+                content_type='application/offset+octet-stream',
+                HTTP_UPLOAD_OFFSET=str(offset),
+                HTTP_UPLOAD_LENGTH=str(len(self.file_content)),
+                HTTP_UPLOAD_NAME='test.txt')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.sink.get_counter(
+            REQUESTS, endpoint='patch', method='PATCH', status='200'), 2)
+        self.assertEqual(self.sink.get_counter(
+            RECEIVED_BYTES, endpoint='patch'), len(self.file_content))
+        self.assertEqual(self._phase_count('chunk_write'), 2)
+        self.assertEqual(self._phase_count('chunk_state_save'), 2)
+        self.assertEqual(self._phase_count('reassemble'), 1)
+        self.assertEqual(self.sink.get_gauge(CHUNK_DIRS), 0)
+        self.assertEqual(self.sink.get_gauge(ACTIVE_UPLOADS), 0)
+
+    def test_restore_sent_bytes(self):
+        tu = self._create_temp_upload()
+        response = self.client.get(reverse('restore') +
+                                   '?id=%s' % tu.upload_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sink.get_counter(SENT_BYTES,
+                                               endpoint='restore'),
+                         len(self.file_content))
+
+    def test_store_upload_phases(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, True)
+        self.addCleanup(load_config)
+        tu = self._create_temp_upload()
+        with patch.object(local_settings, 'FILE_STORE_PATH', store_dir), \
+                patch.object(local_settings, 'STORAGES_BACKEND', None):
+            load_config()
+            store_upload(tu.upload_id, os.path.join('dir1', 'file1.txt'))
+        self.assertEqual(self._phase_count('store_local'), 1)
+        self.assertEqual(self._phase_count('store_db_write'), 1)
+        self.assertEqual(self._phase_count('store_remote'), 0)
+
+    def test_histogram_buckets(self):
+        sink = InMemoryMetricsSink(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            sink.observe('test_seconds', value, {'label': 'a'})
+        self.assertEqual(sink.get_histogram('test_seconds', label='a'), {
+            'buckets': [(0.1, 1), (1.0, 2)], 'sum': 5.55, 'count': 3})
+        self.assertIsNone(sink.get_histogram('test_seconds', label='b'))
+
+    def test_render_prometheus(self):
+        sink = InMemoryMetricsSink(buckets=(0.1, 1.0))
+        sink.increment('test_total', 2, {'endpoint': 'load'})
+        sink.adjust_gauge('test_active', 1)
+        sink.observe('test_seconds', 0.5)
+        self.assertEqual(sink.render_prometheus(), '\n'.join([
+            '# TYPE test_total counter',
+            'test_total{endpoint="load"} 2',
+            '# TYPE test_active gauge',
+            'test_active 1',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 0',
+            'test_seconds_bucket{le="1.0"} 1',
+            'test_seconds_bucket{le="+Inf"} 1',
+            'test_seconds_sum 0.5',
+            'test_seconds_count 1']) + '\n')
+
+    def test_metrics_view(self):
+        self.sink.increment(REQUESTS, 1, {'endpoint': 'load'})
+        view = MetricsView.as_view()
+        response = view(RequestFactory().get('/metrics/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], PROMETHEUS_CONTENT_TYPE)
+        self.assertIn(b'drf_filepond_requests_total{endpoint="load"} 1',
+                      response.content)
+        with patch.object(local_settings, 'METRICS_SINK', None):
+            response = view(RequestFactory().get('/metrics/'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_statsd_sink(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        sink = StatsdMetricsSink(host='127.0.0.1',
+                                 port=server.getsockname()[1])
+        sink.increment(REQUESTS, 1, {'endpoint': 'patch', 'status': '200'})
+        sink.observe(PHASE_DURATION, 0.25, {'phase': 'chunk_write'})
+        sink.adjust_gauge(ACTIVE_UPLOADS, -1)
+        self.assertEqual(
+            [server.recvfrom(1024)[0] for _ in range(3)],
+            [b'drf_filepond.requests_total.patch.200:1|c',
+             b'drf_filepond.phase_duration_seconds.chunk_write:250.000|ms',
+             b'drf_filepond.active_uploads:-1|g'])
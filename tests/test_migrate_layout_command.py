@@ -0,0 +1,165 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from six import StringIO
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.chunk_state import delete_chunk_state, \
+    init_chunk_state, load_chunk_state
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, storage
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+CACHE_BACKEND = 'django_drf_filepond.chunk_state.CacheChunkStateBackend'
+FILE_BACKEND = 'django_drf_filepond.chunk_state.FileChunkStateBackend'
+
+
+#########################################################################
+# Tests for the migrate_upload_tmp_layout management command:
+#
+# test_migrate_to_sharded: Check that flat temporary upload and chunked
+#    upload directories are moved into shard directories and the records
+#    are updated.
+#
+# test_migrate_to_flat: Check that sharded directories are moved back to
+#    the flat layout and that the empty shard directories are removed.
+#
+# test_migrate_shared_dir: Check that a directory shared by a chunked upload
+#    and a temporary upload is moved once and both records are updated.
+#
+# test_migrate_chunk_state: Check that the upload directory held by the
+#    CacheChunkStateBackend and FileChunkStateBackend for a chunked upload
+#    is updated when its directory is moved.
+#
+# test_migrate_dry_run: Check that a dry run reports the directories to be
+#    moved without moving anything or updating records.
+#
+# test_migrate_invalid_options: Check that an invalid batch size results in
+#    a CommandError.
+#
+class MigrateUploadTmpLayoutTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        patchers = [
+            patch.object(storage, 'location', self.tmp_dir),
+            patch.object(storage, 'base_location', self.tmp_dir)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, True)
+
+    def _create_temp_upload(self, upload_dir):
+        upload_id = os.path.basename(upload_dir)
+        os.makedirs(os.path.join(self.tmp_dir, upload_dir))
+        with open(os.path.join(self.tmp_dir, upload_dir, 'file_id'),
+                  'wb') as f:
+            f.write(b'Some test data')
+        return TemporaryUpload.objects.create(
+            upload_id=upload_id, file_id=_get_file_id(),
+            file=os.path.join(upload_dir, 'file_id'), upload_name='test.txt',
+            upload_type=TemporaryUpload.FILE_DATA)
+
+    def _create_chunked_upload(self, upload_dir):
+        upload_id = os.path.basename(upload_dir)
+        if not os.path.exists(os.path.join(self.tmp_dir, upload_dir)):
+            os.makedirs(os.path.join(self.tmp_dir, upload_dir))
+        return TemporaryUploadChunked.objects.create(
+            upload_id=upload_id, file_id=_get_file_id(),
+            upload_dir=upload_dir, last_chunk=1, offset=10, total_size=100)
+
+    def _call_command(self, depth, *args):
+        out = StringIO()
+        with patch.object(local_settings, 'UPLOAD_TMP_SHARD_DEPTH', depth):
+            call_command('migrate_upload_tmp_layout', *args, stdout=out)
+        return out.getvalue()
+
+    def test_migrate_to_sharded(self):
+        tu_id = _get_file_id()
+        tuc_id = _get_file_id()
+        self._create_temp_upload(tu_id)
+        self._create_chunked_upload(tuc_id)
+        output = self._call_command(2)
+
+        self.assertIn('Moved 2 temporary upload directories', output)
+        tu_dir = os.path.join(tu_id[:2], tu_id[2:4], tu_id)
+        tu = TemporaryUpload.objects.get(upload_id=tu_id)
+        self.assertEqual(tu.file.name, os.path.join(tu_dir, 'file_id'))
+        self.assertTrue(os.path.exists(tu.get_file_path()))
+        tuc_dir = os.path.join(tuc_id[:2], tuc_id[2:4], tuc_id)
+        self.assertEqual(TemporaryUploadChunked.objects.get(
+            upload_id=tuc_id).upload_dir, tuc_dir)
+        self.assertTrue(os.path.isdir(os.path.join(self.tmp_dir, tuc_dir)))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, tu_id)))
+
+    def test_migrate_to_flat(self):
+        tu_id = _get_file_id()
+        self._create_temp_upload(os.path.join(tu_id[:2], tu_id))
+        output = self._call_command(0)
+
+        self.assertIn('Moved 1 temporary upload directories', output)
+        tu = TemporaryUpload.objects.get(upload_id=tu_id)
+        self.assertEqual(tu.file.name, os.path.join(tu_id, 'file_id'))
+        self.assertTrue(os.path.exists(tu.get_file_path()))
+        self.assertEqual(os.listdir(self.tmp_dir), [tu_id])
+
+    def test_migrate_shared_dir(self):
+        upload_id = _get_file_id()
+        self._create_temp_upload(upload_id)
+        self._create_chunked_upload(upload_id)
+        output = self._call_command(1)
+
+        self.assertIn('Moved 1 temporary upload directories', output)
+        new_dir = os.path.join(upload_id[:2], upload_id)
+        self.assertEqual(TemporaryUploadChunked.objects.get(
+            upload_id=upload_id).upload_dir, new_dir)
+        self.assertTrue(os.path.exists(TemporaryUpload.objects.get(
+            upload_id=upload_id).get_file_path()))
+
+    def test_migrate_chunk_state(self):
+        for backend in (CACHE_BACKEND, FILE_BACKEND):
+            upload_id = _get_file_id()
+            with patch.object(local_settings, 'CHUNK_STATE_BACKEND',
+                              backend):
+                tuc = self._create_chunked_upload(upload_id)
+                init_chunk_state(tuc)
+                self._call_command(1)
+
+                new_dir = os.path.join(upload_id[:2], upload_id)
+                with patch.object(local_settings, 'UPLOAD_TMP_SHARD_DEPTH',
+                                  1):
+                    tuc = load_chunk_state(upload_id)
+                self.assertEqual(tuc.upload_dir, new_dir)
+                self.assertEqual(tuc.offset, 10)
+                delete_chunk_state(tuc)
+
+    def test_migrate_dry_run(self):
+        tu_id = _get_file_id()
+        self._create_temp_upload(tu_id)
+        output = self._call_command(1, '--dry-run')
+
+        self.assertIn('Would move %s -> %s'
+                      % (tu_id, os.path.join(tu_id[:2], tu_id)), output)
+        self.assertIn('Would move 1 temporary upload directories', output)
+        tu = TemporaryUpload.objects.get(upload_id=tu_id)
+        self.assertEqual(tu.file.name, os.path.join(tu_id, 'file_id'))
+        self.assertTrue(os.path.isdir(os.path.join(self.tmp_dir, tu_id)))
+
+    def test_migrate_invalid_options(self):
+        with self.assertRaises(CommandError):
+            self._call_command(1, '--batch-size', '0')
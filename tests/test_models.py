@@ -1,9 +1,18 @@
 import logging
 import os
+import shutil
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test.testcases import TestCase
 import django_drf_filepond.models as models
 import django_drf_filepond.drf_filepond_settings as local_settings
 import django.conf
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
 LOG = logging.getLogger(__name__)
 
 
@@ -16,6 +25,17 @@ LOG = logging.getLogger(__name__)
 # test_models_attributes_upload_temp_default: Check that the temp upload
 #    directory is set to a sensible default when UPLOAD_TMP is not in settings.
 #
+# test_get_upload_dir_flat: Check that the upload directory is the upload ID
+#    when UPLOAD_TMP_SHARD_DEPTH is 0.
+#
+# test_get_upload_dir_sharded: Check that the upload directory is nested in
+#    shard directories named from the upload ID when UPLOAD_TMP_SHARD_DEPTH
+#    is set and that get_upload_path uses this directory.
+#
+# test_delete_temp_upload_dir_depth_changed: Check that deleting a
+#    TemporaryUpload removes the directory containing its file when the
+#    upload was created with a different UPLOAD_TMP_SHARD_DEPTH.
+#
 class ModelsTestCase(TestCase):
 
     def test_models_attributes_upload_temp_from_settings(self):
@@ -43,3 +63,35 @@ class ModelsTestCase(TestCase):
             local_settings.UPLOAD_TMP = getattr(
                 django.conf.settings, local_settings._app_prefix+'UPLOAD_TMP',
                 os.path.join(local_settings.BASE_DIR, 'filepond_uploads'))
+
+    def test_get_upload_dir_flat(self):
+        with patch.object(local_settings, 'UPLOAD_TMP_SHARD_DEPTH', 0):
+            self.assertEqual(models.get_upload_dir('abcdefghijklmnopqrstuv'),
+                             'abcdefghijklmnopqrstuv')
+
+    def test_get_upload_dir_sharded(self):
+        upload_id = 'abcdefghijklmnopqrstuv'
+        with patch.object(local_settings, 'UPLOAD_TMP_SHARD_DEPTH', 2):
+            self.assertEqual(models.get_upload_dir(upload_id),
+                             os.path.join('ab', 'cd', upload_id))
+            tu = models.TemporaryUpload(upload_id=upload_id)
+            self.assertEqual(models.get_upload_path(tu, 'file_id'),
+                             os.path.join('ab', 'cd', upload_id, 'file_id'))
+
+    def test_delete_temp_upload_dir_depth_changed(self):
+        upload_id = 'abcdefghijklmnopqrstuv'
+        with patch.object(local_settings, 'UPLOAD_TMP_SHARD_DEPTH', 1):
+            tu = models.TemporaryUpload(
+                upload_id=upload_id, file_id='bcdefghijklmnopqrstuvw',
+                file=SimpleUploadedFile('test.txt', b'Some test data'),
+                upload_name='test.txt',
+                upload_type=models.TemporaryUpload.FILE_DATA)
+            tu.save()
+        shard_dir = os.path.join(models.storage.location, 'ab')
+        self.addCleanup(shutil.rmtree, shard_dir, True)
+        file_dir = os.path.dirname(tu.get_file_path())
+        self.assertEqual(file_dir, os.path.join(shard_dir, upload_id))
+        with patch.object(local_settings, 'UPLOAD_TMP_SHARD_DEPTH', 0), \
+                patch.object(local_settings, 'DELETE_UPLOAD_TMP_DIRS', True):
+            tu.delete()
+        self.assertFalse(os.path.exists(file_dir))
@@ -1,10 +1,14 @@
+import hashlib
 import logging
+import os
 
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.response import Response
 
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, storage
 from django_drf_filepond.utils import _get_file_id
 
 # Python 2/3 support
@@ -35,6 +39,11 @@ LOG = logging.getLogger(__name__)
 #    request to continue an upload with an invalid ID. In this case invalid
 #    means that the ID conforms to the 22-character spec but it is unknown.
 #
+# test_chunked_upload_complete: Carry out a real chunked upload, a POST
+#    request followed by a PATCH request for each of three chunks, and check
+#    that the final PATCH request reassembles the file, records its metadata
+#    and removes the chunk files.
+#
 
 
 class ProcessTestCase(TestCase):
@@ -87,3 +96,44 @@ class ProcessTestCase(TestCase):
         response = self.client.head(req_url)
         self.assertEqual(response.data, 'Invalid upload ID specified.')
         self.assertEqual(response.status_code, 404)
+
+    def test_chunked_upload_complete(self):
+        file_content = b'This is the file data for a chunked upload.'
+        response = self.client.post(
+            reverse('process'), {'filepond': '{}'},
+            HTTP_UPLOAD_LENGTH=str(len(file_content)))
+        self.assertEqual(response.status_code, 200)
+        upload_id = response.content.decode()
+        self.addCleanup(self._delete_temp_upload, upload_id)
+        chunk_dir = os.path.join(
+            storage.base_location,
+            TemporaryUploadChunked.objects.get(upload_id=upload_id).upload_dir)
+
+        chunk_size = len(file_content) // 3 + 1
+        for offset in range(0, len(file_content), chunk_size):
+            response = self.client.patch(
+                reverse('patch', args=[upload_id]),
+                data=file_content[offset:offset + chunk_size],
+                content_type='application/offset+octet-stream',
+                HTTP_UPLOAD_OFFSET=str(offset),
+                HTTP_UPLOAD_LENGTH=str(len(file_content)),
+                HTTP_UPLOAD_NAME='test.txt')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertFalse(TemporaryUploadChunked.objects.filter(
+            upload_id=upload_id).exists())
+        tu = TemporaryUpload.objects.get(upload_id=upload_id)
+        with open(tu.get_file_path(), 'rb') as f:
+            self.assertEqual(f.read(), file_content)
+        self.assertEqual(os.listdir(chunk_dir), [tu.file_id])
+        self.assertEqual(tu.size, len(file_content))
+        self.assertEqual(tu.content_type, 'text/plain')
+        self.assertEqual(tu.sniffed_type, 'text/plain')
+        self.assertEqual(tu.digest,
+                         hashlib.sha256(file_content).hexdigest())
+
+    def _delete_temp_upload(self, upload_id):
+        for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+            tu.delete()
+        for tuc in TemporaryUploadChunked.objects.filter(upload_id=upload_id):
+            tuc.delete()
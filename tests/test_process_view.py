@@ -16,6 +16,7 @@ from six import ensure_text
 
 from django_drf_filepond import drf_filepond_settings
 import django_drf_filepond
+import django_drf_filepond.config as config
 import django_drf_filepond.views as views
 from tests.utils import remove_file_upload_dir_if_required
 
@@ -64,6 +65,10 @@ class ProcessTestCase(TestCase):
 
         self.rf = RequestFactory()
 
+    def tearDown(self):
+        # Rebuild the configuration snapshot from the restored settings
+        config.load_config()
+
     def test_process_data(self):
         self._process_data()
 
@@ -83,6 +88,7 @@ class ProcessTestCase(TestCase):
                       (repr(drf_filepond_settings.BASE_DIR),
                        repr(NEW_BASE_DIR)))
             drf_filepond_settings.BASE_DIR = NEW_BASE_DIR
+            config.load_config()
         except ImportError:
             LOG.debug('NO PATHLIB SUPPORT FOR PATHLIB TEST. '
                       'FALLING BACK TO USING REGULAR STRING PATHS...')
@@ -95,6 +101,10 @@ class ProcessTestCase(TestCase):
     def test_UPLOAD_TMP_not_set(self):
         upload_tmp = drf_filepond_settings.UPLOAD_TMP
         delattr(drf_filepond_settings, 'UPLOAD_TMP')
+        try:
+            config.load_config()
+        finally:
+            setattr(drf_filepond_settings, 'UPLOAD_TMP', upload_tmp)
 
         # Set up and run request
         (encoded_form, content_type) = self._get_encoded_form('testfile.dat')
@@ -107,18 +117,17 @@ class ProcessTestCase(TestCase):
         self.assertContains(response, 'The file upload path settings are '
                             'not configured correctly.', status_code=500)
 
-        setattr(drf_filepond_settings, 'UPLOAD_TMP', upload_tmp)
-
     def test_process_invalid_storage_location(self):
-        old_storage = views.storage
-        views.storage = FileSystemStorage(location='/django_test')
+        old_storage = config.storage
+        config.storage = FileSystemStorage(location='/django_test')
+        config.load_config()
         (encoded_form, content_type) = self._get_encoded_form('testfile.dat')
 
         req = self.rf.post(reverse('process'),
                            data=encoded_form, content_type=content_type)
         pv = views.ProcessView.as_view()
         response = pv(req)
-        views.storage = old_storage
+        config.storage = old_storage
         self.assertEqual(response.status_code, 500, 'Expecting 500 error due'
                          ' to invalid storage location.')
         self.assertEqual(
@@ -187,15 +196,16 @@ class ProcessTestCase(TestCase):
                                                 'data.'))
 
     def test_store_upload_with_storage_outside_BASE_DIR_without_enable(self):
-        old_storage = views.storage
-        views.storage = FileSystemStorage(location='/tmp/uploads')
+        old_storage = config.storage
+        config.storage = FileSystemStorage(location='/tmp/uploads')
+        config.load_config()
         (encoded_form, content_type) = self._get_encoded_form('testfile.dat')
 
         req = self.rf.post(reverse('process'),
                            data=encoded_form, content_type=content_type)
         pv = views.ProcessView.as_view()
         response = pv(req)
-        views.storage = old_storage
+        config.storage = old_storage
         self.assertEqual(response.status_code, 500, 'Expecting 500 error due'
                          ' to invalid storage location.')
         self.assertEqual(
@@ -205,13 +215,14 @@ class ProcessTestCase(TestCase):
              'incorrectly.'))
 
     def test_store_upload_with_storage_outside_BASE_DIR_with_enable(self):
-        old_storage = views.storage
+        old_storage = config.storage
         old_UPLOAD_TMP = drf_filepond_settings.UPLOAD_TMP
 
         drf_filepond_settings.ALLOW_EXTERNAL_UPLOAD_DIR = True
 
-        views.storage = FileSystemStorage(location='/tmp/uploads')
+        config.storage = FileSystemStorage(location='/tmp/uploads')
         drf_filepond_settings.UPLOAD_TMP = '/tmp/uploads'
+        config.load_config()
 
         (encoded_form, content_type) = self._get_encoded_form('testfile.dat')
 
@@ -219,7 +230,7 @@ class ProcessTestCase(TestCase):
                            data=encoded_form, content_type=content_type)
         pv = views.ProcessView.as_view()
         response = pv(req)
-        views.storage = old_storage
+        config.storage = old_storage
         drf_filepond_settings.UPLOAD_TMP = old_UPLOAD_TMP
         drf_filepond_settings.ALLOW_EXTERNAL_UPLOAD_DIR = False
         # Remove the TemporaryUpload object to remove the file created on
@@ -232,6 +243,7 @@ class ProcessTestCase(TestCase):
         upload_tmp = drf_filepond_settings.UPLOAD_TMP
         drf_filepond_settings.UPLOAD_TMP = os.path.join(
             drf_filepond_settings.BASE_DIR, '..', '..', 'some_dir')
+        config.load_config()
 
         # Set up and run request
         (encoded_form, content_type) = self._get_encoded_form('testfile.dat')
@@ -0,0 +1,191 @@
+import logging
+import os
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from six import StringIO
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.chunk_state import CHUNK_STATE_FILE_NAME, \
+    delete_chunk_state, init_chunk_state, load_chunk_state
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, TemporaryUploadFetch, storage
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the purge_temp_uploads management command:
+#
+# test_purge_expired_temp_uploads: Check that temporary uploads older than
+#    the max age are removed along with their files and directories while
+#    newer uploads are retained.
+#
+# test_purge_expired_chunked_uploads: Check that expired incomplete chunked
+#    uploads are removed along with their chunk files and directory.
+#
+# test_purge_chunk_state_file: Check that the file holding the progress of
+#    an expired chunked upload when using FileChunkStateBackend is removed
+#    along with the chunk directory.
+#
+# test_purge_cached_chunk_state: Check that the progress of an expired
+#    chunked upload held by CacheChunkStateBackend is removed so that the
+#    upload can't be continued.
+#
+# test_purge_expired_fetch_jobs: Check that expired fetch job records are
+#    removed.
+#
+# test_purge_batches: Check that records are removed correctly when there
+#    are more expired records than the batch size.
+#
+# test_purge_dry_run: Check that a dry run reports the expired records but
+#    doesn't remove any records or files.
+#
+# test_purge_invalid_options: Check that invalid option values result in a
+#    CommandError.
+#
+class PurgeTempUploadsTestCase(TestCase):
+
+    def setUp(self):
+        self.old_time = timezone.now() - timedelta(days=2)
+
+    def _create_temp_upload(self, expired):
+        upload_id = _get_file_id()
+        tu = TemporaryUpload(
+            upload_id=upload_id, file_id=_get_file_id(),
+            file=SimpleUploadedFile('test.txt', b'Some test data'),
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        if expired:
+            TemporaryUpload.objects.filter(upload_id=upload_id).update(
+                uploaded=self.old_time)
+        return TemporaryUpload.objects.get(upload_id=upload_id)
+
+    def _create_chunked_upload(self, expired):
+        upload_id = _get_file_id()
+        file_id = _get_file_id()
+        chunk_dir = os.path.join(storage.base_location, upload_id)
+        os.makedirs(chunk_dir)
+        for i in range(1, 3):
+            with open(os.path.join(chunk_dir, '%s_%s' % (file_id, i)),
+                      'wb') as f:
+                f.write(b'chunk data')
+        tuc = TemporaryUploadChunked.objects.create(
+            upload_id=upload_id, file_id=file_id, upload_dir=upload_id,
+            last_chunk=2, offset=20, total_size=100)
+        if expired:
+            TemporaryUploadChunked.objects.filter(upload_id=upload_id).update(
+                last_upload_time=self.old_time)
+        return tuc
+
+    def _call_command(self, *args):
+        out = StringIO()
+        call_command('purge_temp_uploads', *args, stdout=out)
+        return out.getvalue()
+
+    def test_purge_expired_temp_uploads(self):
+        expired = self._create_temp_upload(True)
+        current = self._create_temp_upload(False)
+        expired_path = expired.get_file_path()
+        output = self._call_command()
+
+        self.assertIn('Removed 1 temporary uploads (1 files)', output)
+        self.assertFalse(TemporaryUpload.objects.filter(
+            upload_id=expired.upload_id).exists())
+        self.assertFalse(os.path.exists(expired_path))
+        self.assertFalse(os.path.exists(os.path.dirname(expired_path)))
+        self.assertTrue(TemporaryUpload.objects.filter(
+            upload_id=current.upload_id).exists())
+        self.assertTrue(os.path.exists(current.get_file_path()))
+        current.delete()
+
+    def test_purge_expired_chunked_uploads(self):
+        expired = self._create_chunked_upload(True)
+        current = self._create_chunked_upload(False)
+        output = self._call_command()
+
+        self.assertIn('Removed 1 chunked uploads (2 files)', output)
+        self.assertFalse(TemporaryUploadChunked.objects.filter(
+            upload_id=expired.upload_id).exists())
+        self.assertFalse(os.path.exists(
+            os.path.join(storage.base_location, expired.upload_dir)))
+        self.assertTrue(TemporaryUploadChunked.objects.filter(
+            upload_id=current.upload_id).exists())
+        current_dir = os.path.join(storage.base_location, current.upload_dir)
+        self.assertEqual(len(os.listdir(current_dir)), 2)
+        for entry in os.listdir(current_dir):
+            os.remove(os.path.join(current_dir, entry))
+        os.rmdir(current_dir)
+
+    def test_purge_chunk_state_file(self):
+        expired = self._create_chunked_upload(True)
+        chunk_dir = os.path.join(storage.base_location, expired.upload_dir)
+        with open(os.path.join(chunk_dir, CHUNK_STATE_FILE_NAME), 'w') as f:
+            f.write('{}')
+        self._call_command()
+        self.assertFalse(os.path.exists(chunk_dir))
+
+    @patch.object(local_settings, 'CHUNK_STATE_BACKEND',
+                  'django_drf_filepond.chunk_state.CacheChunkStateBackend')
+    def test_purge_cached_chunk_state(self):
+        expired = self._create_chunked_upload(True)
+        init_chunk_state(expired)
+        self.addCleanup(delete_chunk_state, expired)
+        self.assertEqual(load_chunk_state(expired.upload_id).offset, 20)
+        self._call_command()
+        with self.assertRaises(TemporaryUploadChunked.DoesNotExist):
+            load_chunk_state(expired.upload_id)
+
+    def test_purge_expired_fetch_jobs(self):
+        expired_id = _get_file_id()
+        current_id = _get_file_id()
+        for upload_id in (expired_id, current_id):
+            TemporaryUploadFetch.objects.create(
+                upload_id=upload_id, target_url='http://localhost/test.txt')
+        TemporaryUploadFetch.objects.filter(upload_id=expired_id).update(
+            last_update_time=self.old_time)
+        output = self._call_command()
+
+        self.assertIn('Removed 1 fetch jobs', output)
+        self.assertEqual(
+            list(TemporaryUploadFetch.objects.values_list('upload_id',
+                                                          flat=True)),
+            [current_id])
+
+    def test_purge_batches(self):
+        uploads = [self._create_temp_upload(True) for _ in range(5)]
+        output = self._call_command('--batch-size', '2', '--workers', '2')
+
+        self.assertIn('Removed 5 temporary uploads (5 files)', output)
+        self.assertEqual(TemporaryUpload.objects.count(), 0)
+        for tu in uploads:
+            self.assertFalse(os.path.exists(os.path.join(
+                storage.location, tu.upload_id)))
+
+    def test_purge_dry_run(self):
+        expired = self._create_temp_upload(True)
+        output = self._call_command('--dry-run')
+
+        self.assertIn('Would remove %s' % expired.upload_id, output)
+        self.assertIn('Would remove 1 temporary uploads', output)
+        self.assertTrue(TemporaryUpload.objects.filter(
+            upload_id=expired.upload_id).exists())
+        self.assertTrue(os.path.exists(expired.get_file_path()))
+        expired.delete()
+
+    def test_purge_invalid_options(self):
+        with self.assertRaises(CommandError):
+            self._call_command('--max-age', '-1')
+        with self.assertRaises(CommandError):
+            self._call_command('--batch-size', '0')
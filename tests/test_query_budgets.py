@@ -0,0 +1,292 @@
+'''
+Tests that check the number of database queries carried out by each of the
+filepond endpoints and the API functions against an explicit budget so that
+changes adding queries to these paths are detected.
+
+The budgets are for the default configuration, i.e. chunk progress held
+using DatabaseChunkStateBackend and no stored upload cache or read replica,
+other than where a budget states otherwise. The budgets for the
+asynchronous API functions are checked in tests/test_async_api.py since that
+module requires Django 4.2 or later.
+
+If a change legitimately alters the number of queries for a path, update
+its budget in QUERY_BUDGETS and explain the change in the commit message.
+'''
+import logging
+import os
+import shutil
+import tempfile
+
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.api import delete_stored_upload, \
+    delete_temp_uploads, get_stored_upload, store_upload
+from django_drf_filepond.config import load_config
+from django_drf_filepond.models import StoredUpload, TemporaryUpload, \
+    TemporaryUploadChunked, TemporaryUploadFetch
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+LOG = logging.getLogger(__name__)
+
+# The number of queries carried out by each path
+QUERY_BUDGETS = {
+    # Insert the TemporaryUpload
+    'process': 1,
+    # Insert the TemporaryUploadChunked
+    'process_chunk_init': 1,
+    # Load the TemporaryUploadChunked and update its progress
+    'patch': 2,
+    # As for patch, then insert the TemporaryUpload and delete the
+    # TemporaryUploadChunked
+    'patch_final': 4,
+    # Load the TemporaryUploadChunked
+    'patch_head': 1,
+    # Load and delete the TemporaryUpload
+    'revert': 2,
+    # Look up the StoredUpload by upload ID (or by file path)
+    'load': 1,
+    # Load the TemporaryUpload
+    'restore': 1,
+    # Insert the TemporaryUpload for the fetched file
+    'fetch_head': 1,
+    # The fetched file is returned without being stored
+    'fetch_get': 0,
+    # Load the TemporaryUploadFetch
+    'fetch_status': 1,
+    # Load the TemporaryUpload, insert the StoredUpload and delete the
+    # TemporaryUpload
+    'store_upload': 3,
+    'get_stored_upload': 1,
+    # With the stored upload cache enabled, a miss looks up the StoredUpload
+    # and a hit is served from the cache
+    'get_stored_upload_cache_miss': 1,
+    'get_stored_upload_cache_hit': 0,
+    # Look up and delete the StoredUpload
+    'delete_stored_upload': 2,
+    # Get the file paths of the batch and bulk delete the records
+    'delete_temp_uploads': 2,
+    # The asynchronous API functions make the same queries as their
+    # synchronous versions, see tests/test_async_api.py
+    'astore_upload': 3,
+    'aget_stored_upload': 1,
+    'adelete_stored_upload': 2,
+}
+
+
+#########################################################################
+# Tests for the query budgets:
+#
+# test_process_query_budget: Check the queries for a standard upload.
+#
+# test_chunked_upload_query_budget: Check the queries for each request of
+#    a chunked upload: the initial POST, each PATCH, the final PATCH that
+#    reassembles the upload and a HEAD request to restart an upload.
+#
+# test_revert_query_budget: Check the queries to revert a temporary upload,
+#    including those made by the post_delete signal handler.
+#
+# test_load_query_budget: Check the queries to load a stored upload by its
+#    upload ID and by its file path.
+#
+# test_restore_query_budget: Check the queries to restore a temporary
+#    upload.
+#
+# test_fetch_query_budget: Check the queries for HEAD and GET requests to
+#    the fetch endpoint.
+#
+# test_fetch_status_query_budget: Check the queries to get the status of an
+#    asynchronous fetch job.
+#
+# test_api_query_budgets: Check the queries made by store_upload,
+#    get_stored_upload, delete_stored_upload and delete_temp_uploads.
+#
+# test_get_stored_upload_cached_query_budget: Check the queries made by
+#    get_stored_upload for a cache miss and a cache hit when the stored
+#    upload cache is enabled.
+#
+class QueryBudgetTestCase(TestCase):
+
+    def setUp(self):
+        self.file_content = b'This is some test file data for an upload.'
+
+    def _delete_temp_upload(self, upload_id):
+        for tu in TemporaryUpload.objects.filter(upload_id=upload_id):
+            tu.delete()
+
+    def _create_temp_upload(self):
+        tu = TemporaryUpload(
+            upload_id=_get_file_id(), file_id=_get_file_id(),
+            file=SimpleUploadedFile('test.txt', self.file_content),
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+        tu.save()
+        self.addCleanup(self._delete_temp_upload, tu.upload_id)
+        return tu
+
+    def _assert_budget(self, path):
+        return self.assertNumQueries(QUERY_BUDGETS[path])
+
+    def _patch_chunk(self, upload_id, offset, chunk):
+        return self.client.patch(
+            reverse('patch', args=[upload_id]), data=chunk,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_LENGTH=str(len(self.file_content)),
+            HTTP_UPLOAD_NAME='test.txt')
+
+    def _use_local_file_store(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, True)
+        self.addCleanup(load_config)
+        for patcher in (
+                patch.object(local_settings, 'FILE_STORE_PATH', store_dir),
+                patch.object(local_settings, 'STORAGES_BACKEND', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        load_config()
+
+    def test_process_query_budget(self):
+        with self._assert_budget('process'):
+            response = self.client.post(reverse('process'), {
+                'filepond': SimpleUploadedFile('test.txt',
+                                               self.file_content)})
+        self.assertEqual(response.status_code, 200)
+        self._delete_temp_upload(response.content.decode())
+
+    def test_chunked_upload_query_budget(self):
+        with self._assert_budget('process_chunk_init'):
+            response = self.client.post(
+                reverse('process'), {'filepond': '{}'},
+                HTTP_UPLOAD_LENGTH=str(len(self.file_content)))
+        upload_id = response.content.decode()
+        self.addCleanup(self._delete_temp_upload, upload_id)
+
+        third = len(self.file_content) // 3
+        for offset in (0, third):
+            with self._assert_budget('patch'):
+                response = self._patch_chunk(
+                    upload_id, offset,
+                    self.file_content[offset:offset + third])
+            self.assertEqual(response.status_code, 200)
+
+        with self._assert_budget('patch_head'):
+            response = self.client.head(reverse('patch', args=[upload_id]))
+        self.assertEqual(response['Upload-Offset'], str(2 * third))
+
+        with self._assert_budget('patch_final'):
+            response = self._patch_chunk(upload_id, 2 * third,
+                                         self.file_content[2 * third:])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(TemporaryUpload.objects.filter(
+            upload_id=upload_id).exists())
+        self.assertFalse(TemporaryUploadChunked.objects.filter(
+            upload_id=upload_id).exists())
+
+    def test_revert_query_budget(self):
+        tu = self._create_temp_upload()
+        with self._assert_budget('revert'):
+            response = self.client.delete(reverse('revert'),
+                                          data=tu.upload_id,
+                                          content_type='text/plain')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).exists())
+
+    def test_load_query_budget(self):
+        self._use_local_file_store()
+        file_path = os.path.join('dir1', 'test.txt')
+        os.makedirs(os.path.join(local_settings.FILE_STORE_PATH, 'dir1'))
+        with open(os.path.join(local_settings.FILE_STORE_PATH, file_path),
+                  'wb') as f:
+            f.write(self.file_content)
+        su = StoredUpload(upload_id=_get_file_id(), file=file_path,
+                          uploaded=timezone.now())
+        su.save()
+        for upload_id in (su.upload_id, file_path):
+            with patch('django_drf_filepond.views.get_stored_upload_file_data',
+                       return_value=('test.txt', self.file_content)):
+                with self._assert_budget('load'):
+                    response = self.client.get(reverse('load'),
+                                               {'id': upload_id})
+            self.assertEqual(response.status_code, 200)
+
+    def test_restore_query_budget(self):
+        tu = self._create_temp_upload()
+        with self._assert_budget('restore'):
+            response = self.client.get(reverse('restore'),
+                                       {'id': tu.upload_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.file_content)
+
+    def test_fetch_query_budget(self):
+        head_response = MagicMock(status_code=200, headers={
+            'Content-Type': 'text/plain'})
+        get_response = MagicMock(headers={})
+        get_response.__enter__.return_value = get_response
+        get_response.iter_content.side_effect = \
+            lambda chunk_size: iter([self.file_content])
+        url = reverse('fetch') + '?target=https://example.com/test.txt'
+        with patch('requests.head', return_value=head_response), \
+                patch('requests.get', return_value=get_response):
+            with self._assert_budget('fetch_head'):
+                response = self.client.head(url)
+            self.assertEqual(response.status_code, 200)
+            self.addCleanup(self._delete_temp_upload,
+                            response['X-Content-Transfer-Id'])
+            with self._assert_budget('fetch_get'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, self.file_content)
+
+    def test_fetch_status_query_budget(self):
+        job = TemporaryUploadFetch.objects.create(
+            upload_id=_get_file_id(),
+            target_url='https://example.com/test.txt')
+        with self._assert_budget('fetch_status'):
+            response = self.client.get(reverse('fetch_status'),
+                                       {'id': job.upload_id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_query_budgets(self):
+        self._use_local_file_store()
+        tu = self._create_temp_upload()
+        with self._assert_budget('store_upload'):
+            su = store_upload(tu.upload_id, os.path.join('dir1',
+                                                         'test.txt'))
+        with self._assert_budget('get_stored_upload'):
+            get_stored_upload(su.upload_id)
+        with self._assert_budget('delete_stored_upload'):
+            delete_stored_upload(su.upload_id, delete_file=True)
+
+        upload_ids = [self._create_temp_upload().upload_id
+                      for _ in range(3)]
+        with self._assert_budget('delete_temp_uploads'):
+            self.assertEqual(delete_temp_uploads(upload_ids), 3)
+
+    def test_get_stored_upload_cached_query_budget(self):
+        self._use_local_file_store()
+        patcher = patch.object(local_settings, 'STORED_UPLOAD_CACHE',
+                               'default')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        su = StoredUpload(upload_id=_get_file_id(),
+                          file=os.path.join('dir1', 'test.txt'),
+                          uploaded=timezone.now())
+        su.save()
+        with self._assert_budget('get_stored_upload_cache_miss'):
+            get_stored_upload(su.upload_id)
+        with self._assert_budget('get_stored_upload_cache_hit'):
+            self.assertEqual(get_stored_upload(su.upload_id).upload_id,
+                             su.upload_id)
@@ -0,0 +1,98 @@
+'''
+Tests checking that the lookups carried out on the django-drf-filepond
+models by the API functions and the purge_temp_uploads management command
+are able to use the indexes created by the app's migrations.
+
+The query plans are obtained using EXPLAIN. These tests are run on SQLite
+and PostgreSQL and skipped on other databases. On PostgreSQL, sequential
+scans are disabled for the duration of the query since the planner would
+otherwise choose to scan the small test tables rather than use an index.
+'''
+import logging
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.db import connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, TemporaryUploadFetch, StoredUpload
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for query plans:
+#
+# test_stored_upload_file_lookup: Check that looking up a StoredUpload by
+#    file path, as carried out by get_stored_upload, uses the file index.
+#
+# test_stored_upload_uploaded_by_lookup: Check that looking up stored
+#    uploads by user uses the uploaded_by index.
+#
+# test_temp_upload_uploaded_lookup: Check that selecting temporary uploads
+#    by upload time uses the uploaded index.
+#
+# test_chunked_upload_last_upload_time_lookup: Check that selecting
+#    chunked uploads by last upload time uses the last_upload_time index.
+#
+# test_fetch_last_update_time_lookup: Check that selecting fetch jobs by
+#    last update time uses the last_update_time index.
+#
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'),
+            'Query plan tests are only supported on SQLite and PostgreSQL')
+class QueryPlanTestCase(TestCase):
+
+    def _get_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql, params)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(col) for row in cursor.fetchall()
+                            for col in row)
+        LOG.debug('Query plan for <%s>: %s' % (sql, plan))
+        return plan
+
+    def _get_index_name(self, model, column):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        for (name, details) in constraints.items():
+            if details['index'] and details['columns'] == [column]:
+                return name
+        self.fail('No index found on column <%s> of <%s>'
+                  % (column, model._meta.db_table))
+
+    def _assert_uses_index(self, queryset, column):
+        index_name = self._get_index_name(queryset.model, column)
+        self.assertIn(index_name, self._get_plan(queryset))
+
+    def test_stored_upload_file_lookup(self):
+        self._assert_uses_index(
+            StoredUpload.objects.filter(file='dir1/test.txt'), 'file')
+
+    def test_stored_upload_uploaded_by_lookup(self):
+        self._assert_uses_index(
+            StoredUpload.objects.filter(uploaded_by_id=1), 'uploaded_by_id')
+
+    def test_temp_upload_uploaded_lookup(self):
+        self._assert_uses_index(
+            TemporaryUpload.objects.filter(
+                uploaded__lt=timezone.now() - timedelta(days=1)),
+            'uploaded')
+
+    def test_chunked_upload_last_upload_time_lookup(self):
+        self._assert_uses_index(
+            TemporaryUploadChunked.objects.filter(
+                last_upload_time__lt=timezone.now() - timedelta(days=1)),
+            'last_upload_time')
+
+    def test_fetch_last_update_time_lookup(self):
+        self._assert_uses_index(
+            TemporaryUploadFetch.objects.filter(
+                last_update_time__lt=timezone.now() - timedelta(days=1)),
+            'last_update_time')
@@ -0,0 +1,279 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from six import StringIO
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.management.commands.reconcile_uploads import \
+    ParallelScanner
+from django_drf_filepond.models import TemporaryUpload, \
+    TemporaryUploadChunked, StoredUpload, get_content_path, get_upload_dir, \
+    storage
+from django_drf_filepond.utils import _get_file_id
+
+# Python 2/3 support
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+LOG = logging.getLogger(__name__)
+
+
+#########################################################################
+# Tests for the reconcile_uploads management command:
+#
+# test_parallel_scanner_recursive: Check that a recursive scan returns the
+#    relative paths of all files in a directory tree, ignoring dot entries.
+#
+# test_parallel_scanner_top_level: Check that a scan with a dir_depth of 0
+#    returns only the directories at the top level of the tree.
+#
+# test_parallel_scanner_dir_depth: Check that a scan with a dir_depth of 1
+#    returns only the directories one level below the top level.
+#
+# test_reconcile_consistent: Check that nothing is reported when the files
+#    and records match.
+#
+# test_reconcile_orphan_temp_dir: Check that a temporary directory with no
+#    record is reported and removed with --repair.
+#
+# test_reconcile_orphan_temp_dir_min_age: Check that a recently modified
+#    temporary directory with no record is not reported.
+#
+# test_reconcile_orphan_temp_dir_sharded: Check that orphaned temporary
+#    directories are found within shard directories when
+#    UPLOAD_TMP_SHARD_DEPTH is set.
+#
+# test_reconcile_missing_temp_files: Check that TemporaryUpload and
+#    TemporaryUploadChunked records whose files are missing are reported
+#    and removed with --repair.
+#
+# test_reconcile_stored_files: Check that orphaned stored files and
+#    StoredUpload records with missing files are reported, are not
+#    repaired with --repair and are removed with --repair-stored.
+#
+# test_reconcile_stored_files_min_age: Check that a recently modified file
+#    in the file store with no record, e.g. a file being stored, is not
+#    reported or removed.
+#
+# test_reconcile_stored_file_remove_error: Check that an error removing an
+#    orphaned stored file is reported and the remaining files are removed.
+#
+# test_reconcile_content_addressed: Check that a StoredUpload in the
+#    content-addressed store is checked using its content path and that the
+#    content files aren't reported as orphaned.
+#
+# test_reconcile_remote_storage: Check that the file store isn't checked
+#    when a remote storage backend is configured.
+#
+# test_reconcile_invalid_options: Check that invalid option values result
+#    in a CommandError.
+#
+class ReconcileUploadsTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_dir = tempfile.mkdtemp()
+        patchers = [
+            patch.object(storage, 'location', self.tmp_dir),
+            patch.object(storage, 'base_location', self.tmp_dir),
+            patch.object(local_settings, 'FILE_STORE_PATH', self.store_dir),
+            patch.object(local_settings, 'STORAGES_BACKEND', None)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, True)
+        shutil.rmtree(self.store_dir, True)
+
+    def _write_file(self, *path):
+        file_path = os.path.join(*path)
+        if not os.path.exists(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, 'wb') as f:
+            f.write(b'Some test data')
+        return file_path
+
+    def _create_temp_upload(self, with_file=True):
+        upload_id = _get_file_id()
+        file_name = os.path.join(get_upload_dir(upload_id), 'test.txt')
+        if with_file:
+            self._write_file(self.tmp_dir, file_name)
+        return TemporaryUpload.objects.create(
+            upload_id=upload_id, file_id=_get_file_id(), file=file_name,
+            upload_name='test.txt', upload_type=TemporaryUpload.FILE_DATA)
+
+    def _call_command(self, *args):
+        out = StringIO()
+        call_command('reconcile_uploads', '--min-age', '0', *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_parallel_scanner_recursive(self):
+        self._write_file(self.store_dir, 'a.txt')
+        self._write_file(self.store_dir, 'dir1', 'b.txt')
+        self._write_file(self.store_dir, 'dir1', 'dir2', 'c.txt')
+        self._write_file(self.store_dir, '.hidden', 'd.txt')
+        paths = sorted(ParallelScanner(self.store_dir, 3))
+        self.assertEqual(paths, [
+            'a.txt', os.path.join('dir1', 'b.txt'),
+            os.path.join('dir1', 'dir2', 'c.txt')])
+
+    def test_parallel_scanner_top_level(self):
+        self._write_file(self.tmp_dir, 'a.txt')
+        self._write_file(self.tmp_dir, 'dir1', 'dir2', 'b.txt')
+        os.makedirs(os.path.join(self.tmp_dir, '.fetch_locks'))
+        paths = list(ParallelScanner(self.tmp_dir, 2, dir_depth=0))
+        self.assertEqual(paths, ['dir1'])
+
+    def test_parallel_scanner_dir_depth(self):
+        self._write_file(self.tmp_dir, 'ab', 'abc', 'a.txt')
+        self._write_file(self.tmp_dir, 'cd', 'cde', 'dir1', 'b.txt')
+        self._write_file(self.tmp_dir, 'ef', 'c.txt')
+        paths = sorted(ParallelScanner(self.tmp_dir, 2, dir_depth=1))
+        self.assertEqual(paths, [os.path.join('ab', 'abc'),
+                                 os.path.join('cd', 'cde')])
+
+    def test_reconcile_consistent(self):
+        self._create_temp_upload()
+        self._write_file(self.store_dir, 'stored', 'test.txt')
+        StoredUpload.objects.create(
+            upload_id=_get_file_id(),
+            file=os.path.join('stored', 'test.txt'), uploaded=timezone.now())
+        output = self._call_command()
+        self.assertIn('orphan-temp-dir=0, missing-temp-file=0, '
+                      'missing-chunk-dir=0, orphan-stored-file=0, '
+                      'missing-stored-file=0', output)
+
+    def test_reconcile_orphan_temp_dir(self):
+        tu = self._create_temp_upload()
+        orphan_id = _get_file_id()
+        self._write_file(self.tmp_dir, orphan_id, 'test.txt')
+        output = self._call_command('--batch-size', '1', '--workers', '2')
+        self.assertIn('orphan-temp-dir %s' % orphan_id, output)
+        self.assertIn('orphan-temp-dir=1', output)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, orphan_id)))
+
+        self._call_command('--repair')
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir,
+                                                     orphan_id)))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir,
+                                                    tu.upload_id)))
+
+    def test_reconcile_orphan_temp_dir_min_age(self):
+        orphan_id = _get_file_id()
+        self._write_file(self.tmp_dir, orphan_id, 'test.txt')
+        out = StringIO()
+        call_command('reconcile_uploads', '--min-age', '3600', stdout=out)
+        self.assertIn('orphan-temp-dir=0', out.getvalue())
+
+    def test_reconcile_orphan_temp_dir_sharded(self):
+        with patch.object(local_settings, 'UPLOAD_TMP_SHARD_DEPTH', 1):
+            tu = self._create_temp_upload()
+            orphan_id = _get_file_id()
+            self._write_file(self.tmp_dir, orphan_id[:2], orphan_id,
+                             'test.txt')
+            output = self._call_command()
+        self.assertIn('orphan-temp-dir %s'
+                      % os.path.join(orphan_id[:2], orphan_id), output)
+        self.assertIn('orphan-temp-dir=1', output)
+        self.assertIn(tu.upload_id[:2], os.listdir(self.tmp_dir))
+
+    def test_reconcile_missing_temp_files(self):
+        tu = self._create_temp_upload(with_file=False)
+        chunk_id = _get_file_id()
+        TemporaryUploadChunked.objects.create(
+            upload_id=chunk_id, file_id=_get_file_id(), upload_dir=chunk_id,
+            last_chunk=1, offset=10, total_size=100)
+        output = self._call_command()
+        self.assertIn('missing-temp-file %s' % tu.upload_id, output)
+        self.assertIn('missing-chunk-dir %s' % chunk_id, output)
+        self.assertTrue(TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).exists())
+
+        self._call_command('--repair')
+        self.assertFalse(TemporaryUpload.objects.filter(
+            upload_id=tu.upload_id).exists())
+        self.assertFalse(TemporaryUploadChunked.objects.filter(
+            upload_id=chunk_id).exists())
+
+    def test_reconcile_stored_files(self):
+        orphan_path = os.path.join('dir1', 'orphan.txt')
+        self._write_file(self.store_dir, orphan_path)
+        missing_id = _get_file_id()
+        StoredUpload.objects.create(upload_id=missing_id,
+                                    file=os.path.join('dir2', 'test.txt'),
+                                    uploaded=timezone.now())
+        output = self._call_command('--repair')
+        self.assertIn('orphan-stored-file %s' % orphan_path, output)
+        self.assertIn('missing-stored-file %s' % missing_id, output)
+        self.assertTrue(os.path.exists(os.path.join(self.store_dir,
+                                                    orphan_path)))
+        self.assertTrue(StoredUpload.objects.filter(
+            upload_id=missing_id).exists())
+
+        self._call_command('--repair-stored')
+        self.assertFalse(os.path.exists(os.path.join(self.store_dir,
+                                                     orphan_path)))
+        self.assertFalse(StoredUpload.objects.filter(
+            upload_id=missing_id).exists())
+
+    def test_reconcile_stored_files_min_age(self):
+        self._write_file(self.store_dir, 'new.txt')
+        out = StringIO()
+        call_command('reconcile_uploads', '--min-age', '3600',
+                     '--repair-stored', stdout=out)
+        self.assertIn('orphan-stored-file=0', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.store_dir,
+                                                    'new.txt')))
+
+    def test_reconcile_stored_file_remove_error(self):
+        self._write_file(self.store_dir, 'a.txt')
+        self._write_file(self.store_dir, 'b.txt')
+        real_remove = os.remove
+
+        def remove(path):
+            if path.endswith('a.txt'):
+                raise OSError('Permission denied')
+            real_remove(path)
+        err = StringIO()
+        with patch('os.remove', side_effect=remove):
+            call_command('reconcile_uploads', '--min-age', '0',
+                         '--repair-stored', stdout=StringIO(), stderr=err)
+        self.assertIn('Unable to remove orphaned file a.txt', err.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.store_dir,
+                                                    'a.txt')))
+        self.assertFalse(os.path.exists(os.path.join(self.store_dir,
+                                                     'b.txt')))
+
+    def test_reconcile_content_addressed(self):
+        content_hash = 'ab' * 32
+        self._write_file(self.store_dir, get_content_path(content_hash))
+        StoredUpload.objects.create(
+            upload_id=_get_file_id(), file=os.path.join('dir1', 'test.txt'),
+            uploaded=timezone.now(), content_hash=content_hash)
+        output = self._call_command()
+        self.assertIn('orphan-stored-file=0, missing-stored-file=0', output)
+
+    def test_reconcile_remote_storage(self):
+        self._write_file(self.store_dir, 'orphan.txt')
+        with patch.object(local_settings, 'STORAGES_BACKEND',
+                          'storages.backends.s3boto3.S3Boto3Storage'):
+            output = self._call_command('--repair-stored')
+        self.assertIn('orphan-stored-file=0', output)
+        self.assertTrue(os.path.exists(os.path.join(self.store_dir,
+                                                    'orphan.txt')))
+
+    def test_reconcile_invalid_options(self):
+        with self.assertRaises(CommandError):
+            self._call_command('--batch-size', '0')
+        with self.assertRaises(CommandError):
+            self._call_command('--workers', '0')
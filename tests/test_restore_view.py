@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import os
 # Switched to using Message rather than cgi.parse_header for parsing and
@@ -44,6 +45,13 @@ LOG = logging.getLogger(__name__)
 # test_restore_successful_request: Make a GET request to the restore endpoint
 #     that is successful.
 #
+# test_restore_metadata_headers: Check that the Content-Type, Content-Length
+#     and ETag headers are set from the metadata stored with the upload.
+#
+# test_restore_not_modified: Make a GET request to the restore endpoint with
+#     an If-None-Match header matching the upload's ETag and check that a 304
+#     response is returned.
+#
 class RestoreTestCase(TestCase):
 
     def setUp(self):
@@ -127,6 +135,25 @@ class RestoreTestCase(TestCase):
         self.assertEqual(response.content.decode(), self.file_content,
                          'The response data is invalid.')
 
+    def test_restore_metadata_headers(self):
+        response = self.client.get((reverse('restore') +
+                                    ('?id=%s' % self.upload_id)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Length'],
+                         str(len(self.file_content)))
+        self.assertEqual(response['ETag'], '"%s"' % hashlib.sha256(
+            self.file_content.encode()).hexdigest())
+
+    def test_restore_not_modified(self):
+        etag = '"%s"' % hashlib.sha256(self.file_content.encode()).hexdigest()
+        response = self.client.get(
+            (reverse('restore') + ('?id=%s' % self.upload_id)),
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
     def tearDown(self):
         upload_tmp_base = getattr(settings,
                                   'DJANGO_DRF_FILEPOND_UPLOAD_TMP',
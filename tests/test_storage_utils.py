@@ -0,0 +1,165 @@
+'''
+Tests for the storage backend registry in django_drf_filepond.storage_utils
+that holds a single shared instance of each configured storage backend.
+'''
+import logging
+import threading
+import time
+
+from django.test import TestCase
+from django.utils.functional import empty
+
+import django_drf_filepond.drf_filepond_settings as local_settings
+from django_drf_filepond.config import load_config
+from django_drf_filepond.models import DrfFilePondStoredStorage, \
+    StoredUpload
+from django_drf_filepond.storage_utils import get_storage_backend, \
+    get_storage_backend_stats, reset_storage_backends
+
+# Python 2/3 support
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+LOG = logging.getLogger(__name__)
+
+SFTP_BACKEND = 'storages.backends.sftpstorage.SFTPStorage'
+
+
+#########################################################################
+# Tests for the storage backend registry:
+#
+# test_local_storage: Check that None is returned for the default backend
+#    when STORAGES_BACKEND isn't set.
+#
+# test_backend_created_once: Check that the backend class is only
+#    instantiated the first time the backend is requested.
+#
+# test_backend_created_once_threads: Check that the backend is only
+#    instantiated once when it's first requested from several threads.
+#
+# test_named_backend: Check that a backend set in STORAGES_BACKENDS is
+#    created with the specified options.
+#
+# test_unknown_backend: Check that a KeyError is raised when requesting a
+#    backend that hasn't been configured.
+#
+# test_reset_storage_backends: Check that backends are created again after
+#    the registry is reset.
+#
+# test_stored_storage_shares_backend: Check that the storage used for stored
+#    uploads uses the registry's instance of the backend.
+#
+# test_reset_stored_storage: Check that resetting the registry also resets
+#    the storage used for stored uploads so that it uses the new instance.
+#
+# test_storage_backend_stats: Check the details reported for each backend,
+#    including the connection pool details provided by a backend.
+#
+# test_storage_backend_stats_client_config: Check that the pool size set in
+#    the botocore client configuration of an S3 backend is reported.
+#
+class StorageBackendRegistryTestCase(TestCase):
+
+    def setUp(self):
+        # Rebuild the registry and configuration from the restored settings
+        # once the patches below have been removed.
+        self.addCleanup(load_config)
+        patcher = patch(SFTP_BACKEND)
+        self.backend_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        reset_storage_backends()
+
+    def test_local_storage(self):
+        with patch.object(local_settings, 'STORAGES_BACKEND', None):
+            self.assertIsNone(get_storage_backend())
+
+    @patch.object(local_settings, 'STORAGES_BACKEND', SFTP_BACKEND)
+    def test_backend_created_once(self):
+        backend = get_storage_backend()
+        self.assertIs(backend, self.backend_class.return_value)
+        self.assertIs(get_storage_backend(), backend)
+        self.backend_class.assert_called_once_with()
+
+    @patch.object(local_settings, 'STORAGES_BACKEND', SFTP_BACKEND)
+    def test_backend_created_once_threads(self):
+        # Slow down the creation of the backend so that the threads request
+        # it while it's being created.
+        self.backend_class.side_effect = (
+            lambda: time.sleep(0.05) or MagicMock())
+        backends = []
+        threads = [threading.Thread(
+            target=lambda: backends.append(get_storage_backend()))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.backend_class.call_count, 1)
+        self.assertEqual(len(backends), 5)
+        self.assertEqual(len(set(id(backend) for backend in backends)), 1)
+
+    def test_named_backend(self):
+        with patch.object(local_settings, 'STORAGES_BACKENDS', {
+                'archive': {'BACKEND': SFTP_BACKEND,
+                            'OPTIONS': {'host': 'archive.example.com'}}}):
+            backend = get_storage_backend('archive')
+        self.assertIs(backend, self.backend_class.return_value)
+        self.backend_class.assert_called_once_with(host='archive.example.com')
+
+    def test_unknown_backend(self):
+        with self.assertRaisesMessage(
+                KeyError, 'No storage backend named [archive] has been '
+                'configured.'):
+            get_storage_backend('archive')
+
+    @patch.object(local_settings, 'STORAGES_BACKEND', SFTP_BACKEND)
+    def test_reset_storage_backends(self):
+        get_storage_backend()
+        reset_storage_backends()
+        get_storage_backend()
+        self.assertEqual(self.backend_class.call_count, 2)
+
+    @patch.object(local_settings, 'STORAGES_BACKEND', SFTP_BACKEND)
+    def test_stored_storage_shares_backend(self):
+        stored_storage = DrfFilePondStoredStorage()
+        stored_storage._setup()
+        self.assertIs(stored_storage._wrapped, get_storage_backend())
+        self.backend_class.assert_called_once_with()
+
+    @patch.object(local_settings, 'STORAGES_BACKEND', SFTP_BACKEND)
+    def test_reset_stored_storage(self):
+        stored_storage = StoredUpload._meta.get_field('file').storage
+        reset_storage_backends()
+        self.assertIs(stored_storage._wrapped, empty)
+        stored_storage._setup()
+        self.assertIs(stored_storage._wrapped, get_storage_backend())
+        self.backend_class.side_effect = lambda: MagicMock()
+        reset_storage_backends()
+        stored_storage._setup()
+        self.assertIs(stored_storage._wrapped, get_storage_backend())
+        self.assertEqual(self.backend_class.call_count, 2)
+
+    @patch.object(local_settings, 'STORAGES_BACKEND', SFTP_BACKEND)
+    def test_storage_backend_stats(self):
+        pool_stats = [{'host': 'sftp.example.com', 'connections': 1}]
+        backend = self.backend_class.return_value
+        backend.get_connection_pool_stats.return_value = pool_stats
+        get_storage_backend()
+        get_storage_backend()
+        stats = get_storage_backend_stats()
+        self.assertEqual(list(stats.keys()), ['default'])
+        self.assertEqual(stats['default']['class'], SFTP_BACKEND)
+        self.assertEqual(stats['default']['lookups'], 2)
+        self.assertEqual(stats['default']['connection_pool'], pool_stats)
+
+    @patch.object(local_settings, 'STORAGES_BACKEND', SFTP_BACKEND)
+    def test_storage_backend_stats_client_config(self):
+        backend = MagicMock(spec=['client_config'])
+        backend.client_config.max_pool_connections = 10
+        self.backend_class.return_value = backend
+        get_storage_backend()
+        stats = get_storage_backend_stats()
+        self.assertEqual(stats['default']['connection_pool'],
+                         {'max_pool_connections': 10})
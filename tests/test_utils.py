@@ -9,7 +9,7 @@ from six import text_type
 
 import django_drf_filepond.drf_filepond_settings as local_settings
 from django_drf_filepond.utils import _get_user, _get_file_id, \
-    get_local_settings_base_dir
+    _is_valid_upload_id, get_local_settings_base_dir
 
 
 # Python 2/3 support
@@ -29,6 +29,9 @@ LOG = logging.getLogger(__name__)
 # test_get_file_id: Test that get_file_id returns an ID that corresponds to
 #    the 22-character specification.
 #
+# test_is_valid_upload_id: Test that generated IDs are accepted and values
+#    of the wrong length or containing invalid characters are rejected.
+#
 # test_get_base_dir_with_str: Test that when the local settings BASE_DIR
 #    is a string, a string is returned.
 #
@@ -60,6 +63,13 @@ class UtilsTestCase(TestCase):
         self.assertRegex(fid, id_format, ('The generated ID does not match '
                                           'the defined ID format.'))
 
+    def test_is_valid_upload_id(self):
+        self.assertTrue(_is_valid_upload_id(_get_file_id()))
+        self.assertFalse(_is_valid_upload_id(_get_file_id()[:21]))
+        self.assertFalse(_is_valid_upload_id(_get_file_id() + 'a'))
+        self.assertFalse(_is_valid_upload_id('../' + _get_file_id()[3:]))
+        self.assertFalse(_is_valid_upload_id(''))
+
     def test_get_base_dir_with_str(self):
         test_dir_name = '/tmp/testdir'
         old_base_dir = local_settings.BASE_DIR